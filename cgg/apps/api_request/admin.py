@@ -1,10 +1,36 @@
 import json
+from datetime import datetime, timedelta
 
 from django.contrib import admin
 
 from cgg.apps.api_request.models import APIRequest
 
 
+class CreatedAtFilter(admin.SimpleListFilter):
+    """
+    Range filters on created_at, so only the needed partitions are scanned
+    """
+    title = 'created at'
+    parameter_name = 'created'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('1', 'Last 24 hours'),
+            ('7', 'Last 7 days'),
+            ('30', 'Last 30 days'),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() in ('1', '7', '30'):
+            return queryset.filter(
+                created_at__gte=datetime.now() - timedelta(
+                    days=int(self.value()),
+                ),
+            )
+
+        return queryset
+
+
 @admin.register(APIRequest)
 class APIRequestAdmin(admin.ModelAdmin):
     date_hierarchy = 'created_at'
@@ -19,9 +45,16 @@ class APIRequestAdmin(admin.ModelAdmin):
         'app_name',
         'created_at',
     )
-    list_filter = ('direction', 'status_code', 'http_method',)
+    list_filter = (
+        CreatedAtFilter,
+        'direction',
+        'status_code',
+        'http_method',
+    )
     ordering = ('-created_at',)
     list_per_page = 20
+    # Counting all rows scans every partition
+    show_full_result_count = False
     fieldsets = (
         ('Base Information', {
             'fields': (
@@ -0,0 +1,297 @@
+# --------------------------------------------------------------------------
+# Buffer api request logs in memory and write them to the log database in
+# batches from a background thread. Request and response bodies are kept
+# raw and decoded by the flush thread, so logging never blocks a request.
+# Bodies larger than MAX_BODY_SIZE are replaced before they are queued.
+# (C) 2021 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - buffer.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+
+import atexit
+import json
+import logging
+import os
+import threading
+from collections import deque
+from json import JSONDecodeError
+
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router
+
+from cgg.apps.api_request.models import APIRequest
+from cgg.core.runtime import threads_available
+
+logger = logging.getLogger('common')
+
+OVERLOAD_POLICIES = ('drop', 'sample')
+
+
+class APIRequestBuffer:
+    _queue = deque()
+    _pid = None
+    _lock = threading.Lock()
+    _wakeup = threading.Event()
+    _thread = None
+    _sampled = 0
+    _stats = {
+        "enqueued": 0,
+        "dropped": 0,
+        "sampled_out": 0,
+        "written": 0,
+        "failed": 0,
+    }
+
+    @classmethod
+    def add(cls, **record):
+        """
+        Queue an api request log. Bodies are passed raw as request_body and
+        response_body (bytes or str) or decoded as request and response.
+        If ASYNC is off the log is written immediately
+        :param record: fields of APIRequest
+        :return: True if the log is queued or written
+        """
+        log_config = settings.CGG['API_REQUEST_LOG']
+        if not log_config['ASYNC']:
+            cls.to_api_request(record).save()
+            return True
+
+        threaded = cls._ensure_started()
+        queue_size = len(cls._queue)
+        if queue_size >= log_config['MAX_BUFFER']:
+            cls._stats["dropped"] += 1
+            return False
+        if log_config['OVERLOAD_POLICY'] == OVERLOAD_POLICIES[1] and \
+                queue_size >= log_config['MAX_BUFFER'] * \
+                log_config['SAMPLE_WATERMARK']:
+            # Keep one log out of every SAMPLE_RATE while the buffer is
+            # filling up faster than it is written
+            cls._sampled += 1
+            if cls._sampled % log_config['SAMPLE_RATE']:
+                cls._stats["sampled_out"] += 1
+                return False
+        cls._queue.append(
+            cls.limit_record(record, log_config['MAX_BODY_SIZE']),
+        )
+        cls._stats["enqueued"] += 1
+        if queue_size + 1 >= log_config['BATCH_SIZE']:
+            if threaded:
+                cls._wakeup.set()
+            else:
+                # No flush thread, the request that fills a batch writes it
+                cls.flush()
+
+        return True
+
+    @classmethod
+    def flush(cls):
+        """
+        Write all queued logs of the current process
+        :return: number of written logs
+        """
+        if cls._pid != os.getpid():
+            return 0
+        batch_size = settings.CGG['API_REQUEST_LOG']['BATCH_SIZE']
+        written = 0
+        while cls._queue:
+            records = []
+            while cls._queue and len(records) < batch_size:
+                try:
+                    records.append(cls._queue.popleft())
+                except IndexError:
+                    break
+            written += cls._write(records)
+
+        return written
+
+    @classmethod
+    def stats(cls):
+        """
+        Statistics of the buffer in the current process
+        :return: dict
+        """
+        return {
+            "pid": os.getpid(),
+            "queued": len(cls._queue) if cls._pid == os.getpid() else 0,
+            **cls._stats,
+        }
+
+    @classmethod
+    def _write(cls, records):
+        objects = []
+        for record in records:
+            try:
+                objects.append(cls.to_api_request(record))
+            except Exception as e:
+                cls._stats["failed"] += 1
+                logger.error("api request log is not valid: %s", e)
+        if not objects:
+            return 0
+        try:
+            APIRequest.objects.bulk_create(objects)
+        except Exception as e:
+            cls._stats["failed"] += len(objects)
+            logger.error("can not write api request logs: %s", e)
+            # The connection may be broken, open a new one on next flush
+            connections[router.db_for_write(APIRequest)].close()
+            return 0
+        cls._stats["written"] += len(objects)
+
+        return len(objects)
+
+    @classmethod
+    def _ensure_started(cls):
+        """
+        Start the flush thread of the current process. Threads do not
+        survive a fork, so a forked worker starts its own thread with an
+        empty buffer. Under uWSGI without enable-threads no thread is
+        started
+        :return: True if the flush thread runs
+        """
+        pid = os.getpid()
+        if cls._pid == pid and cls._thread is not None and \
+                cls._thread.is_alive():
+            return True
+        with cls._lock:
+            if cls._pid == pid and cls._thread is not None and \
+                    cls._thread.is_alive():
+                return True
+            if cls._pid != pid:
+                cls._queue = deque()
+                cls._wakeup = threading.Event()
+                cls._stats = {key: 0 for key in cls._stats}
+                cls._pid = pid
+                atexit.register(cls.flush)
+                if not threads_available():
+                    logger.warning(
+                        "threads are disabled, api request logs are "
+                        "written by requests in batches",
+                    )
+            if not threads_available():
+                return False
+            cls._thread = threading.Thread(
+                target=cls._run,
+                name='api-request-log',
+                daemon=True,
+            )
+            cls._thread.start()
+
+        return True
+
+    @classmethod
+    def _run(cls):
+        wakeup = cls._wakeup
+        while True:
+            wakeup.wait(settings.CGG['API_REQUEST_LOG']['FLUSH_INTERVAL'])
+            wakeup.clear()
+            try:
+                cls.flush()
+            except Exception as e:
+                logger.error("api request log flush failed: %s", e)
+
+    @classmethod
+    def to_api_request(cls, record):
+        """
+        Build an APIRequest from a queued log, decoding raw bodies
+        :param record: dict
+        :return: APIRequest
+        """
+        max_body_size = settings.CGG['API_REQUEST_LOG']['MAX_BODY_SIZE']
+        record = dict(record)
+        if 'request_body' in record:
+            record['request'] = cls.decode_body(
+                record.pop('request_body'),
+                max_body_size,
+            )
+        elif 'request' in record:
+            record['request'] = cls.limit_body(
+                record['request'],
+                max_body_size,
+            )
+        if 'response_body' in record:
+            record['response'] = cls.decode_body(
+                record.pop('response_body'),
+                max_body_size,
+            )
+        elif 'response' in record:
+            record['response'] = cls.limit_body(
+                record['response'],
+                max_body_size,
+            )
+
+        return APIRequest(**record)
+
+    @classmethod
+    def limit_record(cls, record, max_body_size=0):
+        """
+        Replace bodies of a log larger than max_body_size, raw bodies are
+        measured without decoding
+        :param record: dict
+        :param max_body_size: in bytes, 0 means no limit
+        :return: record
+        """
+        if not max_body_size:
+            return record
+        for raw_name, name in (
+                ('request_body', 'request'),
+                ('response_body', 'response'),
+        ):
+            if raw_name in record:
+                body = record[raw_name]
+                if body and len(body) > max_body_size:
+                    del record[raw_name]
+                    record[name] = cls.truncated_body(len(body))
+            elif name in record:
+                record[name] = cls.limit_body(record[name], max_body_size)
+
+        return record
+
+    @classmethod
+    def decode_body(cls, body, max_body_size=0):
+        """
+        Decode a raw JSON body, non JSON bodies are logged as an empty dict
+        :param body: bytes or str
+        :param max_body_size: in bytes, 0 means no limit
+        :return: decoded body
+        """
+        if not body:
+            return {}
+        if max_body_size and len(body) > max_body_size:
+            return cls.truncated_body(len(body))
+        try:
+            if isinstance(body, bytes):
+                body = body.decode('utf-8')
+            return json.loads(body)
+        except (JSONDecodeError, UnicodeDecodeError, TypeError):
+            return {}
+
+    @classmethod
+    def limit_body(cls, body, max_body_size=0):
+        """
+        Replace a decoded body larger than max_body_size when serialized
+        :param body:
+        :param max_body_size: in bytes, 0 means no limit
+        :return: body
+        """
+        if not max_body_size or body is None:
+            return body
+        body_size = len(json.dumps(body, cls=DjangoJSONEncoder))
+        if body_size > max_body_size:
+            return cls.truncated_body(body_size)
+
+        return body
+
+    @classmethod
+    def truncated_body(cls, body_size):
+        return {
+            "truncated": True,
+            "size": body_size,
+        }
+
+
+@worker_process_shutdown.connect
+def flush_api_request_buffer(*args, **kwargs):
+    APIRequestBuffer.flush()
@@ -1,5 +1,7 @@
 # --------------------------------------------------------------------------
-# Clean log database from old api requests
+# Clean log database from old api requests. api_request table is range
+# partitioned on created_at, partitions are created ahead of time and old
+# partitions are dropped instead of deleting rows.
 # (C) 2020 MehrdadEP, Tehran, Iran
 # Respina Networks and beyonds - api_request_clean.py
 # Created at 2020-10-18,  14:40:7
@@ -11,7 +13,10 @@ from datetime import datetime, timedelta
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
-from cgg.apps.api_request.models import APIRequest
+from cgg.apps.api_request.partitions import (
+    APIRequestPartitionService,
+    INTERVALS,
+)
 from cgg.apps.finance.decorators import log_command
 from cgg.apps.finance.versions.v1.config import FinanceConfigurations
 
@@ -19,10 +24,34 @@ from cgg.apps.finance.versions.v1.config import FinanceConfigurations
 class Command(BaseCommand):
     help = 'Clean api_request table from log database'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--premake',
+            type=int,
+            default=None,
+            help='Number of partitions to create ahead of the current one'
+        )
+        parser.add_argument(
+            '--interval',
+            type=str,
+            default=None,
+            choices=INTERVALS,
+            help='Range of each new partition'
+        )
+
     @log_command(command_title=FinanceConfigurations.Commands.TYPES[14][0])
     def handle(self, *args, **options):
         days = settings.CGG['API_REQUESTS_KEEP_DAYS']
         older_than = datetime.now() - timedelta(days=days)
-        APIRequest.objects.filter(
-            created_at__lte=older_than,
-        ).delete()
+        if not APIRequestPartitionService.is_partitioned():
+            deleted = APIRequestPartitionService.delete_rows(older_than)
+            self.stdout.write(f"{deleted} api requests are deleted")
+            return
+        created = APIRequestPartitionService.create_partitions(
+            premake=options['premake'],
+            interval=options['interval'],
+        )
+        dropped = APIRequestPartitionService.drop_partitions(older_than)
+        self.stdout.write(
+            f"partitions created: {len(created)}, dropped: {len(dropped)}"
+        )
@@ -0,0 +1,73 @@
+# Generated by Django 3.1.14 on 2022-12-11 09:20
+
+from django.db import migrations
+
+# The existing table is kept as the first partition (up to the end of the
+# migration day), new partitions are created by api_request_clean command.
+# The primary key of a partitioned table must contain the partition key,
+# the primary key of the legacy table on (id) is dropped before it is
+# attached and the partition gets (id, created_at) of the parent.
+PARTITION_SQL = """
+ALTER TABLE api_request_apirequest
+    RENAME TO api_request_apirequest_legacy;
+ALTER TABLE api_request_apirequest_legacy
+    DROP CONSTRAINT api_request_apirequest_pkey;
+CREATE TABLE api_request_apirequest (
+    LIKE api_request_apirequest_legacy INCLUDING DEFAULTS
+) PARTITION BY RANGE (created_at);
+ALTER TABLE api_request_apirequest
+    ADD CONSTRAINT api_request_apirequest_part_pkey
+    PRIMARY KEY (id, created_at);
+CREATE INDEX api_request_apirequest_part_created_at
+    ON api_request_apirequest (created_at);
+CREATE INDEX api_request_apirequest_part_label
+    ON api_request_apirequest (label);
+CREATE INDEX api_request_apirequest_part_http_method
+    ON api_request_apirequest (http_method);
+DO $$
+BEGIN
+    EXECUTE format(
+        'ALTER TABLE api_request_apirequest '
+        'ATTACH PARTITION api_request_apirequest_legacy '
+        'FOR VALUES FROM (MINVALUE) TO (%L)',
+        date_trunc('day', now()) + interval '1 day'
+    );
+END $$;
+CREATE TABLE api_request_apirequest_default
+    PARTITION OF api_request_apirequest DEFAULT;
+"""
+
+# The name of the old primary key is free once the legacy table is
+# attached, so the plain table gets it back before rows are copied
+UNPARTITION_SQL = """
+CREATE TABLE api_request_apirequest_plain (
+    LIKE api_request_apirequest INCLUDING DEFAULTS
+);
+ALTER TABLE api_request_apirequest_plain
+    ADD CONSTRAINT api_request_apirequest_pkey PRIMARY KEY (id);
+INSERT INTO api_request_apirequest_plain
+    SELECT * FROM api_request_apirequest;
+DROP TABLE api_request_apirequest CASCADE;
+ALTER TABLE api_request_apirequest_plain
+    RENAME TO api_request_apirequest;
+CREATE INDEX api_request_apirequest_created_at
+    ON api_request_apirequest (created_at);
+CREATE INDEX api_request_apirequest_label
+    ON api_request_apirequest (label);
+CREATE INDEX api_request_apirequest_http_method
+    ON api_request_apirequest (http_method);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_request', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=PARTITION_SQL,
+            reverse_sql=UNPARTITION_SQL,
+        ),
+    ]
@@ -0,0 +1,227 @@
+# --------------------------------------------------------------------------
+# Manage range partitions of api_request table on created_at in the log
+# database. Partitions are created ahead of time and old ones are detached
+# and dropped, so retention never deletes rows one by one.
+# (C) 2021 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - partitions.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+
+import logging
+import re
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+
+from cgg.apps.api_request.models import APIRequest
+
+logger = logging.getLogger('common')
+
+INTERVALS = ('day', 'week')
+
+
+class APIRequestPartitionService:
+    BOUND_PATTERN = re.compile(
+        r"FROM \((?:MINVALUE|'([^']+)')\) TO \((?:MAXVALUE|'([^']+)')\)",
+    )
+
+    @classmethod
+    def database(cls):
+        return router.db_for_write(APIRequest)
+
+    @classmethod
+    def table_name(cls):
+        return APIRequest._meta.db_table
+
+    @classmethod
+    def is_partitioned(cls):
+        """
+        :return: True if api_request table is a partitioned table
+        """
+        connection = connections[cls.database()]
+        if connection.vendor != 'postgresql':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_partitioned_table "
+                "WHERE partrelid = to_regclass(%s)",
+                [cls.table_name()],
+            )
+            return cursor.fetchone() is not None
+
+    @classmethod
+    def partition_range(cls, day, interval):
+        """
+        Range of the partition that contains a day, weeks start on Monday
+        :param day: datetime
+        :param interval: one of INTERVALS
+        :return: (start, end)
+        """
+        start = datetime(day.year, day.month, day.day)
+        if interval == INTERVALS[1]:
+            start -= timedelta(days=start.weekday())
+            return start, start + timedelta(days=7)
+
+        return start, start + timedelta(days=1)
+
+    @classmethod
+    def parse_bound(cls, bound):
+        """
+        :param bound: timestamp literal of a partition bound or None
+        :return: naive datetime or None for MINVALUE and MAXVALUE
+        """
+        if bound is None:
+            return None
+        # PostgreSQL writes whole hour offsets as +00
+        if re.search(r'[+-]\d{2}$', bound):
+            bound += ':00'
+        value = datetime.fromisoformat(bound)
+
+        return value.replace(tzinfo=None)
+
+    @classmethod
+    def partitions(cls):
+        """
+        Partitions of api_request table, the default partition is left out
+        :return: list of (name, start, end), start or end is None if
+        unbounded
+        """
+        with connections[cls.database()].cursor() as cursor:
+            cursor.execute(
+                "SELECT child.relname, "
+                "pg_get_expr(child.relpartbound, child.oid) "
+                "FROM pg_inherits "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE pg_inherits.inhparent = to_regclass(%s) "
+                "ORDER BY child.relname",
+                [cls.table_name()],
+            )
+            rows = cursor.fetchall()
+        partitions = []
+        for name, bound_expression in rows:
+            match = cls.BOUND_PATTERN.search(bound_expression or '')
+            if match is None:
+                continue
+            partitions.append((
+                name,
+                cls.parse_bound(match.group(1)),
+                cls.parse_bound(match.group(2)),
+            ))
+
+        return partitions
+
+    @classmethod
+    def create_partitions(cls, premake=None, interval=None, now=None):
+        """
+        Create partitions from now up to premake intervals ahead. Ranges that
+        overlap an existing partition are skipped. Rows of a new range that
+        were written to the default partition are moved to the new one
+        :param premake: number of partitions ahead of the current one
+        :param interval: one of INTERVALS
+        :param now:
+        :return: list of created partition names
+        """
+        partition_config = settings.CGG['API_REQUEST_PARTITION']
+        if premake is None:
+            premake = partition_config['PREMAKE']
+        if interval is None:
+            interval = partition_config['INTERVAL']
+        if now is None:
+            now = datetime.now()
+        table_name = cls.table_name()
+        existing = cls.partitions()
+        created = []
+        start, end = cls.partition_range(now, interval)
+        for _ in range(premake + 1):
+            overlaps = any(
+                (p_start is None or p_start < end) and
+                (p_end is None or start < p_end)
+                for name, p_start, p_end in existing
+            )
+            if not overlaps:
+                name = f"{table_name}_p{start.strftime('%Y%m%d')}"
+                cls._create_partition(name, start, end)
+                existing.append((name, start, end))
+                created.append(name)
+            start, end = end, end + (end - start)
+
+        return created
+
+    @classmethod
+    def _create_partition(cls, name, start, end):
+        table_name = cls.table_name()
+        connection = connections[cls.database()]
+        quote_name = connection.ops.quote_name
+        with transaction.atomic(using=cls.database()):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE TABLE {quote_name(name)} "
+                    f"(LIKE {quote_name(table_name)} INCLUDING DEFAULTS)"
+                )
+                cursor.execute(
+                    f"WITH moved AS ("
+                    f"DELETE FROM {quote_name(table_name + '_default')} "
+                    f"WHERE created_at >= %s AND created_at < %s "
+                    f"RETURNING *) "
+                    f"INSERT INTO {quote_name(name)} SELECT * FROM moved",
+                    [start, end],
+                )
+                cursor.execute(
+                    f"ALTER TABLE {quote_name(table_name)} "
+                    f"ATTACH PARTITION {quote_name(name)} "
+                    f"FOR VALUES FROM (%s) TO (%s)",
+                    [start, end],
+                )
+        logger.info("api request partition %s is created", name)
+
+    @classmethod
+    def drop_partitions(cls, older_than):
+        """
+        Detach and drop partitions that end before older_than and delete old
+        rows of the default partition
+        :param older_than: datetime
+        :return: list of dropped partition names
+        """
+        table_name = cls.table_name()
+        connection = connections[cls.database()]
+        quote_name = connection.ops.quote_name
+        dropped = []
+        for name, start, end in cls.partitions():
+            if end is None or end > older_than:
+                continue
+            with transaction.atomic(using=cls.database()):
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"ALTER TABLE {quote_name(table_name)} "
+                        f"DETACH PARTITION {quote_name(name)}"
+                    )
+                    cursor.execute(f"DROP TABLE {quote_name(name)}")
+            dropped.append(name)
+            logger.info("api request partition %s is dropped", name)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {quote_name(table_name + '_default')} "
+                f"WHERE created_at <= %s",
+                [older_than],
+            )
+
+        return dropped
+
+    @classmethod
+    def delete_rows(cls, older_than):
+        """
+        Retention of a table that is not partitioned, rows are deleted in
+        database without loading them
+        :param older_than: datetime
+        :return: number of deleted rows
+        """
+        connection = connections[cls.database()]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {connection.ops.quote_name(cls.table_name())} "
+                f"WHERE created_at <= %s",
+                [older_than],
+            )
+            return cursor.rowcount
@@ -1,6 +1,11 @@
+from datetime import datetime
+
 from django.test import TestCase
 
+from cgg.apps.api_request.buffer import APIRequestBuffer
 from cgg.apps.api_request.models import APIRequest
+from cgg.apps.api_request.partitions import APIRequestPartitionService
+from cgg.core.testing import cgg_settings
 
 
 class APIRequestTestCase(TestCase):
@@ -54,3 +59,70 @@ class APIRequestTestCase(TestCase):
             APIRequest.objects.create(
                 **self.invalid_status_code
             )
+
+
+class APIRequestBufferTestCase(TestCase):
+    def test_decode_body(self):
+        self.assertEqual(
+            APIRequestBuffer.decode_body(b'{"ok": true}'),
+            {'ok': True},
+        )
+        self.assertEqual(APIRequestBuffer.decode_body(b'not json'), {})
+        self.assertEqual(APIRequestBuffer.decode_body(None), {})
+        self.assertEqual(
+            APIRequestBuffer.decode_body(b'{"ok": true}', 4),
+            {'truncated': True, 'size': 12},
+        )
+
+    def test_large_bodies_are_replaced_when_queued(self):
+        record = APIRequestBuffer.limit_record(
+            {
+                'request_body': b'{"ok": true}',
+                'response_body': b'{}',
+                'status_code': 200,
+            },
+            4,
+        )
+        self.assertNotIn('request_body', record)
+        self.assertEqual(record['request'], {'truncated': True, 'size': 12})
+        self.assertEqual(record['response_body'], b'{}')
+        self.assertEqual(
+            APIRequestBuffer.limit_record({'response': {'ok': True}}, 4),
+            {'response': {'truncated': True, 'size': 12}},
+        )
+
+    def test_synchronous_write(self):
+        with cgg_settings('API_REQUEST_LOG', ASYNC=False):
+            APIRequestBuffer.add(
+                uri='http://test.com',
+                http_method='post',
+                direction='out',
+                label='test',
+                app_name='test',
+                request_body=b'{"ok": true}',
+                response_body=b'',
+                status_code=200,
+            )
+        api_request = APIRequest.objects.get(label='test')
+        self.assertEqual(api_request.request, {'ok': True})
+        self.assertEqual(api_request.response, {})
+
+
+class APIRequestPartitionTestCase(TestCase):
+    def test_partition_range(self):
+        day = datetime(2022, 12, 7, 15, 30)
+        self.assertEqual(
+            APIRequestPartitionService.partition_range(day, 'day'),
+            (datetime(2022, 12, 7), datetime(2022, 12, 8)),
+        )
+        self.assertEqual(
+            APIRequestPartitionService.partition_range(day, 'week'),
+            (datetime(2022, 12, 5), datetime(2022, 12, 12)),
+        )
+
+    def test_parse_bound(self):
+        self.assertEqual(
+            APIRequestPartitionService.parse_bound('2022-12-05 00:00:00+00'),
+            datetime(2022, 12, 5),
+        )
+        self.assertIsNone(APIRequestPartitionService.parse_bound(None))
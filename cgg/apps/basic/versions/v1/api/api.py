@@ -24,12 +24,14 @@ from cgg.apps.basic.versions.v1.services.cgrates import (
 
 
 
+from cgg.core.cache import Cache
 from cgg.core.decorators import log_api_request
 from cgg.core.paginator import Paginator
 from cgg.core.permissions import (
     DashboardAPIPermission,
     TrunkBackendAPIPermission,
 )
+from cgg.core.requests import Requests
 from cgg.core.response import response
 
 
@@ -1228,6 +1230,44 @@ class ReloadPlansAPIView(APIView):
         )
 
 
+class HTTPPoolAPIView(APIView):
+    permission_classes = (
+        DashboardAPIPermission,
+    )
+
+    def get(
+            self,
+            request,
+            *args,
+            **kwargs,
+    ):
+        return response(
+            request,
+            status=200,
+            data=Requests.pool_stats(),
+            message=_('HTTP connection pool statistics of this process'),
+        )
+
+
+class CacheStatsAPIView(APIView):
+    permission_classes = (
+        DashboardAPIPermission,
+    )
+
+    def get(
+            self,
+            request,
+            *args,
+            **kwargs,
+    ):
+        return response(
+            request,
+            status=200,
+            data=Cache.stats(),
+            message=_('Cache statistics of this process'),
+        )
+
+
 class TestAPIView(APIView):
     
     def get(
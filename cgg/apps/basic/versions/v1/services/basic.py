@@ -8,7 +8,9 @@
 # Author: Mehrdad Esmaeilpour
 # Email: m.esmailpour@respina.net
 # --------------------------------------------------------------------------
+import logging
 import uuid as uuid
+from collections import OrderedDict
 from datetime import datetime
 from decimal import Decimal
 
@@ -53,6 +55,48 @@ from cgg.core import api_exceptions
 from cgg.core.cache import Cache
 from cgg.core.requests import Requests
 
+logger = logging.getLogger('common')
+
+
+class CGRatesBatch:
+    """
+    Queue of JSON-RPC calls to CGRateS. Use BasicService.execute_batch to
+    send all queued calls in one round trip, then read each result by the
+    request id returned from add
+    """
+
+    def __init__(self):
+        self.calls = OrderedDict()
+        self.results = {}
+
+    def __len__(self):
+        return len(self.calls)
+
+    def add(self, method, body):
+        """
+        Queue a call
+        :param method: str -> Subsystem.MethodName (Use cgrates_methods.py)
+        :param body: dict to convert to JSON
+        :return: request id of this call
+        """
+        request_id = uuid.uuid4().hex
+        self.calls[request_id] = (method, body)
+
+        return request_id
+
+    def result(self, request_id):
+        """
+        Return the result of a call or raise the same exception that a
+        single call would raise (NotFound404, APIException, ...)
+        :param request_id:
+        :return:
+        """
+        result = self.results[request_id]
+        if isinstance(result, Exception):
+            raise result
+
+        return result
+
 
 class BasicService:
     """
@@ -131,20 +175,162 @@ class BasicService:
                 },
             )
         if data['error']:
-            # Hardcoded due to limitation of JSON-RPC implementation in Go
-            # (CGRateS)
-            if data['error'] in (
-                    'NOT_FOUND',
-                    'SERVER_ERROR: NOT_FOUND',
-            ):
-                raise api_exceptions.NotFound404(
-                    data['error'],
+            raise cls.__response_error(data['error'])
+
+        return data['result']
+
+    @classmethod
+    def __response_error(cls, error):
+        """
+        Convert the error of a JSON-RPC response to an API exception
+        :param error: error field of the response
+        :return: exception object
+        """
+        # Hardcoded due to limitation of JSON-RPC implementation in Go
+        # (CGRateS)
+        if error in (
+                'NOT_FOUND',
+                'SERVER_ERROR: NOT_FOUND',
+        ):
+            return api_exceptions.NotFound404(
+                error,
+            )
+
+        return api_exceptions.APIException(
+            error,
+        )
+
+    @classmethod
+    def __get_batch_response(
+            cls,
+            calls,
+            recovery=False,
+            timeout=settings.CGG['SERVICE_TIMEOUT'],
+    ):
+        """
+        Send several calls as one JSON-RPC batch
+        :param calls: OrderedDict of request id -> (method, body)
+        :param recovery: Check if this is timeout recovery or not
+        :param timeout: Default value from settings, could be overwritten
+        :return: dict of request id -> result or exception object, None if
+        CGRateS does not answer with a batch
+        """
+        cgr_auth = settings.CGG['AUTH_TOKENS']['CGRATES_BASIC_AUTHENTICATION']
+        url = settings.CGG['BASE_URLS']['CGRATES']
+        params = [
+            {
+                "id": request_id,
+                "jsonrpc": "2.0",
+                "method": method,
+                "params": body,
+            } for request_id, (method, body) in calls.items()
+        ]
+        label = ",".join(
+            sorted(set(method for method, body in calls.values()))
+        )
+        try:
+            res = Requests.post(
+                app_name=BasicConfig.name,
+                label=label[:128],
+                url=url,
+                json=params,
+                headers={
+                    'Content-type': 'application/json',
+                },
+                timeout=timeout,
+                auth=(
+                    cgr_auth['USERNAME'],
+                    cgr_auth['PASSWORD'],
                 )
+            )
+        except requests.exceptions.ConnectionError:
             raise api_exceptions.APIException(
-                data['error'],
+                _("Connection error"),
             )
+        except requests.exceptions.Timeout:
+            if not recovery:
+                return cls.__get_batch_response(
+                    calls,
+                    recovery=True,
+                    timeout=timeout,
+                )
+            raise api_exceptions.TimeOut408(_("Timeout on connection"))
 
-        return data['result']
+        if res.status_code == status.HTTP_401_UNAUTHORIZED:
+            raise api_exceptions.AuthenticationFailed401()
+        try:
+            data = res.json()
+        except ValueError:
+            data = None
+        if not isinstance(data, list):
+            return None
+
+        results = {}
+        for item in data:
+            if not isinstance(item, dict) or item.get('id') not in calls:
+                continue
+            if item.get('error'):
+                results[item['id']] = cls.__response_error(item['error'])
+            else:
+                results[item['id']] = item.get('result')
+        for request_id in calls.keys():
+            if request_id not in results:
+                results[request_id] = api_exceptions.APIException(
+                    _("The id of the request is not configured correctly"),
+                )
+
+        return results
+
+    @classmethod
+    def batch(cls):
+        """
+        :return: an empty batch of calls to CGRateS
+        """
+        return CGRatesBatch()
+
+    @classmethod
+    def execute_batch(cls, batch, timeout=settings.CGG['SERVICE_TIMEOUT']):
+        """
+        Send all queued calls of a batch to CGRateS in as few round trips as
+        possible (CGRATES_BATCH_SIZE calls per request). If CGRateS does not
+        accept batches the calls are sent one by one.
+        :param batch: CGRatesBatch
+        :param timeout:
+        :return: the batch with results filled
+        """
+        batch_size = settings.CGG['CGRATES_BATCH_SIZE']
+        pending = OrderedDict(
+            (request_id, call) for request_id, call in batch.calls.items()
+            if request_id not in batch.results
+        )
+        request_ids = list(pending.keys())
+        for index in range(0, len(request_ids), batch_size):
+            chunk = OrderedDict(
+                (request_id, pending[request_id])
+                for request_id in request_ids[index:index + batch_size]
+            )
+            results = None
+            if len(chunk) > 1:
+                results = cls.__get_batch_response(chunk, timeout=timeout)
+                if results is None:
+                    logger.warning(
+                        "CGRateS did not answer the JSON-RPC batch, "
+                        "falling back to single calls"
+                    )
+            if results is None:
+                results = {}
+                for request_id, (method, body) in chunk.items():
+                    try:
+                        results[request_id] = cls.__get_response(
+                            method,
+                            body,
+                            timeout=timeout,
+                        )
+                    except exceptions.APIException as e:
+                        results[request_id] = e
+            batch.results.update(results)
+
+        return batch
 
     @classmethod
     def delete_subscription_related_cache(cls, subscription_code):
@@ -198,14 +384,7 @@ class BasicService:
         if force_reload:
             cls.delete_subscription_related_cache(subscription_code)
 
-        account_details = Cache.get(
-            key=Cache.KEY_CONVENTIONS['account_details'],
-            values={
-                'subscription_code': subscription_code,
-            },
-        )
-
-        if not account_details:
+        def compute():
             method = CGRatesMethods.get_account()
             body = [
                 {
@@ -218,16 +397,7 @@ class BasicService:
                 }
             ]
             try:
-                account_details = cls.__get_response(method, body)
-                Cache.set(
-                    key=Cache.KEY_CONVENTIONS['account_details'],
-                    values={
-                        'subscription_code': subscription_code,
-                    },
-                    store_value=account_details,
-                    expiry_time=
-                    settings.CGG['CACHE_EXPIRY_OBJECTS'],
-                )
+                return cls.__get_response(method, body)
             except api_exceptions.NotFound404:
                 raise api_exceptions.NotFound404(_(
                     'Subscription {subscription_code} does not exists'.format(
@@ -239,20 +409,166 @@ class BasicService:
                     _('Something went wrong in the request to CGRateS')
                 )
 
+        account_details = Cache.get_or_compute(
+            key=Cache.KEY_CONVENTIONS['account_details'],
+            values={
+                'subscription_code': subscription_code,
+            },
+            compute=compute,
+            expiry_time=settings.CGG['CACHE_EXPIRY_OBJECTS'],
+            not_found=(api_exceptions.NotFound404,),
+        )
+
         return account_details
 
+    @classmethod
+    def prefetch_accounts(cls, subscription_codes, force_reload=False):
+        """
+        Load accounts of several subscriptions with one multi-get on cache
+        and one GetAccounts call for the missing ones, so following
+        get_account calls are served from cache. Accounts that are not
+        found are left out and get_account raises for them as usual
+        :param subscription_codes: list of subscription codes
+        :param force_reload: Delete cached values
+        :return: dict of subscription code -> account details
+        """
+        subscription_codes = list(dict.fromkeys(subscription_codes))
+        accounts = {}
+        if force_reload:
+            for subscription_code in subscription_codes:
+                cls.delete_subscription_related_cache(subscription_code)
+        else:
+            cached_accounts = Cache.get_many(
+                key=Cache.KEY_CONVENTIONS['account_details'],
+                values_list=[
+                    {
+                        'subscription_code': subscription_code,
+                    } for subscription_code in subscription_codes
+                ],
+            )
+            for subscription_code, account_details in zip(
+                    subscription_codes,
+                    cached_accounts,
+            ):
+                if account_details:
+                    accounts[subscription_code] = account_details
+        account_names = {
+            CGRatesConventions.account_name(
+                account_name=subscription_code,
+                account_type=BasicConfigurations.Types.ACCOUNT_TYPE[0][0],
+            ): subscription_code for subscription_code in subscription_codes
+            if subscription_code not in accounts
+        }
+        if not account_names:
+            return accounts
+        try:
+            accounts_cgrates = cls.get_accounts(list(account_names.keys()))
+        except api_exceptions.APIException:
+            accounts_cgrates = None
+        loaded_accounts = []
+        for account_details in accounts_cgrates or []:
+            subscription_code = account_names.get(
+                CGRatesConventions.account_name_no_tenant(
+                    account_details.get('ID') or '',
+                )
+            )
+            if subscription_code is None:
+                continue
+            accounts[subscription_code] = account_details
+            loaded_accounts.append((
+                {
+                    'subscription_code': subscription_code,
+                },
+                account_details,
+            ))
+        Cache.set_many(
+            key=Cache.KEY_CONVENTIONS['account_details'],
+            items=loaded_accounts,
+            expiry_time=settings.CGG['CACHE_EXPIRY_OBJECTS'],
+        )
+
+        return accounts
+
     @classmethod
     def get_balance(
             cls,
             subscription_code,
             force_reload=False,
     ):
-        print('account_details_cgrates')
         account_details_cgrates = cls.get_account(
             subscription_code,
             force_reload,
         )
-        balances = cls.balances_object(account_details_cgrates)
+        balance_prepaid, balance_postpaid, has_balance = \
+            cls.monetary_balances(account_details_cgrates)
+
+        if has_balance:
+            return cls.balance_details(
+                balance_prepaid,
+                balance_postpaid,
+                cls.get_base_balance_prepaid(
+                    subscription_code,
+                    force_reload
+                ),
+                cls.get_base_balance_postpaid(
+                    subscription_code,
+                    force_reload,
+                ),
+            )
+
+        return False
+
+    @classmethod
+    def get_balances(cls, subscription_codes, force_reload=False):
+        """
+        get_balance of several subscriptions in a fixed number of calls:
+        accounts are loaded with prefetch_accounts and base balances with
+        get_base_balances
+        :param subscription_codes: list of subscription codes
+        :param force_reload: Delete cached values
+        :return: dict of subscription code -> balance details or False,
+        subscriptions without account in CGRateS are left out
+        """
+        accounts = cls.prefetch_accounts(subscription_codes, force_reload)
+        monetary_balances = {}
+        for subscription_code, account_details in accounts.items():
+            monetary_balances[subscription_code] = cls.monetary_balances(
+                account_details,
+            )
+        base_balances = cls.get_base_balances([
+            subscription_code for subscription_code, (
+                balance_prepaid,
+                balance_postpaid,
+                has_balance,
+            ) in monetary_balances.items() if has_balance
+        ])
+        balances = {}
+        for subscription_code, (
+                balance_prepaid,
+                balance_postpaid,
+                has_balance,
+        ) in monetary_balances.items():
+            if not has_balance:
+                balances[subscription_code] = False
+                continue
+            base_balance_prepaid, base_balance_postpaid = \
+                base_balances[subscription_code]
+            balances[subscription_code] = cls.balance_details(
+                balance_prepaid,
+                balance_postpaid,
+                base_balance_prepaid,
+                base_balance_postpaid,
+            )
+
+        return balances
+
+    @classmethod
+    def monetary_balances(cls, account_details):
+        """
+        :param account_details: account from CGRateS
+        :return: (prepaid balance, postpaid balance, has balance)
+        """
+        balances = cls.balances_object(account_details)
         balance_prepaid = None
         balance_postpaid = None
         has_balance = False
@@ -265,37 +581,36 @@ class BasicService:
                 balance_prepaid = balance
                 has_balance = True
 
-        if has_balance:
-            current_balance_prepaid = int(
-                float(balance_prepaid['value']),
-            )
-            base_balance_prepaid = cls.get_base_balance_prepaid(
-                subscription_code,
-                force_reload
-            )
-            usage_prepaid = base_balance_prepaid - current_balance_prepaid
-            current_balance_postpaid = int(
-                float(balance_postpaid['value']),
-            )
-            base_balance_postpaid = cls.get_base_balance_postpaid(
-                subscription_code,
-                force_reload,
-            )
-            usage_postpaid = base_balance_postpaid - current_balance_postpaid
-            if int(usage_prepaid) < 0:
-                usage_prepaid = 0
-            if int(usage_postpaid) < 0:
-                usage_postpaid = 0
-            return {
-                "used_balance_postpaid": usage_postpaid,
-                "used_balance_prepaid": usage_prepaid,
-                "base_balance_postpaid": base_balance_postpaid,
-                "base_balance_prepaid": base_balance_prepaid,
-                "current_balance_postpaid": current_balance_postpaid,
-                "current_balance_prepaid": current_balance_prepaid,
-            }
+        return balance_prepaid, balance_postpaid, has_balance
 
-        return False
+    @classmethod
+    def balance_details(
+            cls,
+            balance_prepaid,
+            balance_postpaid,
+            base_balance_prepaid,
+            base_balance_postpaid,
+    ):
+        current_balance_prepaid = int(
+            float(balance_prepaid['value']),
+        )
+        usage_prepaid = base_balance_prepaid - current_balance_prepaid
+        current_balance_postpaid = int(
+            float(balance_postpaid['value']),
+        )
+        usage_postpaid = base_balance_postpaid - current_balance_postpaid
+        if int(usage_prepaid) < 0:
+            usage_prepaid = 0
+        if int(usage_postpaid) < 0:
+            usage_postpaid = 0
+        return {
+            "used_balance_postpaid": usage_postpaid,
+            "used_balance_prepaid": usage_prepaid,
+            "base_balance_postpaid": base_balance_postpaid,
+            "base_balance_prepaid": base_balance_prepaid,
+            "current_balance_postpaid": current_balance_postpaid,
+            "current_balance_prepaid": current_balance_prepaid,
+        }
 
     @classmethod
     def get_accounts(
@@ -357,22 +672,7 @@ class BasicService:
                 base_balance_cgrates = cls.__get_response(method, body)
             except api_exceptions.APIException:
                 base_balance_cgrates = None
-
-            if base_balance_cgrates is None:
-                base_balance_value = int(0)
-            else:
-                base_balance = ActionsV1Serializer(
-                    data=base_balance_cgrates,
-                    many=True,
-                )
-
-                if not base_balance.is_valid():
-                    raise api_exceptions.ValidationError400(
-                        base_balance.errors
-                    )
-
-                base_balance = base_balance.data[0]
-                base_balance_value = int(float(base_balance['value']))
+            base_balance_value = cls.base_balance_value(base_balance_cgrates)
 
             Cache.set(
                 key=Cache.KEY_CONVENTIONS['base_balance_prepaid'],
@@ -418,22 +718,7 @@ class BasicService:
                 base_balance_cgrates = cls.__get_response(method, body)
             except api_exceptions.APIException:
                 base_balance_cgrates = None
-
-            if base_balance_cgrates is None:
-                base_balance_value = int(0)
-            else:
-                base_balance = ActionsV1Serializer(
-                    data=base_balance_cgrates,
-                    many=True,
-                )
-
-                if not base_balance.is_valid():
-                    raise api_exceptions.ValidationError400(
-                        base_balance.errors
-                    )
-
-                base_balance = base_balance.data[0]
-                base_balance_value = int(float(base_balance['value']))
+            base_balance_value = cls.base_balance_value(base_balance_cgrates)
 
             Cache.set(
                 key=Cache.KEY_CONVENTIONS['base_balance_postpaid'],
@@ -445,6 +730,102 @@ class BasicService:
 
         return base_balance_value
 
+    @classmethod
+    def get_base_balances(cls, subscription_codes):
+        """
+        Base balances of several subscriptions with one multi-get on cache
+        per balance and one batch of calls to CGRateS for the missing ones
+        :param subscription_codes: list of subscription codes
+        :return: dict of subscription code -> (prepaid, postpaid)
+        """
+        subscription_codes = list(dict.fromkeys(subscription_codes))
+        base_balances = {
+            subscription_code: [None, None] for subscription_code in
+            subscription_codes
+        }
+        if not subscription_codes:
+            return {}
+        method = CGRatesMethods.get_actions_v1()
+        batch = cls.batch()
+        request_ids = []
+        cache_keys = (
+            Cache.KEY_CONVENTIONS['base_balance_prepaid'],
+            Cache.KEY_CONVENTIONS['base_balance_postpaid'],
+        )
+        for index, cache_key in enumerate(cache_keys):
+            cached_values = Cache.get_many(
+                key=cache_key,
+                values_list=[
+                    {
+                        'subscription_code': subscription_code,
+                    } for subscription_code in subscription_codes
+                ],
+            )
+            for subscription_code, base_balance_value in zip(
+                    subscription_codes,
+                    cached_values,
+            ):
+                if base_balance_value:
+                    base_balances[subscription_code][index] = \
+                        base_balance_value
+                    continue
+                request_ids.append((
+                    index,
+                    subscription_code,
+                    batch.add(method, [
+                        CGRatesConventions.topup_reset_action(
+                            subscription_code,
+                            index == 0,
+                        )
+                    ]),
+                ))
+        if len(batch):
+            cls.execute_batch(batch)
+        loaded_values = ([], [])
+        for index, subscription_code, request_id in request_ids:
+            try:
+                base_balance_cgrates = batch.result(request_id)
+            except exceptions.APIException:
+                base_balance_cgrates = None
+            base_balance_value = cls.base_balance_value(base_balance_cgrates)
+            base_balances[subscription_code][index] = base_balance_value
+            loaded_values[index].append((
+                {
+                    'subscription_code': subscription_code,
+                },
+                base_balance_value,
+            ))
+        for index, cache_key in enumerate(cache_keys):
+            Cache.set_many(key=cache_key, items=loaded_values[index])
+
+        return {
+            subscription_code: tuple(values) for subscription_code, values in
+            base_balances.items()
+        }
+
+    @classmethod
+    def base_balance_value(cls, base_balance_cgrates):
+        """
+        :param base_balance_cgrates: topup_reset actions from CGRateS
+        :return: int value of base balance, 0 if there is no action
+        """
+        if base_balance_cgrates is None:
+            return int(0)
+
+        base_balance = ActionsV1Serializer(
+            data=base_balance_cgrates,
+            many=True,
+        )
+
+        if not base_balance.is_valid():
+            raise api_exceptions.ValidationError400(
+                base_balance.errors
+            )
+
+        base_balance = base_balance.data[0]
+
+        return int(float(base_balance['value']))
+
     @classmethod
     def set_topup_reset_action(
             cls,
@@ -1378,13 +1759,39 @@ class BasicService:
 
         return cdrs
 
+    @classmethod
+    def iter_cdrs(cls, page_size=None, **kwargs):
+        """
+        Stream CDRs page by page instead of loading all of them in one
+        response. Accepts the same filters as get_cdrs
+        :param page_size: number of CDRs per request to CGRateS
+        :param kwargs: filters of get_cdrs (except limit and offset)
+        :return: generator of minimal CDR objects
+        """
+        if page_size is None:
+            page_size = settings.CGG['CDRS_PAGE_SIZE']
+        kwargs.setdefault('order_by', 'SetupTime;asc')
+        offset = 0
+        while True:
+            cdrs = cls.get_cdrs(
+                limit=page_size,
+                offset=offset,
+                **kwargs
+            )
+            if not cdrs:
+                break
+            for cdr in cls.cdrs_minimal_object(cdrs):
+                yield cdr
+            if len(cdrs) < page_size:
+                break
+            offset += page_size
+
     @classmethod
     def set_account_availability(
             cls,
             subscription_code,
             new_condition,
     ):
-        print('befor delete_subscription_related_cache')
         cls.delete_subscription_related_cache(subscription_code)
 
         method = CGRatesMethods.set_account()
@@ -1468,6 +1875,9 @@ class BasicService:
         ]
 
         cls.__get_response(method, body)
+        if account_type == BasicConfigurations.Types.ACCOUNT_TYPE[0][0]:
+            # A not found account may be cached before it is added
+            cls.delete_subscription_related_cache(account_name)
 
         return True
 
@@ -2203,6 +2613,34 @@ class BasicService:
 
         return rate_object
 
+    @classmethod
+    def get_rates_batch(cls, rates):
+        """
+        Same as get_rate for several rates in one round trip
+        :param rates: list of rate ids
+        :return: dict of rate id -> rate object
+        """
+        method = CGRatesMethods.get_rate()
+        batch = cls.batch()
+        request_ids = {}
+        for rate in dict.fromkeys(rates):
+            request_ids[rate] = batch.add(method, [
+                {
+                    "TPid": CGRatesConventions.default_tariff_plans(),
+                    "ID": rate
+                }
+            ])
+        cls.execute_batch(batch)
+        rate_objects = {}
+        for rate, request_id in request_ids.items():
+            rate_serializer = RateSerializer(
+                data=batch.result(request_id),
+            )
+            if rate_serializer.is_valid(raise_exception=True):
+                rate_objects[rate] = rate_serializer.data
+
+        return rate_objects
+
     @classmethod
     def get_rates(cls, limit, offset):
         method = CGRatesMethods.get_rate_ids()
@@ -2236,6 +2674,39 @@ class BasicService:
 
         return destination_rate_object
 
+    @classmethod
+    def get_destination_rates_batch(cls, destination_rates):
+        """
+        Same as get_destination_rate for several destination rates in one
+        round trip. Failed calls are returned as exception objects
+        :param destination_rates: list of destination rate ids
+        :return: dict of destination rate id -> object or exception
+        """
+        method = CGRatesMethods.get_destination_rate()
+        batch = cls.batch()
+        request_ids = {}
+        for destination_rate in dict.fromkeys(destination_rates):
+            request_ids[destination_rate] = batch.add(method, [
+                {
+                    "TPid": CGRatesConventions.default_tariff_plans(),
+                    "ID": destination_rate
+                }
+            ])
+        cls.execute_batch(batch)
+        destination_rate_objects = {}
+        for destination_rate, request_id in request_ids.items():
+            try:
+                destination_rate_serializer = DestinationRateSerializer(
+                    data=batch.result(request_id),
+                )
+                if destination_rate_serializer.is_valid(raise_exception=True):
+                    destination_rate_objects[destination_rate] = \
+                        destination_rate_serializer.data
+            except api_exceptions.APIException as e:
+                destination_rate_objects[destination_rate] = e
+
+        return destination_rate_objects
+
     @classmethod
     def get_destination_rates(cls, limit, offset):
         method = CGRatesMethods.get_destination_rate_ids()
@@ -2650,14 +3121,7 @@ class BasicService:
         :param branch_code:
         :return:
         """
-        minimum_rate = Cache.get(
-            key=Cache.KEY_CONVENTIONS['minimum_rate'],
-            values={
-                'branch_code': branch_code,
-            },
-        )
-
-        if not minimum_rate:
+        def compute():
             try:
                 destination_rates = cls.get_destination_rate(
                     destination_rate=CGRatesConventions.destination_rate(
@@ -2665,10 +3129,12 @@ class BasicService:
                     )
                 )
                 rates_fee = []
+                rate_objects = cls.get_rates_batch([
+                    destination_rate["rate_id"] for destination_rate in
+                    destination_rates["destination_rates"]
+                ])
                 for destination_rate in destination_rates["destination_rates"]:
-                    rates = cls.get_rate(
-                        rate=destination_rate["rate_id"],
-                    )
+                    rates = rate_objects[destination_rate["rate_id"]]
                     for rate_slot in rates['rate_slots']:
                         rates_fee.append(
                             float(rate_slot['rate']) if float(
@@ -2688,13 +3154,15 @@ class BasicService:
             if minimum_rate < 1:
                 minimum_rate = 1
 
-            Cache.set(
-                key=Cache.KEY_CONVENTIONS['minimum_rate'],
-                values={
-                    'branch_code': branch_code,
-                },
-                store_value=minimum_rate,
-            )
+            return minimum_rate
+
+        minimum_rate = Cache.get_or_compute(
+            key=Cache.KEY_CONVENTIONS['minimum_rate'],
+            values={
+                'branch_code': branch_code,
+            },
+            compute=compute,
+        )
 
         return str(minimum_rate)
 
@@ -2705,14 +3173,7 @@ class BasicService:
         :param branch_code:
         :return:
         """
-        maximum_rate = Cache.get(
-            key=Cache.KEY_CONVENTIONS['maximum_rate'],
-            values={
-                'branch_code': branch_code,
-            },
-        )
-
-        if not maximum_rate:
+        def compute():
             rates_fee = []
             try:
                 rating_plans = cls.get_rating_plan(
@@ -2723,40 +3184,48 @@ class BasicService:
             except api_exceptions.APIException:
                 rating_plans = None
             if rating_plans:
-                for rating_plan in rating_plans['rating_plan_bindings']:
-                    if rating_plan['destination_rates_id'] != \
-                            CGRatesConventions.destination_rate(
-                                # @TODO: Not a good way though, think of a
-                                #  way to make this name dynamic
-                                "International",
-                            ):
-                        try:
-                            destination_rates = \
-                                cls.get_destination_rate(
-                                    rating_plan['destination_rates_id'],
-                                )
-                        except api_exceptions.APIException:
-                            destination_rates = None
-                        if destination_rates:
-                            fee = []
-                            for dr in destination_rates["destination_rates"]:
-                                rates = cls.get_rate(
-                                    rate=dr["rate_id"],
-                                )
-                                for rate_slot in rates['rate_slots']:
-                                    fee.append(
-                                        float(rate_slot['rate']) if float(
-                                            rate_slot['connect_fee']) == float(
-                                            0) else float(
-                                            rate_slot['connect_fee'])
-                                    )
-                            fee = list(
-                                filter(
-                                    lambda num: float(num) != float(0),
-                                    fee,
-                                )
+                destination_rates_ids = [
+                    rating_plan['destination_rates_id'] for rating_plan in
+                    rating_plans['rating_plan_bindings'] if
+                    rating_plan['destination_rates_id'] !=
+                    CGRatesConventions.destination_rate(
+                        # @TODO: Not a good way though, think of a
+                        #  way to make this name dynamic
+                        "International",
+                    )
+                ]
+                destination_rate_objects = [
+                    destination_rates for destination_rates in
+                    cls.get_destination_rates_batch(
+                        destination_rates_ids,
+                    ).values() if destination_rates and not isinstance(
+                        destination_rates,
+                        exceptions.APIException,
+                    )
+                ]
+                rate_objects = cls.get_rates_batch([
+                    dr["rate_id"] for destination_rates in
+                    destination_rate_objects for dr in
+                    destination_rates["destination_rates"]
+                ])
+                for destination_rates in destination_rate_objects:
+                    fee = []
+                    for dr in destination_rates["destination_rates"]:
+                        rates = rate_objects[dr["rate_id"]]
+                        for rate_slot in rates['rate_slots']:
+                            fee.append(
+                                float(rate_slot['rate']) if float(
+                                    rate_slot['connect_fee']) == float(
+                                    0) else float(
+                                    rate_slot['connect_fee'])
                             )
-                            rates_fee.extend(fee)
+                    fee = list(
+                        filter(
+                            lambda num: float(num) != float(0),
+                            fee,
+                        )
+                    )
+                    rates_fee.extend(fee)
 
             if len(rates_fee):
                 maximum_rate = max(rates_fee)
@@ -2765,13 +3234,15 @@ class BasicService:
             else:
                 maximum_rate = 1
 
-            Cache.set(
-                key=Cache.KEY_CONVENTIONS['maximum_rate'],
-                values={
-                    'branch_code': branch_code,
-                },
-                store_value=maximum_rate,
-            )
+            return maximum_rate
+
+        maximum_rate = Cache.get_or_compute(
+            key=Cache.KEY_CONVENTIONS['maximum_rate'],
+            values={
+                'branch_code': branch_code,
+            },
+            compute=compute,
+        )
 
         return str(maximum_rate)
 
@@ -20,6 +20,7 @@ from cgg.apps.basic.versions.v1.serializers.cgrates import (
     ReverseTimingSerializer,
 )
 from cgg.apps.basic.versions.v1.services.basic import BasicService
+from cgg.apps.cdr.replica import CDRReplicaService
 from cgg.core import api_exceptions
 from cgg.core.tools import Tools
 
@@ -125,15 +126,19 @@ class CGRateSService:
         if 'created_at_end' in query_params:
             created_at_end = query_params['created_at_end']
 
-        cdrs_count = BasicService.get_cdrs_count(
-            subscription_codes=subscription_codes,
-            setup_time_start=setup_time_start,
-            setup_time_end=setup_time_end,
-            created_at_start=created_at_start,
-            created_at_end=created_at_end,
-            destination_prefixes=destination_prefixes,
-            not_destination_prefixes=not_destination_prefixes,
-        )
+        filters = {
+            'subscription_codes': subscription_codes,
+            'setup_time_start': setup_time_start,
+            'setup_time_end': setup_time_end,
+            'created_at_start': created_at_start,
+            'created_at_end': created_at_end,
+            'destination_prefixes': destination_prefixes,
+            'not_destination_prefixes': not_destination_prefixes,
+        }
+        # Count in the CDR replica if it covers the requested period
+        cdrs_count = CDRReplicaService.get_cdrs_count(**filters)
+        if cdrs_count is None:
+            cdrs_count = BasicService.get_cdrs_count(**filters)
 
         return cdrs_count
 
@@ -184,17 +189,21 @@ class CGRateSService:
         if 'created_at_end' in query_params:
             created_at_end = query_params['created_at_end']
 
-        cdr_from_cgrates = BasicService.get_cdrs(
-            subscription_codes=subscription_codes,
-            setup_time_start=setup_time_start,
-            setup_time_end=setup_time_end,
-            created_at_start=created_at_start,
-            created_at_end=created_at_end,
-            destination_prefixes=destination_prefixes,
-            not_destination_prefixes=not_destination_prefixes,
-            limit=limit,
-            offset=offset,
-        )
+        filters = {
+            'subscription_codes': subscription_codes,
+            'setup_time_start': setup_time_start,
+            'setup_time_end': setup_time_end,
+            'created_at_start': created_at_start,
+            'created_at_end': created_at_end,
+            'destination_prefixes': destination_prefixes,
+            'not_destination_prefixes': not_destination_prefixes,
+            'limit': limit,
+            'offset': offset,
+        }
+        # Read from the CDR replica if it covers the requested period
+        cdr_from_cgrates = CDRReplicaService.get_cdrs(**filters)
+        if cdr_from_cgrates is None:
+            cdr_from_cgrates = BasicService.get_cdrs(**filters)
 
         cdr_objects = BasicService.cdrs_object(
             cdr_from_cgrates,
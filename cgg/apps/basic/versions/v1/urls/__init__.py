@@ -199,6 +199,22 @@ urls = [
         name='basic_reload_plans'
     ),
 
+    ############################################
+    #       HTTP connection pool related URLs  #
+    ############################################
+    # Statistics of shared outgoing HTTP session (per process)
+    re_path(
+        r'^(?:v1/)?http-pool(?:/)?$',
+        api.HTTPPoolAPIView.as_view(),
+        name='basic_http_pool'
+    ),
+    # Hit and miss counters of cache (per process)
+    re_path(
+        r'^(?:v1/)?cache-stats(?:/)?$',
+        api.CacheStatsAPIView.as_view(),
+        name='basic_cache_stats'
+    ),
+
     ############################################
     #              API for testing             #
     ############################################
@@ -0,0 +1,77 @@
+from django.contrib import admin
+
+from cgg.apps.cdr.models import CDR, CDRSyncState, UsageRollup
+
+
+@admin.register(CDR)
+class CDRAdmin(admin.ModelAdmin):
+    date_hierarchy = 'created_at'
+    search_fields = ['cgr_id', 'account', 'destination', 'origin_id', ]
+    list_display = (
+        'cgr_id',
+        'account',
+        'destination',
+        'usage',
+        'cost',
+        'balance_type',
+        'call_direction',
+        'setup_time',
+        'created_at',
+    )
+    list_filter = (
+        'call_direction',
+        'balance_type',
+    )
+    ordering = ('-created_at',)
+    list_per_page = 20
+    show_full_result_count = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(CDRSyncState)
+class CDRSyncStateAdmin(admin.ModelAdmin):
+    list_display = (
+        'synced_from',
+        'high_water_mark',
+        'synced_count',
+        'last_run_at',
+        'rolled_up_to',
+    )
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(UsageRollup)
+class UsageRollupAdmin(admin.ModelAdmin):
+    date_hierarchy = 'day'
+    search_fields = ['subscription_code', ]
+    list_display = (
+        'subscription_code',
+        'day',
+        'category',
+        'balance_type',
+        'rounded_usage',
+        'cost',
+        'cdr_count',
+    )
+    list_filter = (
+        'category',
+        'balance_type',
+    )
+    ordering = ('-day',)
+    list_per_page = 20
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
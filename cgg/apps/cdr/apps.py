@@ -0,0 +1,5 @@
+from django.apps import AppConfig
+
+
+class CDRConfig(AppConfig):
+    name = 'cgg.apps.cdr'
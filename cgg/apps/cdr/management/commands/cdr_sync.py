@@ -0,0 +1,45 @@
+# --------------------------------------------------------------------------
+# Pull new and re-rated CDRs from CGRateS into the local CDR replica. Runs
+# every few minutes, each run continues from the high water mark. Daily usage
+# rollups of the days that have new CDRs are rebuilt after each run.
+# (C) 2023 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - cdr_sync.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+from django.core.management.base import BaseCommand
+
+from cgg.apps.cdr.replica import CDRReplicaService
+from cgg.apps.finance.decorators import log_command
+from cgg.apps.finance.versions.v1.config import FinanceConfigurations
+from cgg.apps.finance.versions.v1.services.usage_rollup import (
+    UsageRollupService,
+)
+
+
+class Command(BaseCommand):
+    help = 'Replicate rated CDRs of CGRateS to the cdr database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild-rollups',
+            action='store_true',
+            help='Rebuild usage rollups of all replicated CDRs (after '
+                 'prefixes or branches are changed)'
+        )
+
+    @log_command(command_title=FinanceConfigurations.Commands.TYPES[16][0])
+    def handle(self, *args, **options):
+        if not CDRReplicaService.is_enabled():
+            self.stdout.write("CDR replica is disabled")
+            return
+        fetched = CDRReplicaService.sync()
+        state = CDRReplicaService.get_state()
+        self.stdout.write(
+            f"{fetched} CDRs are synced, high water mark: "
+            f"{state.high_water_mark}"
+        )
+        rebuilt = UsageRollupService.refresh(
+            rebuild=options['rebuild_rollups'],
+        )
+        self.stdout.write(f"Usage rollups of {rebuilt} days are rebuilt")
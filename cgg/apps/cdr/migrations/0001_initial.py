@@ -0,0 +1,65 @@
+# Generated by Django 3.1.14 on 2023-01-08 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CDR',
+            fields=[
+                ('cgr_id', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('run_id', models.CharField(max_length=64)),
+                ('order_id', models.CharField(blank=True, default='', max_length=32)),
+                ('origin_host', models.CharField(blank=True, default='', max_length=128)),
+                ('origin_id', models.CharField(blank=True, default='', max_length=256)),
+                ('source', models.CharField(blank=True, default='', max_length=128)),
+                ('type_of_record', models.CharField(blank=True, default='', max_length=32)),
+                ('request_type', models.CharField(blank=True, default='', max_length=32)),
+                ('tenant', models.CharField(blank=True, default='', max_length=128)),
+                ('category', models.CharField(blank=True, default='', max_length=128)),
+                ('account', models.CharField(max_length=256)),
+                ('subject', models.CharField(blank=True, default='', max_length=256)),
+                ('destination', models.CharField(blank=True, default='', max_length=128)),
+                ('cost_source', models.CharField(blank=True, default='', max_length=128)),
+                ('usage', models.BigIntegerField(default=0)),
+                ('cost', models.DecimalField(decimal_places=8, default=0, max_digits=24)),
+                ('setup_time', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField()),
+                ('balance_type', models.CharField(blank=True, default='', max_length=32)),
+                ('call_direction', models.CharField(blank=True, default='', max_length=32)),
+                ('operator_name', models.CharField(blank=True, default='', max_length=128)),
+                ('extra_fields', models.JSONField(blank=True, null=True)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CDRSyncState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('synced_from', models.DateTimeField()),
+                ('high_water_mark', models.DateTimeField()),
+                ('synced_count', models.BigIntegerField(default=0)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='cdr',
+            index=models.Index(fields=['created_at'], name='cdr_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cdr',
+            index=models.Index(fields=['account', 'created_at'], name='cdr_account_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cdr',
+            index=models.Index(fields=['call_direction', 'created_at'], name='cdr_direction_created_at_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.1.14 on 2023-01-15 09:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cdr', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cdrsyncstate',
+            name='rolled_up_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cdrsyncstate',
+            name='rolled_up_to',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='UsageRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subscription_code', models.CharField(max_length=256)),
+                ('day', models.DateField()),
+                ('category', models.CharField(max_length=32)),
+                ('balance_type', models.CharField(blank=True, default='', max_length=32)),
+                ('branch_id', models.CharField(blank=True, max_length=64, null=True)),
+                ('usage', models.BigIntegerField(default=0)),
+                ('rounded_usage', models.BigIntegerField(default=0)),
+                ('cost', models.DecimalField(decimal_places=8, default=0, max_digits=24)),
+                ('cdr_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('subscription_code', 'day', 'category', 'balance_type')},
+            },
+        ),
+    ]
@@ -0,0 +1,98 @@
+from django.db import models
+from django.db.models import JSONField
+
+
+class CDR(models.Model):
+    """
+    A rated CDR replicated from CGRateS (default charger only), cost details
+    are not kept
+    """
+    cgr_id = models.CharField(primary_key=True, max_length=64)
+    run_id = models.CharField(max_length=64)
+    order_id = models.CharField(max_length=32, blank=True, default='')
+    origin_host = models.CharField(max_length=128, blank=True, default='')
+    origin_id = models.CharField(max_length=256, blank=True, default='')
+    source = models.CharField(max_length=128, blank=True, default='')
+    type_of_record = models.CharField(max_length=32, blank=True, default='')
+    request_type = models.CharField(max_length=32, blank=True, default='')
+    tenant = models.CharField(max_length=128, blank=True, default='')
+    category = models.CharField(max_length=128, blank=True, default='')
+    account = models.CharField(max_length=256)
+    subject = models.CharField(max_length=256, blank=True, default='')
+    destination = models.CharField(max_length=128, blank=True, default='')
+    cost_source = models.CharField(max_length=128, blank=True, default='')
+    # Nanoseconds
+    usage = models.BigIntegerField(default=0)
+    cost = models.DecimalField(max_digits=24, decimal_places=8, default=0)
+    setup_time = models.DateTimeField(db_index=True)
+    # Time the CDR is created in CGRateS, filters of CreatedAtStart and
+    # CreatedAtEnd are applied on this field
+    created_at = models.DateTimeField()
+    balance_type = models.CharField(max_length=32, blank=True, default='')
+    call_direction = models.CharField(max_length=32, blank=True, default='')
+    operator_name = models.CharField(max_length=128, blank=True, default='')
+    extra_fields = JSONField(null=True, blank=True)
+    synced_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['created_at'],
+                name='cdr_created_at_idx',
+            ),
+            models.Index(
+                fields=['account', 'created_at'],
+                name='cdr_account_created_at_idx',
+            ),
+            models.Index(
+                fields=['call_direction', 'created_at'],
+                name='cdr_direction_created_at_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return self.cgr_id
+
+
+class CDRSyncState(models.Model):
+    """
+    High water mark of the CDR replica, there is only one row
+    """
+    # CDRs created before synced_from are not replicated
+    synced_from = models.DateTimeField()
+    # CDRs created before high_water_mark are replicated
+    high_water_mark = models.DateTimeField()
+    synced_count = models.BigIntegerField(default=0)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    # CDRs synced before rolled_up_at are in UsageRollup, days that end
+    # before rolled_up_to have complete rollups
+    rolled_up_at = models.DateTimeField(null=True, blank=True)
+    rolled_up_to = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class UsageRollup(models.Model):
+    """
+    Usage and cost of CDRs of a subscription in a day by usage category and
+    balance type. Usage is in nanoseconds, rounded_usage is rounded per CDR
+    the same as invoices
+    """
+    subscription_code = models.CharField(max_length=256)
+    day = models.DateField()
+    category = models.CharField(max_length=32)
+    balance_type = models.CharField(max_length=32, blank=True, default='')
+    # Branch of the subscription when CDRs were classified
+    branch_id = models.CharField(max_length=64, null=True, blank=True)
+    usage = models.BigIntegerField(default=0)
+    rounded_usage = models.BigIntegerField(default=0)
+    cost = models.DecimalField(max_digits=24, decimal_places=8, default=0)
+    cdr_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (
+            'subscription_code',
+            'day',
+            'category',
+            'balance_type',
+        )
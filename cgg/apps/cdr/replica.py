@@ -0,0 +1,538 @@
+# --------------------------------------------------------------------------
+# Replicate rated CDRs of CGRateS to the cdr database. Each sync pulls CDRs
+# created since the high water mark (minus a lookback window for late and
+# re-rated CDRs) and upserts them by CGRID. Periods that are replicated are
+# read and aggregated locally, the rest is read from CGRateS.
+# (C) 2023 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - replica.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+
+import logging
+import re
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q, Sum
+
+from cgg.apps.basic.versions.v1.config.cgrates_conventions import (
+    CGRatesConventions,
+)
+from cgg.apps.basic.versions.v1.services.basic import BasicService
+from cgg.apps.cdr.models import CDR, CDRSyncState
+
+logger = logging.getLogger('common')
+
+# Columns of CDR that are filled from ExtraFields of CGRateS
+EXTRA_FIELD_COLUMNS = {
+    CGRatesConventions.extra_field_balance_type(): 'balance_type',
+    CGRatesConventions.extra_field_direction(): 'call_direction',
+    CGRatesConventions.extra_field_operator(): 'operator_name',
+}
+
+
+def to_timestamp(value):
+    """
+    :param value: datetime
+    :return: timestamp without milliseconds as used in CGRateS filters
+    """
+    return str(value.timestamp()).split('.')[0]
+
+
+class CDRReplicaService:
+    FRACTION_PATTERN = re.compile(r'\.(\d+)')
+
+    @classmethod
+    def database(cls):
+        return router.db_for_write(CDR)
+
+    @classmethod
+    def is_enabled(cls):
+        return settings.CGG['CDR_REPLICA']['ENABLED']
+
+    @classmethod
+    def get_state(cls):
+        return CDRSyncState.objects.order_by('id').first()
+
+    @classmethod
+    def parse_time(cls, value):
+        """
+        :param value: RFC 3339 time of CGRateS, nanoseconds are cut
+        :return: naive local datetime or None
+        """
+        if not value:
+            return None
+        value = cls.FRACTION_PATTERN.sub(
+            lambda match: '.' + match.group(1)[:6].ljust(6, '0'),
+            str(value).replace('Z', '+00:00'),
+        )
+        try:
+            parsed = datetime.fromisoformat(value)
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone().replace(tzinfo=None)
+        except (ValueError, OverflowError):
+            return None
+        # Zero time of CGRateS
+        if parsed.year <= 1:
+            return None
+
+        return parsed
+
+    @classmethod
+    def row(cls, cdr, window_start, window_end, synced_at):
+        """
+        :param cdr: a CDR of CGRateS
+        :param window_start: CreatedAtStart of the sync
+        :param window_end: CreatedAtEnd of the sync
+        :param synced_at:
+        :return: dict of CDR fields
+        """
+        extra_fields = cdr.get('ExtraFields') or {}
+        try:
+            usage = int(Decimal(str(cdr.get('Usage') or 0)))
+            cost = Decimal(str(cdr.get('Cost') or 0))
+        except InvalidOperation:
+            usage = 0
+            cost = Decimal(0)
+        setup_time = cls.parse_time(cdr.get('SetupTime'))
+        created_at = cls.parse_time(cdr.get('CreatedAt'))
+        if created_at is None:
+            # CDRs are created when calls end
+            if setup_time is not None:
+                created_at = setup_time + timedelta(microseconds=usage // 1000)
+            else:
+                created_at = window_start
+            created_at = min(
+                max(created_at, window_start),
+                window_end - timedelta(microseconds=1),
+            )
+        row = {
+            'cgr_id': cdr['CGRID'],
+            'run_id': cdr.get('RunID') or '',
+            'order_id': str(cdr.get('OrderID') or ''),
+            'origin_host': cdr.get('OriginHost') or '',
+            'origin_id': cdr.get('OriginID') or '',
+            'source': cdr.get('Source') or '',
+            'type_of_record': cdr.get('ToR') or '',
+            'request_type': cdr.get('RequestType') or '',
+            'tenant': cdr.get('Tenant') or '',
+            'category': cdr.get('Category') or '',
+            'account': cdr.get('Account') or '',
+            'subject': cdr.get('Subject') or '',
+            'destination': cdr.get('Destination') or '',
+            'cost_source': cdr.get('CostSource') or '',
+            'usage': usage,
+            'cost': cost,
+            'setup_time': setup_time or created_at,
+            'created_at': created_at,
+            'extra_fields': extra_fields,
+            'synced_at': synced_at,
+        }
+        for name, column in EXTRA_FIELD_COLUMNS.items():
+            row[column] = str(extra_fields.get(name) or '')
+
+        return row
+
+    @classmethod
+    def upsert(cls, rows):
+        """
+        Insert CDRs or replace the stored ones with the same CGRID, created_at
+        of a stored CDR is kept so it stays in the same period
+        :param rows: list of dicts of CDR fields
+        :return:
+        """
+        rows = list({row['cgr_id']: row for row in rows}.values())
+        if not rows:
+            return
+        connection = connections[cls.database()]
+        quote_name = connection.ops.quote_name
+        fields = [CDR._meta.get_field(name) for name in rows[0].keys()]
+        columns = ', '.join(quote_name(field.column) for field in fields)
+        updates = ', '.join(
+            f"{quote_name(field.column)} = EXCLUDED.{quote_name(field.column)}"
+            for field in fields
+            if field.name not in ('cgr_id', 'created_at')
+        )
+        placeholders = f"({', '.join(['%s'] * len(fields))})"
+        params = []
+        for row in rows:
+            params.extend(
+                field.get_db_prep_save(row[field.name], connection)
+                for field in fields
+            )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote_name(CDR._meta.db_table)} ({columns}) "
+                f"VALUES {', '.join([placeholders] * len(rows))} "
+                f"ON CONFLICT ({quote_name(CDR._meta.pk.column)}) "
+                f"DO UPDATE SET {updates}",
+                params,
+            )
+
+    @classmethod
+    def sync(cls, now=None, page_size=None):
+        """
+        Pull CDRs created from the high water mark minus LOOKBACK up to now
+        (at most MAX_WINDOW ahead of the high water mark) and upsert them
+        :param now:
+        :param page_size: number of CDRs per request to CGRateS
+        :return: number of fetched CDRs
+        """
+        replica_config = settings.CGG['CDR_REPLICA']
+        if now is None:
+            now = datetime.now()
+        if page_size is None:
+            page_size = settings.CGG['CDRS_PAGE_SIZE']
+        state = cls.get_state()
+        if state is None:
+            synced_from = (now - timedelta(
+                days=replica_config['INITIAL_DAYS'],
+            )).replace(microsecond=0)
+            state = CDRSyncState()
+            state.synced_from = synced_from
+            state.high_water_mark = synced_from
+        window_start = max(
+            state.synced_from,
+            state.high_water_mark - timedelta(
+                seconds=replica_config['LOOKBACK'],
+            ),
+        )
+        window_end = min(
+            now,
+            state.high_water_mark + timedelta(
+                seconds=replica_config['MAX_WINDOW'],
+            ),
+        ).replace(microsecond=0)
+        if window_end <= window_start:
+            return 0
+
+        fetched = 0
+        offset = 0
+        while True:
+            cdrs = BasicService.get_cdrs(
+                created_at_start=to_timestamp(window_start),
+                created_at_end=to_timestamp(window_end),
+                order_by='SetupTime;asc',
+                limit=page_size,
+                offset=offset,
+            )
+            if not cdrs:
+                break
+            synced_at = datetime.now()
+            cls.upsert([
+                cls.row(cdr, window_start, window_end, synced_at)
+                for cdr in cdrs if cdr.get('CGRID')
+            ])
+            fetched += len(cdrs)
+            if len(cdrs) < page_size:
+                break
+            offset += page_size
+        state.high_water_mark = max(state.high_water_mark, window_end)
+        state.synced_count += fetched
+        state.last_run_at = datetime.now()
+        state.save()
+        logger.info(
+            "CDR replica: %s CDRs from %s to %s",
+            fetched,
+            window_start,
+            window_end,
+        )
+
+        return fetched
+
+    @classmethod
+    def local_end(cls, from_date, to_date=None):
+        """
+        Part of a period that is replicated
+        :param from_date: start of the period
+        :param to_date: end of the period, None is now
+        :return: end of the replicated part or None if the period can not
+        be read locally
+        """
+        if from_date is None or not cls.is_enabled():
+            return None
+        state = cls.get_state()
+        if state is None or from_date < state.synced_from:
+            return None
+        if to_date is None or to_date > state.high_water_mark:
+            return state.high_water_mark
+
+        return to_date
+
+    @classmethod
+    def queryset(
+            cls,
+            subscription_codes=None,
+            setup_time_start=None,
+            setup_time_end=None,
+            created_at_start=None,
+            created_at_end=None,
+            destination_prefixes=None,
+            not_destination_prefixes=None,
+            extra_fields=None,
+    ):
+        """
+        Local CDRs with the same filters as BasicService.get_cdrs, times are
+        datetimes
+        :return: QuerySet of CDR
+        """
+        queryset = CDR.objects.all()
+        if subscription_codes:
+            queryset = queryset.filter(account__in=[
+                CGRatesConventions.account_name(code)
+                for code in subscription_codes
+            ])
+        if setup_time_start is not None:
+            queryset = queryset.filter(setup_time__gte=setup_time_start)
+        if setup_time_end is not None:
+            queryset = queryset.filter(setup_time__lt=setup_time_end)
+        if created_at_start is not None:
+            queryset = queryset.filter(created_at__gte=created_at_start)
+        if created_at_end is not None:
+            queryset = queryset.filter(created_at__lt=created_at_end)
+        if destination_prefixes:
+            condition = Q()
+            for prefix in destination_prefixes:
+                condition |= Q(destination__startswith=prefix)
+            queryset = queryset.filter(condition)
+        for prefix in not_destination_prefixes or []:
+            queryset = queryset.exclude(destination__startswith=prefix)
+        for name, value in (extra_fields or {}).items():
+            column = EXTRA_FIELD_COLUMNS.get(name, f'extra_fields__{name}')
+            queryset = queryset.filter(**{column: value})
+
+        return queryset
+
+    @classmethod
+    def minimal_object(cls, values):
+        """
+        :param values: dict of CDR fields
+        :return: the same fields as BasicService.cdrs_minimal_object
+        """
+        return {
+            'id': values['cgr_id'],
+            'cgr_id': values['cgr_id'],
+            'account': values['account'],
+            'category': values['category'],
+            'destination': values['destination'],
+            'usage': str(values['usage']),
+            'cost': str(values['cost']),
+            'extra_fields': {
+                'balance_type': values['balance_type'],
+            },
+        }
+
+    @classmethod
+    def external_object(cls, cdr):
+        """
+        :param cdr: CDR
+        :return: CDR in the format of CGRateS, for BasicService.cdrs_object
+        """
+        return {
+            'CGRID': cdr.cgr_id,
+            'RunID': cdr.run_id,
+            'OrderID': cdr.order_id,
+            'OriginHost': cdr.origin_host,
+            'OriginID': cdr.origin_id,
+            'Source': cdr.source,
+            'ToR': cdr.type_of_record,
+            'RequestType': cdr.request_type,
+            'Tenant': cdr.tenant,
+            'Category': cdr.category,
+            'Account': cdr.account,
+            'CostSource': cdr.cost_source,
+            'Usage': str(cdr.usage),
+            'Destination': cdr.destination,
+            'Cost': str(cdr.cost),
+            'SetupTime': cdr.setup_time.isoformat(),
+            'CostDetails': None,
+            'ExtraFields': cdr.extra_fields,
+        }
+
+    @classmethod
+    def iter_cdrs(cls, from_date, to_date=None, **filters):
+        """
+        Minimal CDR objects created in a period, the replicated part is read
+        locally and the rest is streamed from CGRateS
+        :param from_date: datetime or None for all CDRs
+        :param to_date: datetime or None for now
+        :param filters: subscription_codes, destination_prefixes and
+        extra_fields
+        :return: generator of minimal CDR objects
+        """
+        remote_start = from_date
+        local_end = cls.local_end(from_date, to_date)
+        if local_end is not None:
+            for values in cls.queryset(
+                    created_at_start=from_date,
+                    created_at_end=local_end,
+                    **filters
+            ).order_by().values(
+                'cgr_id',
+                'account',
+                'category',
+                'destination',
+                'usage',
+                'cost',
+                'balance_type',
+            ).iterator(chunk_size=settings.CGG['CDRS_PAGE_SIZE']):
+                yield cls.minimal_object(values)
+            if to_date is not None and local_end >= to_date:
+                return
+            remote_start = max(from_date, local_end)
+
+        yield from BasicService.iter_cdrs(
+            created_at_start=to_timestamp(remote_start) if
+            remote_start else "",
+            created_at_end=to_timestamp(to_date) if to_date else None,
+            **filters
+        )
+
+    @classmethod
+    def totals(cls, from_date, to_date=None, by_balance_type=False,
+               **filters):
+        """
+        Sum of usage and cost of CDRs created in a period, the replicated
+        part is aggregated in database
+        :param from_date: datetime or None for all CDRs
+        :param to_date: datetime or None for now
+        :param by_balance_type: group sums by BalanceType of CDRs
+        :param filters: subscription_codes, destination_prefixes and
+        extra_fields
+        :return: dict of balance type (None if not grouped) -> dict of usage
+        and cost
+        """
+        totals = {}
+
+        def add(key, usage, cost):
+            total = totals.setdefault(key, {
+                'usage': Decimal(0),
+                'cost': Decimal(0),
+            })
+            total['usage'] += Decimal(usage or 0)
+            total['cost'] += Decimal(cost or 0)
+
+        remote_start = from_date
+        local_end = cls.local_end(from_date, to_date)
+        if local_end is not None:
+            queryset = cls.queryset(
+                created_at_start=from_date,
+                created_at_end=local_end,
+                **filters
+            ).order_by()
+            if by_balance_type:
+                rows = queryset.values('balance_type').annotate(
+                    total_usage=Sum('usage'),
+                    total_cost=Sum('cost'),
+                )
+            else:
+                rows = [queryset.aggregate(
+                    total_usage=Sum('usage'),
+                    total_cost=Sum('cost'),
+                )]
+            for row in rows:
+                add(
+                    row['balance_type'] if by_balance_type else None,
+                    row['total_usage'],
+                    row['total_cost'],
+                )
+            if to_date is not None and local_end >= to_date:
+                return totals
+            remote_start = max(from_date, local_end)
+
+        used_cdrs = set()
+        for cdr in BasicService.iter_cdrs(
+                created_at_start=to_timestamp(remote_start) if
+                remote_start else "",
+                created_at_end=to_timestamp(to_date) if to_date else None,
+                **filters
+        ):
+            if cdr['cgr_id'] in used_cdrs:
+                continue
+            used_cdrs.add(cdr['cgr_id'])
+            add(
+                cdr['extra_fields']['balance_type'] if by_balance_type
+                else None,
+                cdr['usage'],
+                cdr['cost'],
+            )
+
+        return totals
+
+    @classmethod
+    def listing_queryset(cls, setup_time_start, created_at_start, **filters):
+        """
+        Local CDRs for listing if the replica covers the requested period
+        :param setup_time_start: timestamp or None
+        :param created_at_start: timestamp or None
+        :param filters: filters of queryset, times are timestamps
+        :return: QuerySet of CDR or None to read from CGRateS
+        """
+        if not cls.is_enabled():
+            return None
+        state = cls.get_state()
+        if state is None:
+            return None
+        try:
+            times = {
+                name: datetime.fromtimestamp(float(value)) if value else None
+                for name, value in (
+                    ('setup_time_start', setup_time_start),
+                    ('created_at_start', created_at_start),
+                    ('setup_time_end', filters.pop('setup_time_end', None)),
+                    ('created_at_end', filters.pop('created_at_end', None)),
+                )
+            }
+        except (TypeError, ValueError, OverflowError):
+            return None
+        starts = [
+            value for value in (
+                times['setup_time_start'],
+                times['created_at_start'],
+            ) if value is not None
+        ]
+        if not starts or max(starts) < state.synced_from:
+            return None
+        # CDRs created after high_water_mark are not replicated yet, a call
+        # ends after it is set up so only created_at bounds the creation
+        if times['created_at_end'] is None or \
+                times['created_at_end'] > state.high_water_mark:
+            return None
+
+        return cls.queryset(**times, **filters)
+
+    @classmethod
+    def get_cdrs(cls, limit=None, offset=None, **filters):
+        """
+        A page of local CDRs in the format of CGRateS
+        :param limit:
+        :param offset:
+        :param filters: the same filters as BasicService.get_cdrs
+        :return: list of CDRs or None to read from CGRateS
+        """
+        queryset = cls.listing_queryset(**filters)
+        if queryset is None:
+            return None
+        offset = offset or 0
+        queryset = queryset.order_by('-setup_time', 'cgr_id')
+        if limit is not None:
+            queryset = queryset[offset:offset + limit]
+        else:
+            queryset = queryset[offset:]
+
+        return [cls.external_object(cdr) for cdr in queryset]
+
+    @classmethod
+    def get_cdrs_count(cls, **filters):
+        """
+        :param filters: the same filters as BasicService.get_cdrs_count
+        :return: number of local CDRs or None to count in CGRateS
+        """
+        queryset = cls.listing_queryset(**filters)
+        if queryset is None:
+            return None
+
+        return queryset.count()
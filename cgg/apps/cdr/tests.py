@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+
+from cgg.apps.cdr.models import CDR, CDRSyncState
+from cgg.apps.cdr.replica import CDRReplicaService
+from cgg.core.testing import cgg_settings
+
+
+class CDRReplicaTestCase(TestCase):
+    databases = {'default', 'cdr'}
+
+    def setUp(self):
+        self.window_start = datetime(2023, 1, 1, 10, 0)
+        self.window_end = datetime(2023, 1, 1, 11, 0)
+        self.cdr = {
+            'CGRID': 'f0c6d2a1',
+            'RunID': '*default',
+            'OrderID': 1672556400000000000,
+            'OriginID': 'call-1',
+            'ToR': '*voice',
+            'RequestType': '*postpaid',
+            'Tenant': 'respina.net',
+            'Category': 'call',
+            'Account': 'AN_1000',
+            'Destination': '00989121234567',
+            'SetupTime': '2023-01-01T10:10:00.123456789Z',
+            'Usage': 60000000000,
+            'Cost': 120.5,
+            'ExtraFields': {
+                'BalanceType': 'postpaid',
+                'CallDirection': 'outbound',
+            },
+        }
+
+    def test_parse_time(self):
+        parsed = CDRReplicaService.parse_time('2023-01-01T10:10:00.5+00:00')
+        self.assertEqual(parsed.microsecond, 500000)
+        self.assertIsNone(parsed.tzinfo)
+        self.assertIsNone(CDRReplicaService.parse_time(''))
+        self.assertIsNone(CDRReplicaService.parse_time('not a time'))
+
+    def test_row_created_at_is_in_window(self):
+        row = CDRReplicaService.row(
+            self.cdr,
+            self.window_start,
+            self.window_end,
+            datetime.now(),
+        )
+        self.assertEqual(row['usage'], 60000000000)
+        self.assertEqual(row['cost'], Decimal('120.5'))
+        self.assertEqual(row['balance_type'], 'postpaid')
+        self.assertEqual(row['call_direction'], 'outbound')
+        self.assertGreaterEqual(row['created_at'], self.window_start)
+        self.assertLess(row['created_at'], self.window_end)
+
+    def test_upsert_replaces_re_rated_cdr(self):
+        synced_at = datetime.now()
+        row = CDRReplicaService.row(
+            self.cdr,
+            self.window_start,
+            self.window_end,
+            synced_at,
+        )
+        CDRReplicaService.upsert([row])
+        re_rated = dict(self.cdr, Cost=99)
+        CDRReplicaService.upsert([CDRReplicaService.row(
+            re_rated,
+            self.window_end,
+            self.window_end + timedelta(hours=1),
+            synced_at,
+        )])
+        cdr = CDR.objects.get(cgr_id=self.cdr['CGRID'])
+        self.assertEqual(cdr.cost, Decimal(99))
+        self.assertEqual(cdr.created_at, row['created_at'])
+
+    def test_totals_of_replicated_period(self):
+        CDRReplicaService.upsert([CDRReplicaService.row(
+            self.cdr,
+            self.window_start,
+            self.window_end,
+            datetime.now(),
+        )])
+        state = CDRSyncState()
+        state.synced_from = self.window_start
+        state.high_water_mark = self.window_end
+        state.save()
+        with cgg_settings('CDR_REPLICA', ENABLED=True):
+            self.assertEqual(
+                CDRReplicaService.local_end(self.window_start),
+                self.window_end,
+            )
+            self.assertIsNone(CDRReplicaService.local_end(
+                self.window_start - timedelta(seconds=1),
+            ))
+            totals = CDRReplicaService.totals(
+                self.window_start,
+                self.window_end,
+                by_balance_type=True,
+                subscription_codes=['1000'],
+            )
+        self.assertEqual(totals['postpaid']['cost'], Decimal('120.5'))
+        self.assertEqual(totals['postpaid']['usage'], Decimal(60000000000))
+
+    def test_listing_after_high_water_mark_reads_cgrates(self):
+        CDRReplicaService.upsert([CDRReplicaService.row(
+            self.cdr,
+            self.window_start,
+            self.window_end,
+            datetime.now(),
+        )])
+        state = CDRSyncState()
+        state.synced_from = self.window_start
+        state.high_water_mark = self.window_end
+        state.save()
+        start = self.window_start.timestamp()
+        with cgg_settings('CDR_REPLICA', ENABLED=True):
+            self.assertEqual(CDRReplicaService.get_cdrs_count(
+                setup_time_start=None,
+                created_at_start=start,
+                created_at_end=self.window_end.timestamp(),
+            ), 1)
+            self.assertIsNone(CDRReplicaService.get_cdrs_count(
+                setup_time_start=None,
+                created_at_start=start,
+                created_at_end=None,
+            ))
+            self.assertIsNone(CDRReplicaService.get_cdrs(
+                setup_time_start=None,
+                created_at_start=start,
+                created_at_end=(
+                    self.window_end + timedelta(minutes=1)
+                ).timestamp(),
+            ))
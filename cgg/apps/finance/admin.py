@@ -14,8 +14,12 @@ from cgg.apps.finance.models import (
     CreditInvoice,
     Customer,
     Destination,
+    ExportJob,
     FailedJob,
+    IntegrityMismatch,
+    IntegrityScan,
     Invoice,
+    InvoiceRun,
     Operator,
     Package,
     PackageInvoice,
@@ -24,6 +28,7 @@ from cgg.apps.finance.models import (
     RuntimeConfig,
     Subscription,
     Tax,
+    TrunkNotification,
 )
 from cgg.apps.finance.versions.v1.config import FinanceConfigurations
 from cgg.apps.finance.versions.v1.serializers.destination import (
@@ -45,6 +50,9 @@ from cgg.apps.finance.versions.v1.services.package import PackageService
 from cgg.apps.finance.versions.v1.services.subscription import (
     SubscriptionService,
 )
+from cgg.apps.finance.versions.v1.services.trunk_outbox import (
+    TrunkOutboxService,
+)
 from cgg.core import api_exceptions
 from cgg.core.integrity import Integrity
 
@@ -87,6 +95,8 @@ class FailedJobAdmin(admin.ModelAdmin):
         'service_name',
         'method_name',
         'is_done',
+        'attempts',
+        'next_retry_at',
         'created_at',
         'updated_at',
     )
@@ -110,6 +120,8 @@ class FailedJobAdmin(admin.ModelAdmin):
             'classes': ('collapse',),
             'fields': (
                 'is_done',
+                'attempts',
+                'next_retry_at',
                 'error_message',
             ),
         }),
@@ -1500,11 +1512,14 @@ class CommandRunAdmin(admin.ModelAdmin):
     list_display = (
         'id',
         'command_title',
+        'status_code',
+        'duration',
         'created_at',
         'updated_at',
     )
     list_filter = (
         'command_title',
+        'status_code',
         ('created_at', DateRangeFilter),
     )
 
@@ -1514,6 +1529,9 @@ class CommandRunAdmin(admin.ModelAdmin):
         ('Info', {
             'fields': ('id', 'command_title')
         }),
+        ('Outcome', {
+            'fields': ('status_code', 'duration', 'error')
+        }),
         ('Dates', {
             'classes': ('collapse',),
             'fields': ('created_at', 'updated_at'),
@@ -1533,6 +1551,228 @@ class CommandRunAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(InvoiceRun)
+class InvoiceRunAdmin(admin.ModelAdmin):
+    date_hierarchy = 'created_at'
+    search_fields = ['id', ]
+    list_display = (
+        'id',
+        'to_date',
+        'status_code',
+        'chunks_done',
+        'chunks_total',
+        'issued_count',
+        'failed_count',
+        'skipped_count',
+        'created_at',
+        'finished_at',
+    )
+    list_filter = (
+        'status_code',
+        ('created_at', DateRangeFilter),
+    )
+
+    ordering = ('-created_at',)
+    list_per_page = 20
+    fieldsets = (
+        ('Info', {
+            'fields': ('id', 'from_date', 'to_date', 'status_code')
+        }),
+        ('Progress', {
+            'fields': (
+                'chunk_size',
+                'chunks_total',
+                'chunks_done',
+                'issued_count',
+                'failed_count',
+                'skipped_count',
+            )
+        }),
+        ('Dates', {
+            'classes': ('collapse',),
+            'fields': ('created_at', 'updated_at', 'finished_at'),
+        }),
+    )
+    actions = [check_integrity, ]
+
+    def get_readonly_fields(self, request, obj=None):
+        fields = [f.name for f in InvoiceRun._meta.fields]
+
+        return fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(IntegrityScan)
+class IntegrityScanAdmin(admin.ModelAdmin):
+    date_hierarchy = 'created_at'
+    search_fields = ['id', ]
+    list_display = (
+        'id',
+        'status_code',
+        'chunks_done',
+        'chunks_total',
+        'checked_count',
+        'mismatch_count',
+        'created_at',
+        'finished_at',
+    )
+    list_filter = (
+        'status_code',
+        ('created_at', DateRangeFilter),
+    )
+
+    ordering = ('-created_at',)
+    list_per_page = 20
+    actions = [check_integrity, ]
+
+    def get_readonly_fields(self, request, obj=None):
+        fields = [f.name for f in IntegrityScan._meta.fields]
+
+        return fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(IntegrityMismatch)
+class IntegrityMismatchAdmin(admin.ModelAdmin):
+    date_hierarchy = 'created_at'
+    search_fields = ['object_id', ]
+    list_display = (
+        'model_label',
+        'object_id',
+        'integrity_scan',
+        'created_at',
+        'updated_at',
+    )
+    list_filter = (
+        'model_label',
+        ('created_at', DateRangeFilter),
+    )
+
+    ordering = ('-created_at',)
+    list_per_page = 20
+
+    def get_readonly_fields(self, request, obj=None):
+        fields = [f.name for f in IntegrityMismatch._meta.fields]
+
+        return fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    date_hierarchy = 'created_at'
+    search_fields = ['id', 'filters_hash', ]
+    list_display = (
+        'id',
+        'name',
+        'output',
+        'status_code',
+        'rows_count',
+        'file_size',
+        'created_at',
+        'finished_at',
+    )
+    list_filter = (
+        'name',
+        'status_code',
+        ('created_at', DateRangeFilter),
+    )
+
+    ordering = ('-created_at',)
+    list_per_page = 20
+    fieldsets = (
+        ('Info', {
+            'fields': ('id', 'name', 'output', 'status_code', 'error')
+        }),
+        ('Filters', {
+            'fields': ('arguments', 'query_params', 'filters_hash')
+        }),
+        ('Progress', {
+            'fields': ('rows_count', 'file_name', 'file_size')
+        }),
+        ('Dates', {
+            'classes': ('collapse',),
+            'fields': (
+                'created_at',
+                'updated_at',
+                'started_at',
+                'finished_at',
+            ),
+        }),
+    )
+    actions = [check_integrity, ]
+
+    def get_readonly_fields(self, request, obj=None):
+        fields = [f.name for f in ExportJob._meta.fields]
+
+        return fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TrunkNotification)
+class TrunkNotificationAdmin(admin.ModelAdmin):
+    date_hierarchy = 'created_at'
+    search_fields = ['id', ]
+    list_display = (
+        'id',
+        'notify_type_code',
+        'status_code',
+        'attempts',
+        'next_attempt_at',
+        'created_at',
+        'sent_at',
+    )
+    list_filter = (
+        'status_code',
+        'notify_type_code',
+        ('created_at', DateRangeFilter),
+    )
+    ordering = ('-created_at',)
+    list_per_page = 20
+    show_full_result_count = False
+    actions = ['retry_failed', check_integrity, ]
+
+    def get_readonly_fields(self, request, obj=None):
+        fields = [f.name for f in TrunkNotification._meta.fields]
+
+        return fields
+
+    def retry_failed(self, request, queryset):
+        retried = TrunkOutboxService.retry_failed(queryset)
+        self.message_user(
+            request,
+            f"{_('Retried notifications:')} {retried}",
+        )
+
+    retry_failed.short_description = _('Retry failed notifications')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Attachment)
 class AttachmentAdmin(admin.ModelAdmin):
     date_hierarchy = 'created_at'
@@ -1,19 +1,103 @@
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
 from cgg.apps.finance.models import CommandRun
+from cgg.apps.finance.versions.v1.config import FinanceConfigurations
+
+logger = logging.getLogger('common')
+
+# Delete the lock only if it still holds the token of the run, a run that
+# outlived its lock must not delete the lock of the next run
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _release_lock(lock_key, token):
+    client = getattr(cache, 'client', None)
+    if not hasattr(client, 'encode'):
+        # Caches other than django-redis (e.g. local memory in tests)
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+        return
+    from django_redis import get_redis_connection
+
+    get_redis_connection('default').eval(
+        RELEASE_LOCK_SCRIPT,
+        1,
+        cache.make_key(lock_key),
+        # Values are stored serialized by django-redis
+        client.encode(token),
+    )
 
 
 def log_command(command_title):
     """
-    log running command
+    log running command with its duration and outcome. Runs of a command
+    take a lock in cache, a run that starts while another one is in
+    progress is skipped
     :param command_title: choices from CommandRun model
     :return:
     """
 
     def wrapper(view_method):
         def args_wrapper(class_view_obj, *args, **kwargs):
-            view_result = view_method(class_view_obj, *args, **kwargs)
+            states = FinanceConfigurations.CommandRun.STATE_CHOICES
+            lock_key = f"command_lock:{command_title}"
+            token = uuid.uuid4().hex
+            scheduler_config = settings.CGG['SCHEDULER']
             command_run = CommandRun()
             command_run.command_title = command_title
-            command_run.save()
+            try:
+                locked = cache.add(
+                    lock_key,
+                    token,
+                    scheduler_config['LOCK_TIMEOUTS'].get(
+                        command_title,
+                        scheduler_config['LOCK_TIMEOUT'],
+                    ),
+                )
+            except Exception as e:
+                # Commands run without the lock when cache is not available
+                logger.error("lock of %s is not taken: %s", command_title, e)
+                locked = True
+                token = None
+            if not locked:
+                command_run.status_code = states[2][0]
+                command_run.save()
+                logger.warning(
+                    "%s is skipped, another run is in progress",
+                    command_title,
+                )
+                return None
+
+            started_at = time.monotonic()
+            try:
+                view_result = view_method(class_view_obj, *args, **kwargs)
+            except BaseException as e:
+                command_run.status_code = states[1][0]
+                command_run.error = str(e) or e.__class__.__name__
+                raise
+            finally:
+                command_run.duration = round(time.monotonic() - started_at, 3)
+                command_run.save()
+                if token is not None:
+                    try:
+                        _release_lock(lock_key, token)
+                    except Exception as e:
+                        # The lock expires after its timeout
+                        logger.error(
+                            "lock of %s is not released: %s",
+                            command_title,
+                            e,
+                        )
 
             return view_result
 
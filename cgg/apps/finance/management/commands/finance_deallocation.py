@@ -7,21 +7,22 @@
 # Email: m.esmailpour@respina.net
 # --------------------------------------------------------------------------
 
-import json
 from datetime import datetime, timedelta
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.db.models import Q
 
 from cgg.apps.finance.decorators import log_command
 from cgg.apps.finance.models import Subscription
 from cgg.apps.finance.versions.v1.config import FinanceConfigurations
-from cgg.apps.finance.versions.v1.services.job import JobService
 from cgg.apps.finance.versions.v1.services.runtime_config import (
     RuntimeConfigService,
 )
-from cgg.apps.finance.versions.v1.services.trunk import TrunkService
-from cgg.core import api_exceptions
+from cgg.apps.finance.versions.v1.services.trunk_outbox import (
+    TrunkOutboxService,
+)
 
 
 def notify_overdue_subscriptions(
@@ -29,7 +30,7 @@ def notify_overdue_subscriptions(
         notify_type_code,
 ):
     """
-    Notify trunk backend based on notify_type_code
+    Add notifications to trunk backend based on notify_type_code
     :param overdue_subscriptions:
     :type overdue_subscriptions:
     :param notify_type_code:
@@ -37,9 +38,17 @@ def notify_overdue_subscriptions(
     :return:
     :rtype:
     """
-    notify_object = []
-    for overdue_subscription in overdue_subscriptions:
-        notify_object.append({
+    overdue_subscriptions = overdue_subscriptions.select_related(
+        'customer',
+    ).only(
+        'id',
+        'subscription_code',
+        'number',
+        'customer__customer_code',
+    )
+
+    def build_notify_item(overdue_subscription):
+        return {
             "customer_code": str(
                 overdue_subscription.customer.customer_code,
             ),
@@ -47,48 +56,15 @@ def notify_overdue_subscriptions(
                 overdue_subscription.subscription_code
             ),
             "number": str(overdue_subscription.number),
-        })
+        }
 
-        # Send 25 invoice at a time
-        if len(notify_object) == 25:
-            try:
-                TrunkService.notify_trunk_backend(
-                    notify_type_code=notify_type_code,
-                    notify_object=notify_object,
-                )
-            except api_exceptions.APIException as e:
-                JobService.add_failed_job(
-                    FinanceConfigurations.Jobs.TYPES[1][0],
-                    'v1',
-                    'TrunkService',
-                    'notify_trunk_backend',
-                    json.dumps({
-                        "notify_type_code": notify_type_code,
-                        "notify_object": notify_object,
-                    }),
-                    str(e)
-                )
-            notify_object = []
-
-    # Send the rest of invoices
-    if notify_object:
-        try:
-            TrunkService.notify_trunk_backend(
-                notify_type_code=notify_type_code,
-                notify_object=notify_object,
-            )
-        except api_exceptions.APIException as e:
-            JobService.add_failed_job(
-                FinanceConfigurations.Jobs.TYPES[1][0],
-                'v1',
-                'TrunkService',
-                'notify_trunk_backend',
-                json.dumps({
-                    "notify_type_code": notify_type_code,
-                    "notify_object": notify_object,
-                }),
-                str(e)
-            )
+    TrunkOutboxService.add_notification_stream(
+        notify_type_code,
+        overdue_subscriptions.iterator(
+            chunk_size=settings.CGG['TRUNK_NOTIFY']['CHUNK_SIZE'],
+        ),
+        build_notify_item,
+    )
 
 
 class Command(BaseCommand):
@@ -129,14 +105,17 @@ class Command(BaseCommand):
                 deallocate_warned=True,
             )
         )
-        notify_overdue_subscriptions(
-            warn_subscriptions,
-            FinanceConfigurations.TrunkBackend.Notify.DEALLOCATION_WARNING_1,
-        )
-        notify_overdue_subscriptions(
-            overdue_subscriptions,
-            FinanceConfigurations.TrunkBackend.Notify.DEALLOCATION_WARNING_2,
-        )
-        warn_subscriptions.update(
-            deallocate_warned=True,
-        )
+        tb_notify = FinanceConfigurations.TrunkBackend.Notify
+        # Notifications are sent only if subscriptions are marked as warned
+        with transaction.atomic():
+            notify_overdue_subscriptions(
+                warn_subscriptions,
+                tb_notify.DEALLOCATION_WARNING_1,
+            )
+            notify_overdue_subscriptions(
+                overdue_subscriptions,
+                tb_notify.DEALLOCATION_WARNING_2,
+            )
+            warn_subscriptions.update_with_checksum(
+                deallocate_warned=True,
+            )
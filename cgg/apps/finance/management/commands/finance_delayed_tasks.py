@@ -0,0 +1,27 @@
+# --------------------------------------------------------------------------
+# Queue delayed tasks when they are due. This command runs until it is
+# stopped, with --once it polls one time.
+# (C) 2023 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - finance_delayed_tasks.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+from django.core.management.base import BaseCommand
+
+from cgg.apps.finance.versions.v1.services.delayed_task import (
+    DelayedTaskService,
+)
+
+
+class Command(BaseCommand):
+    help = 'Poll delayed tasks and queue the due ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Poll one time and exit'
+        )
+
+    def handle(self, *args, **options):
+        DelayedTaskService.run(once=options['once'])
@@ -7,18 +7,19 @@
 # Email: m.esmailpour@respina.net
 # --------------------------------------------------------------------------
 
-import json
 from datetime import datetime, timedelta
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from jdatetime import datetime as jdatetime
 
 from cgg.apps.finance.decorators import log_command
 from cgg.apps.finance.models import Invoice
 from cgg.apps.finance.versions.v1.config import FinanceConfigurations
-from cgg.apps.finance.versions.v1.services.job import JobService
-from cgg.apps.finance.versions.v1.services.trunk import TrunkService
-from cgg.core import api_exceptions
+from cgg.apps.finance.versions.v1.services.trunk_outbox import (
+    TrunkOutboxService,
+)
 from cgg.core.tools import Tools
 
 
@@ -27,7 +28,7 @@ def notify_overdue_invoices(
         notify_type_code,
 ):
     """
-    Notify trunk backend based on notify_type_code
+    Add notifications to trunk backend based on notify_type_code
     :param overdue_invoices:
     :type overdue_invoices:
     :param notify_type_code:
@@ -35,14 +36,26 @@ def notify_overdue_invoices(
     :return:
     :rtype:
     """
-    notify_object = []
-    for overdue_invoice in overdue_invoices:
+    overdue_invoices = overdue_invoices.select_related(
+        'subscription__customer',
+    ).only(
+        'id',
+        'total_cost',
+        'to_date',
+        'created_at',
+        'subscription__subscription_code',
+        'subscription__number',
+        'subscription__latest_paid_at',
+        'subscription__customer__customer_code',
+    )
+
+    def build_notify_item(overdue_invoice):
         if overdue_invoice.subscription.latest_paid_at is None or (
                 overdue_invoice.subscription.latest_paid_at and
                 overdue_invoice.subscription.latest_paid_at <
                 overdue_invoice.created_at
         ):
-            notify_object.append({
+            return {
                 "customer_code": str(
                     overdue_invoice.subscription.customer.customer_code,
                 ),
@@ -57,48 +70,17 @@ def notify_overdue_invoices(
                         datetime=overdue_invoice.to_date
                     ).month
                 ),
-            })
+            }
 
-        # Send 25 invoice at a time
-        if len(notify_object) == 25:
-            try:
-                TrunkService.notify_trunk_backend(
-                    notify_type_code=notify_type_code,
-                    notify_object=notify_object,
-                )
-            except api_exceptions.APIException as e:
-                JobService.add_failed_job(
-                    FinanceConfigurations.Jobs.TYPES[1][0],
-                    'v1',
-                    'TrunkService',
-                    'notify_trunk_backend',
-                    json.dumps({
-                        "notify_type_code": notify_type_code,
-                        "notify_object": notify_object,
-                    }),
-                    str(e)
-                )
-            notify_object = []
+        return None
 
-    # Send the rest of invoices
-    if notify_object:
-        try:
-            TrunkService.notify_trunk_backend(
-                notify_type_code=notify_type_code,
-                notify_object=notify_object,
-            )
-        except api_exceptions.APIException as e:
-            JobService.add_failed_job(
-                FinanceConfigurations.Jobs.TYPES[1][0],
-                'v1',
-                'TrunkService',
-                'notify_trunk_backend',
-                json.dumps({
-                    "notify_type_code": notify_type_code,
-                    "notify_object": notify_object,
-                }),
-                str(e)
-            )
+    TrunkOutboxService.add_notification_stream(
+        notify_type_code,
+        overdue_invoices.iterator(
+            chunk_size=settings.CGG['TRUNK_NOTIFY']['CHUNK_SIZE'],
+        ),
+        build_notify_item,
+    )
 
 
 class Command(BaseCommand):
@@ -151,31 +133,33 @@ class Command(BaseCommand):
             due_date__lte=due_date_warning_four,
             due_date_notified=due_date_notify[3][0],
         )
-        notify_overdue_invoices(
-            w1_overdue_invoices,
-            FinanceConfigurations.TrunkBackend.Notify.DUE_DATE_WARNING_1,
-        )
-        notify_overdue_invoices(
-            w2_overdue_invoices,
-            FinanceConfigurations.TrunkBackend.Notify.DUE_DATE_WARNING_2,
-        )
-        notify_overdue_invoices(
-            w3_overdue_invoices,
-            FinanceConfigurations.TrunkBackend.Notify.DUE_DATE_WARNING_3,
-        )
-        notify_overdue_invoices(
-            w4_overdue_invoices,
-            FinanceConfigurations.TrunkBackend.Notify.DUE_DATE_WARNING_4,
-        )
-        w4_overdue_invoices.update(
-            due_date_notified=due_date_notify[4][0],
-        )
-        w3_overdue_invoices.update(
-            due_date_notified=due_date_notify[3][0],
-        )
-        w2_overdue_invoices.update(
-            due_date_notified=due_date_notify[2][0],
-        )
-        w1_overdue_invoices.update(
-            due_date_notified=due_date_notify[1][0],
-        )
+        # Notifications are sent only if invoices are marked as notified
+        with transaction.atomic():
+            notify_overdue_invoices(
+                w1_overdue_invoices,
+                FinanceConfigurations.TrunkBackend.Notify.DUE_DATE_WARNING_1,
+            )
+            notify_overdue_invoices(
+                w2_overdue_invoices,
+                FinanceConfigurations.TrunkBackend.Notify.DUE_DATE_WARNING_2,
+            )
+            notify_overdue_invoices(
+                w3_overdue_invoices,
+                FinanceConfigurations.TrunkBackend.Notify.DUE_DATE_WARNING_3,
+            )
+            notify_overdue_invoices(
+                w4_overdue_invoices,
+                FinanceConfigurations.TrunkBackend.Notify.DUE_DATE_WARNING_4,
+            )
+            w4_overdue_invoices.update_with_checksum(
+                due_date_notified=due_date_notify[4][0],
+            )
+            w3_overdue_invoices.update_with_checksum(
+                due_date_notified=due_date_notify[3][0],
+            )
+            w2_overdue_invoices.update_with_checksum(
+                due_date_notified=due_date_notify[2][0],
+            )
+            w1_overdue_invoices.update_with_checksum(
+                due_date_notified=due_date_notify[1][0],
+            )
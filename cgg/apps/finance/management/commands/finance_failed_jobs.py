@@ -10,7 +10,6 @@
 from django.core.management.base import BaseCommand
 
 from cgg.apps.finance.decorators import log_command
-from cgg.apps.finance.models import FailedJob
 from cgg.apps.finance.versions.v1.config import FinanceConfigurations
 from cgg.apps.finance.versions.v1.services.job import JobService
 
@@ -18,10 +17,20 @@ from cgg.apps.finance.versions.v1.services.job import JobService
 class Command(BaseCommand):
     help = 'Redo failed jobs and update status'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-seconds',
+            type=int,
+            default=3000,
+            help='Stop after this many seconds (0 is no limit)'
+        )
+
     @log_command(command_title=FinanceConfigurations.Commands.TYPES[2][0])
     def handle(self, *args, **options):
-        failed_job_objects = FailedJob.objects.filter(
-            is_done=False
+        summary = JobService.redo_due_jobs(
+            max_seconds=options['max_seconds'],
+        )
+        self.stdout.write(
+            f"done {summary['done']}, failed {summary['failed']}, "
+            f"moved to trunk outbox {summary['merged']}"
         )
-        for failed_job_object in failed_job_objects:
-            JobService.redo_the_job(failed_job_object)
@@ -1,5 +1,8 @@
 # --------------------------------------------------------------------------
-# Randomly checks for any integrity errors in object of models.
+# Checks for any integrity errors in objects of models. Every row of every
+# model with a checksum is checked in primary key order by a process pool,
+# a scan that reaches its time limit continues on the next run. Mismatches
+# are kept in IntegrityMismatch.
 # An anomaly in objects is related to changes made to objects outside of the
 # CGG's logic, for example directly into the database.
 # (C) 2020 MehrdadEP, Tehran, Iran
@@ -9,42 +12,66 @@
 # Email: m.esmailpour@respina.net
 # --------------------------------------------------------------------------
 
-import logging
-import random
-
-from django.apps import apps
 from django.core.management.base import BaseCommand
 
 from cgg.apps.finance.decorators import log_command
 from cgg.apps.finance.versions.v1.config import FinanceConfigurations
-from cgg.core.integrity import Integrity
-
-logger = logging.getLogger('integrity')
+from cgg.apps.finance.versions.v1.services.integrity_scan import (
+    IntegrityScanService,
+)
 
 
 class Command(BaseCommand):
-    help = 'Integrity check on random objects'
+    help = 'Integrity check on all objects'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=None,
+            help='Number of processes that check key ranges'
+        )
+        parser.add_argument(
+            '--partitions',
+            type=int,
+            default=None,
+            help='Number of key ranges of each model (new scans only)'
+        )
+        parser.add_argument(
+            '--max-seconds',
+            type=int,
+            default=None,
+            help='Stop after this many seconds, the next run continues '
+                 '(0 is no limit)'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Leave the unfinished scan and start a new one'
+        )
 
     @log_command(command_title=FinanceConfigurations.Commands.TYPES[11][0])
     def handle(self, *args, **options):
-        max_number = 150
-        finance_models = apps.get_app_config('finance').get_models()
-        indexed_models = {}
-        index = 0
-        for model in finance_models:
-            indexed_models[index] = model
-            index += 1
-        # Choosing 1/3 of models randomly
-        random_indexes = random.sample(range(0, index), int(index / 3))
-        for random_index in random_indexes:
-            model_objects = indexed_models[random_index].objects.all()
-            model_count = model_objects.count()
-            if model_count > max_number:
-                model_count = max_number
-            random_objects = random.choices(model_objects, k=model_count)
-            for random_object in random_objects:
-                if not Integrity.check(random_object):
-                    logger.info(
-                        f"{random_object._meta.model}: {random_object.id} is "
-                        f"manipulated"
-                    )
+        integrity_scan, resumed = IntegrityScanService.get_or_create_scan(
+            partitions=options['partitions'],
+            restart=options['restart'],
+        )
+        if resumed:
+            self.stdout.write(
+                f"continuing integrity scan {integrity_scan.id} "
+                f"({integrity_scan.chunks_done}/{integrity_scan.chunks_total} "
+                f"chunks done) ..."
+            )
+        summary = IntegrityScanService.execute(
+            integrity_scan,
+            concurrency=options['concurrency'],
+            max_seconds=options['max_seconds'],
+        )
+        integrity_scan.refresh_from_db()
+        self.stdout.write(
+            f"integrity scan {integrity_scan.id}: "
+            f"checked {summary['checked']}, "
+            f"mismatches {summary['mismatches']}, "
+            f"chunks {integrity_scan.chunks_done}/"
+            f"{integrity_scan.chunks_total}"
+        )
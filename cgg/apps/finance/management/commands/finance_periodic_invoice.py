@@ -8,28 +8,49 @@
 # Email: m.esmailpour@respina.net
 # --------------------------------------------------------------------------
 
-import json
 from datetime import datetime
 
 import pytz
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.utils.translation import gettext as _
 from jdatetime import datetime as jdatetime, timedelta as jtimedelta
 
 from cgg.apps.finance.decorators import log_command
-from cgg.apps.finance.models import Subscription
+from cgg.apps.finance.models import Invoice
 from cgg.apps.finance.versions.v1.config import FinanceConfigurations
-from cgg.apps.finance.versions.v1.services.invoice import (
-    InvoiceService,
+from cgg.apps.finance.versions.v1.services.invoice_run import (
+    InvoiceRunService,
+)
+from cgg.apps.finance.versions.v1.services.trunk_outbox import (
+    TrunkOutboxService,
 )
-from cgg.apps.finance.versions.v1.services.job import JobService
-from cgg.apps.finance.versions.v1.services.trunk import TrunkService
-from cgg.core import api_exceptions
 
 
 class Command(BaseCommand):
     help = 'Issue periodic invoices'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode',
+            type=str,
+            default=FinanceConfigurations.InvoiceRun.MODES[0][0],
+            choices=[m[0] for m in FinanceConfigurations.InvoiceRun.MODES],
+            help='Run chunks on Celery workers, a local process pool or '
+                 'serially (auto uses Celery when the broker is available)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Number of subscriptions in each chunk (new runs only)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=None,
+            help='Maximum number of chunks processed at the same time'
+        )
+
     @log_command(command_title=FinanceConfigurations.Commands.TYPES[0][0])
     def handle(self, *args, **options):
         today_jalali = jdatetime.now(tz=pytz.timezone("Asia/Tehran"))
@@ -95,62 +116,63 @@ class Command(BaseCommand):
                 second=to_date_tz.second,
                 microsecond=to_date_tz.microsecond,
             )
-            subscriptions_object = Subscription.objects.filter(
-                is_allocated=True,
-                subscription_type__in=[
-                    FinanceConfigurations.Subscription.TYPE[0][0],
-                    FinanceConfigurations.Subscription.TYPE[1][0],
-                ]
+            invoice_run, resumed = InvoiceRunService.get_or_create_run(
+                from_date,
+                to_date,
+                chunk_size=options['chunk_size'],
+            )
+            if resumed:
+                self.stdout.write(
+                    f"continuing invoice run {invoice_run.id} "
+                    f"({invoice_run.chunks_done}/{invoice_run.chunks_total} "
+                    f"chunks done) ..."
+                )
+                # Notify subscriptions of the whole run, not only this part
+                start_command_datetime = invoice_run.created_at
+            summary = InvoiceRunService.execute(
+                invoice_run,
+                mode=options['mode'],
+                concurrency=options['concurrency'],
+            )
+            self.stdout.write(
+                f"invoice run {invoice_run.id}: "
+                f"issued {summary['issued']}, "
+                f"failed {summary['failed']}, "
+                f"skipped {summary['skipped']}"
             )
-            for subscription_object in subscriptions_object:
-                try:
-                    InvoiceService.issue_periodic_invoice(
-                        subscription_object.id,
-                        from_date,
-                        to_date,
-                        description=_(
-                            "This invoice a generated automatically at the "
-                            "end of the period",
-                        )
-                    )
-                except Exception as e:
-                    JobService.add_failed_job(
-                        FinanceConfigurations.Jobs.TYPES[0][0],
-                        'v1',
-                        'InvoiceService',
-                        'issue_periodic_invoice',
-                        json.dumps({
-                            "subscription_id": str(subscription_object.id),
-                            "from_date": str(from_date.timestamp()),
-                            "to_date": str(to_date.timestamp()),
-                            "notify_singular": True,
-                            "description": _(
-                                "This invoice a generated automatically at "
-                                "the end of the period",
-                            )
-                        }),
-                        str(e)
-                    )
-
             self.stdout.write(
                 "issuing periodic invoices completed successfully!"
             )
             self.stdout.write(
                 "notifying customers about periodic invoices ..."
             )
-            subscription_objects = Subscription.objects.distinct().filter(
-                invoices__to_date__exact=to_date,
-                invoices__created_at__gte=start_command_datetime
+            # Latest invoice of every subscription that got an invoice for
+            # this period, in one query
+            latest_invoices = Invoice.objects.filter(
+                subscription_id__in=Invoice.objects.filter(
+                    to_date__exact=to_date,
+                    created_at__gte=start_command_datetime,
+                ).values('subscription_id'),
+            ).select_related(
+                'subscription__customer',
+            ).only(
+                'id',
+                'total_cost',
+                'status_code',
+                'created_at',
+                'subscription__subscription_code',
+                'subscription__number',
+                'subscription__customer__customer_code',
+            ).order_by(
+                'subscription_id',
+                '-created_at',
+            ).distinct(
+                'subscription_id',
             )
 
-            notify_object = []
-            notify_type = FinanceConfigurations.TrunkBackend.Notify \
-                .PERIODIC_INVOICE
-            for subscription_object in subscription_objects:
-                latest_invoice = subscription_object.invoices.latest(
-                    'created_at',
-                )
-                notify_object.append({
+            def build_notify_item(latest_invoice):
+                subscription_object = latest_invoice.subscription
+                return {
                     "customer_code":
                         str(subscription_object.customer.customer_code),
                     "subscription_code":
@@ -162,47 +184,16 @@ class Command(BaseCommand):
                     latest_invoice.status_code ==
                     FinanceConfigurations.Invoice.STATE_CHOICES[2][
                         0] else False,
-                })
-                # Notify 25 objects at a time
-                if len(notify_object) == 25:
-                    try:
-                        TrunkService.notify_trunk_backend(
-                            notify_type_code=notify_type,
-                            notify_object=notify_object,
-                        )
-                    except api_exceptions.APIException as e:
-                        JobService.add_failed_job(
-                            FinanceConfigurations.Jobs.TYPES[1][0],
-                            'v1',
-                            'TrunkService',
-                            'notify_trunk_backend',
-                            json.dumps({
-                                "notify_type_code": notify_type,
-                                "notify_object": notify_object,
-                            }),
-                            str(e)
-                        )
-                    notify_object = []
+                }
 
-            # Notify the rest of invoices (less than 25)
-            if notify_object:
-                try:
-                    TrunkService.notify_trunk_backend(
-                        notify_type_code=notify_type,
-                        notify_object=notify_object,
-                    )
-                except api_exceptions.APIException as e:
-                    JobService.add_failed_job(
-                        FinanceConfigurations.Jobs.TYPES[1][0],
-                        'v1',
-                        'TrunkService',
-                        'notify_trunk_backend',
-                        json.dumps({
-                            "notify_type_code": notify_type,
-                            "notify_object": notify_object,
-                        }),
-                        str(e)
-                    )
+            added_count = TrunkOutboxService.add_notification_stream(
+                FinanceConfigurations.TrunkBackend.Notify.PERIODIC_INVOICE,
+                latest_invoices.iterator(
+                    chunk_size=settings.CGG['TRUNK_NOTIFY']['CHUNK_SIZE'],
+                ),
+                build_notify_item,
+            )
+            self.stdout.write(f"{added_count} notifications are queued")
             self.stdout.write(
                 "notifying customers about periodic invoices completed "
                 "successfully!"
@@ -0,0 +1,47 @@
+# --------------------------------------------------------------------------
+# Send due notifications of the trunk outbox. The dispatcher task is woken
+# up whenever notifications are added, this command is a backstop for
+# notifications whose task was lost.
+# (C) 2023 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - finance_trunk_dispatch.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+from django.core.management.base import BaseCommand
+
+from cgg.apps.finance.decorators import log_command
+from cgg.apps.finance.versions.v1.config import FinanceConfigurations
+from cgg.apps.finance.versions.v1.services.trunk_outbox import (
+    TrunkOutboxService,
+)
+
+
+class Command(BaseCommand):
+    help = 'Send pending notifications of trunk backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-seconds',
+            type=int,
+            default=240,
+            help='Stop after this many seconds (0 is no limit)'
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Send notifications that reached the maximum attempts again'
+        )
+
+    @log_command(command_title=FinanceConfigurations.Commands.TYPES[17][0])
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            retried = TrunkOutboxService.retry_failed()
+            self.stdout.write(f"{retried} failed notifications are retried")
+        sent_count, failed_count = TrunkOutboxService.dispatch(
+            max_seconds=options['max_seconds'],
+        )
+        stats = TrunkOutboxService.stats()
+        self.stdout.write(
+            f"sent {sent_count}, failed {failed_count}, "
+            f"pending {stats['pending']}, lag {stats['lag_seconds']}s"
+        )
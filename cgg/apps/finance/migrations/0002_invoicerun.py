@@ -0,0 +1,57 @@
+# Generated by Django 3.1.14 on 2022-12-04 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceRun',
+            fields=[
+                ('checksum', models.CharField(blank=True, max_length=512, null=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('from_date', models.DateTimeField()),
+                ('to_date', models.DateTimeField(db_index=True)),
+                ('status_code', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed')], db_index=True, default='running', max_length=64)),
+                ('chunk_size', models.PositiveIntegerField(default=0)),
+                ('chunks_total', models.PositiveIntegerField(default=0)),
+                ('chunks_done', models.PositiveIntegerField(default=0)),
+                ('issued_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('skipped_count', models.PositiveIntegerField(default=0)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='InvoiceRunChunk',
+            fields=[
+                ('checksum', models.CharField(blank=True, max_length=512, null=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('chunk_index', models.PositiveIntegerField()),
+                ('subscription_ids', models.JSONField(default=list)),
+                ('is_done', models.BooleanField(db_index=True, default=False)),
+                ('issued_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('skipped_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('invoice_run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='finance.invoicerun')),
+            ],
+            options={
+                'ordering': ['chunk_index'],
+                'unique_together': {('invoice_run', 'chunk_index')},
+            },
+        ),
+    ]
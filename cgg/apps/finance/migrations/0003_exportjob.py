@@ -0,0 +1,38 @@
+# Generated by Django 3.1.14 on 2022-12-18 11:05
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0002_invoicerun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('checksum', models.CharField(blank=True, max_length=512, null=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('name', models.CharField(choices=[('invoices', 'Invoices'), ('base-balance-invoices', 'Base balance invoices'), ('package-invoices', 'Package invoices'), ('credit-invoices', 'Credit invoices'), ('payments', 'Payments'), ('profits', 'Profits')], max_length=64)),
+                ('output', models.CharField(choices=[('csv', 'CSV'), ('ndjson', 'Newline delimited JSON')], default='csv', max_length=16)),
+                ('arguments', models.JSONField(default=list)),
+                ('query_params', models.JSONField(default=dict)),
+                ('filters_hash', models.CharField(db_index=True, max_length=64)),
+                ('status_code', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], db_index=True, default='pending', max_length=64)),
+                ('rows_count', models.PositiveIntegerField(default=0)),
+                ('file_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('file_size', models.PositiveBigIntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 3.1.14 on 2022-12-21 08:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0003_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntegrityScan',
+            fields=[
+                ('checksum', models.CharField(blank=True, max_length=512, null=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('status_code', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed')], db_index=True, default='running', max_length=64)),
+                ('chunks_total', models.PositiveIntegerField(default=0)),
+                ('chunks_done', models.PositiveIntegerField(default=0)),
+                ('checked_count', models.PositiveBigIntegerField(default=0)),
+                ('mismatch_count', models.PositiveBigIntegerField(default=0)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='IntegrityScanChunk',
+            fields=[
+                ('checksum', models.CharField(blank=True, max_length=512, null=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('model_label', models.CharField(max_length=128)),
+                ('range_start', models.CharField(blank=True, max_length=64, null=True)),
+                ('range_end', models.CharField(blank=True, max_length=64, null=True)),
+                ('last_pk', models.CharField(blank=True, max_length=64, null=True)),
+                ('is_done', models.BooleanField(db_index=True, default=False)),
+                ('checked_count', models.PositiveBigIntegerField(default=0)),
+                ('mismatch_count', models.PositiveBigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('integrity_scan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='finance.integrityscan')),
+            ],
+            options={
+                'ordering': ['model_label', 'range_start'],
+            },
+        ),
+        migrations.CreateModel(
+            name='IntegrityMismatch',
+            fields=[
+                ('checksum', models.CharField(blank=True, max_length=512, null=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('model_label', models.CharField(db_index=True, max_length=128)),
+                ('object_id', models.CharField(max_length=64)),
+                ('stored_checksum', models.CharField(blank=True, max_length=512, null=True)),
+                ('computed_checksum', models.CharField(max_length=512)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('integrity_scan', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mismatches', to='finance.integrityscan')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'unique_together': {('model_label', 'object_id')},
+            },
+        ),
+    ]
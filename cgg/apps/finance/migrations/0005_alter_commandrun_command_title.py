@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2023-01-08 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0004_integrityscan'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='commandrun',
+            name='command_title',
+            field=models.CharField(choices=[('periodic_invoices', 'Periodic invoices'), ('due_date', 'Due date'), ('failed_jobs', 'Failed jobs'), ('renew_branches', 'Renew branches'), ('import_destinations', 'Import destinations'), ('import_tariffs', 'Import tariffs'), ('init_cgrates', 'Initialize CGRateS'), ('import_credits', 'Import credits from Excel'), ('import_branches', 'Import branches'), ('renew_subscription_type', "Renew subscription's type"), ('expire_packages', 'Expire packages'), ('integrity_check', 'Integrity check'), ('update_runtime_configs', 'Update runtime configs'), ('check_deallocation', 'Check deallocation'), ('clean_api_requests', 'Clean api requests'), ('check_sessions', 'Check sessions'), ('sync_cdrs', 'Sync CDRs')], default='periodic_invoices', max_length=512, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.1.14 on 2023-01-22 11:05
+
+import datetime
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0005_alter_commandrun_command_title'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrunkNotification',
+            fields=[
+                ('checksum', models.CharField(blank=True, max_length=512, null=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('notify_type_code', models.CharField(max_length=64)),
+                ('notify_object', models.JSONField(default=dict)),
+                ('status_code', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=64)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=datetime.datetime.now)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='trunknotification',
+            index=models.Index(fields=['status_code', 'next_attempt_at'], name='trunk_notification_due_idx'),
+        ),
+        migrations.AlterField(
+            model_name='commandrun',
+            name='command_title',
+            field=models.CharField(choices=[('periodic_invoices', 'Periodic invoices'), ('due_date', 'Due date'), ('failed_jobs', 'Failed jobs'), ('renew_branches', 'Renew branches'), ('import_destinations', 'Import destinations'), ('import_tariffs', 'Import tariffs'), ('init_cgrates', 'Initialize CGRateS'), ('import_credits', 'Import credits from Excel'), ('import_branches', 'Import branches'), ('renew_subscription_type', "Renew subscription's type"), ('expire_packages', 'Expire packages'), ('integrity_check', 'Integrity check'), ('update_runtime_configs', 'Update runtime configs'), ('check_deallocation', 'Check deallocation'), ('clean_api_requests', 'Clean api requests'), ('check_sessions', 'Check sessions'), ('sync_cdrs', 'Sync CDRs'), ('dispatch_trunk_notifications', 'Dispatch trunk notifications')], default='periodic_invoices', max_length=512, null=True),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 3.1.14 on 2023-01-29 10:42
+
+import copy
+import datetime
+
+from django.db import migrations, models
+
+from cgg.core.integrity import Integrity
+
+
+# Fields added by this migration, checksums of existing rows were taken
+# without them
+ADDED_FIELDS = ('attempts', 'next_retry_at')
+
+
+def previous_checksum(model_object):
+    previous_object = copy.copy(model_object)
+    for field in ADDED_FIELDS:
+        vars(previous_object).pop(field, None)
+
+    return Integrity.checksum(previous_object)
+
+
+def refresh_checksums(apps, schema_editor):
+    # attempts and next_retry_at are part of checksums of jobs. Only rows that
+    # are valid before the migration are signed again, the others are kept
+    # as integrity mismatches
+    failed_job_model = apps.get_model('finance', 'FailedJob')
+    integrity_mismatch_model = apps.get_model('finance', 'IntegrityMismatch')
+    manager = failed_job_model.objects.db_manager(
+        schema_editor.connection.alias,
+    )
+    failed_jobs = []
+    for failed_job in manager.iterator():
+        checksum = previous_checksum(failed_job)
+        if failed_job.checksum and failed_job.checksum != checksum:
+            integrity_mismatch = integrity_mismatch_model(
+                model_label=failed_job_model._meta.label_lower,
+                object_id=str(failed_job.pk),
+                stored_checksum=failed_job.checksum,
+                computed_checksum=checksum,
+            )
+            integrity_mismatch.checksum = Integrity.checksum(
+                integrity_mismatch,
+            )
+            integrity_mismatch_model.objects.db_manager(
+                schema_editor.connection.alias,
+            ).bulk_create([integrity_mismatch], ignore_conflicts=True)
+            continue
+        failed_job.checksum = Integrity.checksum(failed_job)
+        failed_jobs.append(failed_job)
+        if len(failed_jobs) == 1000:
+            manager.bulk_update(failed_jobs, ['checksum'])
+            failed_jobs = []
+    manager.bulk_update(failed_jobs, ['checksum'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0006_trunknotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='failedjob',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='failedjob',
+            name='next_retry_at',
+            field=models.DateTimeField(default=datetime.datetime.now),
+        ),
+        migrations.AddIndex(
+            model_name='failedjob',
+            index=models.Index(fields=['is_done', 'next_retry_at'], name='failed_job_due_idx'),
+        ),
+        migrations.RunPython(refresh_checksums, migrations.RunPython.noop),
+    ]
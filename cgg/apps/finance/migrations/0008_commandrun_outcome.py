@@ -0,0 +1,80 @@
+# Generated by Django 3.1.14 on 2023-02-05 09:18
+
+import copy
+
+from django.db import migrations, models
+
+from cgg.core.integrity import Integrity
+
+
+# Fields added by this migration, checksums of existing rows were taken
+# without them
+ADDED_FIELDS = ('status_code', 'duration', 'error')
+
+
+def previous_checksum(model_object):
+    previous_object = copy.copy(model_object)
+    for field in ADDED_FIELDS:
+        vars(previous_object).pop(field, None)
+
+    return Integrity.checksum(previous_object)
+
+
+def refresh_checksums(apps, schema_editor):
+    # status_code, duration and error are part of checksums of runs. Only rows that
+    # are valid before the migration are signed again, the others are kept
+    # as integrity mismatches
+    command_run_model = apps.get_model('finance', 'CommandRun')
+    integrity_mismatch_model = apps.get_model('finance', 'IntegrityMismatch')
+    manager = command_run_model.objects.db_manager(
+        schema_editor.connection.alias,
+    )
+    command_runs = []
+    for command_run in manager.iterator():
+        checksum = previous_checksum(command_run)
+        if command_run.checksum and command_run.checksum != checksum:
+            integrity_mismatch = integrity_mismatch_model(
+                model_label=command_run_model._meta.label_lower,
+                object_id=str(command_run.pk),
+                stored_checksum=command_run.checksum,
+                computed_checksum=checksum,
+            )
+            integrity_mismatch.checksum = Integrity.checksum(
+                integrity_mismatch,
+            )
+            integrity_mismatch_model.objects.db_manager(
+                schema_editor.connection.alias,
+            ).bulk_create([integrity_mismatch], ignore_conflicts=True)
+            continue
+        command_run.checksum = Integrity.checksum(command_run)
+        command_runs.append(command_run)
+        if len(command_runs) == 1000:
+            manager.bulk_update(command_runs, ['checksum'])
+            command_runs = []
+    manager.bulk_update(command_runs, ['checksum'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0007_failedjob_retry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commandrun',
+            name='status_code',
+            field=models.CharField(choices=[('succeeded', 'Succeeded'), ('failed', 'Failed'), ('skipped', 'Skipped, another run was in progress')], default='succeeded', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='commandrun',
+            name='duration',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='commandrun',
+            name='error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.RunPython(refresh_checksums, migrations.RunPython.noop),
+    ]
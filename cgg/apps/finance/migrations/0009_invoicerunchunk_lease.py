@@ -0,0 +1,75 @@
+# Generated by Django 3.1.14 on 2023-02-12 11:05
+
+import copy
+
+from django.db import migrations, models
+
+from cgg.core.integrity import Integrity
+
+
+# Fields added by this migration, checksums of existing rows were taken
+# without them
+ADDED_FIELDS = ('claimed_by', 'claimed_at')
+
+
+def previous_checksum(model_object):
+    previous_object = copy.copy(model_object)
+    for field in ADDED_FIELDS:
+        vars(previous_object).pop(field, None)
+
+    return Integrity.checksum(previous_object)
+
+
+def refresh_checksums(apps, schema_editor):
+    # claimed_by and claimed_at are part of checksums of chunks. Only rows that
+    # are valid before the migration are signed again, the others are kept
+    # as integrity mismatches
+    chunk_model = apps.get_model('finance', 'InvoiceRunChunk')
+    integrity_mismatch_model = apps.get_model('finance', 'IntegrityMismatch')
+    manager = chunk_model.objects.db_manager(
+        schema_editor.connection.alias,
+    )
+    chunks = []
+    for chunk in manager.iterator():
+        checksum = previous_checksum(chunk)
+        if chunk.checksum and chunk.checksum != checksum:
+            integrity_mismatch = integrity_mismatch_model(
+                model_label=chunk_model._meta.label_lower,
+                object_id=str(chunk.pk),
+                stored_checksum=chunk.checksum,
+                computed_checksum=checksum,
+            )
+            integrity_mismatch.checksum = Integrity.checksum(
+                integrity_mismatch,
+            )
+            integrity_mismatch_model.objects.db_manager(
+                schema_editor.connection.alias,
+            ).bulk_create([integrity_mismatch], ignore_conflicts=True)
+            continue
+        chunk.checksum = Integrity.checksum(chunk)
+        chunks.append(chunk)
+        if len(chunks) == 1000:
+            manager.bulk_update(chunks, ['checksum'])
+            chunks = []
+    manager.bulk_update(chunks, ['checksum'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0008_commandrun_outcome'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoicerunchunk',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoicerunchunk',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(refresh_checksums, migrations.RunPython.noop),
+    ]
@@ -19,7 +19,7 @@ from django.core.validators import (
     MaxValueValidator,
     MinValueValidator,
 )
-from django.db import models
+from django.db import models, transaction
 from django.db.models import JSONField
 from django.utils.translation import gettext as _
 
@@ -28,6 +28,55 @@ from cgg.core.cache import Cache
 from cgg.core.integrity import Integrity
 
 
+class BaseQuerySet(models.QuerySet):
+    BATCH_SIZE = 1000
+
+    def update_with_checksum(self, batch_size=None, **fields):
+        """
+        Same as update() but checksums of rows are computed again. Rows are
+        locked and updated in chunks with bulk_update, fields that are not
+        part of the checksum are not fetched
+        :param batch_size: number of rows in each chunk
+        :param fields: field name -> value, expressions are not supported
+        :return: number of updated rows
+        """
+        for value in fields.values():
+            if hasattr(value, 'resolve_expression'):
+                raise TypeError(
+                    "update_with_checksum does not support expressions",
+                )
+        if batch_size is None:
+            batch_size = self.BATCH_SIZE
+        meta = self.model._meta
+        update_fields = [meta.get_field(name).name for name in fields]
+        update_fields.append('checksum')
+        queryset = self.select_related(None).order_by('pk').defer(*[
+            field.name for field in meta.concrete_fields
+            if field.is_relation or
+            field.attname in Integrity.EXCLUDED_FIELDS
+        ])
+        updated = 0
+        last_pk = None
+        while True:
+            with transaction.atomic(using=self.db):
+                chunk_queryset = queryset.select_for_update()
+                if last_pk is not None:
+                    chunk_queryset = chunk_queryset.filter(pk__gt=last_pk)
+                chunk = list(chunk_queryset[:batch_size])
+                for model_object in chunk:
+                    for name, value in fields.items():
+                        setattr(model_object, name, value)
+                    model_object.checksum = Integrity.checksum(model_object)
+                self.model._base_manager.using(self.db).bulk_update(
+                    chunk,
+                    update_fields,
+                )
+            updated += len(chunk)
+            if len(chunk) < batch_size:
+                return updated
+            last_pk = chunk[-1].pk
+
+
 class BaseModel(models.Model):
     checksum = models.CharField(
         null=True,
@@ -35,11 +84,23 @@ class BaseModel(models.Model):
         max_length=512,
     )
 
+    objects = BaseQuerySet.as_manager()
+
     class Meta:
         abstract = True
 
     def save(self, *args, **kwargs):
         self.checksum = Integrity.checksum(self)
+        if kwargs.get('update_fields') is not None:
+            # The checksum covers all fields, it is written with the changed
+            # ones only
+            update_fields = set(kwargs['update_fields'])
+            update_fields.add('checksum')
+            update_fields.update(
+                field.name for field in self._meta.concrete_fields
+                if getattr(field, 'auto_now', False)
+            )
+            kwargs['update_fields'] = update_fields
         super(BaseModel, self).save(*args, **kwargs)
 
     @classmethod
@@ -424,11 +485,11 @@ class Subscription(BaseModel):
 
     def interim_requested(self):
         self.interim_request = True
-        self.save()
+        self.save(update_fields=['interim_request'])
 
     def interim_processed(self):
         self.interim_request = False
-        self.save()
+        self.save(update_fields=['interim_request'])
 
     def deallocate(self, cause):
         assert cause in (
@@ -445,7 +506,7 @@ class Subscription(BaseModel):
 
     def update_latest_payed(self):
         self.latest_paid_at = datetime.now()
-        self.save()
+        self.save(update_fields=['latest_paid_at'])
 
     @property
     def credit(self):
@@ -534,45 +595,47 @@ class CreditInvoice(BaseInvoice):
     def customer_code(self):
         return self.customer.customer_code
 
-    @property
-    def subscription(self):
+    @classmethod
+    def used_for_invoice_class(cls, used_for):
+        """
+        :param used_for: one of FinanceConfigurations.CreditInvoice.USED_FOR
+        :return: model of the invoice that a credit invoice is used for
+        """
+        if used_for == FinanceConfigurations.CreditInvoice.USED_FOR[0][0]:
+            return Invoice
+        if used_for == FinanceConfigurations.CreditInvoice.USED_FOR[1][0]:
+            return BaseBalanceInvoice
+
+        return PackageInvoice
+
+    def get_used_for_invoice(self):
+        """
+        :return: the invoice that this credit invoice is used for or None
+        """
         if self.used_for:
-            if self.used_for == \
-                    FinanceConfigurations.CreditInvoice.USED_FOR[0][0]:
-                invoice_class = Invoice
-            elif self.used_for == \
-                    FinanceConfigurations.CreditInvoice.USED_FOR[1][0]:
-                invoice_class = BaseBalanceInvoice
-            else:
-                invoice_class = PackageInvoice
+            invoice_class = self.used_for_invoice_class(self.used_for)
             try:
-                invoice_object = invoice_class.objects.get(
+                return invoice_class.objects.get(
                     id=self.used_for_id
                 )
-                return invoice_object.subscription
             except invoice_class.DoesNotExist:
                 pass
 
         return None
 
+    @property
+    def subscription(self):
+        invoice_object = self.get_used_for_invoice()
+        if invoice_object is not None:
+            return invoice_object.subscription
+
+        return None
+
     @property
     def related_tracking_code(self):
-        if self.used_for:
-            if self.used_for == \
-                    FinanceConfigurations.CreditInvoice.USED_FOR[0][0]:
-                invoice_class = Invoice
-            elif self.used_for == \
-                    FinanceConfigurations.CreditInvoice.USED_FOR[1][0]:
-                invoice_class = BaseBalanceInvoice
-            else:
-                invoice_class = PackageInvoice
-            try:
-                invoice_object = invoice_class.objects.get(
-                    id=self.used_for_id
-                )
-                return invoice_object.tracking_code
-            except invoice_class.DoesNotExist:
-                pass
+        invoice_object = self.get_used_for_invoice()
+        if invoice_object is not None:
+            return invoice_object.tracking_code
 
         return None
 
@@ -1147,11 +1210,60 @@ class FailedJob(BaseModel):
     method_args = JSONField(null=True, blank=True)
     is_done = models.BooleanField(default=False)
     error_message = models.CharField(null=False, blank=False, max_length=1024)
+    # Number of retries, jobs are retried with backoff until MAX_ATTEMPTS
+    attempts = models.PositiveIntegerField(default=0)
+    next_retry_at = models.DateTimeField(default=datetime.now)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['is_done', 'next_retry_at'],
+                name='failed_job_due_idx',
+            ),
+        ]
+
+
+class TrunkNotification(BaseModel):
+    """
+    Outbox of notifications to trunk backend. Rows are written in the
+    transaction of the change they notify about and sent in batches by
+    the dispatcher
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    notify_type_code = models.CharField(
+        null=False,
+        blank=False,
+        max_length=64,
+    )
+    # An item of the list for batched types, the whole body otherwise
+    notify_object = JSONField(null=False, default=dict)
+    status_code = models.CharField(
+        null=False,
+        blank=False,
+        max_length=64,
+        choices=FinanceConfigurations.TrunkNotification.STATE_CHOICES,
+        default=FinanceConfigurations.TrunkNotification.STATE_CHOICES[0][0],
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    # Pending rows are not sent before this time (backoff of failed
+    # attempts and lease of rows that are being sent)
+    next_attempt_at = models.DateTimeField(default=datetime.now)
+    error = models.TextField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(
+                fields=['status_code', 'next_attempt_at'],
+                name='trunk_notification_due_idx',
+            ),
+        ]
 
 
 class CommandRun(BaseModel):
@@ -1163,8 +1275,196 @@ class CommandRun(BaseModel):
         choices=FinanceConfigurations.Commands.TYPES,
         default=FinanceConfigurations.Commands.TYPES[0][0]
     )
+    status_code = models.CharField(
+        null=False,
+        blank=False,
+        max_length=64,
+        choices=FinanceConfigurations.CommandRun.STATE_CHOICES,
+        default=FinanceConfigurations.CommandRun.STATE_CHOICES[0][0],
+    )
+    # Seconds of the run
+    duration = models.FloatField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class InvoiceRun(BaseModel):
+    """
+    A run of issuing periodic invoices, subscriptions are split into chunks
+    and the run can continue from unfinished chunks after a crash
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    from_date = models.DateTimeField(null=False)
+    to_date = models.DateTimeField(null=False, db_index=True)
+    status_code = models.CharField(
+        null=False,
+        blank=False,
+        max_length=64,
+        choices=FinanceConfigurations.InvoiceRun.STATE_CHOICES,
+        default=FinanceConfigurations.InvoiceRun.STATE_CHOICES[0][0],
+        db_index=True,
+    )
+    chunk_size = models.PositiveIntegerField(default=0)
+    chunks_total = models.PositiveIntegerField(default=0)
+    chunks_done = models.PositiveIntegerField(default=0)
+    issued_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    skipped_count = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class InvoiceRunChunk(BaseModel):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    invoice_run = models.ForeignKey(
+        InvoiceRun,
+        on_delete=models.CASCADE,
+        related_name='chunks',
+    )
+    chunk_index = models.PositiveIntegerField(null=False)
+    subscription_ids = JSONField(null=False, default=list)
+    is_done = models.BooleanField(default=False, db_index=True)
+    issued_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    skipped_count = models.PositiveIntegerField(default=0)
+    # Lease of the worker that processes the chunk, other workers leave the
+    # chunk alone until the lease is not renewed for CHUNK_TIMEOUT seconds
+    claimed_by = models.CharField(null=True, blank=True, max_length=128)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['chunk_index']
+        unique_together = ('invoice_run', 'chunk_index')
+
+
+class ExportJob(BaseModel):
+    """
+    An export that is written to a file by a Celery task. Jobs with the same
+    filters_hash reuse the file of a recent completed job
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    name = models.CharField(
+        null=False,
+        blank=False,
+        max_length=64,
+        choices=FinanceConfigurations.ExportJob.NAMES,
+    )
+    output = models.CharField(
+        null=False,
+        blank=False,
+        max_length=16,
+        choices=FinanceConfigurations.ExportJob.FORMATS,
+        default=FinanceConfigurations.ExportJob.FORMATS[0][0],
+    )
+    arguments = JSONField(null=False, default=list)
+    query_params = JSONField(null=False, default=dict)
+    filters_hash = models.CharField(
+        null=False,
+        blank=False,
+        max_length=64,
+        db_index=True,
+    )
+    status_code = models.CharField(
+        null=False,
+        blank=False,
+        max_length=64,
+        choices=FinanceConfigurations.ExportJob.STATE_CHOICES,
+        default=FinanceConfigurations.ExportJob.STATE_CHOICES[0][0],
+        db_index=True,
+    )
+    rows_count = models.PositiveIntegerField(default=0)
+    file_name = models.CharField(max_length=255, null=True, blank=True)
+    file_size = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class IntegrityScan(BaseModel):
+    """
+    A scan of checksums of all rows of BaseModel subclasses. Primary keys
+    of each model are split into ranges that are scanned in parallel and
+    checkpointed in IntegrityScanChunk, so a stopped scan continues later
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    status_code = models.CharField(
+        null=False,
+        blank=False,
+        max_length=64,
+        choices=FinanceConfigurations.IntegrityScan.STATE_CHOICES,
+        default=FinanceConfigurations.IntegrityScan.STATE_CHOICES[0][0],
+        db_index=True,
+    )
+    chunks_total = models.PositiveIntegerField(default=0)
+    chunks_done = models.PositiveIntegerField(default=0)
+    checked_count = models.PositiveBigIntegerField(default=0)
+    mismatch_count = models.PositiveBigIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class IntegrityScanChunk(BaseModel):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    integrity_scan = models.ForeignKey(
+        IntegrityScan,
+        on_delete=models.CASCADE,
+        related_name='chunks',
+    )
+    model_label = models.CharField(null=False, max_length=128)
+    # Range of primary keys [range_start, range_end), None is unbounded
+    range_start = models.CharField(null=True, blank=True, max_length=64)
+    range_end = models.CharField(null=True, blank=True, max_length=64)
+    # Checkpoint, primary key of the last checked row
+    last_pk = models.CharField(null=True, blank=True, max_length=64)
+    is_done = models.BooleanField(default=False, db_index=True)
+    checked_count = models.PositiveBigIntegerField(default=0)
+    mismatch_count = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['model_label', 'range_start']
+
+
+class IntegrityMismatch(BaseModel):
+    """
+    A row whose stored checksum does not match its fields, removed when the
+    row is valid again in a later scan
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    integrity_scan = models.ForeignKey(
+        IntegrityScan,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='mismatches',
+    )
+    model_label = models.CharField(null=False, max_length=128, db_index=True)
+    object_id = models.CharField(null=False, max_length=64)
+    stored_checksum = models.CharField(null=True, blank=True, max_length=512)
+    computed_checksum = models.CharField(null=False, max_length=512)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        unique_together = ('model_label', 'object_id')
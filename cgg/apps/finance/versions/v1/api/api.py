@@ -8,6 +8,9 @@
 # Email: m.esmailpour@respina.net
 # --------------------------------------------------------------------------
 
+import itertools
+
+from django.http import FileResponse
 from django.utils.translation import gettext as _
 from rest_framework import exceptions, status
 from rest_framework.views import APIView
@@ -18,10 +21,8 @@ from cgg.apps.finance.versions.v1.services.base_balance_invoice import (
     BaseBalanceInvoiceService,
 )
 from cgg.apps.finance.versions.v1.services.branch import BranchService
-# Shared tasks using Celery
 from cgg.apps.finance.versions.v1.services.cgrates_notify import (
-    handle_cgrates_expired_notification,
-    handle_cgrates_notification,
+    CGRateSNotifyService,
 )
 from cgg.apps.finance.versions.v1.services.credit_invoice import (
     CreditInvoiceService,
@@ -32,6 +33,9 @@ from cgg.apps.finance.versions.v1.services.customer import (
 from cgg.apps.finance.versions.v1.services.destination import (
     DestinationService,
 )
+from cgg.apps.finance.versions.v1.services.export_job import (
+    ExportJobService,
+)
 from cgg.apps.finance.versions.v1.services.invoice import (
     InvoiceService,
 )
@@ -55,6 +59,9 @@ from cgg.apps.finance.versions.v1.services.runtime_config import (
 from cgg.apps.finance.versions.v1.services.subscription import (
     SubscriptionService,
 )
+from cgg.apps.finance.versions.v1.services.trunk_outbox import (
+    TrunkOutboxService,
+)
 from cgg.core.decorators import log_api_request
 from cgg.core.error_messages import ErrorMessages
 from cgg.core.permissions import TrunkBackendAPIPermission
@@ -690,6 +697,9 @@ class ExportInvoicesAPIView(APIView):
         except exceptions.APIException as e:
             return response(request, error=e.detail, status=e.status_code)
 
+        if request.query_params.get('async') == 'true':
+            return export_async(request, 'invoices', [customer, subscription])
+
         return export_csv(request, 'invoices', data)
 
 
@@ -832,6 +842,12 @@ class ExportBaseBalanceInvoicesAPIView(APIView):
         except exceptions.APIException as e:
             return response(request, error=e.detail, status=e.status_code)
 
+        if request.query_params.get('async') == 'true':
+            return export_async(request, 'base-balance-invoices', [
+                customer,
+                subscription,
+            ])
+
         return export_csv(request, 'base-balance-invoices', data)
 
 
@@ -967,6 +983,12 @@ class ExportPackageInvoicesAPIView(APIView):
         except exceptions.APIException as e:
             return response(request, error=e.detail, status=e.status_code)
 
+        if request.query_params.get('async') == 'true':
+            return export_async(request, 'package-invoices', [
+                customer,
+                subscription,
+            ])
+
         return export_csv(request, 'package-invoices', data)
 
 
@@ -1103,6 +1125,12 @@ class ExportCreditInvoicesAPIView(APIView):
         except exceptions.APIException as e:
             return response(request, error=e.detail, status=e.status_code)
 
+        if request.query_params.get('async') == 'true':
+            return export_async(request, 'credit-invoices', [
+                customer,
+                subscription,
+            ])
+
         return export_csv(request, 'credit-invoices', data)
 
 
@@ -1225,6 +1253,16 @@ class PaymentsExportAPIView(APIView):
         except exceptions.APIException as e:
             return response(request, error=e.detail, status=e.status_code)
 
+        if request.query_params.get('async') == 'true':
+            return export_async(request, 'payments', [
+                customer,
+                subscription,
+                credit_invoice,
+                base_balance_invoice,
+                package_invoice,
+                invoice,
+            ])
+
         return export_csv(request, 'payments', data)
 
 
@@ -1757,6 +1795,9 @@ class ExportProfitsAPIView(APIView):
         except exceptions.APIException as e:
             return response(request, error=e.detail, status=e.status_code)
 
+        if request.query_params.get('async') == 'true':
+            return export_async(request, 'profits', [])
+
         return export_csv(request, 'profits', data)
 
 
@@ -1851,9 +1892,7 @@ class CGRateSExpiryAPIView(APIView):
         label=APILabels.EXPIRY_NOTIFICATION,
     )
     def post(self, request, subscription_code, *args, **kwargs):
-        handle_cgrates_expired_notification.delay(
-            subscription_code
-        )
+        CGRateSNotifyService.receive_expiry_notification(subscription_code)
         return response(
             request,
             status=status.HTTP_204_NO_CONTENT,
@@ -1868,10 +1907,7 @@ class CGRateSNotificationAPIView(APIView):
     )
     def post(self, request, notify_type, *args, **kwargs):
         body = Tools.get_dict_from_json(request.body)
-        handle_cgrates_notification.delay(
-            notify_type,
-            body,
-        )
+        CGRateSNotifyService.receive_notification(notify_type, body)
         return response(
             request,
             status=status.HTTP_204_NO_CONTENT,
@@ -1924,17 +1960,113 @@ def export_csv(request, name, data):
     :type request:
     :param name:
     :type name:
-    :param data:
+    :param data: iterable of rows, consumed lazily
     :type data:
     :return:
     :rtype:
     """
-    if len(data) == 0:
+    rows = iter(data)
+    first_row = next(rows, None)
+    if first_row is None:
         return response(
             request,
             error=ErrorMessages.EXPORT_NO_DATA,
             status=status.HTTP_404_NOT_FOUND,
         )
     file_name = Tools.get_file_name(name)
+    compress = request.query_params.get('compress') == 'gzip'
+
+    return csv_response(
+        itertools.chain((first_row,), rows),
+        file_name,
+        compress=compress,
+    )
 
-    return csv_response(data, file_name)
+
+def export_async(request, name, arguments):
+    """
+    Queue an export job or reuse a recent one with the same filters
+    :param request:
+    :param name: one of ExportJob.NAMES
+    :param arguments: path arguments of the export
+    :return:
+    """
+    try:
+        data = ExportJobService.request_export(
+            name,
+            arguments,
+            request.query_params,
+        )
+    except exceptions.APIException as e:
+        return response(request, error=e.detail, status=e.status_code)
+
+    return response(
+        request,
+        status=status.HTTP_202_ACCEPTED,
+        data=data,
+        message=_('Export job is queued'),
+    )
+
+
+class ExportJobAPIView(APIView):
+    permission_classes = (TrunkBackendAPIPermission,)
+
+    @log_api_request(
+        app_name=FinanceConfig.name,
+        label=APILabels.GET_EXPORT_JOB,
+    )
+    def get(self, request, export_job, *args, **kwargs):
+        """
+        Status and progress of an export job
+        """
+        try:
+            data = ExportJobService.get_export_job(export_job)
+        except exceptions.APIException as e:
+            return response(request, error=e.detail, status=e.status_code)
+
+        return response(
+            request,
+            status=status.HTTP_200_OK,
+            data=data,
+            message=_('Details of an export job'),
+        )
+
+
+class ExportJobDownloadAPIView(APIView):
+    permission_classes = (TrunkBackendAPIPermission,)
+
+    @log_api_request(
+        app_name=FinanceConfig.name,
+        label=APILabels.DOWNLOAD_EXPORT_JOB,
+    )
+    def get(self, request, export_job, *args, **kwargs):
+        """
+        File of a completed export job
+        """
+        try:
+            export_file, file_name = ExportJobService.get_export_file(
+                export_job,
+            )
+        except exceptions.APIException as e:
+            return response(request, error=e.detail, status=e.status_code)
+
+        return FileResponse(
+            export_file,
+            as_attachment=True,
+            filename=file_name,
+        )
+
+
+class TrunkNotificationStatsAPIView(APIView):
+    permission_classes = (TrunkBackendAPIPermission,)
+
+    def get(self, request, *args, **kwargs):
+        """
+        Lag and throughput of notifications to trunk backend
+        """
+        return response(
+            request,
+            status=status.HTTP_200_OK,
+            data=TrunkOutboxService.stats(),
+            message=_('Statistics of trunk notifications'),
+        )
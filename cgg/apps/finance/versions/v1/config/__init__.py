@@ -93,6 +93,8 @@ class FinanceConfigurations:
         EXPORT_INVOICES = "Export invoices"
         EXPORT_BASE_BALANCE_INVOICES = "Export base balance invoices"
         EXPORT_PROFITS = "Export profits"
+        GET_EXPORT_JOB = "Get export job"
+        DOWNLOAD_EXPORT_JOB = "Download export job"
         UPDATE_RUNTIME_CONFIGS = "Update runtime configs"
         GET_RUNTIME_CONFIGS = "Get runtime configs"
         UPDATE_SUBSCRIPTION_CONVERT = "Convert subscription"
@@ -251,6 +253,60 @@ class FinanceConfigurations:
             ('interim', _('Interim')),
         )
 
+    class InvoiceRun:
+        STATE_CHOICES = (
+            ('running', _('Running')),
+            ('completed', _('Completed')),
+        )
+        MODES = (
+            ('auto', _('Celery if broker is available, otherwise local')),
+            ('celery', _('Celery tasks')),
+            ('local', _('Local process pool')),
+            ('serial', _('Serial')),
+        )
+
+    class IntegrityScan:
+        STATE_CHOICES = (
+            ('running', _('Running')),
+            ('completed', _('Completed')),
+        )
+
+    class ExportJob:
+        STATE_CHOICES = (
+            ('pending', _('Pending')),
+            ('running', _('Running')),
+            ('completed', _('Completed')),
+            ('failed', _('Failed')),
+        )
+        FORMATS = (
+            ('csv', _('CSV')),
+            ('ndjson', _('Newline delimited JSON')),
+        )
+        NAMES = (
+            ('invoices', _('Invoices')),
+            ('base-balance-invoices', _('Base balance invoices')),
+            ('package-invoices', _('Package invoices')),
+            ('credit-invoices', _('Credit invoices')),
+            ('payments', _('Payments')),
+            ('profits', _('Profits')),
+        )
+        # Query params that control the export and are not filters
+        CONTROL_PARAMS = ('async', 'output', 'compress')
+
+    class CommandRun:
+        STATE_CHOICES = (
+            ('succeeded', _('Succeeded')),
+            ('failed', _('Failed')),
+            ('skipped', _('Skipped, another run was in progress')),
+        )
+
+    class TrunkNotification:
+        STATE_CHOICES = (
+            ('pending', _('Pending')),
+            ('sent', _('Sent')),
+            ('failed', _('Failed')),
+        )
+
     class CreditInvoice:
         OPERATION_TYPES = (
             ('increase', _('Increase')),
@@ -358,6 +414,8 @@ class FinanceConfigurations:
             ('check_deallocation', _("Check deallocation")),
             ('clean_api_requests', _("Clean api requests")),
             ('check_sessions', _("Check sessions")),
+            ('sync_cdrs', _("Sync CDRs")),
+            ('dispatch_trunk_notifications', _("Dispatch trunk notifications")),
         )
 
     class Jobs:
@@ -386,6 +444,17 @@ class FinanceConfigurations:
             POSTPAID_MAX_USAGE = "POSTPAID_MAX_USAGE"
             DEALLOCATION_WARNING_1 = "DEALLOCATION_WARNING_1"
             DEALLOCATION_WARNING_2 = "DEALLOCATION_WARNING_2"
+            # Endpoints of these types get a list of items, items of several
+            # notifications are sent in one request
+            BATCHED = (
+                DUE_DATE_WARNING_1,
+                DUE_DATE_WARNING_2,
+                DUE_DATE_WARNING_3,
+                DUE_DATE_WARNING_4,
+                PERIODIC_INVOICE,
+                DEALLOCATION_WARNING_1,
+                DEALLOCATION_WARNING_2,
+            )
 
         @classmethod
         def default_headers(cls):
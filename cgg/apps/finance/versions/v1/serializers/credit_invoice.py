@@ -14,6 +14,7 @@ from cgg.apps.finance.models import (
 from cgg.apps.finance.versions.v1.config import FinanceConfigurations
 from cgg.apps.finance.versions.v1.serializers.payment import (
     PaymentsSerializer,
+    UsedForInvoiceExportMixin,
 )
 from cgg.core import api_exceptions
 from cgg.core.error_messages import ErrorMessages
@@ -295,8 +296,12 @@ class CreditInvoicesSerializer(serializers.ModelSerializer):
         ]
 
 
-class CreditInvoiceExportSerializer(serializers.ModelSerializer):
+class CreditInvoiceExportSerializer(
+    UsedForInvoiceExportMixin,
+    serializers.ModelSerializer,
+):
     def to_representation(self, instance):
+        subscription = self.used_for_subscription(instance)
         return {
             _('id'): Tools.to_string_for_export(
                 instance.id,
@@ -308,10 +313,10 @@ class CreditInvoiceExportSerializer(serializers.ModelSerializer):
                 instance.tracking_code,
             ),
             _('subscription code'): Tools.to_string_for_export(
-                instance.subscription_code,
+                subscription.subscription_code if subscription else None,
             ),
             _('number'): Tools.to_string_for_export(
-                instance.number,
+                subscription.number if subscription else None,
             ),
             _('status code'): Tools.to_string_for_export(
                 instance.status_label,
@@ -0,0 +1,36 @@
+from rest_framework import serializers
+
+from cgg.apps.finance.models import ExportJob
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ExportJob
+        fields = [
+            'id',
+            'name',
+            'output',
+            'status_code',
+            'rows_count',
+            'file_size',
+            'error',
+            'created_at',
+            'started_at',
+            'finished_at',
+        ]
+
+    def to_representation(self, instance):
+        return {
+            "id": str(instance.id),
+            "name": instance.name,
+            "output": instance.output,
+            "status_code": instance.status_code,
+            "rows_count": instance.rows_count,
+            "file_size": instance.file_size,
+            "error": instance.error,
+            "created_at": instance.created_at.timestamp(),
+            "started_at": instance.started_at.timestamp() if
+            instance.started_at else None,
+            "finished_at": instance.finished_at.timestamp() if
+            instance.finished_at else None,
+        }
@@ -278,23 +278,57 @@ class PaymentsSerializer(serializers.ModelSerializer):
         ]
 
 
-class PaymentExportSerializer(serializers.ModelSerializer):
+class UsedForInvoiceExportMixin:
+    """
+    Reads the invoice that a credit invoice is used for from
+    context['used_for_invoices'] (see ExportService.used_for_invoices) and
+    falls back to a query per row
+    """
+
+    def used_for_invoice(self, credit_invoice):
+        used_for_invoices = self.context.get('used_for_invoices')
+        if used_for_invoices is not None and \
+                credit_invoice.id in used_for_invoices:
+            return used_for_invoices[credit_invoice.id]
+
+        return credit_invoice.get_used_for_invoice()
+
+    def used_for_subscription(self, credit_invoice):
+        invoice_object = self.used_for_invoice(credit_invoice)
+        if invoice_object is not None:
+            return invoice_object.subscription
+
+        return None
+
+
+class PaymentExportSerializer(
+    UsedForInvoiceExportMixin,
+    serializers.ModelSerializer,
+):
     def to_representation(self, instance):
+        credit_invoice = instance.credit_invoice
+        invoice_object = self.used_for_invoice(credit_invoice)
+        subscription = invoice_object.subscription if invoice_object else None
+        if credit_invoice.used_for:
+            related_tracking_code = invoice_object.tracking_code if \
+                invoice_object else None
+        else:
+            related_tracking_code = credit_invoice.tracking_code
         return {
             _('id'): Tools.to_string_for_export(
                 instance.id,
             ),
             _('related tracking code'): Tools.to_string_for_export(
-                instance.related_tracking_code,
+                related_tracking_code,
             ),
             _('prime code'): Tools.to_string_for_export(
                 instance.prime_code,
             ),
             _('subscription code'): Tools.to_string_for_export(
-                instance.subscription_code,
+                subscription.subscription_code if subscription else None,
             ),
             _('number'): Tools.to_string_for_export(
-                instance.number,
+                subscription.number if subscription else None,
             ),
             _('amount'): Tools.to_string_for_export(
                 instance.amount,
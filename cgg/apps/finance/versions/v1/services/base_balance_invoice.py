@@ -25,6 +25,7 @@ from cgg.apps.finance.versions.v1.serializers.base_balance_invoice import (
 )
 from cgg.apps.finance.versions.v1.services.common import CommonService
 from cgg.apps.finance.versions.v1.services.customer import CustomerService
+from cgg.apps.finance.versions.v1.services.export import ExportService
 from cgg.core import api_exceptions
 from cgg.core.error_messages import ErrorMessages
 from cgg.core.paginator import Paginator
@@ -112,11 +113,11 @@ class BaseBalanceInvoiceService:
             )
             data = invoice_serializer.data, paginator
         else:
-            invoice_serializer = BaseBalanceInvoiceExportSerializer(
+            data = ExportService.rows(
                 query_invoice,
-                many=True,
+                BaseBalanceInvoiceExportSerializer,
+                select_related=('subscription__customer',),
             )
-            data = invoice_serializer.data
 
         return data
 
@@ -10,7 +10,6 @@
 import json
 from datetime import datetime, timedelta
 
-from django.db.models import CharField, F, Value
 from django.utils.translation import gettext as _
 
 from cgg.apps.basic.versions.v1.config import BasicConfigurations
@@ -26,6 +25,9 @@ from cgg.apps.finance.versions.v1.serializers.branch import (
     BranchesSerializer,
 )
 from cgg.apps.finance.versions.v1.services.common import CommonService
+from cgg.apps.finance.versions.v1.services.prefix_index import (
+    PrefixIndexService,
+)
 from cgg.core import api_exceptions
 from cgg.core.cache import Cache
 from cgg.core.error_messages import ErrorMessages
@@ -112,18 +114,19 @@ class BranchService:
         :param number:
         :return:
         """
-        branch_object = Branch.objects.annotate(reverse_number=Value(
+        branch_ids = PrefixIndexService.get_index().branch_ids_of_number(
             number,
-            output_field=CharField(),
-        )).filter(
-            reverse_number__istartswith=F('destinations__prefix'),
         )
 
-        if branch_object.count() == 0:
+        if len(branch_ids) == 0:
             branch_object = cls.get_default_branch()
-        elif branch_object.count() == 1:
-            branch_object = branch_object[0]
-        elif branch_object.count() > 1:
+        elif len(branch_ids) == 1:
+            try:
+                branch_object = Branch.objects.get(id=branch_ids[0])
+            except Branch.DoesNotExist:
+                PrefixIndexService.invalidate()
+                branch_object = cls.get_branch_from_number(number)
+        else:
             raise api_exceptions.Conflict409(
                 _('More than one branch is found with this prefix')
             )
@@ -462,14 +465,9 @@ class BranchService:
         Return emergency branch code and flat list of it's numbers
         :return:
         """
-        try:
-            dest_emergency = Branch.objects.get(
-                branch_code=
-                FinanceConfigurations.Branch.DEFAULT_EMERGENCY_BRANCH[0],
-            ).destinations.all().values_list('prefix', flat=True)
-            dest_emergency = list(dest_emergency)
-        except Branch.DoesNotExist:
-            dest_emergency = []
+        dest_emergency = PrefixIndexService.get_index().branch_code_prefixes(
+            FinanceConfigurations.Branch.DEFAULT_EMERGENCY_BRANCH[0],
+        )
 
         return dest_emergency
 
@@ -481,16 +479,6 @@ class BranchService:
         :return:
         :rtype:
         """
-        dest = []
-        branches = Branch.objects.exclude(
-            branch_code__in=[
-                FinanceConfigurations.Branch.DEFAULT_EMERGENCY_BRANCH[0],
-                FinanceConfigurations.Branch.DEFAULT_COUNTRY_BRANCH[0],
-            ]
-        )
-        for b in branches:
-            dest += list(
-                b.destinations.all().values_list('prefix', flat=True)
-            )
+        dest = PrefixIndexService.get_index().not_default_prefixes()
 
         return dest
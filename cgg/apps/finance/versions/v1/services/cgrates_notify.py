@@ -1,5 +1,7 @@
 # --------------------------------------------------------------------------
-# Handle received notification from CGRateS
+# Handle received notification from CGRateS. Notifications are coalesced
+# per (notify type, subscription): while a task of a key is queued or
+# running, later notifications of the key fold into one follow-up task.
 # (C) 2020 MehrdadEP, Tehran, Iran
 # Respina Networks and beyonds - cgrates_notify.py
 # Created at 2020-8-29,  16:55:9
@@ -7,12 +9,13 @@
 # Email: m.esmailpour@respina.net
 # --------------------------------------------------------------------------
 
-import json
 import logging
 from datetime import datetime, timedelta
 
 import math
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
 from django.utils.translation import gettext as _
 
 from cgg.apps.basic.versions.v1.config.cgrates_conventions import (
@@ -21,14 +24,18 @@ from cgg.apps.basic.versions.v1.config.cgrates_conventions import (
 from cgg.apps.basic.versions.v1.services.basic import BasicService
 from cgg.apps.finance.versions.v1.config import FinanceConfigurations
 from cgg.apps.finance.versions.v1.services.common import CommonService
+from cgg.apps.finance.versions.v1.services.delayed_task import (
+    DelayedTaskService,
+)
 from cgg.apps.finance.versions.v1.services.invoice import (
     InvoiceService,
 )
-from cgg.apps.finance.versions.v1.services.job import JobService
 from cgg.apps.finance.versions.v1.services.package_invoice import (
     PackageInvoiceService,
 )
-from cgg.apps.finance.versions.v1.services.trunk import TrunkService
+from cgg.apps.finance.versions.v1.services.trunk_outbox import (
+    TrunkOutboxService,
+)
 from cgg.core import api_exceptions
 
 logger = logging.getLogger('common')
@@ -40,31 +47,49 @@ TB_NOTIFY = FinanceConfigurations.TrunkBackend.Notify
 def handle_cgrates_notification(
         notify_type,
         body,
+        intake_key=None,
 ):
     """
     Handle CGRateS Notification using celery
     :param notify_type:
     :param body:
-    :return:
+    :param intake_key: key of the notification in intake
+    :return: result of cgrates_notification
     """
-    CGRateSNotifyService.cgrates_notification(
-        notify_type,
-        body,
-    )
+    try:
+        return CGRateSNotifyService.cgrates_notification(
+            notify_type,
+            body,
+        )
+    finally:
+        if intake_key is not None:
+            CGRateSNotifyService.intake_done(
+                intake_key,
+                handle_cgrates_notification,
+            )
 
 
 @shared_task
 def handle_cgrates_expired_notification(
-        subscription_code
+        subscription_code,
+        intake_key=None,
 ):
     """
     Handle CGRateS Notification for prepaid expiry using celery
     :param subscription_code:
+    :param intake_key: key of the notification in intake
     :return:
     """
-    CGRateSNotifyService.expiry_notification(
-        subscription_code,
-    )
+    try:
+        CGRateSNotifyService.expiry_notification(
+            subscription_code,
+        )
+    finally:
+        if intake_key is not None:
+            CGRateSNotifyService.intake_done(
+                intake_key,
+                handle_cgrates_expired_notification,
+            )
 
 
 @shared_task
@@ -90,12 +115,122 @@ def handle_max_usage_postpaid_invoice(
 
 class CGRateSNotifyService:
 
+    @classmethod
+    def receive_notification(cls, notify_type, body):
+        """
+        Queue a notification of CGRateS, duplicates of a subscription are
+        coalesced
+        :param notify_type:
+        :param body:
+        :return: True if a task is queued
+        """
+        try:
+            account_object = BasicService.account_object(body)
+        except api_exceptions.ValidationError400:
+            # The task reports the invalid body
+            handle_cgrates_notification.delay(notify_type, body)
+            return True
+        subscription_code = CGRatesConventions.revert_account_name(
+            original_name=account_object['id'],
+            with_tenant=True,
+        )
+
+        return cls.intake(
+            f"{notify_type}:{subscription_code}",
+            handle_cgrates_notification,
+            [notify_type, body],
+        )
+
+    @classmethod
+    def receive_expiry_notification(cls, subscription_code):
+        """
+        Queue an expiry notification of CGRateS, duplicates are coalesced
+        :param subscription_code:
+        :return: True if a task is queued
+        """
+        return cls.intake(
+            f"expiry:{subscription_code}",
+            handle_cgrates_expired_notification,
+            [subscription_code],
+        )
+
+    @classmethod
+    def intake(cls, key, task, args):
+        """
+        Queue the task of a notification if no task of the key is queued or
+        running, otherwise keep the arguments for one follow-up task
+        :param key: notify type and subscription code
+        :param task: celery task
+        :param args: arguments of the task
+        :return: True if a task is queued
+        """
+        intake_config = settings.CGG['NOTIFY_INTAKE']
+        if not intake_config['ENABLED']:
+            task.delay(*args)
+            return True
+        running_key, pending_key = cls._intake_keys(key)
+        timeout = intake_config['LOCK_TIMEOUT']
+        if not cache.add(running_key, 1, timeout):
+            cache.set(pending_key, args, timeout)
+            # The running task may be done before pending_key is set and
+            # never see it
+            if not cache.add(running_key, 1, timeout):
+                return False
+            args = cache.get(pending_key)
+            if args is None:
+                cache.delete(running_key)
+                return False
+        cache.delete(pending_key)
+        task.apply_async(args=args, kwargs={'intake_key': key})
+
+        return True
+
+    @classmethod
+    def intake_done(cls, key, task):
+        """
+        Release the key of a finished task and queue the follow-up task if
+        notifications of the key arrived in the meantime. The follow-up
+        waits for WINDOW seconds, so notifications of the window fold into
+        it too
+        :param key: notify type and subscription code
+        :param task: celery task
+        :return: True if a follow-up task is queued
+        """
+        intake_config = settings.CGG['NOTIFY_INTAKE']
+        running_key, pending_key = cls._intake_keys(key)
+        timeout = intake_config['LOCK_TIMEOUT']
+        cache.delete(running_key)
+        if cache.get(pending_key) is None:
+            return False
+        if not cache.add(running_key, 1, timeout):
+            # A newer notification is queued and takes the pending one
+            return False
+        args = cache.get(pending_key)
+        if args is None:
+            cache.delete(running_key)
+            return False
+        cache.delete(pending_key)
+        task.apply_async(
+            args=args,
+            kwargs={'intake_key': key},
+            countdown=intake_config['WINDOW'],
+        )
+        logger.info("notifications of %s are coalesced", key)
+
+        return True
+
+    @classmethod
+    def _intake_keys(cls, key):
+        return f"notify_intake:running:{key}", f"notify_intake:pending:{key}"
+
     @classmethod
     def cgrates_notification(cls, notify_type, body):
         """
         Directly related to CGRateS
         :param notify_type: from url to decide about type of notifications
         :param body: comes directly from CGRateS call_url_async action for
+        :return: dict of subscription_code, notify_type, verified and seconds
+        of each phase of verify_and_repair
         """
         account_object = BasicService.account_object(body)
         subscription_code = CGRatesConventions.revert_account_name(
@@ -109,12 +244,16 @@ class CGRateSNotifyService:
         number = subscription_object.number
         customer_code = subscription_object.customer.customer_code
         branch_code = subscription_object.branch.branch_code
+        phases = {}
+        verified = None
 
         if notify_type == FinanceConfigurations.Notify.PostpaidEightyPercent:
-            if InvoiceService.verify_and_repair(
-                    branch_code=branch_code,
-                    subscription_code=subscription_code,
-            ):
+            verified = InvoiceService.verify_and_repair(
+                branch_code=branch_code,
+                subscription_code=subscription_code,
+                phases=phases,
+            )
+            if verified:
                 InvoiceService.issue_interim_invoice(
                     subscription_code=subscription_code,
                     description=_(
@@ -125,33 +264,22 @@ class CGRateSNotifyService:
                     FinanceConfigurations.Invoice.BypassType.EIGHTY_PERCENT,
                 )
         elif notify_type == FinanceConfigurations.Notify.PostpaidMaxUsage:
-            if InvoiceService.verify_and_repair(
-                    branch_code=branch_code,
-                    subscription_code=subscription_code,
-                    max_usage=True,
-            ):
+            verified = InvoiceService.verify_and_repair(
+                branch_code=branch_code,
+                subscription_code=subscription_code,
+                max_usage=True,
+                phases=phases,
+            )
+            if verified:
                 notify_object = {
                     "customer_code": customer_code,
                     "subscription_code": subscription_code,
                     "number": number,
                 }
-                try:
-                    TrunkService.notify_trunk_backend(
-                        notify_type_code=TB_NOTIFY.POSTPAID_MAX_USAGE,
-                        notify_object=notify_object,
-                    )
-                except api_exceptions.APIException as e:
-                    JobService.add_failed_job(
-                        FinanceConfigurations.Jobs.TYPES[1][0],
-                        'v1',
-                        'TrunkService',
-                        'notify_trunk_backend',
-                        json.dumps({
-                            "notify_type_code": TB_NOTIFY.POSTPAID_MAX_USAGE,
-                            "notify_object": notify_object,
-                        }),
-                        str(e)
-                    )
+                TrunkOutboxService.add_notification(
+                    TB_NOTIFY.POSTPAID_MAX_USAGE,
+                    notify_object,
+                )
                 wait_in_minutes = math.ceil(
                     float(BasicService.get_branch_maximum_rate(
                         branch_code
@@ -162,48 +290,38 @@ class CGRateSNotifyService:
                 check_time = datetime.now() + timedelta(
                     minutes=wait_in_minutes
                 )
-                handle_max_usage_postpaid_invoice.apply_async(
-                    args=(
-                        subscription_code,
-                    ),
-                    eta=check_time,
+                DelayedTaskService.schedule(
+                    handle_max_usage_postpaid_invoice,
+                    [subscription_code],
+                    check_time,
+                    key=f"max_usage_postpaid:{subscription_code}",
                 )
         elif notify_type == FinanceConfigurations.Notify.PrepaidEightyPercent:
-            if InvoiceService.verify_and_repair(
-                    branch_code=branch_code,
-                    subscription_code=subscription_code,
-                    is_prepaid=True,
-            ):
+            verified = InvoiceService.verify_and_repair(
+                branch_code=branch_code,
+                subscription_code=subscription_code,
+                is_prepaid=True,
+                phases=phases,
+            )
+            if verified:
                 notify_object = {
                     "subscription_code": subscription_code,
                     "customer_code": customer_code,
                     "number": number,
                 }
-                try:
-                    TrunkService.notify_trunk_backend(
-                        notify_type_code=TB_NOTIFY.PREPAID_EIGHTY_PERCENT,
-                        notify_object=notify_object,
-                    )
-                except api_exceptions.APIException as e:
-                    JobService.add_failed_job(
-                        FinanceConfigurations.Jobs.TYPES[1][0],
-                        'v1',
-                        'TrunkService',
-                        'notify_trunk_backend',
-                        json.dumps({
-                            "notify_type_code":
-                                TB_NOTIFY.PREPAID_EIGHTY_PERCENT,
-                            "notify_object": notify_object,
-                        }),
-                        str(e),
-                    )
+                TrunkOutboxService.add_notification(
+                    TB_NOTIFY.PREPAID_EIGHTY_PERCENT,
+                    notify_object,
+                )
         elif notify_type == FinanceConfigurations.Notify.PrepaidMaxUsage:
-            if InvoiceService.verify_and_repair(
-                    branch_code=branch_code,
-                    subscription_code=subscription_code,
-                    max_usage=True,
-                    is_prepaid=True,
-            ):
+            verified = InvoiceService.verify_and_repair(
+                branch_code=branch_code,
+                subscription_code=subscription_code,
+                max_usage=True,
+                is_prepaid=True,
+                phases=phases,
+            )
+            if verified:
                 is_renewed = PackageInvoiceService.expire_prepaid(
                     subscription_code,
                 )
@@ -215,23 +333,23 @@ class CGRateSNotifyService:
                 tb_notify_type = TB_NOTIFY.PREPAID_MAX_USAGE
                 if is_renewed:
                     tb_notify_type = TB_NOTIFY.PREPAID_RENEWED
-                try:
-                    TrunkService.notify_trunk_backend(
-                        notify_type_code=tb_notify_type,
-                        notify_object=notify_object,
-                    )
-                except api_exceptions.APIException as e:
-                    JobService.add_failed_job(
-                        FinanceConfigurations.Jobs.TYPES[1][0],
-                        'v1',
-                        'TrunkService',
-                        'notify_trunk_backend',
-                        json.dumps({
-                            "notify_type_code": tb_notify_type,
-                            "notify_object": notify_object,
-                        }),
-                        str(e),
-                    )
+                TrunkOutboxService.add_notification(
+                    tb_notify_type,
+                    notify_object,
+                )
+        logger.info(
+            "cgrates notification %s of %s: %s",
+            notify_type,
+            subscription_code,
+            phases,
+        )
+
+        return {
+            'subscription_code': subscription_code,
+            'notify_type': notify_type,
+            'verified': verified,
+            'phases': phases,
+        }
 
     @classmethod
     def expiry_notification(cls, subscription_code):
@@ -258,20 +376,7 @@ class CGRateSNotifyService:
         tb_notify_type = TB_NOTIFY.PREPAID_EXPIRED
         if is_renewed:
             tb_notify_type = TB_NOTIFY.PREPAID_RENEWED
-        try:
-            TrunkService.notify_trunk_backend(
-                notify_type_code=tb_notify_type,
-                notify_object=notify_object,
-            )
-        except api_exceptions.APIException as e:
-            JobService.add_failed_job(
-                FinanceConfigurations.Jobs.TYPES[1][0],
-                'v1',
-                'TrunkService',
-                'notify_trunk_backend',
-                json.dumps({
-                    "notify_type_code": tb_notify_type,
-                    "notify_object": notify_object,
-                }),
-                str(e),
-            )
+        TrunkOutboxService.add_notification(
+            tb_notify_type,
+            notify_object,
+        )
@@ -33,6 +33,7 @@ from cgg.apps.finance.versions.v1.serializers.credit_invoice import (
 )
 from cgg.apps.finance.versions.v1.services.branch import BranchService
 from cgg.apps.finance.versions.v1.services.common import CommonService
+from cgg.apps.finance.versions.v1.services.export import ExportService
 from cgg.core import api_exceptions
 from cgg.core.error_messages import ErrorMessages
 from cgg.core.paginator import Paginator
@@ -120,11 +121,12 @@ class CreditInvoiceService:
             )
             data = invoice_serializer.data, paginator
         else:
-            invoice_serializer = CreditInvoiceExportSerializer(
+            data = ExportService.rows(
                 query_invoice,
-                many=True,
+                CreditInvoiceExportSerializer,
+                select_related=('customer',),
+                context_builder=ExportService.credit_invoices_context,
             )
-            data = invoice_serializer.data
 
         return data
 
@@ -337,7 +339,7 @@ class CreditInvoiceService:
                         due_date_notified=False,
                         invoice_type_code=
                         FinanceConfigurations.Invoice.TYPES[0][0],
-                    ).update(
+                    ).update_with_checksum(
                         due_date_notified=True,
                     )
                     # Update subscription latest paid
@@ -0,0 +1,164 @@
+# --------------------------------------------------------------------------
+# Delayed tasks. Tasks that must run later are kept in a sorted set of Redis
+# by due time instead of Celery ETA messages, which are held in memory of
+# workers until due. finance_delayed_tasks polls the set and queues due
+# tasks. A task is scheduled with a key, scheduling the same key again
+# replaces the pending one.
+# (C) 2023 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - delayed_task.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+
+import json
+import logging
+import time
+
+from celery import current_app
+from django.conf import settings
+
+logger = logging.getLogger('common')
+
+
+class DelayedTaskService:
+    # Remove due members of the schedule with their payloads, pollers that
+    # run at the same time never get the same task
+    POP_DUE_SCRIPT = """
+local keys = redis.call(
+    'ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2]
+)
+local due = {}
+for i, key in ipairs(keys) do
+    local payload = redis.call('HGET', KEYS[2], key)
+    redis.call('ZREM', KEYS[1], key)
+    redis.call('HDEL', KEYS[2], key)
+    if payload then
+        table.insert(due, key)
+        table.insert(due, payload)
+    end
+end
+return due
+"""
+
+    @classmethod
+    def _redis(cls):
+        from django_redis import get_redis_connection
+
+        return get_redis_connection('default')
+
+    @classmethod
+    def _keys(cls):
+        prefix = f"{settings.CACHES['default'].get('KEY_PREFIX') or ''}:" \
+                 f"delayed_tasks"
+
+        return f"{prefix}:schedule", f"{prefix}:payloads"
+
+    @classmethod
+    def schedule(cls, task, args, due_at, key=None):
+        """
+        Run a task at due_at, a pending task of the same key is replaced
+        :param task: celery task
+        :param args: list of arguments of the task
+        :param due_at: datetime
+        :param key: identity of the task, task name and arguments by default
+        :return: key of the task
+        """
+        args = list(args)
+        if key is None:
+            key = f"{task.name}:{json.dumps(args)}"
+        if not settings.CGG['DELAYED_TASKS']['ENABLED']:
+            task.apply_async(args=args, eta=due_at)
+            return key
+        schedule_key, payloads_key = cls._keys()
+        pipeline = cls._redis().pipeline(transaction=True)
+        pipeline.hset(payloads_key, key, json.dumps({
+            "task": task.name,
+            "args": args,
+        }))
+        pipeline.zadd(schedule_key, {key: due_at.timestamp()})
+        pipeline.execute()
+
+        return key
+
+    @classmethod
+    def cancel(cls, key):
+        """
+        Remove a pending task
+        :param key: key of the task
+        :return: True if the task was pending
+        """
+        schedule_key, payloads_key = cls._keys()
+        pipeline = cls._redis().pipeline(transaction=True)
+        pipeline.zrem(schedule_key, key)
+        pipeline.hdel(payloads_key, key)
+
+        return bool(pipeline.execute()[0])
+
+    @classmethod
+    def due_at(cls, key):
+        """
+        :param key: key of the task
+        :return: timestamp of a pending task or None
+        """
+        return cls._redis().zscore(cls._keys()[0], key)
+
+    @classmethod
+    def poll(cls, limit=None):
+        """
+        Queue tasks that are due, tasks that can not be queued are scheduled
+        again after RETRY seconds
+        :param limit: maximum number of tasks
+        :return: number of queued tasks
+        """
+        delayed_config = settings.CGG['DELAYED_TASKS']
+        if limit is None:
+            limit = delayed_config['BATCH_SIZE']
+        redis = cls._redis()
+        schedule_key, payloads_key = cls._keys()
+        due = redis.eval(
+            cls.POP_DUE_SCRIPT,
+            2,
+            schedule_key,
+            payloads_key,
+            time.time(),
+            limit,
+        )
+        queued_count = 0
+        for index in range(0, len(due), 2):
+            key = due[index].decode('utf-8')
+            payload = due[index + 1].decode('utf-8')
+            try:
+                task = json.loads(payload)
+                current_app.send_task(task['task'], args=task['args'])
+                queued_count += 1
+            except Exception as e:
+                logger.error("delayed task %s is not queued: %s", key, e)
+                pipeline = redis.pipeline(transaction=True)
+                pipeline.hsetnx(payloads_key, key, payload)
+                pipeline.zadd(
+                    schedule_key,
+                    {key: time.time() + delayed_config['RETRY']},
+                    nx=True,
+                )
+                pipeline.execute()
+
+        return queued_count
+
+    @classmethod
+    def run(cls, once=False):
+        """
+        Poll the schedule every POLL_INTERVAL seconds, right away while due
+        tasks are left
+        :param once: poll one time
+        """
+        delayed_config = settings.CGG['DELAYED_TASKS']
+        while True:
+            try:
+                queued_count = cls.poll()
+            except Exception as e:
+                logger.error("delayed tasks are not polled: %s", e)
+                queued_count = 0
+            if once:
+                return
+            if queued_count < delayed_config['BATCH_SIZE']:
+                time.sleep(delayed_config['POLL_INTERVAL'])
@@ -26,6 +26,9 @@ from cgg.apps.finance.versions.v1.serializers.destination import (
     DestinationSerializer,
 )
 from cgg.apps.finance.versions.v1.services.common import CommonService
+from cgg.apps.finance.versions.v1.services.prefix_index import (
+    PrefixIndexService,
+)
 from cgg.apps.finance.versions.v1.services.runtime_config import (
     RuntimeConfigService,
 )
@@ -660,57 +663,37 @@ class DestinationService:
         :param only_corporate:
         :return:
         """
-        print(code)
-        print(includes)
-        print(excludes)
-        print(only_corporate)
-        if only_corporate:
-            prefixes = Destination.objects.filter(
-                code=code,
-                name=
-                FinanceConfigurations.Destination.CORPORATE_DEFAULT_NAME[1]
-            )
-        else:
-            prefixes = Destination.objects.filter(
-                code=code,
-            ).exclude(
-                name=
-                FinanceConfigurations.Destination.CORPORATE_DEFAULT_NAME[1]
-            )
+        prefix_index = PrefixIndexService.get_index()
+        prefixes = prefix_index.destination_prefixes(
+            code,
+            only_corporate=only_corporate,
+        )
 
         if includes or excludes:
-            branch_prefixes = []
             try:
-                branch_object = Subscription.objects.get(
+                branch_id = Subscription.objects.values_list(
+                    'branch_id',
+                    flat=True,
+                ).get(
                     Q(subscription_code=includes) |
                     Q(subscription_code=excludes)
-                ).branch
-                if branch_object:
-                    branch_prefixes = list(
-                        branch_object.destinations.values_list(
-                            'prefix',
-                            flat=True,
-                        ),
-                    )
+                )
             except Subscription.DoesNotExist:
                 raise api_exceptions.NotFound404(
                     ErrorMessages.SUBSCRIPTION_404
                 )
+            branch_prefixes = set(prefix_index.branch_prefixes(branch_id))
             if includes:
                 if branch_prefixes:
-                    prefixes = prefixes.filter(
-                        prefix__in=branch_prefixes,
-                    )
+                    prefixes = [p for p in prefixes if p in branch_prefixes]
                 else:
                     return [FinanceConfigurations.Destination.NOT_FOUND_PREFIX]
             else:
                 if branch_prefixes:
-                    prefixes = prefixes.exclude(
-                        prefix__in=branch_prefixes,
-                    )
-        prefixes = prefixes.values_list('prefix', flat=True)
-        print(prefixes)
+                    prefixes = [
+                        p for p in prefixes if p not in branch_prefixes
+                    ]
         if prefixes:
-            return list(prefixes)
+            return prefixes
         else:
             return [FinanceConfigurations.Destination.NOT_FOUND_PREFIX]
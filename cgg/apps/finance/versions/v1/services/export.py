@@ -0,0 +1,110 @@
+# --------------------------------------------------------------------------
+# Build rows of exports one by one from a server side cursor. Related rows
+# are joined with select_related and the invoices that credit invoices are
+# used for are loaded once per chunk, so memory and queries per row stay
+# flat regardless of the size of an export.
+# (C) 2021 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - export.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+
+from django.conf import settings
+
+from cgg.apps.finance.models import CreditInvoice
+
+
+class ExportService:
+
+    @classmethod
+    def rows(
+            cls,
+            queryset,
+            serializer_class,
+            select_related=(),
+            context_builder=None,
+            chunk_size=None,
+    ):
+        """
+        Generator of export rows
+        :param queryset: filtered and ordered queryset
+        :param serializer_class: export serializer of the model
+        :param select_related: relations that the serializer reads
+        :param context_builder: callable that gets a chunk of objects and
+        returns the context of the serializer for that chunk
+        :param chunk_size: number of rows fetched from database at a time
+        :return: generator of dicts
+        """
+        if chunk_size is None:
+            chunk_size = settings.CGG['EXPORT']['CHUNK_SIZE']
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        chunk = []
+        for instance in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(instance)
+            if len(chunk) >= chunk_size:
+                yield from cls._serialize(chunk, serializer_class,
+                                          context_builder)
+                chunk = []
+        if chunk:
+            yield from cls._serialize(chunk, serializer_class,
+                                      context_builder)
+
+    @classmethod
+    def _serialize(cls, chunk, serializer_class, context_builder):
+        context = context_builder(chunk) if context_builder else {}
+        serializer = serializer_class(context=context)
+        for instance in chunk:
+            yield serializer.to_representation(instance)
+
+    @classmethod
+    def used_for_invoices(cls, credit_invoices):
+        """
+        Load the invoices that credit invoices are used for with one query
+        per invoice type
+        :param credit_invoices: list of CreditInvoice
+        :return: dict of credit invoice id -> invoice or None
+        """
+        invoice_ids = {}
+        for credit_invoice in credit_invoices:
+            if credit_invoice.used_for:
+                invoice_ids.setdefault(
+                    CreditInvoice.used_for_invoice_class(
+                        credit_invoice.used_for,
+                    ),
+                    set(),
+                ).add(credit_invoice.used_for_id)
+        invoices = {}
+        for invoice_class, ids in invoice_ids.items():
+            for invoice_object in invoice_class.objects.filter(
+                    id__in=ids,
+            ).select_related('subscription'):
+                invoices[(invoice_class, invoice_object.id)] = invoice_object
+        used_for_invoices = {}
+        for credit_invoice in credit_invoices:
+            invoice_object = None
+            if credit_invoice.used_for:
+                invoice_object = invoices.get((
+                    CreditInvoice.used_for_invoice_class(
+                        credit_invoice.used_for,
+                    ),
+                    credit_invoice.used_for_id,
+                ))
+            used_for_invoices[credit_invoice.id] = invoice_object
+
+        return used_for_invoices
+
+    @classmethod
+    def credit_invoices_context(cls, credit_invoices):
+        return {
+            'used_for_invoices': cls.used_for_invoices(credit_invoices),
+        }
+
+    @classmethod
+    def payments_context(cls, payments):
+        return {
+            'used_for_invoices': cls.used_for_invoices([
+                payment.credit_invoice for payment in payments
+                if payment.credit_invoice is not None
+            ]),
+        }
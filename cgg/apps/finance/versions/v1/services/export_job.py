@@ -0,0 +1,316 @@
+# --------------------------------------------------------------------------
+# Run large finance exports in Celery tasks. Rows are written to a file in
+# chunks and the file is saved to the export storage, progress is recorded
+# in ExportJob. Requests with the same filters reuse a recent job.
+# (C) 2021 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - export_job.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+
+import csv
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from celery import shared_task
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import get_storage_class
+from django.db import transaction
+from django.http import QueryDict
+
+from cgg.apps.finance.models import ExportJob
+from cgg.apps.finance.versions.v1.config import FinanceConfigurations
+from cgg.apps.finance.versions.v1.serializers.export_job import (
+    ExportJobSerializer,
+)
+from cgg.apps.finance.versions.v1.services.base_balance_invoice import (
+    BaseBalanceInvoiceService,
+)
+from cgg.apps.finance.versions.v1.services.credit_invoice import (
+    CreditInvoiceService,
+)
+from cgg.apps.finance.versions.v1.services.invoice import InvoiceService
+from cgg.apps.finance.versions.v1.services.package_invoice import (
+    PackageInvoiceService,
+)
+from cgg.apps.finance.versions.v1.services.payment import PaymentService
+from cgg.apps.finance.versions.v1.services.profit import ProfitService
+from cgg.core import api_exceptions
+from cgg.core.error_messages import ErrorMessages
+from cgg.core.tools import Tools
+
+logger = logging.getLogger('common')
+job_config = FinanceConfigurations.ExportJob
+
+
+@shared_task
+def run_export_job(export_job_id):
+    """
+    Celery entry point of ExportJobService.process
+    :param export_job_id:
+    :return:
+    """
+    return ExportJobService.process(export_job_id)
+
+
+class ExportJobService:
+    # Name of export -> method that returns rows of the export, methods get
+    # arguments of the job followed by request and export type
+    EXPORTS = {
+        job_config.NAMES[0][0]: InvoiceService.get_invoices,
+        job_config.NAMES[1][0]: BaseBalanceInvoiceService.get_invoices,
+        job_config.NAMES[2][0]: PackageInvoiceService.get_invoices,
+        job_config.NAMES[3][0]: CreditInvoiceService.get_invoices,
+        job_config.NAMES[4][0]: PaymentService.get_payments,
+        job_config.NAMES[5][0]: ProfitService.get_profits,
+    }
+
+    @classmethod
+    def storage(cls):
+        export_config = settings.CGG['EXPORT_JOB']
+
+        return get_storage_class(export_config['STORAGE'])(
+            location=export_config['LOCATION'],
+        )
+
+    @classmethod
+    def filter_params(cls, query_params):
+        """
+        Query params of a request without the ones that control the export
+        :param query_params: QueryDict
+        :return: dict of param -> list of values
+        """
+        return {
+            param: values for param, values in query_params.lists()
+            if param not in job_config.CONTROL_PARAMS
+        }
+
+    @classmethod
+    def filters_hash(cls, name, output, arguments, query_params):
+        """
+        :param name: one of ExportJob.NAMES
+        :param output: one of ExportJob.FORMATS
+        :param arguments: list of path arguments of the export
+        :param query_params: dict of param -> list of values
+        :return: sha256 of the export and its filters
+        """
+        filters = json.dumps(
+            [name, output, arguments, query_params],
+            sort_keys=True,
+        )
+
+        return hashlib.sha256(filters.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def request_export(cls, name, arguments, query_params):
+        """
+        Reuse a pending, running or recently completed job with the same
+        filters or create a new job and queue it
+        :param name: one of ExportJob.NAMES
+        :param arguments: list of path arguments of the export
+        :param query_params: QueryDict of the request
+        :return: serialized ExportJob
+        """
+        output = query_params.get('output', job_config.FORMATS[0][0])
+        if output not in [f[0] for f in job_config.FORMATS]:
+            raise api_exceptions.ValidationError400({
+                'output': ErrorMessages.EXPORT_OUTPUT_400,
+            })
+        arguments = [
+            str(argument) if argument is not None else None
+            for argument in arguments
+        ]
+        filter_params = cls.filter_params(query_params)
+        filters_hash = cls.filters_hash(
+            name,
+            output,
+            arguments,
+            filter_params,
+        )
+        reuse_after = datetime.now() - timedelta(
+            seconds=settings.CGG['EXPORT_JOB']['REUSE_TTL'],
+        )
+        export_job = ExportJob.objects.filter(
+            filters_hash=filters_hash,
+            created_at__gte=reuse_after,
+            status_code__in=[
+                job_config.STATE_CHOICES[0][0],
+                job_config.STATE_CHOICES[1][0],
+                job_config.STATE_CHOICES[2][0],
+            ],
+        ).first()
+        if export_job is not None:
+            return ExportJobSerializer(export_job).data
+
+        export_job = ExportJob()
+        export_job.name = name
+        export_job.output = output
+        export_job.arguments = arguments
+        export_job.query_params = filter_params
+        export_job.filters_hash = filters_hash
+        export_job.save()
+        export_job_id = str(export_job.id)
+        transaction.on_commit(lambda: run_export_job.delay(export_job_id))
+
+        return ExportJobSerializer(export_job).data
+
+    @classmethod
+    def get_export_job_object(cls, export_job_id):
+        try:
+            return ExportJob.objects.get(id=export_job_id)
+        except (ExportJob.DoesNotExist, ValidationError):
+            raise api_exceptions.NotFound404(ErrorMessages.EXPORT_JOB_404)
+
+    @classmethod
+    def get_export_job(cls, export_job_id):
+        """
+        Status and progress of an export job
+        :param export_job_id:
+        :return: serialized ExportJob
+        """
+        return ExportJobSerializer(
+            cls.get_export_job_object(export_job_id),
+        ).data
+
+    @classmethod
+    def get_export_file(cls, export_job_id):
+        """
+        :param export_job_id:
+        :return: (file of a completed export job, name to download as)
+        """
+        export_job = cls.get_export_job_object(export_job_id)
+        if export_job.status_code != job_config.STATE_CHOICES[2][0]:
+            raise api_exceptions.Conflict409(ErrorMessages.EXPORT_JOB_409)
+        file_name = Tools.get_file_name(export_job.name)
+
+        return (
+            cls.storage().open(export_job.file_name),
+            f"{file_name}.{export_job.output}",
+        )
+
+    @classmethod
+    def rows(cls, export_job):
+        """
+        Rows of an export, filters are applied the same as the synchronous
+        export
+        :param export_job: ExportJob
+        :return: iterable of dicts
+        """
+        query_params = QueryDict(mutable=True)
+        for param, values in export_job.query_params.items():
+            query_params.setlist(param, values)
+        # Services only read query params of the request
+        request = SimpleNamespace(query_params=query_params)
+
+        return cls.EXPORTS[export_job.name](
+            *export_job.arguments,
+            request,
+            FinanceConfigurations.Export.Format.CSV,
+        )
+
+    @classmethod
+    def process(cls, export_job_id):
+        """
+        Write rows of a job to a file and save it in the export storage
+        :param export_job_id:
+        :return: number of exported rows
+        """
+        with transaction.atomic():
+            export_job = ExportJob.objects.select_for_update().get(
+                id=export_job_id,
+            )
+            if export_job.status_code != job_config.STATE_CHOICES[0][0]:
+                return export_job.rows_count
+            export_job.status_code = job_config.STATE_CHOICES[1][0]
+            export_job.started_at = datetime.now()
+            export_job.save()
+
+        file_name = f"{export_job.name}-{export_job.id}.{export_job.output}"
+        temp_file = tempfile.NamedTemporaryFile(
+            mode='w',
+            encoding='utf-8',
+            newline='',
+            suffix=f".{export_job.output}",
+            delete=False,
+        )
+        try:
+            with temp_file:
+                cls._write(export_job, temp_file)
+            with open(temp_file.name, 'rb') as export_file:
+                export_job.file_name = cls.storage().save(
+                    file_name,
+                    File(export_file),
+                )
+            export_job.file_size = os.path.getsize(temp_file.name)
+            export_job.status_code = job_config.STATE_CHOICES[2][0]
+        except Exception as e:
+            logger.error("export job %s failed: %s", export_job.id, e)
+            export_job.status_code = job_config.STATE_CHOICES[3][0]
+            export_job.error = str(e)
+        finally:
+            os.remove(temp_file.name)
+        export_job.finished_at = datetime.now()
+        export_job.save()
+        cls.delete_expired()
+
+        return export_job.rows_count
+
+    @classmethod
+    def _write(cls, export_job, export_file):
+        progress_size = settings.CGG['EXPORT']['CHUNK_SIZE']
+        writer = None
+        if export_job.output == job_config.FORMATS[0][0]:
+            export_file.write('\ufeff')
+        for row in cls.rows(export_job):
+            if export_job.output == job_config.FORMATS[0][0]:
+                if writer is None:
+                    writer = csv.writer(export_file)
+                    writer.writerow(row.keys())
+                writer.writerow(row.values())
+            else:
+                export_file.write(json.dumps(row, ensure_ascii=False))
+                export_file.write('\n')
+            export_job.rows_count += 1
+            if export_job.rows_count % progress_size == 0:
+                export_job.save()
+
+    @classmethod
+    def delete_expired(cls):
+        """
+        Delete jobs and files older than KEEP_HOURS
+        :return: number of deleted jobs
+        """
+        older_than = datetime.now() - timedelta(
+            hours=settings.CGG['EXPORT_JOB']['KEEP_HOURS'],
+        )
+        storage = cls.storage()
+        deleted = 0
+        for export_job in ExportJob.objects.filter(
+                created_at__lt=older_than,
+        ).exclude(
+            status_code__in=[
+                job_config.STATE_CHOICES[0][0],
+                job_config.STATE_CHOICES[1][0],
+            ],
+        ).iterator():
+            if export_job.file_name:
+                try:
+                    storage.delete(export_job.file_name)
+                except Exception as e:
+                    logger.error(
+                        "can not delete export file %s: %s",
+                        export_job.file_name,
+                        e,
+                    )
+                    continue
+            export_job.delete()
+            deleted += 1
+
+        return deleted
@@ -0,0 +1,308 @@
+# --------------------------------------------------------------------------
+# Check checksums of every row of BaseModel subclasses. Primary keys of each
+# model are split into ranges that are walked in primary key order by a
+# process pool. Each range keeps a checkpoint so a scan that is stopped by
+# its time limit continues on the next run. Mismatches are kept in
+# IntegrityMismatch.
+# (C) 2020 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - integrity_scan.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+
+import logging
+import time
+import uuid
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    wait,
+)
+from datetime import datetime
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models import Max, Min
+
+from cgg.apps.finance.models import (
+    BaseModel,
+    IntegrityMismatch,
+    IntegrityScan,
+    IntegrityScanChunk,
+)
+from cgg.apps.finance.versions.v1.config import FinanceConfigurations
+from cgg.core.integrity import Integrity
+
+logger = logging.getLogger('integrity')
+scan_config = FinanceConfigurations.IntegrityScan
+
+
+def _scan_chunk_local(chunk_id, deadline):
+    """
+    Process pool entry point of IntegrityScanService.scan_chunk (must be a
+    module level function to be picklable)
+    :param chunk_id:
+    :param deadline:
+    :return:
+    """
+    return IntegrityScanService.scan_chunk(chunk_id, deadline)
+
+
+class IntegrityScanService:
+
+    @classmethod
+    def scanned_models(cls):
+        """
+        :return: models that have a checksum
+        """
+        return [
+            model for model in apps.get_models()
+            if issubclass(model, BaseModel)
+        ]
+
+    @classmethod
+    def key_ranges(cls, model, partitions):
+        """
+        Split primary keys of a model into ranges. UUIDs are spread evenly
+        so their space is split, integer keys are split between the current
+        minimum and maximum
+        :param model:
+        :param partitions: number of ranges
+        :return: list of (start, end) as strings, None is unbounded
+        """
+        partitions = max(int(partitions), 1)
+        if isinstance(model._meta.pk, models.UUIDField):
+            bounds = [
+                str(uuid.UUID(int=index * (2 ** 128) // partitions))
+                for index in range(1, partitions)
+            ]
+        else:
+            key_range = model.objects.aggregate(
+                minimum=Min('pk'),
+                maximum=Max('pk'),
+            )
+            if key_range['minimum'] is None:
+                return [(None, None)]
+            step = (key_range['maximum'] - key_range['minimum'] + 1) / \
+                partitions
+            bounds = sorted(set(
+                str(key_range['minimum'] + int(step * index))
+                for index in range(1, partitions)
+                if int(step * index) > 0
+            ), key=int)
+        starts = [None] + bounds
+        ends = bounds + [None]
+
+        return list(zip(starts, ends))
+
+    @classmethod
+    def get_or_create_scan(cls, partitions=None, restart=False):
+        """
+        Continue the unfinished scan or create a new one
+        :param partitions: number of key ranges of each model
+        :param restart: finish the unfinished scan and start a new one
+        :return: (IntegrityScan, resumed)
+        """
+        integrity_scan = IntegrityScan.objects.filter(
+            status_code=scan_config.STATE_CHOICES[0][0],
+        ).first()
+        if integrity_scan is not None:
+            if not restart:
+                return integrity_scan, True
+            integrity_scan.status_code = scan_config.STATE_CHOICES[1][0]
+            integrity_scan.finished_at = datetime.now()
+            integrity_scan.save()
+
+        if partitions is None:
+            partitions = settings.CGG['INTEGRITY_SCAN']['PARTITIONS']
+        with transaction.atomic():
+            integrity_scan = IntegrityScan()
+            integrity_scan.save()
+            for model in cls.scanned_models():
+                for start, end in cls.key_ranges(model, partitions):
+                    chunk = IntegrityScanChunk()
+                    chunk.integrity_scan = integrity_scan
+                    chunk.model_label = model._meta.label_lower
+                    chunk.range_start = start
+                    chunk.range_end = end
+                    chunk.save()
+                    integrity_scan.chunks_total += 1
+            integrity_scan.save()
+
+        return integrity_scan, False
+
+    @classmethod
+    def scan_chunk(cls, chunk_id, deadline=None):
+        """
+        Check rows of a key range from its checkpoint in primary key order
+        :param chunk_id:
+        :param deadline: time.time() to stop at, the checkpoint is kept
+        :return: dict of checked and mismatch counts
+        """
+        chunk = IntegrityScanChunk.objects.get(id=chunk_id)
+        if chunk.is_done:
+            return cls.summary(chunk)
+
+        model = apps.get_model(chunk.model_label)
+        batch_size = settings.CGG['INTEGRITY_SCAN']['CHUNK_SIZE']
+        queryset = model.objects.all()
+        if chunk.last_pk is not None:
+            queryset = queryset.filter(pk__gt=chunk.last_pk)
+        elif chunk.range_start is not None:
+            queryset = queryset.filter(pk__gte=chunk.range_start)
+        if chunk.range_end is not None:
+            queryset = queryset.filter(pk__lt=chunk.range_end)
+        batch = []
+        for model_object in queryset.order_by('pk').iterator(
+                chunk_size=batch_size,
+        ):
+            batch.append(model_object)
+            if len(batch) >= batch_size:
+                cls._check_batch(chunk, batch)
+                batch = []
+                if deadline is not None and time.time() >= deadline:
+                    return cls.summary(chunk)
+        if batch:
+            cls._check_batch(chunk, batch)
+        chunk.is_done = True
+        chunk.save()
+
+        return cls.summary(chunk)
+
+    @classmethod
+    def _check_batch(cls, chunk, batch):
+        mismatches = []
+        valid_ids = []
+        for model_object in batch:
+            if Integrity.check(model_object):
+                valid_ids.append(str(model_object.pk))
+            else:
+                mismatches.append(model_object)
+        with transaction.atomic():
+            for model_object in mismatches:
+                logger.info(
+                    f"{model_object._meta.model}: {model_object.pk} is "
+                    f"manipulated"
+                )
+                IntegrityMismatch.objects.update_or_create(
+                    model_label=chunk.model_label,
+                    object_id=str(model_object.pk),
+                    defaults={
+                        "integrity_scan_id": chunk.integrity_scan_id,
+                        "stored_checksum": model_object.checksum,
+                        "computed_checksum": Integrity.checksum(model_object),
+                    },
+                )
+            # Rows that were fixed since the last scan
+            IntegrityMismatch.objects.filter(
+                model_label=chunk.model_label,
+                object_id__in=valid_ids,
+            ).delete()
+            chunk.last_pk = str(batch[-1].pk)
+            chunk.checked_count += len(batch)
+            chunk.mismatch_count += len(mismatches)
+            chunk.save()
+
+    @classmethod
+    def execute(cls, integrity_scan, concurrency=None, max_seconds=None):
+        """
+        Scan unfinished chunks of a scan
+        :param integrity_scan: IntegrityScan
+        :param concurrency: number of processes
+        :param max_seconds: stop after this many seconds, None is no limit
+        :return: summary of the scan
+        """
+        scan_settings = settings.CGG['INTEGRITY_SCAN']
+        if concurrency is None:
+            concurrency = scan_settings['CONCURRENCY']
+        concurrency = max(int(concurrency), 1)
+        if max_seconds is None:
+            max_seconds = scan_settings['MAX_SECONDS']
+        deadline = time.time() + max_seconds if max_seconds else None
+        chunk_ids = [
+            str(chunk_id) for chunk_id in integrity_scan.chunks.filter(
+                is_done=False,
+            ).values_list('id', flat=True)
+        ]
+        logger.info(
+            "integrity scan %s: %s chunks left, concurrency %s",
+            integrity_scan.id,
+            len(chunk_ids),
+            concurrency,
+        )
+        if concurrency > 1:
+            cls._execute_local(chunk_ids, concurrency, deadline)
+        else:
+            for chunk_id in chunk_ids:
+                if deadline is not None and time.time() >= deadline:
+                    break
+                cls.scan_chunk(chunk_id, deadline)
+
+        return cls.update_scan(integrity_scan)
+
+    @classmethod
+    def _execute_local(cls, chunk_ids, concurrency, deadline):
+        # Forked workers must not share database connections of the parent
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=concurrency) as executor:
+            pending = list(chunk_ids)
+            in_flight = {}
+            while pending or in_flight:
+                while pending and len(in_flight) < concurrency:
+                    if deadline is not None and time.time() >= deadline:
+                        pending = []
+                        break
+                    chunk_id = pending.pop(0)
+                    in_flight[executor.submit(
+                        _scan_chunk_local,
+                        chunk_id,
+                        deadline,
+                    )] = chunk_id
+                if not in_flight:
+                    break
+                done, not_done = wait(
+                    in_flight.keys(),
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    chunk_id = in_flight.pop(future)
+                    if future.exception() is not None:
+                        logger.error(
+                            "integrity scan chunk %s failed: %s",
+                            chunk_id,
+                            future.exception(),
+                        )
+
+    @classmethod
+    def update_scan(cls, integrity_scan):
+        """
+        Sum up chunks of a scan and complete it if all chunks are done
+        :param integrity_scan: IntegrityScan
+        :return: summary of the scan
+        """
+        chunks = integrity_scan.chunks.all()
+        integrity_scan.chunks_done = chunks.filter(is_done=True).count()
+        integrity_scan.checked_count = sum(
+            chunks.values_list('checked_count', flat=True),
+        )
+        integrity_scan.mismatch_count = sum(
+            chunks.values_list('mismatch_count', flat=True),
+        )
+        if integrity_scan.chunks_done >= integrity_scan.chunks_total:
+            integrity_scan.status_code = scan_config.STATE_CHOICES[1][0]
+            integrity_scan.finished_at = datetime.now()
+        integrity_scan.save()
+
+        return cls.summary(integrity_scan)
+
+    @classmethod
+    def summary(cls, scan_object):
+        """
+        :param scan_object: IntegrityScan or IntegrityScanChunk
+        :return: dict
+        """
+        return {
+            "checked": scan_object.checked_count,
+            "mismatches": scan_object.mismatch_count,
+        }
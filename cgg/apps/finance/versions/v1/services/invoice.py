@@ -7,9 +7,10 @@
 # Email: m.esmailpour@respina.net
 # --------------------------------------------------------------------------
 
-import json
 import math
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import (
     datetime,
     timedelta,
@@ -23,11 +24,12 @@ from decimal import (
 import pytz
 from celery import shared_task
 from django.conf import settings
-from django.db import DataError, transaction
+from django.db import DataError, connections, transaction
 from django.utils.translation import gettext as _
 from jdatetime import datetime as jdatetime
 
 from cgg.apps.basic.versions.v1.services.basic import BasicService
+from cgg.apps.cdr.replica import CDRReplicaService
 from cgg.apps.finance.models import (
     Invoice,
     PackageInvoice, Subscription,
@@ -37,21 +39,29 @@ from cgg.apps.finance.versions.v1.serializers.invoice import (
     ExportInvoiceSerializer,
     InvoiceSerializer,
 )
-from cgg.apps.finance.versions.v1.services.branch import BranchService
 from cgg.apps.finance.versions.v1.services.common import CommonService
 from cgg.apps.finance.versions.v1.services.credit_invoice import (
     CreditInvoiceService,
 )
-from cgg.apps.finance.versions.v1.services.destination import (
-    DestinationService,
+from cgg.apps.finance.versions.v1.services.delayed_task import (
+    DelayedTaskService,
 )
-from cgg.apps.finance.versions.v1.services.job import JobService
+from cgg.apps.finance.versions.v1.services.export import ExportService
 from cgg.apps.finance.versions.v1.services.mis import MisService
+from cgg.apps.finance.versions.v1.services.prefix_index import (
+    PrefixIndexService,
+    USAGE_CATEGORIES,
+)
 from cgg.apps.finance.versions.v1.services.runtime_config import (
     RuntimeConfigService,
 )
 from cgg.apps.finance.versions.v1.services.tax import TaxService
-from cgg.apps.finance.versions.v1.services.trunk import TrunkService
+from cgg.apps.finance.versions.v1.services.trunk_outbox import (
+    TrunkOutboxService,
+)
+from cgg.apps.finance.versions.v1.services.usage_rollup import (
+    UsageRollupService,
+)
 from cgg.core import api_exceptions
 from cgg.core.error_messages import ErrorMessages
 from cgg.core.paginator import Paginator
@@ -93,49 +103,35 @@ def continue_issuing_interim_invoice(
         description,
         on_demand=on_demand,
     )
-    subscription_object.interim_processed()
-    if invoice_object:
-        if bypass_type == invoice_config.BypassType.DEALLOCATE:
-            invoice_cause = _("Deallocation of subscription")
-        elif bypass_type == invoice_config.BypassType.EIGHTY_PERCENT:
-            invoice_cause = _("Eighty percent usage")
-        elif bypass_type == invoice_config.BypassType.MAX_USAGE:
-            invoice_cause = _("Max usage")
-        else:
-            invoice_cause = _("Your request") if on_demand else _(
-                "Nexfon support request"
-            )
-        notify_object = {
-            "customer_code": str(invoice_object['customer_code']),
-            "subscription_code": str(invoice_object['subscription_code']),
-            "number": str(invoice_object['number']),
-            "invoice_id": str(invoice_object['id']),
-            "total_cost": str(invoice_object['total_cost']),
-            "cause": invoice_cause,
-        }
-        tb_notify_type = \
-            FinanceConfigurations.TrunkBackend.Notify.INTERIM_INVOICE
-        if payed:
+    # The notification is sent if the subscription is updated
+    with transaction.atomic():
+        subscription_object.interim_processed()
+        if invoice_object:
+            if bypass_type == invoice_config.BypassType.DEALLOCATE:
+                invoice_cause = _("Deallocation of subscription")
+            elif bypass_type == invoice_config.BypassType.EIGHTY_PERCENT:
+                invoice_cause = _("Eighty percent usage")
+            elif bypass_type == invoice_config.BypassType.MAX_USAGE:
+                invoice_cause = _("Max usage")
+            else:
+                invoice_cause = _("Your request") if on_demand else _(
+                    "Nexfon support request"
+                )
+            notify_object = {
+                "customer_code": str(invoice_object['customer_code']),
+                "subscription_code": str(invoice_object['subscription_code']),
+                "number": str(invoice_object['number']),
+                "invoice_id": str(invoice_object['id']),
+                "total_cost": str(invoice_object['total_cost']),
+                "cause": invoice_cause,
+            }
             tb_notify_type = \
-                FinanceConfigurations.TrunkBackend.Notify \
-                    .INTERIM_INVOICE_AUTO_PAYED
-        try:
-            TrunkService.notify_trunk_backend(
-                notify_type_code=tb_notify_type,
-                notify_object=notify_object,
-            )
-        except api_exceptions.APIException as e:
-            JobService.add_failed_job(
-                FinanceConfigurations.Jobs.TYPES[1][0],
-                'v1',
-                'TrunkService',
-                'notify_trunk_backend',
-                json.dumps({
-                    "notify_type_code": tb_notify_type,
-                    "notify_object": notify_object,
-                }),
-                str(e)
-            )
+                FinanceConfigurations.TrunkBackend.Notify.INTERIM_INVOICE
+            if payed:
+                tb_notify_type = \
+                    FinanceConfigurations.TrunkBackend.Notify \
+                        .INTERIM_INVOICE_AUTO_PAYED
+            TrunkOutboxService.add_notification(tb_notify_type, notify_object)
 
     return True
 
@@ -257,11 +253,11 @@ class InvoiceService:
             )
             data = invoice_serializer.data, paginator
         else:
-            invoice_serializer = ExportInvoiceSerializer(
+            data = ExportService.rows(
                 query_invoice,
-                many=True,
+                ExportInvoiceSerializer,
+                select_related=('subscription__customer',),
             )
-            data = invoice_serializer.data
 
         return data
 
@@ -339,32 +335,59 @@ class InvoiceService:
             subscription_code,
             from_date,
     ):
-        cdrs = BasicService.get_cdrs(
+        """
+        Cost of CDRs created since from_date, replicated CDRs are summed in
+        database
+        :param subscription_code:
+        :param from_date: datetime or None for all CDRs
+        :return:
+        """
+        totals = CDRReplicaService.totals(
+            from_date,
             subscription_codes=[subscription_code],
-            created_at_start=str(from_date.timestamp()).split('.')[0] if
-            from_date else "",
+            by_balance_type=True,
         )
-        cdrs = BasicService.cdrs_minimal_object(
-            cdrs,
-        )
-        used_cdrs = []
         cost_postpaid = Decimal(0)
         cost_prepaid = Decimal(0)
-        for cdr in cdrs:
-            if cdr['cgr_id'] not in used_cdrs:
-                if cdr["extra_fields"]["balance_type"] == \
-                        FinanceConfigurations.Subscription.TYPE[0][0]:
-                    cost_postpaid += Decimal(cdr['cost'])
-                else:
-                    cost_prepaid += Decimal(cdr['cost'])
-
-                used_cdrs.append(cdr['cgr_id'])
+        for balance_type, total in totals.items():
+            if balance_type == FinanceConfigurations.Subscription.TYPE[0][0]:
+                cost_postpaid += total['cost']
+            else:
+                cost_prepaid += total['cost']
 
         return {
             "cost_postpaid": cost_postpaid,
             "cost_prepaid": cost_prepaid,
         }
 
+    @classmethod
+    def subscription_branch_id(cls, subscription_code):
+        """
+        :param subscription_code:
+        :return: branch_id of the subscription
+        """
+        try:
+            return Subscription.objects.values_list(
+                'branch_id',
+                flat=True,
+            ).get(subscription_code=subscription_code)
+        except Subscription.DoesNotExist:
+            raise api_exceptions.NotFound404(
+                ErrorMessages.SUBSCRIPTION_404
+            )
+
+    @classmethod
+    def usage_prefix_trie(cls, subscription_code):
+        """
+        Prefix trie of usage categories for a subscription. Local and long
+        distance prefixes depend on the branch of the subscription
+        :param subscription_code:
+        :return: PrefixTrie
+        """
+        branch_id = cls.subscription_branch_id(subscription_code)
+
+        return PrefixIndexService.get_index().usage_trie(branch_id)
+
     @classmethod
     def calculate_usages(
             cls,
@@ -373,390 +396,91 @@ class InvoiceService:
             to_date,
     ):
         """
-        Calculate usages and costs based on CDRs
+        Calculate usages and costs based on CDRs. Whole days of the period
+        are read from daily usage rollups, CDRs of the partial days at the
+        edges (or of the whole period if rollups do not cover it) are
+        streamed once and classified locally by destination prefix
         :param subscription_code:
         :param from_date:
         :param to_date:
         :return:
         """
-        prefixes_landline_local = \
-            DestinationService.get_prefixes_landline_local(
-                subscription_code,
-            )
-        prefixes_landline_long_distance = \
-            DestinationService.get_prefixes_landline_long_distance(
+        branch_id = cls.subscription_branch_id(subscription_code)
+        prefix_index = PrefixIndexService.get_index()
+        prefixes_trie = prefix_index.usage_trie(branch_id)
+        totals = {}
+        for category in USAGE_CATEGORIES:
+            for suffix in ('', '_prepaid'):
+                totals[f'{category}_usage{suffix}'] = Decimal(0)
+                totals[f'{category}_cost{suffix}'] = Decimal(0)
+        periods = [(from_date, to_date)]
+        rollup_days = UsageRollupService.rollup_days(from_date, to_date)
+        if rollup_days is not None:
+            first_day, end_day = rollup_days
+            rollups = UsageRollupService.totals(
                 subscription_code,
+                branch_id,
+                first_day,
+                end_day,
             )
-        prefixes_landline_corporate = \
-            DestinationService.get_prefixes_landline_corporate()
-        prefixes_landline_branches = \
-            BranchService.get_not_default_destinations()
-        prefixes_mobile = DestinationService.get_prefixes_mobile()
-        prefixes_international = \
-            DestinationService.get_prefixes_international()
-
-        # landlines_local_object = BasicService.get_cdrs(
-        #     subscription_codes=[subscription_code],
-        #     created_at_start=str(from_date.timestamp()).split('.')[0],
-        #     created_at_end=str(to_date.timestamp()).split('.')[0],
-        #     destination_prefixes=prefixes_landline_local,
-        #     not_destination_prefixes=list(
-        #         prefixes_international + prefixes_mobile +
-        #         prefixes_landline_corporate + prefixes_landline_long_distance
-        #     ),
-        # )
-
-        landlines_local_object_count = BasicService.get_cdrs_count(
-            subscription_codes=[subscription_code],
-            created_at_start=str(from_date.timestamp()).split('.')[0],
-            created_at_end=str(to_date.timestamp()).split('.')[0],
-            destination_prefixes=prefixes_landline_local,
-            not_destination_prefixes=list(
-                prefixes_international + prefixes_mobile +
-                prefixes_landline_corporate + prefixes_landline_long_distance
-            ),
-        )
-
-        with open('logs.txt', 'w') as f:
-            f.write('\n landlines_local_object_count : ' + str(landlines_local_object_count))
-
-
-        # landlines_long_distance_object = BasicService.get_cdrs(
-        #     subscription_codes=[subscription_code],
-        #     created_at_start=str(from_date.timestamp()).split('.')[0],
-        #     created_at_end=str(to_date.timestamp()).split('.')[0],
-        #     destination_prefixes=prefixes_landline_long_distance,
-        #     not_destination_prefixes=list(
-        #         prefixes_international + prefixes_mobile +
-        #         prefixes_landline_corporate + prefixes_landline_local
-        #     ),
-        # )
-
-        landlines_long_distance_object_count = BasicService.get_cdrs_count(
-            subscription_codes=[subscription_code],
-            created_at_start=str(from_date.timestamp()).split('.')[0],
-            created_at_end=str(to_date.timestamp()).split('.')[0],
-            destination_prefixes=prefixes_landline_long_distance,
-            not_destination_prefixes=list(
-                prefixes_international + prefixes_mobile +
-                prefixes_landline_corporate + prefixes_landline_local
-            ),
-        )
-
-        with open('logs.txt', 'a') as f:
-            f.write('\n landlines_long_distance_object_count: ' + str(landlines_long_distance_object_count))
-
-
-
-
-        # landlines_corporate_object = BasicService.get_cdrs(
-        #     subscription_codes=[subscription_code],
-        #     created_at_start=str(from_date.timestamp()).split('.')[0],
-        #     created_at_end=str(to_date.timestamp()).split('.')[0],
-        #     destination_prefixes=prefixes_landline_corporate,
-        #     not_destination_prefixes=[
-        #         d for d in list(
-        #             prefixes_international + prefixes_mobile +
-        #             prefixes_landline_local + prefixes_landline_long_distance
-        #         ) if d not in prefixes_landline_branches
-        #     ],
-        # )
-
-
-        landlines_corporate_object_count = BasicService.get_cdrs_count(
-            subscription_codes=[subscription_code],
-            created_at_start=str(from_date.timestamp()).split('.')[0],
-            created_at_end=str(to_date.timestamp()).split('.')[0],
-            destination_prefixes=prefixes_landline_corporate,
-            not_destination_prefixes=[
-                d for d in list(
-                    prefixes_international + prefixes_mobile +
-                    prefixes_landline_local + prefixes_landline_long_distance
-                ) if d not in prefixes_landline_branches
-            ],
-        )
-
-        with open('logs.txt', 'a') as f:
-            f.write('\n landlines_corporate_object_count: ' + str(landlines_corporate_object_count))
-
-
-        # mobiles_national_object = BasicService.get_cdrs(
-        #     subscription_codes=[subscription_code],
-        #     created_at_start=str(from_date.timestamp()).split('.')[0],
-        #     created_at_end=str(to_date.timestamp()).split('.')[0],
-        #     destination_prefixes=prefixes_mobile,
-        #     not_destination_prefixes=list(
-        #         prefixes_international + prefixes_landline_corporate +
-        #         prefixes_landline_local + prefixes_landline_long_distance
-        #     ),
-        # )
-
-
-        mobiles_national_object_count = BasicService.get_cdrs(
-            subscription_codes=[subscription_code],
-            created_at_start=str(from_date.timestamp()).split('.')[0],
-            created_at_end=str(to_date.timestamp()).split('.')[0],
-            destination_prefixes=prefixes_mobile,
-            not_destination_prefixes=list(
-                prefixes_international + prefixes_landline_corporate +
-                prefixes_landline_local + prefixes_landline_long_distance
-            ),
-        )
-
-        with open('logs.txt', 'a') as f:
-            f.write('\n mobiles_national_object_count: ' + str(mobiles_national_object_count))
-
-
-
-        # international_object = BasicService.get_cdrs(
-        #     subscription_codes=[subscription_code],
-        #     created_at_start=str(from_date.timestamp()).split('.')[0],
-        #     created_at_end=str(to_date.timestamp()).split('.')[0],
-        #     destination_prefixes=prefixes_international,
-        #     not_destination_prefixes=list(
-        #         prefixes_mobile + prefixes_landline_corporate +
-        #         prefixes_landline_local + prefixes_landline_long_distance
-        #     ),
-        # )
-
-
-        international_object_count = BasicService.get_cdrs_count(
-            subscription_codes=[subscription_code],
-            created_at_start=str(from_date.timestamp()).split('.')[0],
-            created_at_end=str(to_date.timestamp()).split('.')[0],
-            destination_prefixes=prefixes_international,
-            not_destination_prefixes=list(
-                prefixes_mobile + prefixes_landline_corporate +
-                prefixes_landline_local + prefixes_landline_long_distance
-            ),
-        )
-
-        with open('logs.txt', 'a') as f:
-            f.write('\n international_object_count: ' + str(international_object_count))
-
-
-
-        all_sub_c_cdrs_count = BasicService.get_cdrs_count(
-            subscription_codes=[subscription_code],
-        )
-
-        with open('logs.txt', 'a') as f:
-            f.write('\n all_sub_c_cdrs_count: ' + str(all_sub_c_cdrs_count))
-
-
-        
-
-
-
-
-
-        landlines_local_list = BasicService.cdrs_minimal_object(
-            landlines_local_object,
-        )
-        landlines_long_distance_list = BasicService.cdrs_minimal_object(
-            landlines_long_distance_object,
-        )
-        mobiles_list = BasicService.cdrs_minimal_object(
-            mobiles_national_object,
-        )
-        internationals_list = BasicService.cdrs_minimal_object(
-            international_object,
-        )
-        landlines_corporate_list = BasicService.cdrs_minimal_object(
-            landlines_corporate_object,
-        )
-        mobile_usage = Decimal(0)
-        mobile_cost = Decimal(0)
-        landline_local_usage = Decimal(0)
-        landline_local_cost = Decimal(0)
-        landline_long_distance_usage = Decimal(0)
-        landline_long_distance_cost = Decimal(0)
-        landlines_corporate_usage = Decimal(0)
-        landlines_corporate_cost = Decimal(0)
-        international_usage = Decimal(0)
-        international_cost = Decimal(0)
-        mobile_usage_prepaid = Decimal(0)
-        mobile_cost_prepaid = Decimal(0)
-        landline_local_usage_prepaid = Decimal(0)
-        landline_local_cost_prepaid = Decimal(0)
-        landline_long_distance_usage_prepaid = Decimal(0)
-        landline_long_distance_cost_prepaid = Decimal(0)
-        landlines_corporate_usage_prepaid = Decimal(0)
-        landlines_corporate_cost_prepaid = Decimal(0)
-        international_usage_prepaid = Decimal(0)
-        international_cost_prepaid = Decimal(0)
-        used_cdrs = []
-
-        for landlines_item in landlines_corporate_list:
-            if landlines_item['cgr_id'] not in used_cdrs:
-                if landlines_item["extra_fields"]["balance_type"] == \
-                        FinanceConfigurations.Subscription.TYPE[0][0]:
-                    landlines_corporate_usage += Decimal(
-                        landlines_item['usage'])
-                    landlines_corporate_cost += Decimal(landlines_item['cost'])
-                else:
-                    landlines_corporate_usage_prepaid += Decimal(
-                        landlines_item['usage'],
-                    )
-                    landlines_corporate_cost_prepaid += Decimal(
-                        landlines_item['cost'],
+            if rollups is not None:
+                for rollup in rollups:
+                    suffix = UsageRollupService.balance_suffix(
+                        rollup['balance_type'],
                     )
-
-                used_cdrs.append(landlines_item['cgr_id'])
-
-        for landlines_item in landlines_local_list:
-            if landlines_item['cgr_id'] not in used_cdrs:
-                if landlines_item["extra_fields"]["balance_type"] == \
-                        FinanceConfigurations.Subscription.TYPE[0][0]:
-                    if landlines_item['category'] == 'BR_Tehran':
-                        landline_local_usage += cls.round_to_nearest_min(Decimal(landlines_item['usage']))
-                    else:
-                        landline_local_usage += cls.round_to_nearest_half_min(Decimal(landlines_item['usage']))
-                    landline_local_cost += Decimal(landlines_item['cost'])
-                else:
-                    if landlines_item['category'] == 'BR_Tehran':
-                        landline_local_usage_prepaid += cls.round_to_nearest_min(Decimal(
-                            landlines_item['usage'],
-                        ))
-                    else:
-                        landline_local_usage_prepaid += cls.round_to_nearest_half_min(Decimal(
-                            landlines_item['usage'],
-                        ))
-
-                    landline_local_cost_prepaid += Decimal(
-                        landlines_item['cost'],
-                    )
-
-                used_cdrs.append(landlines_item['cgr_id'])
-
-        for landlines_item in landlines_long_distance_list:
-            if landlines_item['cgr_id'] not in used_cdrs:
-                if landlines_item["extra_fields"]["balance_type"] == \
-                        FinanceConfigurations.Subscription.TYPE[0][0]:
-                    landline_long_distance_usage += cls.round_to_nearest_half_min(Decimal(
-                        landlines_item['usage'],
-                    ))
-                    landline_long_distance_cost += Decimal(
-                        landlines_item['cost'],
-                    )
-                else:
-                    landline_long_distance_usage_prepaid += cls.round_to_nearest_half_min(Decimal(
-                        landlines_item['usage'],
-                    ))
-                    landline_long_distance_cost_prepaid += Decimal(
-                        landlines_item['cost'],
+                    category = rollup['category']
+                    totals[f'{category}_usage{suffix}'] += Decimal(
+                        rollup['total_rounded_usage'],
                     )
-                used_cdrs.append(landlines_item['cgr_id'])
-
-        for mobiles_item in mobiles_list:
-            if mobiles_item['cgr_id'] not in used_cdrs:
-                if mobiles_item["extra_fields"]["balance_type"] == \
-                        FinanceConfigurations.Subscription.TYPE[0][0]:
-                    mobile_usage += cls.round_to_nearest_half_min(Decimal(mobiles_item['usage']))
-                    mobile_cost += Decimal(mobiles_item['cost'])
-                else:
-                    mobile_usage_prepaid += cls.round_to_nearest_half_min(Decimal(mobiles_item['usage']))
-                    mobile_cost_prepaid += Decimal(mobiles_item['cost'])
-                used_cdrs.append(mobiles_item['cgr_id'])
-
-        for internationals_item in internationals_list:
-            if internationals_item['cgr_id'] not in used_cdrs:
-                if internationals_item["extra_fields"]["balance_type"] == \
-                        FinanceConfigurations.Subscription.TYPE[0][0]:
-                    international_usage += Decimal(
-                        internationals_item['usage'],
-                    )
-                    international_cost += Decimal(internationals_item['cost'])
-                else:
-                    international_usage_prepaid += Decimal(
-                        internationals_item['usage'],
-                    )
-                    international_cost_prepaid += Decimal(
-                        internationals_item['cost'],
+                    totals[f'{category}_cost{suffix}'] += Decimal(
+                        rollup['total_cost'],
                     )
+                periods = [(from_date, first_day), (end_day, to_date)]
+        used_cdrs = set()
+        for start, end in periods:
+            if start is not None and end is not None and start >= end:
+                continue
+            cdrs = CDRReplicaService.iter_cdrs(
+                start,
+                end,
+                subscription_codes=[subscription_code],
+            )
+            for cdr in cdrs:
+                if cdr['cgr_id'] in used_cdrs:
+                    continue
+                category = prefix_index.classify_usage(
+                    prefixes_trie,
+                    cdr['destination'],
+                )
+                if category is None:
+                    continue
+                used_cdrs.add(cdr['cgr_id'])
+                usage = UsageRollupService.rounded_usage(
+                    category,
+                    cdr['category'],
+                    Decimal(cdr['usage']),
+                )
+                suffix = UsageRollupService.balance_suffix(
+                    cdr["extra_fields"]["balance_type"],
+                )
+                totals[f'{category}_usage{suffix}'] += usage
+                totals[f'{category}_cost{suffix}'] += Decimal(cdr['cost'])
 
-                used_cdrs.append(internationals_item['cgr_id'])
-
-        cost_usage_dict = {
-            # Postpaid part of usages and costs
-            'landlines_corporate_usage': Decimal(
-                landlines_corporate_usage,
-            ).to_integral_exact(rounding=ROUND_CEILING),
-            'landlines_corporate_cost': Decimal(
-                landlines_corporate_cost,
-            ).to_integral_exact(rounding=ROUND_CEILING),
-            'landlines_local_cost': Decimal(
-                landline_local_cost,
-            ).to_integral_exact(rounding=ROUND_CEILING),
-            'landlines_local_usage': Decimal(
-                landline_local_usage,
-            ).to_integral_exact(rounding=ROUND_CEILING),
-            'landlines_long_distance_cost': Decimal(
-                landline_long_distance_cost,
-            ).to_integral_exact(rounding=ROUND_CEILING),
-            'landlines_long_distance_usage': Decimal(
-                landline_long_distance_usage,
-            ).to_integral_exact(rounding=ROUND_CEILING),
-            'mobile_cost': Decimal(mobile_cost).to_integral_exact(
-                rounding=ROUND_CEILING,
-            ),
-            'mobile_usage': Decimal(mobile_usage).to_integral_exact(
-                rounding=ROUND_CEILING,
-            ),
-            'international_cost': Decimal(
-                international_cost).to_integral_exact(
-                rounding=ROUND_CEILING,
-            ),
-            'international_usage': Decimal(
-                international_usage).to_integral_exact(
-                rounding=ROUND_CEILING,
-            ),
-            # Prepaid part of usages and costs
-            'landlines_corporate_usage_prepaid': Decimal(
-                landlines_corporate_usage_prepaid,
-            ).to_integral_exact(rounding=ROUND_CEILING),
-            'landlines_corporate_cost_prepaid': Decimal(
-                landlines_corporate_cost_prepaid,
-            ).to_integral_exact(rounding=ROUND_CEILING),
-            'landlines_local_cost_prepaid': Decimal(
-                landline_local_cost_prepaid,
-            ).to_integral_exact(rounding=ROUND_CEILING),
-            'landlines_local_usage_prepaid': Decimal(
-                landline_local_usage_prepaid,
-            ).to_integral_exact(rounding=ROUND_CEILING),
-            'landlines_long_distance_cost_prepaid': Decimal(
-                landline_long_distance_cost_prepaid,
-            ).to_integral_exact(rounding=ROUND_CEILING),
-            'landlines_long_distance_usage_prepaid': Decimal(
-                landline_long_distance_usage_prepaid,
-            ).to_integral_exact(rounding=ROUND_CEILING),
-            'mobile_cost_prepaid': Decimal(
-                mobile_cost_prepaid).to_integral_exact(
-                rounding=ROUND_CEILING,
-            ),
-            'mobile_usage_prepaid': Decimal(
-                mobile_usage_prepaid).to_integral_exact(
+        cost_usage_dict = {}
+        for key, value in totals.items():
+            cost_usage_dict[key] = Decimal(value).to_integral_exact(
                 rounding=ROUND_CEILING,
-            ),
-            'international_cost_prepaid': Decimal(
-                international_cost_prepaid).to_integral_exact(
-                rounding=ROUND_CEILING,
-            ),
-            'international_usage_prepaid': Decimal(
-                international_usage_prepaid).to_integral_exact(
-                rounding=ROUND_CEILING,
-            ),
-        }
+            )
 
         return cost_usage_dict
 
     @classmethod
     def round_to_nearest_half_min(cls, time):
-        return Decimal(time / 30000000000).to_integral_exact(rounding=ROUND_CEILING) * 30000000000
+        return UsageRollupService.round_to_nearest_half_min(time)
 
     @classmethod
     def round_to_nearest_min(cls, time):
-        return Decimal(time / 60000000000).to_integral_exact(rounding=ROUND_CEILING) * 60000000000
+        return UsageRollupService.round_to_nearest_min(time)
 
     @classmethod
     def calculate_discount(
@@ -1095,15 +819,17 @@ class InvoiceService:
                     should_restart = True
 
                 if should_restart:
-                    restart_issuing_interim_invoice.apply_async(
-                        args=(
+                    DelayedTaskService.schedule(
+                        restart_issuing_interim_invoice,
+                        [
                             customer_code,
                             subscription_code,
                             description,
                             bypass_type,
                             on_demand,
-                        ),
-                        eta=check_time,
+                        ],
+                        check_time,
+                        key=f"restart_interim_invoice:{subscription_code}",
                     )
                     return
 
@@ -1151,87 +877,79 @@ class InvoiceService:
         if isinstance(to_date, str):
             to_date = datetime.fromtimestamp(float(to_date))
 
-        # Check latest invoice and subscription's created at. Change
-        # from date if necessary
-        try:
-            subscription_object = Subscription.objects.get(
-                id=subscription_id,
-                is_allocated=True,
-            )
-        except Subscription.DoesNotExist:
-            raise api_exceptions.NotFound404(
-                ErrorMessages.SUBSCRIPTION_404,
-            )
+        # The subscription is locked until the invoice is committed, runs
+        # that issue the same period at the same time see the latest invoice
+        # of each other
+        with transaction.atomic():
+            # Check latest invoice and subscription's created at. Change
+            # from date if necessary
+            try:
+                subscription_object = Subscription.objects.select_for_update(
+                ).get(
+                    id=subscription_id,
+                    is_allocated=True,
+                )
+            except Subscription.DoesNotExist:
+                raise api_exceptions.NotFound404(
+                    ErrorMessages.SUBSCRIPTION_404,
+                )
 
-        if subscription_object.subscription_type == \
-                FinanceConfigurations.Subscription.TYPE[2][0]:
-            raise api_exceptions.Conflict409(
-                ErrorMessages.SUBSCRIPTION_409_UNLIMITED
-            )
+            if subscription_object.subscription_type == \
+                    FinanceConfigurations.Subscription.TYPE[2][0]:
+                raise api_exceptions.Conflict409(
+                    ErrorMessages.SUBSCRIPTION_409_UNLIMITED
+                )
 
-        if from_date < subscription_object.created_at:
-            from_date = subscription_object.created_at + timedelta(
-                microseconds=1,
-            )
+            if from_date < subscription_object.created_at:
+                from_date = subscription_object.created_at + timedelta(
+                    microseconds=1,
+                )
 
-        should_issue = True
-        try:
-            latest_invoice = Invoice.objects.filter(
-                subscription=subscription_object,
-            ).latest(
-                'created_at',
-            )
-            if to_date == latest_invoice.to_date:
-                # this is it, no need to create a new one
-                should_issue = False
-            if from_date < latest_invoice.to_date:
-                from_date = latest_invoice.to_date
-        except Invoice.DoesNotExist:
-            pass
+            should_issue = True
+            try:
+                latest_invoice = Invoice.objects.filter(
+                    subscription=subscription_object,
+                ).latest(
+                    'created_at',
+                )
+                if to_date == latest_invoice.to_date:
+                    # this is it, no need to create a new one
+                    should_issue = False
+                if from_date < latest_invoice.to_date:
+                    from_date = latest_invoice.to_date
+            except Invoice.DoesNotExist:
+                pass
 
-        payed = False
-        if should_issue:
-            invoice_object, payed = cls.issue_invoice(
-                subscription_object,
-                from_date,
-                to_date,
-                invoice_type_code,
-                description,
-            )
+            payed = False
+            if should_issue:
+                invoice_object, payed = cls.issue_invoice(
+                    subscription_object,
+                    from_date,
+                    to_date,
+                    invoice_type_code,
+                    description,
+                )
 
-            if invoice_object is not None and notify_singular:
-                notify_object = [{
-                    "customer_code":
-                        str(invoice_object['customer_code']),
-                    "subscription_code": str(
-                        invoice_object['subscription_code']
-                    ),
-                    "number": str(
-                        invoice_object['number']
-                    ),
-                    'invoice_id': str(invoice_object['id']),
-                    'total_cost': str(invoice_object['total_cost']),
-                    'auto_payed': payed,
-                }]
-                try:
-                    TrunkService.notify_trunk_backend(
-                        notify_type_code=FinanceConfigurations.TrunkBackend
-                            .Notify.PERIODIC_INVOICE,
-                        notify_object=notify_object,
-                    )
-                except api_exceptions.APIException as e:
-                    JobService.add_failed_job(
-                        FinanceConfigurations.Jobs.TYPES[1][0],
-                        'v1',
-                        'TrunkService',
-                        'notify_trunk_backend',
-                        json.dumps({
-                            "notify_type_code":
-                                FinanceConfigurations.TrunkBackend
-                                    .Notify.PERIODIC_INVOICE,
-                            "notify_object": notify_object,
-                        }),
-                        str(e)
+                if invoice_object is not None and notify_singular:
+                    notify_object = [{
+                        "customer_code":
+                            str(invoice_object['customer_code']),
+                        "subscription_code": str(
+                            invoice_object['subscription_code']
+                        ),
+                        "number": str(
+                            invoice_object['number']
+                        ),
+                        'invoice_id': str(invoice_object['id']),
+                        'total_cost': str(invoice_object['total_cost']),
+                        'auto_payed': payed,
+                    }]
+                    tb_notify_type = \
+                        FinanceConfigurations.TrunkBackend.Notify \
+                            .PERIODIC_INVOICE
+                    TrunkOutboxService.add_notification(
+                        tb_notify_type,
+                        notify_object,
                     )
 
         return invoice_object, payed
@@ -1327,36 +1045,50 @@ class InvoiceService:
             subscription_code,
             max_usage=False,
             is_prepaid=False,
+            phases=None,
     ):
         """
-        Verify the correctness of 80 and 100 percent events and fix sessions
+        Verify the correctness of 80 and 100 percent events and fix sessions.
+        Independent reads are run concurrently with a shared deadline
         :param max_usage:
         :param branch_code:
         :param subscription_code:
         :param is_prepaid:
-        :return:
+        :param phases: dict that gets seconds of each phase
+        :return: False if the balance is repaired
         """
-        # Phase 1: Go through active sessions unconditionally
-        BasicService.disconnect_sessions(
-            subscription_code=subscription_code,
-            setup_time=datetime.now() - timedelta(
-                seconds=int(settings.CGG['MAX_CALL_DURATION'])
+
+        def sessions():
+            # Phase 1: Go through active sessions unconditionally, then get
+            # the cost of the remaining sessions
+            BasicService.disconnect_sessions(
+                subscription_code=subscription_code,
+                setup_time=datetime.now() - timedelta(
+                    seconds=int(settings.CGG['MAX_CALL_DURATION'])
+                )
             )
-        )
+            return cls._total_unpaid_active(subscription_code)
+
+        calls = {
+            'sessions': sessions,
+            'usages': lambda: cls._total_unpaid_usages(
+                subscription_code,
+                is_prepaid,
+            ),
+            'balance': lambda: BasicService.get_balance(
+                subscription_code,
+                True,
+            ),
+        }
+        if max_usage:
+            calls['maximum_rate'] = \
+                lambda: BasicService.get_branch_maximum_rate(branch_code)
+        results = cls._fan_out(calls, phases)
         # Phase 2: Repair the current balance if needed
-        total_active = cls._total_unpaid_active(subscription_code)
-        total_unpaid = cls._total_unpaid_usages(
-            subscription_code,
-            is_prepaid,
-        )
-        total_cost = total_active + total_unpaid
-        balances = BasicService.get_balance(subscription_code, True)
+        total_cost = results['sessions'] + results['usages']
+        balances = results['balance']
         if max_usage:
-            check_value = Decimal(
-                BasicService.get_branch_maximum_rate(
-                    branch_code
-                )
-            )
+            check_value = Decimal(results['maximum_rate'])
         else:
             if is_prepaid:
                 check_value = Decimal(
@@ -1382,6 +1114,7 @@ class InvoiceService:
             return_balance = \
                 balances["used_balance_postpaid"] - total_cost
         if should_return:
+            repair_started_at = time.monotonic()
             BasicService.add_balance(
                 subscription_code,
                 return_balance,
@@ -1394,10 +1127,54 @@ class InvoiceService:
                 int(return_balance) + int(current_balance),
                 is_prepaid,
             )
+            if phases is not None:
+                phases['repair'] = round(
+                    time.monotonic() - repair_started_at,
+                    3,
+                )
             return False
 
         return True
 
+    @classmethod
+    def _fan_out(cls, calls, phases=None):
+        """
+        Run independent calls on a thread pool, all of them must finish
+        before the deadline of VERIFY_AND_REPAIR
+        :param calls: dict of phase name and callable
+        :param phases: dict that gets seconds of each phase and the total
+        :return: dict of phase name and result
+        """
+        deadline = float(settings.CGG['VERIFY_AND_REPAIR']['DEADLINE'])
+        started_at = time.monotonic()
+
+        def timed(name, call):
+            try:
+                return call()
+            finally:
+                if phases is not None:
+                    phases[name] = round(time.monotonic() - started_at, 3)
+                # Database connections of worker threads are not reused
+                connections.close_all()
+
+        executor = ThreadPoolExecutor(max_workers=len(calls))
+        try:
+            futures = {
+                name: executor.submit(timed, name, call)
+                for name, call in calls.items()
+            }
+            done, not_done = wait(futures.values(), timeout=deadline)
+            if phases is not None:
+                phases['total'] = round(time.monotonic() - started_at, 3)
+            if not_done:
+                raise api_exceptions.TimeOut408(
+                    ErrorMessages.VERIFY_AND_REPAIR_408
+                )
+
+            return {name: future.result() for name, future in futures.items()}
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
     @classmethod
     def _total_unpaid_active(cls, subscription_code):
         """
@@ -0,0 +1,413 @@
+# --------------------------------------------------------------------------
+# Issue periodic invoices in parallel. Subscriptions are split into chunks
+# that are processed by Celery workers or a local process pool, with a
+# bounded number of chunks in flight. Each finished chunk is checkpointed in
+# InvoiceRunChunk so a crashed run continues from unfinished chunks. A worker
+# leases the chunk it processes, a chunk is not processed by two workers at
+# the same time.
+# (C) 2020 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - invoice_run.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    wait,
+)
+from datetime import datetime, timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils.translation import gettext as _
+
+from cgg.apps.finance.models import (
+    InvoiceRun,
+    InvoiceRunChunk,
+    Subscription,
+)
+from cgg.apps.finance.versions.v1.config import FinanceConfigurations
+from cgg.apps.finance.versions.v1.services.invoice import InvoiceService
+from cgg.apps.finance.versions.v1.services.job import JobService
+
+logger = logging.getLogger('common')
+run_config = FinanceConfigurations.InvoiceRun
+
+
+@shared_task
+def issue_periodic_invoice_chunk(chunk_id):
+    """
+    Celery entry point of InvoiceRunService.process_chunk
+    :param chunk_id:
+    :return:
+    """
+    return InvoiceRunService.process_chunk(chunk_id)
+
+
+def _process_chunk_local(chunk_id):
+    """
+    Process pool entry point of InvoiceRunService.process_chunk (must be a
+    module level function to be picklable)
+    :param chunk_id:
+    :return:
+    """
+    return InvoiceRunService.process_chunk(chunk_id)
+
+
+class InvoiceRunService:
+    POLL_INTERVAL = 2
+
+    @classmethod
+    def subscriptions_queryset(cls):
+        """
+        Subscriptions that get periodic invoices (Unlimited ones are left out)
+        :return:
+        """
+        return Subscription.objects.filter(
+            is_allocated=True,
+            subscription_type__in=[
+                FinanceConfigurations.Subscription.TYPE[0][0],
+                FinanceConfigurations.Subscription.TYPE[1][0],
+            ]
+        )
+
+    @classmethod
+    def get_or_create_run(cls, from_date, to_date, chunk_size=None):
+        """
+        Continue the unfinished run of this period or create a new one
+        :param from_date:
+        :param to_date:
+        :param chunk_size:
+        :return: (InvoiceRun, resumed)
+        """
+        invoice_run = InvoiceRun.objects.filter(
+            to_date=to_date,
+            status_code=run_config.STATE_CHOICES[0][0],
+        ).first()
+        if invoice_run is not None:
+            return invoice_run, True
+
+        if chunk_size is None:
+            chunk_size = settings.CGG['INVOICE_RUN']['CHUNK_SIZE']
+        chunk_size = max(int(chunk_size), 1)
+        subscription_ids = [
+            str(subscription_id) for subscription_id in
+            cls.subscriptions_queryset().order_by('id').values_list(
+                'id',
+                flat=True,
+            )
+        ]
+        with transaction.atomic():
+            invoice_run = InvoiceRun()
+            invoice_run.from_date = from_date
+            invoice_run.to_date = to_date
+            invoice_run.chunk_size = chunk_size
+            invoice_run.chunks_total = 0
+            invoice_run.save()
+            for chunk_index, start in enumerate(
+                    range(0, len(subscription_ids), chunk_size),
+            ):
+                chunk = InvoiceRunChunk()
+                chunk.invoice_run = invoice_run
+                chunk.chunk_index = chunk_index
+                chunk.subscription_ids = \
+                    subscription_ids[start:start + chunk_size]
+                chunk.save()
+                invoice_run.chunks_total += 1
+            if invoice_run.chunks_total == 0:
+                invoice_run.status_code = run_config.STATE_CHOICES[1][0]
+                invoice_run.finished_at = datetime.now()
+            invoice_run.save()
+
+        return invoice_run, False
+
+    @classmethod
+    def lease_expired_at(cls):
+        """
+        :return: leases taken or renewed before this time are expired
+        """
+        return datetime.now() - timedelta(
+            seconds=settings.CGG['INVOICE_RUN']['CHUNK_TIMEOUT'],
+        )
+
+    @classmethod
+    def claim_chunk(cls, chunk_id, claimed_by):
+        """
+        Take the lease of an unfinished chunk
+        :param chunk_id:
+        :param claimed_by: identity of the worker
+        :return: InvoiceRunChunk or None if the chunk is done or leased by
+        another worker
+        """
+        with transaction.atomic():
+            chunk = InvoiceRunChunk.objects.select_for_update(
+                skip_locked=True,
+                of=('self',),
+            ).select_related('invoice_run').filter(
+                id=chunk_id,
+                is_done=False,
+            ).first()
+            if chunk is None:
+                return None
+            if chunk.claimed_at is not None and \
+                    chunk.claimed_at > cls.lease_expired_at() and \
+                    chunk.claimed_by != claimed_by:
+                return None
+            chunk.claimed_by = claimed_by
+            chunk.claimed_at = datetime.now()
+            chunk.save()
+
+        return chunk
+
+    @classmethod
+    def renew_lease(cls, chunk_id, claimed_by):
+        """
+        :param chunk_id:
+        :param claimed_by: identity of the worker
+        :return: False if the chunk is leased by another worker
+        """
+        with transaction.atomic():
+            chunk = InvoiceRunChunk.objects.select_for_update().get(
+                id=chunk_id,
+            )
+            if chunk.is_done or chunk.claimed_by != claimed_by:
+                return False
+            chunk.claimed_at = datetime.now()
+            chunk.save()
+
+        return True
+
+    @classmethod
+    def process_chunk(cls, chunk_id):
+        """
+        Issue periodic invoices of a chunk and checkpoint the result. Failed
+        subscriptions are added to FailedJob. A chunk that is done or leased
+        by another worker is left alone
+        :param chunk_id:
+        :return: dict of issued, failed and skipped counts
+        """
+        claimed_by = f"{socket.gethostname()}:{os.getpid()}:" \
+                     f"{uuid.uuid4().hex[:8]}"
+        chunk = cls.claim_chunk(chunk_id, claimed_by)
+        if chunk is None:
+            chunk = InvoiceRunChunk.objects.get(id=chunk_id)
+            if not chunk.is_done:
+                logger.warning(
+                    "invoice run chunk %s is leased by %s",
+                    chunk_id,
+                    chunk.claimed_by,
+                )
+            return cls.summary(chunk)
+
+        invoice_run = chunk.invoice_run
+        description = _(
+            "This invoice a generated automatically at the end of the period",
+        )
+        # Subscriptions may be deallocated or changed after the run started
+        subscription_ids = set(
+            str(subscription_id) for subscription_id in
+            cls.subscriptions_queryset().filter(
+                id__in=chunk.subscription_ids,
+            ).values_list('id', flat=True)
+        )
+        issued_count = 0
+        failed_count = 0
+        skipped_count = len(chunk.subscription_ids) - len(subscription_ids)
+        for subscription_id in chunk.subscription_ids:
+            if subscription_id not in subscription_ids:
+                continue
+            if not cls.renew_lease(chunk_id, claimed_by):
+                # The lease expired and another worker took the chunk
+                logger.warning(
+                    "invoice run chunk %s: lease is lost",
+                    chunk_id,
+                )
+                return cls.summary(chunk)
+            try:
+                invoice_object, payed = InvoiceService.issue_periodic_invoice(
+                    subscription_id,
+                    invoice_run.from_date,
+                    invoice_run.to_date,
+                    description=description,
+                )
+                if invoice_object is None:
+                    skipped_count += 1
+                else:
+                    issued_count += 1
+            except Exception as e:
+                failed_count += 1
+                JobService.add_failed_job(
+                    FinanceConfigurations.Jobs.TYPES[0][0],
+                    'v1',
+                    'InvoiceService',
+                    'issue_periodic_invoice',
+                    json.dumps({
+                        "subscription_id": subscription_id,
+                        "from_date": str(invoice_run.from_date.timestamp()),
+                        "to_date": str(invoice_run.to_date.timestamp()),
+                        "notify_singular": True,
+                        "description": description,
+                    }),
+                    str(e)
+                )
+
+        with transaction.atomic():
+            chunk = InvoiceRunChunk.objects.select_for_update().get(
+                id=chunk_id,
+            )
+            if chunk.is_done or chunk.claimed_by != claimed_by:
+                return cls.summary(chunk)
+            invoice_run = InvoiceRun.objects.select_for_update().get(
+                id=chunk.invoice_run_id,
+            )
+            chunk.is_done = True
+            chunk.issued_count = issued_count
+            chunk.failed_count = failed_count
+            chunk.skipped_count = skipped_count
+            chunk.save()
+            invoice_run.chunks_done += 1
+            invoice_run.issued_count += issued_count
+            invoice_run.failed_count += failed_count
+            invoice_run.skipped_count += skipped_count
+            if invoice_run.chunks_done >= invoice_run.chunks_total:
+                invoice_run.status_code = run_config.STATE_CHOICES[1][0]
+                invoice_run.finished_at = datetime.now()
+            invoice_run.save()
+
+        return cls.summary(chunk)
+
+    @classmethod
+    def is_broker_available(cls):
+        """
+        :return: True if Celery broker accepts connections
+        """
+        from cgg.celery_app import app
+
+        try:
+            with app.connection_for_write() as connection:
+                connection.ensure_connection(max_retries=1)
+        except Exception:
+            return False
+
+        return True
+
+    @classmethod
+    def execute(cls, invoice_run, mode='auto', concurrency=None):
+        """
+        Process unfinished chunks of a run
+        :param invoice_run: InvoiceRun
+        :param mode: one of InvoiceRun.MODES
+        :param concurrency: maximum chunks in flight
+        :return: summary of the run
+        """
+        if concurrency is None:
+            concurrency = settings.CGG['INVOICE_RUN']['CONCURRENCY']
+        concurrency = max(int(concurrency), 1)
+        if mode == run_config.MODES[0][0]:
+            if cls.is_broker_available():
+                mode = run_config.MODES[1][0]
+            else:
+                mode = run_config.MODES[2][0]
+        # Chunks that are leased by workers of another run are left out
+        chunk_ids = [
+            str(chunk_id) for chunk_id in invoice_run.chunks.filter(
+                Q(claimed_at__isnull=True) |
+                Q(claimed_at__lte=cls.lease_expired_at()),
+                is_done=False,
+            ).values_list('id', flat=True)
+        ]
+        logger.info(
+            "invoice run %s: %s chunks left, mode %s, concurrency %s",
+            invoice_run.id,
+            len(chunk_ids),
+            mode,
+            concurrency,
+        )
+        if mode == run_config.MODES[1][0]:
+            cls._execute_celery(chunk_ids, concurrency)
+        elif mode == run_config.MODES[2][0] and concurrency > 1:
+            cls._execute_local(chunk_ids, concurrency)
+        else:
+            for chunk_id in chunk_ids:
+                cls.process_chunk(chunk_id)
+        invoice_run.refresh_from_db()
+
+        return cls.summary(invoice_run)
+
+    @classmethod
+    def _execute_celery(cls, chunk_ids, concurrency):
+        chunk_timeout = settings.CGG['INVOICE_RUN']['CHUNK_TIMEOUT']
+        pending = list(chunk_ids)
+        in_flight = {}
+        while pending or in_flight:
+            while pending and len(in_flight) < concurrency:
+                chunk_id = pending.pop(0)
+                in_flight[chunk_id] = (
+                    issue_periodic_invoice_chunk.delay(chunk_id),
+                    time.monotonic(),
+                )
+            time.sleep(cls.POLL_INTERVAL)
+            for chunk_id, (result, started_at) in list(in_flight.items()):
+                if result.ready():
+                    if result.failed():
+                        logger.error(
+                            "invoice run chunk %s failed: %s",
+                            chunk_id,
+                            result.result,
+                        )
+                    del in_flight[chunk_id]
+                elif time.monotonic() - started_at > chunk_timeout:
+                    # Left unfinished, a task that is not started yet is
+                    # revoked and a running one keeps its lease, the next
+                    # run continues this chunk when the lease expires
+                    logger.error("invoice run chunk %s timed out", chunk_id)
+                    result.revoke()
+                    del in_flight[chunk_id]
+
+    @classmethod
+    def _execute_local(cls, chunk_ids, concurrency):
+        # Forked workers must not share database connections of the parent
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=concurrency) as executor:
+            pending = list(chunk_ids)
+            in_flight = {}
+            while pending or in_flight:
+                while pending and len(in_flight) < concurrency:
+                    chunk_id = pending.pop(0)
+                    in_flight[executor.submit(
+                        _process_chunk_local,
+                        chunk_id,
+                    )] = chunk_id
+                done, not_done = wait(
+                    in_flight.keys(),
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    chunk_id = in_flight.pop(future)
+                    if future.exception() is not None:
+                        logger.error(
+                            "invoice run chunk %s failed: %s",
+                            chunk_id,
+                            future.exception(),
+                        )
+
+    @classmethod
+    def summary(cls, run_object):
+        """
+        :param run_object: InvoiceRun or InvoiceRunChunk
+        :return: dict
+        """
+        return {
+            "issued": run_object.issued_count,
+            "failed": run_object.failed_count,
+            "skipped": run_object.skipped_count,
+        }
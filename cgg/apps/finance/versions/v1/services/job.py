@@ -9,25 +9,43 @@
 # Email: m.esmailpour@respina.net
 # --------------------------------------------------------------------------
 
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from importlib import import_module
 from json import JSONDecodeError
 
+from django.conf import settings
+from django.db import connections, transaction
+
 from cgg.apps.finance.models import FailedJob
+from cgg.apps.finance.versions.v1.services.trunk_outbox import (
+    TrunkOutboxService,
+)
 from cgg.core import api_exceptions
 from cgg.core.tools import Tools
 
+logger = logging.getLogger('common')
+
 
 class JobService:
+    # (service_name, version) -> service class
+    _services = {}
 
     @classmethod
     def import_job_module(cls, service_name, version='v1'):
         """
-        Dynamically import module based on service name and version
+        Dynamically import module based on service name and version, classes
+        are cached after the first import
         Depends on project's structure, file and method names
         :param service_name:
         :param version:
         :return:
         """
+        if (service_name, version) in cls._services:
+            return cls._services[(service_name, version)]
         try:
             service_name_module = \
                 f"{Tools.camelcase_to_snake_case(service_name)}".replace(
@@ -38,11 +56,28 @@ class JobService:
                               f".{service_name_module}"
             module_object = import_module(abs_module_path)
             target_class = getattr(module_object, service_name)
+            cls._services[(service_name, version)] = target_class
 
             return target_class
         except ModuleNotFoundError:
             return False
 
+    @classmethod
+    def run_the_job(cls, job_object):
+        """
+        Call the method of a job
+        :param job_object: an object from FailedJob model
+        :return: True if the method returned a truthy value
+        """
+        service = cls.import_job_module(
+            job_object.service_name,
+            job_object.service_version,
+        )
+        method_args = Tools.get_dict_from_json(job_object.method_args)
+        result = getattr(service, job_object.method_name)(**method_args)
+
+        return bool(result)
+
     @classmethod
     def redo_the_job(cls, job_object):
         """
@@ -53,18 +88,9 @@ class JobService:
         """
         if not job_object.is_done:
             try:
-                service = cls.import_job_module(
-                    job_object.service_name,
-                    job_object.service_version,
-                )
-                method_args = Tools.get_dict_from_json(job_object.method_args)
-                method = getattr(service, job_object.method_name)(
-                    **method_args,
-                )
-
-                if method:
+                if cls.run_the_job(job_object):
                     job_object.is_done = True
-                    job_object.save()
+                    job_object.save(update_fields=['is_done'])
 
                     return True
 
@@ -74,6 +100,168 @@ class JobService:
 
         return False
 
+    @classmethod
+    def redo_due_jobs(cls, max_seconds=None):
+        """
+        Redo due jobs in leased batches until none is left
+        :param max_seconds: stop after this many seconds
+        :return: dict of done, failed and merged counts
+        """
+        started_at = time.monotonic()
+        summary = {
+            "done": 0,
+            "failed": 0,
+            "merged": 0,
+        }
+        while True:
+            job_objects = cls.claim(settings.CGG['FAILED_JOBS']['FETCH_SIZE'])
+            if not job_objects:
+                break
+            job_objects, merged_count = cls.merge_trunk_notifications(
+                job_objects,
+            )
+            done_count, failed_count = cls.redo_jobs(job_objects)
+            summary['done'] += done_count
+            summary['failed'] += failed_count
+            summary['merged'] += merged_count
+            if max_seconds and time.monotonic() - started_at > max_seconds:
+                break
+        logger.info("failed jobs: %s", summary)
+
+        return summary
+
+    @classmethod
+    def claim(cls, limit):
+        """
+        Lease due jobs for LEASE seconds, jobs locked by other runs are
+        skipped and jobs that reached MAX_ATTEMPTS are left for admin
+        :param limit:
+        :return: list of FailedJob
+        """
+        jobs_config = settings.CGG['FAILED_JOBS']
+        now = datetime.now()
+        lease = timedelta(seconds=jobs_config['LEASE'])
+        with transaction.atomic():
+            job_objects = list(
+                FailedJob.objects.select_for_update(
+                    skip_locked=True,
+                ).filter(
+                    is_done=False,
+                    attempts__lt=jobs_config['MAX_ATTEMPTS'],
+                    next_retry_at__lte=now,
+                ).order_by('next_retry_at', 'created_at')[:limit]
+            )
+            if job_objects:
+                FailedJob.objects.filter(
+                    id__in=[job_object.id for job_object in job_objects],
+                ).update_with_checksum(
+                    next_retry_at=now + lease,
+                )
+
+        return job_objects
+
+    @classmethod
+    def merge_trunk_notifications(cls, job_objects):
+        """
+        Move notify_trunk_backend jobs to the trunk outbox, the dispatcher
+        sends items of the same notify type in one batched request
+        :param job_objects: list of FailedJob
+        :return: (other jobs, number of moved jobs)
+        """
+        other_job_objects = []
+        notify_job_objects = []
+        for job_object in job_objects:
+            if job_object.service_name == 'TrunkService' and \
+                    job_object.method_name == 'notify_trunk_backend':
+                notify_job_objects.append(job_object)
+            else:
+                other_job_objects.append(job_object)
+        merged_ids = []
+        with transaction.atomic():
+            for job_object in notify_job_objects:
+                try:
+                    method_args = Tools.get_dict_from_json(
+                        job_object.method_args,
+                    )
+                    TrunkOutboxService.add_notification(
+                        method_args['notify_type_code'],
+                        method_args['notify_object'],
+                    )
+                    merged_ids.append(job_object.id)
+                except (KeyError, TypeError, api_exceptions.APIException) as e:
+                    cls.mark_failed(job_object, e)
+            if merged_ids:
+                FailedJob.objects.filter(
+                    id__in=merged_ids,
+                ).update_with_checksum(is_done=True)
+
+        return other_job_objects, len(merged_ids)
+
+    @classmethod
+    def redo_jobs(cls, job_objects):
+        """
+        Redo jobs concurrently, at most CONCURRENCY jobs of a service run
+        at the same time
+        :param job_objects: list of FailedJob
+        :return: (number of done jobs, number of failed jobs)
+        """
+        if not job_objects:
+            return 0, 0
+        concurrency = max(int(settings.CGG['FAILED_JOBS']['CONCURRENCY']), 1)
+        semaphores = {
+            job_object.service_name: threading.BoundedSemaphore(concurrency)
+            for job_object in job_objects
+        }
+
+        def redo(job_object):
+            with semaphores[job_object.service_name]:
+                try:
+                    if cls.run_the_job(job_object):
+                        return None
+                    return "the job returned no result"
+                except Exception as e:
+                    return str(e) or e.__class__.__name__
+                finally:
+                    # Database connections of worker threads are not reused
+                    connections.close_all()
+
+        with ThreadPoolExecutor(
+                max_workers=concurrency * len(semaphores),
+        ) as executor:
+            errors = list(executor.map(redo, job_objects))
+        done_ids = []
+        for job_object, error in zip(job_objects, errors):
+            if error is None:
+                done_ids.append(job_object.id)
+            else:
+                cls.mark_failed(job_object, error)
+        if done_ids:
+            FailedJob.objects.filter(
+                id__in=done_ids,
+            ).update_with_checksum(is_done=True)
+
+        return len(done_ids), len(job_objects) - len(done_ids)
+
+    @classmethod
+    def mark_failed(cls, job_object, error):
+        """
+        Retry the job later with exponential backoff
+        :param job_object: an object from FailedJob model
+        :param error: message of the error
+        """
+        jobs_config = settings.CGG['FAILED_JOBS']
+        job_object.attempts += 1
+        job_object.error_message = str(error)[:1024]
+        job_object.next_retry_at = datetime.now() + timedelta(seconds=min(
+            jobs_config['BACKOFF'] * 2 ** (job_object.attempts - 1),
+            jobs_config['BACKOFF_MAX'],
+        ))
+        job_object.save(update_fields=[
+            'attempts',
+            'error_message',
+            'next_retry_at',
+        ])
+
     @classmethod
     def add_failed_job(
             cls,
@@ -28,6 +28,7 @@ from cgg.apps.finance.versions.v1.services.common import CommonService
 from cgg.apps.finance.versions.v1.services.credit_invoice import (
     CreditInvoiceService,
 )
+from cgg.apps.finance.versions.v1.services.export import ExportService
 from cgg.core import api_exceptions
 from cgg.core.error_messages import ErrorMessages
 from cgg.core.paginator import Paginator
@@ -115,11 +116,11 @@ class PackageInvoiceService:
             )
             data = invoice_serializer.data, paginator
         else:
-            invoice_serializer = PackageInvoiceExportSerializer(
+            data = ExportService.rows(
                 query_invoice,
-                many=True,
+                PackageInvoiceExportSerializer,
+                select_related=('subscription__customer',),
             )
-            data = invoice_serializer.data
 
         return data
 
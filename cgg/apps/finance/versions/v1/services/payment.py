@@ -29,6 +29,7 @@ from cgg.apps.finance.versions.v1.services.common import CommonService
 from cgg.apps.finance.versions.v1.services.credit_invoice import (
     CreditInvoiceService,
 )
+from cgg.apps.finance.versions.v1.services.export import ExportService
 from cgg.core import api_exceptions
 from cgg.core.error_messages import ErrorMessages
 from cgg.core.paginator import Paginator
@@ -146,11 +147,12 @@ class PaymentService:
             payment_serializer = PaymentsSerializer(query_payment, many=True)
             data = payment_serializer.data, paginator
         else:
-            payment_serializer = PaymentExportSerializer(
+            data = ExportService.rows(
                 query_payment,
-                many=True,
+                PaymentExportSerializer,
+                select_related=('credit_invoice__customer',),
+                context_builder=ExportService.payments_context,
             )
-            data = payment_serializer.data
 
         return data
 
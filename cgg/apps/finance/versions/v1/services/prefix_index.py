@@ -0,0 +1,304 @@
+# --------------------------------------------------------------------------
+# In-process index of Destination and Branch prefixes. The index is built
+# once per process from the database and rebuilt when any process changes
+# destinations, branches or corporate RuntimeConfig (a version key in cache
+# is shared between processes).
+# (C) 2021 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - prefix_index.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+
+import threading
+import uuid
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from cgg.apps.finance.models import Branch, Destination, RuntimeConfig
+from cgg.apps.finance.versions.v1.config import FinanceConfigurations
+from cgg.core.cache import Cache
+from cgg.core.prefix_trie import PrefixTrie
+
+# Usage categories of an invoice, in order of precedence
+USAGE_CATEGORIES = (
+    'landlines_corporate',
+    'landlines_local',
+    'landlines_long_distance',
+    'mobile',
+    'international',
+)
+BRANCH_PREFIX_TAG = 'branch'
+
+
+class PrefixIndex:
+    """
+    Immutable snapshot of all prefixes. Usage tries are built lazily per
+    branch and kept for the lifetime of the snapshot
+    """
+
+    def __init__(self, destinations, branches):
+        """
+        :param destinations: list of (prefix, code, name)
+        :param branches: dict of branch id -> (branch code, list of prefixes)
+        """
+        corporate_name = \
+            FinanceConfigurations.Destination.CORPORATE_DEFAULT_NAME[1]
+        self._prefixes = {}
+        self._corporate_prefixes = {}
+        for prefix, code, name in destinations:
+            if name == corporate_name:
+                self._corporate_prefixes.setdefault(code, []).append(prefix)
+            else:
+                self._prefixes.setdefault(code, []).append(prefix)
+        self._branches = branches
+        self._branches_trie = PrefixTrie()
+        for branch_id, (branch_code, prefixes) in branches.items():
+            for prefix in prefixes:
+                # A branch is counted once for every matching prefix
+                self._branches_trie.insert(
+                    prefix.lower(),
+                    (branch_id, prefix),
+                )
+        self._usage_tries = {}
+        self._lock = threading.Lock()
+
+    def destination_prefixes(self, code, only_corporate=False):
+        """
+        :param code: Destination code
+        :param only_corporate: Only corporate or only not corporate prefixes
+        :return: list of prefixes
+        """
+        if only_corporate:
+            return list(self._corporate_prefixes.get(code, []))
+
+        return list(self._prefixes.get(code, []))
+
+    def branch_prefixes(self, branch_id):
+        """
+        :param branch_id:
+        :return: list of prefixes of a branch
+        """
+        if branch_id not in self._branches:
+            return []
+
+        return list(self._branches[branch_id][1])
+
+    def branch_code_prefixes(self, branch_code):
+        """
+        :param branch_code:
+        :return: list of prefixes of a branch
+        """
+        for code, prefixes in self._branches.values():
+            if code == branch_code:
+                return list(prefixes)
+
+        return []
+
+    def not_default_prefixes(self):
+        """
+        :return: prefixes of all branches except country and emergency
+        """
+        prefixes = []
+        for branch_code, branch_prefixes in self._branches.values():
+            if branch_code not in (
+                    FinanceConfigurations.Branch.DEFAULT_EMERGENCY_BRANCH[0],
+                    FinanceConfigurations.Branch.DEFAULT_COUNTRY_BRANCH[0],
+            ):
+                prefixes.extend(branch_prefixes)
+
+        return prefixes
+
+    def branch_ids_of_number(self, number):
+        """
+        Branches that have a prefix of the number (case insensitive)
+        :param number:
+        :return: list of branch ids, one item per matching prefix
+        """
+        branch_ids = []
+        for prefix, tags in self._branches_trie.matches(str(number).lower()):
+            branch_ids.extend(branch_id for branch_id, _ in tags)
+
+        return branch_ids
+
+    def usage_trie(self, branch_id):
+        """
+        Prefix trie of usage categories for subscriptions of a branch.
+        Local prefixes are landline prefixes of the branch and long distance
+        prefixes are the other landline prefixes
+        :param branch_id: None if subscription has no branch
+        :return: PrefixTrie
+        """
+        usage_trie = self._usage_tries.get(branch_id)
+        if usage_trie is not None:
+            return usage_trie
+
+        not_found_prefix = FinanceConfigurations.Destination.NOT_FOUND_PREFIX
+        landline_code = FinanceConfigurations.Destination.CODE_CHOICES[1][0]
+        branch_prefixes = set(self.branch_prefixes(branch_id))
+        landlines = self.destination_prefixes(landline_code)
+        local_prefixes = [p for p in landlines if p in branch_prefixes]
+        long_distance_prefixes = [
+            p for p in landlines if p not in branch_prefixes
+        ]
+        category_prefixes = (
+            (
+                USAGE_CATEGORIES[0],
+                self.destination_prefixes(landline_code, only_corporate=True),
+            ),
+            (
+                USAGE_CATEGORIES[1],
+                local_prefixes,
+            ),
+            (
+                USAGE_CATEGORIES[2],
+                long_distance_prefixes,
+            ),
+            (
+                USAGE_CATEGORIES[3],
+                self.destination_prefixes(
+                    FinanceConfigurations.Destination.CODE_CHOICES[0][0],
+                ),
+            ),
+            (
+                USAGE_CATEGORIES[4],
+                self.destination_prefixes(
+                    FinanceConfigurations.Destination.CODE_CHOICES[3][0],
+                ) + self.destination_prefixes(
+                    FinanceConfigurations.Destination.CODE_CHOICES[2][0],
+                ),
+            ),
+            (
+                BRANCH_PREFIX_TAG,
+                self.not_default_prefixes(),
+            ),
+        )
+        usage_trie = PrefixTrie()
+        for category, prefixes in category_prefixes:
+            for prefix in prefixes:
+                if prefix != not_found_prefix:
+                    usage_trie.insert(prefix, category)
+        with self._lock:
+            self._usage_tries[branch_id] = usage_trie
+
+        return usage_trie
+
+    def classify_usage(self, usage_trie, destination):
+        """
+        Find the usage category of a destination number. A category matches
+        if the number starts with one of its prefixes and with no prefix of
+        the other categories (prefixes of branches do not exclude corporate
+        numbers). Categories are checked in USAGE_CATEGORIES order.
+        :param usage_trie: PrefixTrie from usage_trie
+        :param destination:
+        :return: category or None
+        """
+        matches = usage_trie.matches(destination)
+        if not matches:
+            return None
+        for category in USAGE_CATEGORIES:
+            if not any(category in tags for prefix, tags in matches):
+                continue
+            excluded = False
+            for prefix, tags in matches:
+                if category == USAGE_CATEGORIES[0] and \
+                        BRANCH_PREFIX_TAG in tags:
+                    continue
+                if tags - {category, BRANCH_PREFIX_TAG}:
+                    excluded = True
+                    break
+            if not excluded:
+                return category
+
+        return None
+
+
+class PrefixIndexService:
+    _index = None
+    _version = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_index(cls):
+        """
+        Return the prefix index of this process, rebuild it if another
+        process has changed prefixes since it was built
+        :return: PrefixIndex
+        """
+        version = Cache.get(
+            key=Cache.KEY_CONVENTIONS['prefix_index_version'],
+            values={},
+        )
+        if cls._index is None or cls._version != version:
+            with cls._lock:
+                if cls._index is None or cls._version != version:
+                    cls._index = cls.build_index()
+                    cls._version = version
+
+        return cls._index
+
+    @classmethod
+    def build_index(cls):
+        """
+        Load all destinations and branches with two queries
+        :return: PrefixIndex
+        """
+        destinations = list(
+            Destination.objects.values_list('prefix', 'code', 'name')
+        )
+        branches = {}
+        for branch_id, branch_code in Branch.objects.values_list(
+                'id',
+                'branch_code',
+        ):
+            branches[branch_id] = (branch_code, [])
+        branch_destinations = Branch.destinations.through.objects.values_list(
+            'branch_id',
+            'destination__prefix',
+        )
+        for branch_id, prefix in branch_destinations:
+            if branch_id in branches:
+                branches[branch_id][1].append(prefix)
+
+        return PrefixIndex(destinations, branches)
+
+    @classmethod
+    def invalidate(cls):
+        """
+        Force all processes to rebuild the index on next use
+        :return:
+        """
+        Cache.set(
+            key=Cache.KEY_CONVENTIONS['prefix_index_version'],
+            values={},
+            store_value=uuid.uuid4().hex,
+        )
+        cls._index = None
+
+
+@receiver(post_save, sender=Destination)
+@receiver(post_delete, sender=Destination)
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def invalidate_prefix_index(*args, **kwargs):
+    # Processes that rebuild the index before the change is committed would
+    # cache the old prefixes under the new version
+    transaction.on_commit(PrefixIndexService.invalidate)
+
+
+@receiver(m2m_changed, sender=Branch.destinations.through)
+def invalidate_prefix_index_branch_destinations(*args, **kwargs):
+    if kwargs.get('action') in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(PrefixIndexService.invalidate)
+
+
+@receiver(post_save, sender=RuntimeConfig)
+def invalidate_prefix_index_runtime_config(*args, **kwargs):
+    instance = kwargs['instance']
+    if instance.item_key in (
+            FinanceConfigurations.RuntimeConfig.KEY_CHOICES[2][0],
+            FinanceConfigurations.RuntimeConfig.KEY_CHOICES[3][0],
+            FinanceConfigurations.RuntimeConfig.KEY_CHOICES[7][0],
+    ):
+        transaction.on_commit(PrefixIndexService.invalidate)
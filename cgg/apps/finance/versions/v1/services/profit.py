@@ -16,7 +16,7 @@ from django.utils.translation import gettext as _
 from cgg.apps.basic.versions.v1.config.cgrates_conventions import (
     CGRatesConventions,
 )
-from cgg.apps.basic.versions.v1.services.basic import BasicService
+from cgg.apps.cdr.replica import CDRReplicaService
 from cgg.apps.finance.models import Operator, Profit
 from cgg.apps.finance.versions.v1.config import FinanceConfigurations
 from cgg.apps.finance.versions.v1.serializers.profit import (
@@ -25,6 +25,7 @@ from cgg.apps.finance.versions.v1.serializers.profit import (
     ProfitSerializer, ProfitsSerializer,
 )
 from cgg.apps.finance.versions.v1.services.common import CommonService
+from cgg.apps.finance.versions.v1.services.export import ExportService
 from cgg.core import api_exceptions
 from cgg.core.error_messages import ErrorMessages
 from cgg.core.paginator import Paginator
@@ -110,11 +111,11 @@ class ProfitService:
             )
             data = profits_serializer.data, paginator
         else:
-            profits_serializer = ProfitExportSerializer(
+            data = ExportService.rows(
                 profits_query,
-                many=True,
+                ProfitExportSerializer,
+                select_related=('operator',),
             )
-            data = profits_serializer.data
 
         return data
 
@@ -157,7 +158,7 @@ class ProfitService:
                 'prefix',
                 flat=True,
             ))
-            # Get CDRs from CGRateS
+            # Usage of CDRs, replicated CDRs are summed in database
             extra_inbound_with_operator = {
                 **CGRatesConventions.extra_field_inbound(),
                 **CGRatesConventions.extra_field(
@@ -165,41 +166,23 @@ class ProfitService:
                     operator_object.operator_code,
                 )
             }
-            operator_cdrs_inbound = BasicService.get_cdrs(
-                created_at_start=
-                str(create_profit_data['from_date'].timestamp()).split('.')[0],
-                created_at_end=
-                str(create_profit_data['to_date'].timestamp()).split('.')[0],
+            inbound_totals = CDRReplicaService.totals(
+                create_profit_data['from_date'],
+                create_profit_data['to_date'],
                 extra_fields=extra_inbound_with_operator,
             )
-            operator_cdrs_outbound = BasicService.get_cdrs(
-                created_at_start=
-                str(create_profit_data['from_date'].timestamp()).split('.')[0],
-                created_at_end=
-                str(create_profit_data['to_date'].timestamp()).split('.')[0],
+            outbound_totals = CDRReplicaService.totals(
+                create_profit_data['from_date'],
+                create_profit_data['to_date'],
                 destination_prefixes=prefixes,
                 extra_fields=CGRatesConventions.extra_field_outbound(),
             )
-            operator_cdrs_inbound_list = \
-                BasicService.cdrs_minimal_object(
-                    operator_cdrs_inbound,
-                )
-            operator_cdrs_outbound_list = \
-                BasicService.cdrs_minimal_object(
-                    operator_cdrs_outbound,
-                )
             inbound_usage_nano = Decimal(0)
             outbound_usage_nano = Decimal(0)
-
-            for operator_cdrs_inbound in operator_cdrs_inbound_list:
-                inbound_usage_nano += Decimal(
-                    operator_cdrs_inbound['usage'],
-                )
-
-            for operator_cdrs_outbound in operator_cdrs_outbound_list:
-                outbound_usage_nano += Decimal(
-                    operator_cdrs_outbound['usage'],
-                )
+            if None in inbound_totals:
+                inbound_usage_nano = inbound_totals[None]['usage']
+            if None in outbound_totals:
+                outbound_usage_nano = outbound_totals[None]['usage']
             if operator_object.rate_time_type == \
                     FinanceConfigurations.Profit.RATE_TIME_TYPE[0][0]:
                 # Convert to seconds
@@ -83,7 +83,7 @@ class RuntimeConfigService:
             if 'issue_hour' in data:
                 RuntimeConfig.objects.filter(
                     item_key=keys[0][0]
-                ).update(
+                ).update_with_checksum(
                     item_value=str(int(data['issue_hour']))
                 )
                 cls.remove_cache(keys[0][0])
@@ -91,7 +91,7 @@ class RuntimeConfigService:
             if 'due_date' in data:
                 RuntimeConfig.objects.filter(
                     item_key=keys[1][0]
-                ).update(
+                ).update_with_checksum(
                     item_value=str(int(data['due_date']))
                 )
                 cls.remove_cache(keys[1][0])
@@ -99,7 +99,7 @@ class RuntimeConfigService:
             if 'discount_percent' in data:
                 RuntimeConfig.objects.filter(
                     item_key=keys[5][0]
-                ).update(
+                ).update_with_checksum(
                     item_value=str(float(data['discount_percent']))
                 )
                 cls.remove_cache(keys[5][0])
@@ -107,7 +107,7 @@ class RuntimeConfigService:
             if 'discount_value' in data:
                 RuntimeConfig.objects.filter(
                     item_key=keys[4][0]
-                ).update(
+                ).update_with_checksum(
                     item_value=str(float(data['discount_value']))
                 )
                 cls.remove_cache(keys[4][0])
@@ -115,7 +115,7 @@ class RuntimeConfigService:
             if 'deallocation_due' in data:
                 RuntimeConfig.objects.filter(
                     item_key=keys[6][0]
-                ).update(
+                ).update_with_checksum(
                     item_value=str(int(data['deallocation_due']))
                 )
                 cls.remove_cache(keys[6][0])
@@ -123,7 +123,7 @@ class RuntimeConfigService:
             if 'payment_cool_down' in data:
                 RuntimeConfig.objects.filter(
                     item_key=keys[8][0]
-                ).update(
+                ).update_with_checksum(
                     item_value=str(int(data['payment_cool_down']))
                 )
                 cls.remove_cache(keys[8][0])
@@ -131,7 +131,7 @@ class RuntimeConfigService:
             if 'black_list_in_days' in data:
                 RuntimeConfig.objects.filter(
                     item_key=keys[9][0]
-                ).update(
+                ).update_with_checksum(
                     item_value=str(int(data['black_list_in_days']))
                 )
                 cls.remove_cache(keys[9][0])
@@ -140,27 +140,20 @@ class RuntimeConfigService:
 
     @classmethod
     def get_value(cls, key):
-        value = Cache.get(
-            key=Cache.KEY_CONVENTIONS['runtime_config'],
-            values={
-                'key': key,
-            },
-        )
-        if value is None:
-            try:
-                rc = RuntimeConfig.objects.get(
-                    item_key=key
-                )
-                value = rc.item_value
-                Cache.set(
-                    key=Cache.KEY_CONVENTIONS['runtime_config'],
-                    values={
-                        'key': key,
-                    },
-                    store_value=value,
-                )
-            except RuntimeConfig.DoesNotExist:
-                value = cls.get_default(key)
+        def compute():
+            return RuntimeConfig.objects.get(item_key=key).item_value
+
+        try:
+            value = Cache.get_or_compute(
+                key=Cache.KEY_CONVENTIONS['runtime_config'],
+                values={
+                    'key': key,
+                },
+                compute=compute,
+                not_found=(RuntimeConfig.DoesNotExist,),
+            )
+        except RuntimeConfig.DoesNotExist:
+            value = cls.get_default(key)
 
         return value
 
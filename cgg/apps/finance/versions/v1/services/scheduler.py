@@ -0,0 +1,48 @@
+# --------------------------------------------------------------------------
+# Periodic commands as Celery tasks. Celery beat queues the commands of
+# CELERY_BEAT_SCHEDULE and workers run them in their warm processes instead
+# of starting a new process per run. log_command of each command records
+# the run and keeps runs of a command from overlapping.
+# (C) 2023 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - scheduler.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+
+import logging
+import time
+
+from celery import shared_task
+from django.core.management import call_command
+
+logger = logging.getLogger('common')
+
+
+@shared_task(ignore_result=True)
+def run_scheduled_command(command_name, *args):
+    """
+    Celery entry point of SchedulerService.run_command
+    :param command_name: name of a management command
+    :param args: arguments of the command
+    """
+    SchedulerService.run_command(command_name, *args)
+
+
+class SchedulerService:
+
+    @classmethod
+    def run_command(cls, command_name, *args):
+        """
+        Run a management command in this process
+        :param command_name: name of a management command
+        :param args: arguments of the command
+        :return: seconds of the run
+        """
+        started_at = time.monotonic()
+        try:
+            call_command(command_name, *args)
+        finally:
+            duration = round(time.monotonic() - started_at, 3)
+            logger.info("%s ran in %s seconds", command_name, duration)
+
+        return duration
@@ -74,7 +74,6 @@ class SubscriptionService:
         :param subscription:
         :return:
         """
-        print('start get_subscription_from_cgrates')
         balance_details = BasicService.get_balance(
             subscription.subscription_code,
             force_reload,
@@ -90,6 +89,40 @@ class SubscriptionService:
 
         return subscription_serializer.data
 
+    @classmethod
+    def get_subscriptions_from_cgrates(cls, subscriptions, force_reload=False):
+        """
+        get_subscription_from_cgrates for a page of subscriptions, balances
+        of the whole page are loaded with BasicService.get_balances
+        :param subscriptions: list of Subscription
+        :param force_reload:
+        :return: list of subscription details
+        """
+        subscriptions = list(subscriptions)
+        balances = BasicService.get_balances(
+            [subscription.subscription_code for subscription in
+             subscriptions],
+            force_reload,
+        )
+        subscriptions_list = []
+        for subscription in subscriptions:
+            if subscription.subscription_code not in balances:
+                # Not loaded from CGRateS, raises as a single lookup does
+                subscriptions_list.append(
+                    cls.get_subscription_from_cgrates(subscription),
+                )
+                continue
+            balance_details = balances[subscription.subscription_code]
+            if balance_details:
+                subscriptions_list.append(SubscriptionSerializer(
+                    subscription,
+                    context=balance_details,
+                ).data)
+            else:
+                subscriptions_list.append([])
+
+        return subscriptions_list
+
     @classmethod
     def get_subscription(
             cls,
@@ -314,13 +347,10 @@ class SubscriptionService:
             request=request,
             queryset=subscriptions_object,
         )
-        subscriptions_list = []
-        for subscription in subscriptions_object:
-            subscription_detail = cls.get_subscription_from_cgrates(
-                subscription,
-                force_reload,
-            )
-            subscriptions_list.append(subscription_detail)
+        subscriptions_list = cls.get_subscriptions_from_cgrates(
+            subscriptions_object,
+            force_reload,
+        )
 
         return subscriptions_list, paginator
 
@@ -438,13 +468,10 @@ class SubscriptionService:
             request=request,
             queryset=subscriptions_object,
         )
-        subscriptions_list = []
-        for subscription in subscriptions_object:
-            subscription_detail = cls.get_subscription_from_cgrates(
-                subscription,
-                force_reload,
-            )
-            subscriptions_list.append(subscription_detail)
+        subscriptions_list = cls.get_subscriptions_from_cgrates(
+            subscriptions_object,
+            force_reload,
+        )
 
         return subscriptions_list, paginator
 
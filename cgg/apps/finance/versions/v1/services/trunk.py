@@ -10,6 +10,7 @@
 from json import JSONDecodeError
 
 import requests
+from django.conf import settings
 from django.utils.translation import gettext as _
 from rest_framework import status
 
@@ -37,8 +38,7 @@ class TrunkService:
                 url=url,
                 json=body,
                 headers=headers,
-                # Fine tune this timeout somehow!
-                timeout=5,
+                timeout=settings.CGG['TRUNK_NOTIFY']['TIMEOUT'],
             )
             if response.status_code == status.HTTP_204_NO_CONTENT:
                 return True
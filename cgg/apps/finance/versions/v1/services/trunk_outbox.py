@@ -0,0 +1,388 @@
+# --------------------------------------------------------------------------
+# Outbox of notifications to trunk backend. Notifications are written to
+# TrunkNotification in the transaction of the change they are about and a
+# dispatcher (Celery task woken up on commit, finance_trunk_dispatch as a
+# backstop) sends them in batches per notify type with backoff on errors.
+# (C) 2023 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - trunk_outbox.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Count, Min
+
+from cgg.apps.finance.models import TrunkNotification
+from cgg.apps.finance.versions.v1.config import FinanceConfigurations
+from cgg.apps.finance.versions.v1.services.delayed_task import (
+    DelayedTaskService,
+)
+from cgg.apps.finance.versions.v1.services.trunk import TrunkService
+from cgg.core import api_exceptions
+from cgg.core.integrity import Integrity
+
+logger = logging.getLogger('common')
+notification_config = FinanceConfigurations.TrunkNotification
+TB_NOTIFY = FinanceConfigurations.TrunkBackend.Notify
+
+
+@shared_task
+def dispatch_trunk_notifications():
+    """
+    Celery entry point of TrunkOutboxService.dispatch
+    :return: (number of sent notifications, number of failed attempts)
+    """
+    return TrunkOutboxService.dispatch()
+
+
+class TrunkOutboxService:
+    # A dispatcher task is queued and has not started yet
+    QUEUED_KEY = 'trunk_outbox:queued'
+    # Key of the delayed dispatcher task of the next retry
+    RETRY_KEY = 'trunk_outbox:retry'
+
+    @classmethod
+    def add_notification(cls, notify_type_code, notify_object):
+        """
+        Add a notification to the outbox, it is sent after the current
+        transaction is committed
+        :param notify_type_code: from FinanceConfigurations.TrunkBackend
+        :param notify_object: dict or list of items for batched types
+        :return: number of added rows
+        """
+        if notify_type_code in TB_NOTIFY.BATCHED and \
+                isinstance(notify_object, list):
+            return cls.add_notifications(notify_type_code, notify_object)
+
+        return cls.add_notifications(notify_type_code, [notify_object])
+
+    @classmethod
+    def add_notification_stream(
+            cls,
+            notify_type_code,
+            rows,
+            build_notify_item,
+    ):
+        """
+        Add a notification for each row of a stream, rows are inserted in
+        chunks of TRUNK_NOTIFY.CHUNK_SIZE
+        :param notify_type_code: one of batched types
+        :param rows: iterable (e.g. queryset.iterator())
+        :param build_notify_item: function of a row to a notify item, None
+        to leave the row out
+        :return: number of added rows
+        """
+        chunk_size = settings.CGG['TRUNK_NOTIFY']['CHUNK_SIZE']
+        added_count = 0
+        notify_items = []
+        for row in rows:
+            notify_item = build_notify_item(row)
+            if notify_item is None:
+                continue
+            notify_items.append(notify_item)
+            if len(notify_items) == chunk_size:
+                added_count += cls.add_notifications(
+                    notify_type_code,
+                    notify_items,
+                )
+                notify_items = []
+        if notify_items:
+            added_count += cls.add_notifications(
+                notify_type_code,
+                notify_items,
+            )
+
+        return added_count
+
+    @classmethod
+    def add_notifications(cls, notify_type_code, notify_objects):
+        notifications = []
+        for notify_object in notify_objects:
+            notification = TrunkNotification(
+                notify_type_code=notify_type_code,
+                notify_object=notify_object,
+            )
+            notification.checksum = Integrity.checksum(notification)
+            notifications.append(notification)
+        if not notifications:
+            return 0
+        TrunkNotification.objects.bulk_create(notifications)
+        transaction.on_commit(cls.wake_up)
+
+        return len(notifications)
+
+    @classmethod
+    def wake_up(cls):
+        """
+        Queue a dispatcher task unless one is queued and not started yet
+        """
+        notify_config = settings.CGG['TRUNK_NOTIFY']
+        try:
+            if cache.add(cls.QUEUED_KEY, 1, notify_config['LEASE']):
+                dispatch_trunk_notifications.delay()
+        except Exception as e:
+            # Rows are sent by the next dispatcher run
+            cache.delete(cls.QUEUED_KEY)
+            logger.error("trunk dispatcher is not queued: %s", e)
+
+    @classmethod
+    def dispatch(cls, max_seconds=None):
+        """
+        Send due notifications until none is left
+        :param max_seconds: stop after this many seconds
+        :return: (number of sent notifications, number of failed attempts)
+        """
+        # Notifications added from now on queue another task
+        cache.delete(cls.QUEUED_KEY)
+        notify_config = settings.CGG['TRUNK_NOTIFY']
+        started_at = time.monotonic()
+        sent_count = 0
+        failed_count = 0
+        while True:
+            notifications = cls.claim(notify_config['FETCH_SIZE'])
+            if not notifications:
+                break
+            sent, failed = cls.send(notifications)
+            sent_count += sent
+            failed_count += failed
+            if max_seconds and time.monotonic() - started_at > max_seconds:
+                break
+        cls.schedule_retry()
+        if sent_count or failed_count:
+            logger.info(
+                "trunk notifications: %s sent, %s failed",
+                sent_count,
+                failed_count,
+            )
+
+        return sent_count, failed_count
+
+    @classmethod
+    def claim(cls, limit):
+        """
+        Lease due notifications for LEASE seconds, rows locked by other
+        dispatchers are skipped
+        :param limit:
+        :return: list of TrunkNotification
+        """
+        now = datetime.now()
+        with transaction.atomic():
+            notifications = list(
+                TrunkNotification.objects.select_for_update(
+                    skip_locked=True,
+                ).filter(
+                    status_code=notification_config.STATE_CHOICES[0][0],
+                    next_attempt_at__lte=now,
+                ).order_by('created_at')[:limit]
+            )
+            if notifications:
+                TrunkNotification.objects.filter(
+                    id__in=[notification.id for notification in notifications],
+                ).update_with_checksum(
+                    next_attempt_at=now + timedelta(
+                        seconds=settings.CGG['TRUNK_NOTIFY']['LEASE'],
+                    ),
+                )
+
+        return notifications
+
+    @classmethod
+    def batches(cls, notifications):
+        """
+        Group notifications by notify type, items of batched types are sent
+        in lists of TRUNK_NOTIFY.BATCH_SIZE
+        :param notifications: list of TrunkNotification
+        :return: list of (notify_type_code, notify_object, notifications)
+        """
+        batch_size = max(int(settings.CGG['TRUNK_NOTIFY']['BATCH_SIZE']), 1)
+        grouped = {}
+        for notification in notifications:
+            grouped.setdefault(
+                notification.notify_type_code,
+                [],
+            ).append(notification)
+        batches = []
+        for notify_type_code, group in grouped.items():
+            if notify_type_code not in TB_NOTIFY.BATCHED:
+                for notification in group:
+                    batches.append((
+                        notify_type_code,
+                        notification.notify_object,
+                        [notification],
+                    ))
+                continue
+            for index in range(0, len(group), batch_size):
+                chunk = group[index:index + batch_size]
+                batches.append((
+                    notify_type_code,
+                    [notification.notify_object for notification in chunk],
+                    chunk,
+                ))
+
+        return batches
+
+    @classmethod
+    def send(cls, notifications):
+        """
+        Post batches of notifications concurrently over the shared HTTP
+        session and record the results
+        :param notifications: list of TrunkNotification
+        :return: (number of sent notifications, number of failed attempts)
+        """
+        notify_config = settings.CGG['TRUNK_NOTIFY']
+        concurrency = max(int(notify_config['CONCURRENCY']), 1)
+
+        def post(batch):
+            notify_type_code, notify_object, batch_notifications = batch
+            try:
+                TrunkService.notify_trunk_backend(
+                    notify_type_code=notify_type_code,
+                    notify_object=notify_object,
+                )
+                return None
+            except api_exceptions.APIException as e:
+                return str(e)
+            finally:
+                # Database connections of worker threads are not reused
+                connections.close_all()
+
+        batches = cls.batches(notifications)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            errors = list(executor.map(post, batches))
+        sent_count = 0
+        failed_count = 0
+        for batch, error in zip(batches, errors):
+            batch_notifications = batch[2]
+            if error is None:
+                cls.mark_sent(batch_notifications)
+                sent_count += len(batch_notifications)
+            else:
+                cls.mark_failed(batch_notifications, error)
+                failed_count += len(batch_notifications)
+
+        return sent_count, failed_count
+
+    @classmethod
+    def mark_sent(cls, notifications):
+        TrunkNotification.objects.filter(
+            id__in=[notification.id for notification in notifications],
+        ).update_with_checksum(
+            status_code=notification_config.STATE_CHOICES[1][0],
+            sent_at=datetime.now(),
+            error=None,
+        )
+
+    @classmethod
+    def mark_failed(cls, notifications, error):
+        """
+        Retry later with exponential backoff, give up after MAX_ATTEMPTS
+        :param notifications: list of TrunkNotification
+        :param error: message of the error
+        """
+        notify_config = settings.CGG['TRUNK_NOTIFY']
+        now = datetime.now()
+        for notification in notifications:
+            notification.attempts += 1
+            notification.error = error
+            if notification.attempts >= notify_config['MAX_ATTEMPTS']:
+                notification.status_code = \
+                    notification_config.STATE_CHOICES[2][0]
+            notification.next_attempt_at = now + timedelta(seconds=min(
+                notify_config['BACKOFF'] * 2 ** (notification.attempts - 1),
+                notify_config['BACKOFF_MAX'],
+            ))
+            notification.save(update_fields=[
+                'attempts',
+                'error',
+                'status_code',
+                'next_attempt_at',
+            ])
+
+    @classmethod
+    def schedule_retry(cls):
+        """
+        Queue a dispatcher task for the earliest pending notification
+        """
+        next_attempt_at = TrunkNotification.objects.filter(
+            status_code=notification_config.STATE_CHOICES[0][0],
+        ).aggregate(next_attempt_at=Min('next_attempt_at'))['next_attempt_at']
+        if next_attempt_at is None:
+            return
+        try:
+            DelayedTaskService.schedule(
+                dispatch_trunk_notifications,
+                [],
+                next_attempt_at + timedelta(seconds=1),
+                key=cls.RETRY_KEY,
+            )
+        except Exception as e:
+            logger.error("trunk dispatcher retry is not queued: %s", e)
+
+    @classmethod
+    def retry_failed(cls, queryset=None):
+        """
+        Send failed notifications again
+        :param queryset: notifications to retry, all failed ones by default
+        :return: number of notifications
+        """
+        if queryset is None:
+            queryset = TrunkNotification.objects.all()
+        count = queryset.filter(
+            status_code=notification_config.STATE_CHOICES[2][0],
+        ).update_with_checksum(
+            status_code=notification_config.STATE_CHOICES[0][0],
+            attempts=0,
+            next_attempt_at=datetime.now(),
+        )
+        if count:
+            transaction.on_commit(cls.wake_up)
+
+        return count
+
+    @classmethod
+    def stats(cls):
+        """
+        Lag and throughput of the outbox
+        :return: dict
+        """
+        now = datetime.now()
+        pending = TrunkNotification.objects.filter(
+            status_code=notification_config.STATE_CHOICES[0][0],
+        )
+        pending_stats = pending.aggregate(
+            count=Count('id'),
+            oldest=Min('created_at'),
+        )
+        sent = TrunkNotification.objects.filter(
+            status_code=notification_config.STATE_CHOICES[1][0],
+        )
+        sent_last_hour = sent.filter(
+            sent_at__gte=now - timedelta(hours=1),
+        ).count()
+
+        return {
+            "pending": pending_stats['count'],
+            "pending_by_type": dict(pending.values_list(
+                'notify_type_code',
+            ).annotate(count=Count('id')).order_by()),
+            "lag_seconds": round(
+                (now - pending_stats['oldest']).total_seconds(),
+                3,
+            ) if pending_stats['oldest'] else 0,
+            "failed": TrunkNotification.objects.filter(
+                status_code=notification_config.STATE_CHOICES[2][0],
+            ).count(),
+            "sent_last_minute": sent.filter(
+                sent_at__gte=now - timedelta(minutes=1),
+            ).count(),
+            "sent_last_hour": sent_last_hour,
+            "sent_per_minute": round(sent_last_hour / 60, 2),
+        }
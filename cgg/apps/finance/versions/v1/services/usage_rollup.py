@@ -0,0 +1,239 @@
+# --------------------------------------------------------------------------
+# Daily usage rollups of subscriptions. CDRs of the CDR replica are
+# classified and rounded per CDR the same as invoices and summed by day,
+# usage category and balance type. Days with CDRs that are synced since the
+# last refresh are rebuilt, so invoices read whole days from rollups and only
+# the partial days at the edges of a period from CDRs.
+# (C) 2023 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - usage_rollup.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_CEILING
+
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+from cgg.apps.basic.versions.v1.config.cgrates_conventions import (
+    CGRatesConventions,
+)
+from cgg.apps.cdr.models import CDR, UsageRollup
+from cgg.apps.cdr.replica import CDRReplicaService
+from cgg.apps.finance.models import Subscription
+from cgg.apps.finance.versions.v1.config import FinanceConfigurations
+from cgg.apps.finance.versions.v1.services.prefix_index import (
+    PrefixIndexService,
+    USAGE_CATEGORIES,
+)
+
+logger = logging.getLogger('common')
+
+
+class UsageRollupService:
+
+    @classmethod
+    def round_to_nearest_half_min(cls, time):
+        return Decimal(time / 30000000000).to_integral_exact(
+            rounding=ROUND_CEILING,
+        ) * 30000000000
+
+    @classmethod
+    def round_to_nearest_min(cls, time):
+        return Decimal(time / 60000000000).to_integral_exact(
+            rounding=ROUND_CEILING,
+        ) * 60000000000
+
+    @classmethod
+    def rounded_usage(cls, category, cdr_category, usage):
+        """
+        Local calls of Tehran are rounded to minutes, other landline and
+        mobile calls to half minutes
+        :param category: one of USAGE_CATEGORIES
+        :param cdr_category: Category of the CDR
+        :param usage: Decimal, nanoseconds
+        :return: Decimal
+        """
+        if category == USAGE_CATEGORIES[1] and cdr_category == 'BR_Tehran':
+            return cls.round_to_nearest_min(usage)
+        if category in (
+                USAGE_CATEGORIES[1],
+                USAGE_CATEGORIES[2],
+                USAGE_CATEGORIES[3],
+        ):
+            return cls.round_to_nearest_half_min(usage)
+
+        return usage
+
+    @classmethod
+    def balance_suffix(cls, balance_type):
+        """
+        :param balance_type: BalanceType of CDRs
+        :return: suffix of invoice fields
+        """
+        if balance_type == FinanceConfigurations.Subscription.TYPE[0][0]:
+            return ''
+
+        return '_prepaid'
+
+    @classmethod
+    def rebuild_day(cls, subscription_code, branch_id, day):
+        """
+        Replace rollups of a subscription in a day
+        :param subscription_code:
+        :param branch_id: branch of the subscription
+        :param day: date
+        :return: number of rollups
+        """
+        prefix_index = PrefixIndexService.get_index()
+        usage_trie = prefix_index.usage_trie(branch_id)
+        day_start = datetime(day.year, day.month, day.day)
+        rollups = {}
+        for values in CDR.objects.filter(
+                account=CGRatesConventions.account_name(subscription_code),
+                created_at__gte=day_start,
+                created_at__lt=day_start + timedelta(days=1),
+        ).values(
+            'destination',
+            'category',
+            'usage',
+            'cost',
+            'balance_type',
+        ).iterator():
+            category = prefix_index.classify_usage(
+                usage_trie,
+                values['destination'],
+            )
+            if category is None:
+                continue
+            key = (category, values['balance_type'])
+            if key not in rollups:
+                rollups[key] = UsageRollup(
+                    subscription_code=subscription_code,
+                    day=day,
+                    category=category,
+                    balance_type=values['balance_type'],
+                    branch_id=str(branch_id) if branch_id else None,
+                )
+            rollup = rollups[key]
+            usage = Decimal(values['usage'])
+            rollup.usage += int(usage)
+            rollup.rounded_usage += int(cls.rounded_usage(
+                category,
+                values['category'],
+                usage,
+            ))
+            rollup.cost += values['cost']
+            rollup.cdr_count += 1
+        with transaction.atomic(using=CDRReplicaService.database()):
+            UsageRollup.objects.filter(
+                subscription_code=subscription_code,
+                day=day,
+            ).delete()
+            UsageRollup.objects.bulk_create(rollups.values())
+
+        return len(rollups)
+
+    @classmethod
+    def refresh(cls, rebuild=False):
+        """
+        Rebuild rollups of the days that have CDRs synced since the last
+        refresh
+        :param rebuild: rebuild rollups of all replicated CDRs (after prefixes
+        of destinations or branches are changed)
+        :return: number of rebuilt days
+        """
+        state = CDRReplicaService.get_state()
+        if state is None:
+            return 0
+        refreshed_at = datetime.now()
+        cdrs = CDR.objects.filter(synced_at__lt=refreshed_at)
+        if state.rolled_up_at is not None and not rebuild:
+            cdrs = cdrs.filter(synced_at__gte=state.rolled_up_at)
+        days = {}
+        for account, day in cdrs.annotate(
+                day=TruncDate('created_at'),
+        ).values_list('account', 'day').distinct().order_by().iterator():
+            subscription_code = CGRatesConventions.revert_account_name(
+                original_name=account,
+                with_tenant=False,
+            )
+            days.setdefault(subscription_code, []).append(day)
+        branches = dict(Subscription.objects.filter(
+            subscription_code__in=days.keys(),
+        ).values_list('subscription_code', 'branch_id'))
+        rebuilt = 0
+        for subscription_code, subscription_days in days.items():
+            if subscription_code not in branches:
+                continue
+            for day in subscription_days:
+                cls.rebuild_day(
+                    subscription_code,
+                    branches[subscription_code],
+                    day,
+                )
+                rebuilt += 1
+        state.rolled_up_at = refreshed_at
+        state.rolled_up_to = state.high_water_mark
+        state.save()
+        logger.info("usage rollups: %s days are rebuilt", rebuilt)
+
+        return rebuilt
+
+    @classmethod
+    def rollup_days(cls, from_date, to_date):
+        """
+        Whole days of a period that have complete rollups
+        :param from_date:
+        :param to_date:
+        :return: (start of the first day, end of the last day) or None
+        """
+        if from_date is None or to_date is None or \
+                not CDRReplicaService.is_enabled():
+            return None
+        state = CDRReplicaService.get_state()
+        if state is None or state.rolled_up_to is None:
+            return None
+        start = max(from_date, state.synced_from)
+        first_day = datetime(start.year, start.month, start.day)
+        if first_day < start:
+            first_day += timedelta(days=1)
+        end = min(to_date, state.rolled_up_to)
+        end_day = datetime(end.year, end.month, end.day)
+        if first_day >= end_day:
+            return None
+
+        return first_day, end_day
+
+    @classmethod
+    def totals(cls, subscription_code, branch_id, first_day, end_day):
+        """
+        Sum of rollups of a subscription in whole days
+        :param subscription_code:
+        :param branch_id: current branch of the subscription
+        :param first_day: datetime
+        :param end_day: datetime, not included
+        :return: list of dicts of category, balance_type,
+        total_rounded_usage and total_cost or None if CDRs were classified
+        for another branch
+        """
+        rollups = list(UsageRollup.objects.filter(
+            subscription_code=subscription_code,
+            day__gte=first_day.date(),
+            day__lt=end_day.date(),
+        ).values(
+            'branch_id',
+            'category',
+            'balance_type',
+        ).annotate(
+            total_rounded_usage=Sum('rounded_usage'),
+            total_cost=Sum('cost'),
+        ).order_by())
+        branch_id = str(branch_id) if branch_id else None
+        if any(rollup['branch_id'] != branch_id for rollup in rollups):
+            return None
+
+        return rollups
@@ -0,0 +1,63 @@
+import json
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+
+from cgg.apps.finance.versions.v1.services.delayed_task import (
+    DelayedTaskService,
+)
+from cgg.core.testing import cgg_settings
+
+
+class RecordedTask:
+    """
+    Keeps queued calls instead of sending them to the broker
+    """
+    name = 'tests.recorded_task'
+
+    def __init__(self):
+        self.calls = []
+
+    def apply_async(self, args=None, eta=None):
+        self.calls.append((args, eta))
+
+
+class DelayedTaskTestCase(TestCase):
+    def setUp(self):
+        self.task = RecordedTask()
+        self.key = 'tests:delayed_task:1000'
+        try:
+            DelayedTaskService.cancel(self.key)
+        except Exception:
+            self.skipTest('Redis is not available')
+
+    def tearDown(self):
+        DelayedTaskService.cancel(self.key)
+
+    def test_scheduling_a_key_again_replaces_the_task(self):
+        due_at = datetime.now() + timedelta(minutes=5)
+        DelayedTaskService.schedule(self.task, ['first'], due_at, self.key)
+        later = due_at + timedelta(minutes=5)
+        DelayedTaskService.schedule(self.task, ['second'], later, self.key)
+        self.assertEqual(
+            DelayedTaskService.due_at(self.key),
+            later.timestamp(),
+        )
+        redis = DelayedTaskService._redis()
+        schedule_key, payloads_key = DelayedTaskService._keys()
+        self.assertEqual(
+            json.loads(redis.hget(payloads_key, self.key)),
+            {"task": self.task.name, "args": ['second']},
+        )
+        self.assertEqual(self.task.calls, [])
+        self.assertTrue(DelayedTaskService.cancel(self.key))
+        self.assertFalse(DelayedTaskService.cancel(self.key))
+        self.assertIsNone(DelayedTaskService.due_at(self.key))
+
+    def test_eta_when_disabled(self):
+        due_at = datetime.now() + timedelta(minutes=5)
+        with cgg_settings('DELAYED_TASKS', ENABLED=False):
+            key = DelayedTaskService.schedule(self.task, ['first'], due_at)
+        self.assertEqual(key, 'tests.recorded_task:["first"]')
+        self.assertEqual(self.task.calls, [(['first'], due_at)])
+        self.assertIsNone(DelayedTaskService.due_at(key))
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from django.test import TestCase
+
+from cgg.apps.finance.models import CreditInvoice, Customer
+from cgg.apps.finance.versions.v1.serializers.credit_invoice import (
+    CreditInvoiceExportSerializer,
+)
+from cgg.apps.finance.versions.v1.services.export import ExportService
+
+
+class ExportRowsTestCase(TestCase):
+    def create_credit_invoices(self, count):
+        for _ in range(count):
+            index = Customer.objects.count()
+            CreditInvoice.objects.create(
+                customer=Customer.objects.create(customer_code=f"c{index}"),
+                total_cost=1000,
+                updated_status_at=datetime.now(),
+            )
+
+    def export_credit_invoices(self):
+        return list(ExportService.rows(
+            CreditInvoice.objects.order_by('created_at'),
+            CreditInvoiceExportSerializer,
+            select_related=('customer',),
+            context_builder=ExportService.credit_invoices_context,
+        ))
+
+    def test_queries_do_not_grow_with_rows(self):
+        self.create_credit_invoices(1)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.export_credit_invoices()), 1)
+        self.create_credit_invoices(3)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.export_credit_invoices()), 4)
@@ -0,0 +1,40 @@
+from django.http import QueryDict
+from django.test import TestCase
+
+from cgg.apps.finance.versions.v1.services.export_job import (
+    ExportJobService,
+)
+
+
+class ExportJobFiltersTestCase(TestCase):
+    def filters_hash(self, query_string, arguments=None):
+        return ExportJobService.filters_hash(
+            'invoices',
+            'csv',
+            arguments or [None, None],
+            ExportJobService.filter_params(QueryDict(query_string)),
+        )
+
+    def test_control_params_are_ignored(self):
+        self.assertEqual(
+            ExportJobService.filter_params(
+                QueryDict('status_code=paid&async=true&output=ndjson'),
+            ),
+            {'status_code': ['paid']},
+        )
+
+    def test_same_filters_same_hash(self):
+        self.assertEqual(
+            self.filters_hash('status_code=paid&created_at_from=1'),
+            self.filters_hash('created_at_from=1&async=true&status_code=paid'),
+        )
+
+    def test_different_filters_different_hash(self):
+        self.assertNotEqual(
+            self.filters_hash('status_code=paid'),
+            self.filters_hash('status_code=unpaid'),
+        )
+        self.assertNotEqual(
+            self.filters_hash('status_code=paid'),
+            self.filters_hash('status_code=paid', ['customer', None]),
+        )
@@ -0,0 +1,85 @@
+import json
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+
+from cgg.apps.finance.models import FailedJob, TrunkNotification
+from cgg.apps.finance.versions.v1.config import FinanceConfigurations
+from cgg.apps.finance.versions.v1.services.job import JobService
+from cgg.apps.finance.versions.v1.services.trunk_outbox import (
+    TrunkOutboxService,
+)
+from cgg.core.integrity import Integrity
+from cgg.core.testing import cgg_settings
+
+TB_NOTIFY = FinanceConfigurations.TrunkBackend.Notify
+
+
+class FailedJobsTestCase(TestCase):
+    def add_job(self, service_name, method_name, method_args):
+        JobService.add_failed_job(
+            FinanceConfigurations.Jobs.TYPES[1][0],
+            'v1',
+            service_name,
+            method_name,
+            json.dumps(method_args),
+            'error',
+        )
+
+    def test_services_are_cached(self):
+        service = JobService.import_job_module('TrunkOutboxService')
+        self.assertIs(service, TrunkOutboxService)
+        self.assertIs(
+            JobService._services[('TrunkOutboxService', 'v1')],
+            TrunkOutboxService,
+        )
+
+    def test_claim_leases_due_jobs(self):
+        self.add_job('MissingService', 'run', {})
+        self.add_job('MissingService', 'run', {})
+        given_up = FailedJob.objects.first()
+        given_up.attempts = 3
+        given_up.save(update_fields=['attempts'])
+        with cgg_settings('FAILED_JOBS', MAX_ATTEMPTS=3):
+            job_objects = JobService.claim(10)
+            self.assertEqual(len(job_objects), 1)
+            self.assertNotEqual(job_objects[0].id, given_up.id)
+            self.assertEqual(JobService.claim(10), [])
+        job_object = FailedJob.objects.get(id=job_objects[0].id)
+        self.assertGreater(job_object.next_retry_at, datetime.now())
+        self.assertTrue(Integrity.check(job_object))
+
+    def test_failed_jobs_back_off(self):
+        self.add_job('MissingService', 'run', {})
+        with cgg_settings('FAILED_JOBS', BACKOFF=60, BACKOFF_MAX=90):
+            summary = JobService.redo_due_jobs()
+            self.assertEqual(summary['failed'], 1)
+            job_object = FailedJob.objects.get()
+            self.assertEqual(job_object.attempts, 1)
+            self.assertFalse(job_object.is_done)
+            JobService.mark_failed(job_object, 'error')
+        job_object = FailedJob.objects.get()
+        self.assertEqual(job_object.attempts, 2)
+        self.assertLessEqual(
+            job_object.next_retry_at,
+            datetime.now() + timedelta(seconds=90),
+        )
+        self.assertTrue(Integrity.check(job_object))
+
+    def test_trunk_notifications_move_to_outbox(self):
+        for invoice_id in ('1', '2'):
+            self.add_job('TrunkService', 'notify_trunk_backend', {
+                "notify_type_code": TB_NOTIFY.DUE_DATE_WARNING_1,
+                "notify_object": [{"invoice_id": invoice_id}],
+            })
+        self.add_job('TrunkService', 'notify_trunk_backend', {
+            "notify_type_code": TB_NOTIFY.PREPAID_EXPIRED,
+            "notify_object": {"subscription_code": "1000"},
+        })
+        summary = JobService.redo_due_jobs()
+        self.assertEqual(summary['merged'], 3)
+        self.assertFalse(FailedJob.objects.filter(is_done=False).exists())
+        notifications = list(TrunkNotification.objects.all())
+        self.assertEqual(len(notifications), 3)
+        batches = TrunkOutboxService.batches(notifications)
+        self.assertEqual(len(batches), 2)
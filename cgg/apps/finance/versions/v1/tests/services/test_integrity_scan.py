@@ -0,0 +1,32 @@
+import uuid
+
+from django.test import TestCase
+
+from cgg.apps.finance.models import Invoice, RuntimeConfig
+from cgg.apps.finance.versions.v1.services.integrity_scan import (
+    IntegrityScanService,
+)
+
+
+class IntegrityScanKeyRangesTestCase(TestCase):
+    def test_uuid_ranges_cover_key_space(self):
+        key_ranges = IntegrityScanService.key_ranges(Invoice, 4)
+        self.assertEqual(len(key_ranges), 4)
+        self.assertIsNone(key_ranges[0][0])
+        self.assertIsNone(key_ranges[-1][1])
+        for (start, end), (next_start, next_end) in zip(
+                key_ranges,
+                key_ranges[1:],
+        ):
+            self.assertEqual(end, next_start)
+        self.assertEqual(
+            key_ranges[2][0],
+            str(uuid.UUID(int=2 ** 127)),
+        )
+
+    def test_empty_integer_keys(self):
+        RuntimeConfig.objects.all().delete()
+        self.assertEqual(
+            IntegrityScanService.key_ranges(RuntimeConfig, 4),
+            [(None, None)],
+        )
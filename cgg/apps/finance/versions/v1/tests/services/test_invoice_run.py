@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.test import TestCase
+
+from cgg.apps.finance.models import InvoiceRun, InvoiceRunChunk
+from cgg.apps.finance.versions.v1.services.invoice_run import (
+    InvoiceRunService,
+)
+
+
+class InvoiceRunLeaseTestCase(TestCase):
+    def setUp(self):
+        invoice_run = InvoiceRun()
+        invoice_run.from_date = datetime(2023, 1, 1)
+        invoice_run.to_date = datetime(2023, 2, 1)
+        invoice_run.chunks_total = 1
+        invoice_run.save()
+        self.invoice_run = invoice_run
+        chunk = InvoiceRunChunk()
+        chunk.invoice_run = invoice_run
+        chunk.chunk_index = 0
+        chunk.subscription_ids = []
+        chunk.save()
+        self.chunk = chunk
+
+    def lease(self, claimed_at):
+        self.chunk.claimed_by = 'other-worker'
+        self.chunk.claimed_at = claimed_at
+        self.chunk.save()
+
+    def test_leased_chunk_is_left_alone(self):
+        self.lease(datetime.now())
+        self.assertIsNone(InvoiceRunService.claim_chunk(
+            self.chunk.id,
+            'this-worker',
+        ))
+        InvoiceRunService.process_chunk(self.chunk.id)
+        self.chunk.refresh_from_db()
+        self.assertFalse(self.chunk.is_done)
+        self.assertEqual(self.chunk.claimed_by, 'other-worker')
+        self.assertFalse(
+            InvoiceRunService.renew_lease(self.chunk.id, 'this-worker'),
+        )
+
+    def test_expired_lease_is_taken_over(self):
+        self.lease(datetime.now() - timedelta(
+            seconds=settings.CGG['INVOICE_RUN']['CHUNK_TIMEOUT'] + 1,
+        ))
+        InvoiceRunService.process_chunk(self.chunk.id)
+        self.chunk.refresh_from_db()
+        self.invoice_run.refresh_from_db()
+        self.assertTrue(self.chunk.is_done)
+        self.assertNotEqual(self.chunk.claimed_by, 'other-worker')
+        self.assertEqual(self.invoice_run.chunks_done, 1)
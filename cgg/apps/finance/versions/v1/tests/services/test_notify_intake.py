@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from cgg.apps.finance.versions.v1.services.cgrates_notify import (
+    CGRateSNotifyService,
+)
+from cgg.core.testing import cgg_settings
+
+
+class RecordedTask:
+    """
+    Keeps queued calls instead of sending them to the broker
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def delay(self, *args):
+        self.calls.append((list(args), {}, None))
+
+    def apply_async(self, args=None, kwargs=None, countdown=None):
+        self.calls.append((args, kwargs, countdown))
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    },
+)
+class NotifyIntakeTestCase(TestCase):
+    def setUp(self):
+        self.task = RecordedTask()
+        self.key = 'postpaid_80:1000'
+
+    def test_duplicates_fold_into_one_follow_up(self):
+        self.assertTrue(
+            CGRateSNotifyService.intake(self.key, self.task, ['first']),
+        )
+        self.assertFalse(
+            CGRateSNotifyService.intake(self.key, self.task, ['second']),
+        )
+        self.assertFalse(
+            CGRateSNotifyService.intake(self.key, self.task, ['third']),
+        )
+        self.assertEqual(len(self.task.calls), 1)
+        self.assertTrue(CGRateSNotifyService.intake_done(self.key, self.task))
+        self.assertEqual(len(self.task.calls), 2)
+        args, kwargs, countdown = self.task.calls[1]
+        self.assertEqual(args, ['third'])
+        self.assertEqual(kwargs, {'intake_key': self.key})
+        self.assertEqual(countdown, settings.CGG['NOTIFY_INTAKE']['WINDOW'])
+        self.assertFalse(
+            CGRateSNotifyService.intake_done(self.key, self.task),
+        )
+        self.assertTrue(
+            CGRateSNotifyService.intake(self.key, self.task, ['fourth']),
+        )
+
+    def test_keys_are_independent(self):
+        CGRateSNotifyService.intake(self.key, self.task, ['first'])
+        CGRateSNotifyService.intake('postpaid_80:1001', self.task, ['other'])
+        self.assertEqual(len(self.task.calls), 2)
+
+    def test_disabled(self):
+        with cgg_settings('NOTIFY_INTAKE', ENABLED=False):
+            CGRateSNotifyService.intake(self.key, self.task, ['first'])
+            CGRateSNotifyService.intake(self.key, self.task, ['second'])
+        self.assertEqual(len(self.task.calls), 2)
@@ -0,0 +1,95 @@
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from cgg.apps.finance.models import Destination
+from cgg.apps.finance.versions.v1.services.prefix_index import (
+    PrefixIndex,
+    PrefixIndexService,
+)
+from cgg.core.cache import Cache
+
+
+class PrefixIndexTestCase(TestCase):
+    def setUp(self):
+        self.tehran_id = uuid.uuid4()
+        self.shiraz_id = uuid.uuid4()
+        self.prefix_index = PrefixIndex(
+            destinations=[
+                ('9821', 'landline_national', 'Tehran'),
+                ('9871', 'landline_national', 'Shiraz'),
+                ('982191', 'landline_national', 'Corporate'),
+                ('98912', 'mobile_national', 'MCI'),
+                ('44', 'landline_international', 'UK'),
+            ],
+            branches={
+                self.tehran_id: ('Tehran', ['9821']),
+                self.shiraz_id: ('Shiraz', ['9871']),
+            },
+        )
+
+    def test_branch_of_number(self):
+        self.assertEqual(
+            self.prefix_index.branch_ids_of_number('982188776655'),
+            [self.tehran_id],
+        )
+        self.assertEqual(
+            self.prefix_index.branch_ids_of_number('985188776655'),
+            [],
+        )
+
+    def test_classify_usage(self):
+        usage_trie = self.prefix_index.usage_trie(self.tehran_id)
+        expected = (
+            ('982188776655', 'landlines_local'),
+            ('987188776655', 'landlines_long_distance'),
+            ('98219100', 'landlines_corporate'),
+            ('989121234567', 'mobile'),
+            ('442071234567', 'international'),
+            ('1234', None),
+        )
+        for destination, category in expected:
+            self.assertEqual(
+                self.prefix_index.classify_usage(usage_trie, destination),
+                category,
+            )
+
+    def test_usage_trie_without_branch(self):
+        usage_trie = self.prefix_index.usage_trie(None)
+        self.assertEqual(
+            self.prefix_index.classify_usage(usage_trie, '982188776655'),
+            'landlines_long_distance',
+        )
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    },
+)
+class PrefixIndexInvalidateTestCase(TransactionTestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def version(self):
+        return Cache.get(
+            key=Cache.KEY_CONVENTIONS['prefix_index_version'],
+            values={},
+        )
+
+    def test_version_changes_after_commit(self):
+        PrefixIndexService.invalidate()
+        version = self.version()
+        with transaction.atomic():
+            Destination.objects.create(
+                prefix='9821',
+                name='Tehran',
+                country_code='98',
+                code='landline_national',
+            )
+            self.assertEqual(self.version(), version)
+        self.assertNotEqual(self.version(), version)
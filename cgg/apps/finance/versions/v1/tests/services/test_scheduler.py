@@ -0,0 +1,62 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from cgg.apps.finance.decorators import log_command
+from cgg.apps.finance.models import CommandRun
+from cgg.apps.finance.versions.v1.config import FinanceConfigurations
+
+COMMAND_TITLE = FinanceConfigurations.Commands.TYPES[2][0]
+STATES = FinanceConfigurations.CommandRun.STATE_CHOICES
+
+
+class RecordedCommand:
+    def __init__(self, error=None):
+        self.error = error
+        self.runs = 0
+
+    @log_command(command_title=COMMAND_TITLE)
+    def handle(self, *args, **options):
+        self.runs += 1
+        if self.error is not None:
+            raise self.error
+        return 'done'
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    },
+)
+class LogCommandTestCase(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def test_run_is_recorded(self):
+        self.assertEqual(RecordedCommand().handle(), 'done')
+        command_run = CommandRun.objects.get()
+        self.assertEqual(command_run.command_title, COMMAND_TITLE)
+        self.assertEqual(command_run.status_code, STATES[0][0])
+        self.assertIsNotNone(command_run.duration)
+        self.assertIsNone(cache.get(f"command_lock:{COMMAND_TITLE}"))
+
+    def test_failed_run_is_recorded(self):
+        command = RecordedCommand(error=ValueError('broken'))
+        with self.assertRaises(ValueError):
+            command.handle()
+        command_run = CommandRun.objects.get()
+        self.assertEqual(command_run.status_code, STATES[1][0])
+        self.assertEqual(command_run.error, 'broken')
+        self.assertIsNone(cache.get(f"command_lock:{COMMAND_TITLE}"))
+
+    def test_overlapping_run_is_skipped(self):
+        cache.add(f"command_lock:{COMMAND_TITLE}", 'other run', 60)
+        command = RecordedCommand()
+        self.assertIsNone(command.handle())
+        self.assertEqual(command.runs, 0)
+        self.assertEqual(CommandRun.objects.get().status_code, STATES[2][0])
+        self.assertEqual(
+            cache.get(f"command_lock:{COMMAND_TITLE}"),
+            'other run',
+        )
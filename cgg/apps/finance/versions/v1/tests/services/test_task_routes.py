@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from cgg.apps.finance.versions.v1.services import (
+    cgrates_notify,
+    export_job,
+    invoice,
+    invoice_run,
+    scheduler,
+    trunk_outbox,
+)
+from cgg.celery_app import (
+    QUEUE_BULK,
+    QUEUE_INVOICING,
+    QUEUE_REALTIME,
+    app,
+)
+
+
+class TaskRoutesTestCase(SimpleTestCase):
+    def queue(self, task):
+        options = app.amqp.router.route({}, task.name)
+
+        return options['queue'].name
+
+    def test_tasks_are_routed_by_workload(self):
+        self.assertEqual(
+            self.queue(cgrates_notify.handle_max_usage_postpaid_invoice),
+            QUEUE_REALTIME,
+        )
+        self.assertEqual(
+            self.queue(cgrates_notify.handle_cgrates_notification),
+            QUEUE_REALTIME,
+        )
+        self.assertEqual(
+            self.queue(trunk_outbox.dispatch_trunk_notifications),
+            QUEUE_REALTIME,
+        )
+        self.assertEqual(
+            self.queue(invoice.continue_issuing_interim_invoice),
+            QUEUE_INVOICING,
+        )
+        self.assertEqual(
+            self.queue(invoice_run.issue_periodic_invoice_chunk),
+            QUEUE_INVOICING,
+        )
+        self.assertEqual(self.queue(export_job.run_export_job), QUEUE_BULK)
+        self.assertEqual(
+            self.queue(scheduler.run_scheduled_command),
+            QUEUE_BULK,
+        )
+
+    def test_routed_tasks_exist(self):
+        for task_name in list(app.conf.task_routes) + list(
+                settings.CELERY_TASK_ANNOTATIONS,
+        ):
+            self.assertIn(task_name, app.tasks)
@@ -0,0 +1,97 @@
+from datetime import datetime
+
+from django.test import TestCase
+
+from cgg.apps.finance.models import TrunkNotification
+from cgg.apps.finance.versions.v1.config import FinanceConfigurations
+from cgg.apps.finance.versions.v1.services.trunk_outbox import (
+    TrunkOutboxService,
+)
+from cgg.core.integrity import Integrity
+from cgg.core.testing import cgg_settings
+
+TB_NOTIFY = FinanceConfigurations.TrunkBackend.Notify
+STATES = FinanceConfigurations.TrunkNotification.STATE_CHOICES
+
+
+class TrunkOutboxTestCase(TestCase):
+    def test_items_of_batched_types_are_rows(self):
+        added = TrunkOutboxService.add_notification(
+            TB_NOTIFY.PERIODIC_INVOICE,
+            [{'invoice_id': '1'}, {'invoice_id': '2'}],
+        )
+        self.assertEqual(added, 2)
+        added = TrunkOutboxService.add_notification(
+            TB_NOTIFY.POSTPAID_MAX_USAGE,
+            {'subscription_code': '1000'},
+        )
+        self.assertEqual(added, 1)
+        for notification in TrunkNotification.objects.all():
+            self.assertEqual(notification.status_code, STATES[0][0])
+            self.assertTrue(Integrity.check(notification))
+
+    def test_batches(self):
+        TrunkOutboxService.add_notification_stream(
+            TB_NOTIFY.DUE_DATE_WARNING_1,
+            range(5),
+            lambda row: {'invoice_id': str(row)} if row != 3 else None,
+        )
+        TrunkOutboxService.add_notification(
+            TB_NOTIFY.PREPAID_EXPIRED,
+            {'subscription_code': '1000'},
+        )
+        TrunkOutboxService.add_notification(
+            TB_NOTIFY.PREPAID_EXPIRED,
+            {'subscription_code': '1001'},
+        )
+        with cgg_settings('TRUNK_NOTIFY', BATCH_SIZE=3):
+            batches = TrunkOutboxService.batches(
+                list(TrunkNotification.objects.order_by('created_at')),
+            )
+        self.assertEqual(
+            [(notify_type_code, notify_object)
+             for notify_type_code, notify_object, _ in batches],
+            [
+                (
+                    TB_NOTIFY.DUE_DATE_WARNING_1,
+                    [{'invoice_id': '0'}, {'invoice_id': '1'},
+                     {'invoice_id': '2'}],
+                ),
+                (TB_NOTIFY.DUE_DATE_WARNING_1, [{'invoice_id': '4'}]),
+                (TB_NOTIFY.PREPAID_EXPIRED, {'subscription_code': '1000'}),
+                (TB_NOTIFY.PREPAID_EXPIRED, {'subscription_code': '1001'}),
+            ],
+        )
+
+    def test_backoff_and_failure(self):
+        TrunkOutboxService.add_notification(
+            TB_NOTIFY.POSTPAID_MAX_USAGE,
+            {'subscription_code': '1000'},
+        )
+        with cgg_settings('TRUNK_NOTIFY', MAX_ATTEMPTS=2, BACKOFF=10):
+            notifications = TrunkOutboxService.claim(10)
+            self.assertEqual(len(notifications), 1)
+            self.assertEqual(TrunkOutboxService.claim(10), [])
+            TrunkOutboxService.mark_failed(notifications, 'timeout')
+            notification = TrunkNotification.objects.get()
+            self.assertEqual(notification.attempts, 1)
+            self.assertEqual(notification.status_code, STATES[0][0])
+            self.assertGreater(notification.next_attempt_at, datetime.now())
+            TrunkOutboxService.mark_failed([notification], 'timeout')
+        notification = TrunkNotification.objects.get()
+        self.assertEqual(notification.status_code, STATES[2][0])
+        self.assertTrue(Integrity.check(notification))
+        self.assertEqual(TrunkOutboxService.retry_failed(), 1)
+        self.assertEqual(TrunkOutboxService.stats()['pending'], 1)
+
+    def test_stats(self):
+        TrunkOutboxService.add_notification(
+            TB_NOTIFY.PREPAID_RENEWED,
+            {'subscription_code': '1000'},
+        )
+        notifications = TrunkOutboxService.claim(10)
+        TrunkOutboxService.mark_sent(notifications)
+        stats = TrunkOutboxService.stats()
+        self.assertEqual(stats['pending'], 0)
+        self.assertEqual(stats['lag_seconds'], 0)
+        self.assertEqual(stats['sent_last_minute'], 1)
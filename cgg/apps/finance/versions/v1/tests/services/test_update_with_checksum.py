@@ -0,0 +1,39 @@
+from django.db.models import F
+from django.test import TestCase
+
+from cgg.apps.finance.models import RuntimeConfig
+from cgg.apps.finance.versions.v1.config import FinanceConfigurations
+from cgg.core.integrity import Integrity
+
+
+class UpdateWithChecksumTestCase(TestCase):
+    def setUp(self):
+        RuntimeConfig.objects.all().delete()
+        keys = FinanceConfigurations.RuntimeConfig.KEY_CHOICES
+        for key in (keys[0][0], keys[1][0], keys[6][0]):
+            runtime_config = RuntimeConfig()
+            runtime_config.item_key = key
+            runtime_config.item_value = '1'
+            runtime_config.save()
+
+    def test_checksums_are_valid_after_update(self):
+        updated = RuntimeConfig.objects.all().update_with_checksum(
+            batch_size=2,
+            item_value='5',
+        )
+        self.assertEqual(updated, 3)
+        for runtime_config in RuntimeConfig.objects.all():
+            self.assertEqual(runtime_config.item_value, '5')
+            self.assertTrue(Integrity.check(runtime_config))
+
+    def test_update_fields_keeps_checksum_valid(self):
+        runtime_config = RuntimeConfig.objects.first()
+        runtime_config.item_value = '7'
+        runtime_config.save(update_fields=['item_value'])
+        runtime_config = RuntimeConfig.objects.get(id=runtime_config.id)
+        self.assertEqual(runtime_config.item_value, '7')
+        self.assertTrue(Integrity.check(runtime_config))
+
+    def test_expressions_are_rejected(self):
+        with self.assertRaises(TypeError):
+            RuntimeConfig.objects.update_with_checksum(item_value=F('id'))
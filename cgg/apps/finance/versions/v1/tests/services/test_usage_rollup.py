@@ -0,0 +1,79 @@
+from datetime import datetime
+from decimal import Decimal
+
+from django.test import TestCase
+
+from cgg.apps.cdr.models import CDRSyncState
+from cgg.apps.finance.versions.v1.services.prefix_index import (
+    USAGE_CATEGORIES,
+)
+from cgg.apps.finance.versions.v1.services.usage_rollup import (
+    UsageRollupService,
+)
+from cgg.core.testing import cgg_settings
+
+
+class UsageRollupTestCase(TestCase):
+    databases = {'default', 'cdr'}
+
+    def test_rounded_usage(self):
+        usage = Decimal(61000000000)
+        self.assertEqual(
+            UsageRollupService.rounded_usage(
+                USAGE_CATEGORIES[1],
+                'BR_Tehran',
+                usage,
+            ),
+            Decimal(120000000000),
+        )
+        self.assertEqual(
+            UsageRollupService.rounded_usage(
+                USAGE_CATEGORIES[1],
+                'BR_Shiraz',
+                usage,
+            ),
+            Decimal(90000000000),
+        )
+        self.assertEqual(
+            UsageRollupService.rounded_usage(
+                USAGE_CATEGORIES[0],
+                'BR_Tehran',
+                usage,
+            ),
+            usage,
+        )
+
+    def test_balance_suffix(self):
+        self.assertEqual(UsageRollupService.balance_suffix('postpaid'), '')
+        self.assertEqual(
+            UsageRollupService.balance_suffix('prepaid'),
+            '_prepaid',
+        )
+
+    def test_rollup_days(self):
+        state = CDRSyncState()
+        state.synced_from = datetime(2023, 1, 1, 10, 0)
+        state.high_water_mark = datetime(2023, 1, 20, 10, 0)
+        state.save()
+        with cgg_settings('CDR_REPLICA', ENABLED=True):
+            self.assertIsNone(UsageRollupService.rollup_days(
+                datetime(2023, 1, 1),
+                datetime(2023, 2, 1),
+            ))
+            state.rolled_up_to = state.high_water_mark
+            state.save()
+            self.assertEqual(
+                UsageRollupService.rollup_days(
+                    datetime(2023, 1, 1),
+                    datetime(2023, 2, 1),
+                ),
+                (datetime(2023, 1, 2), datetime(2023, 1, 20)),
+            )
+            self.assertIsNone(UsageRollupService.rollup_days(
+                datetime(2023, 1, 20, 1, 0),
+                datetime(2023, 2, 1),
+            ))
+        self.assertIsNone(UsageRollupService.rollup_days(
+            datetime(2023, 1, 1),
+            datetime(2023, 2, 1),
+        ))
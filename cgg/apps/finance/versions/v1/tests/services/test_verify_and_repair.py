@@ -0,0 +1,50 @@
+import time
+
+from django.test import TestCase
+
+from cgg.apps.finance.versions.v1.services.invoice import InvoiceService
+from cgg.core import api_exceptions
+from cgg.core.testing import cgg_settings
+
+
+class VerifyAndRepairFanOutTestCase(TestCase):
+
+    def test_results_and_phases(self):
+        phases = {}
+        with cgg_settings('VERIFY_AND_REPAIR', DEADLINE=5):
+            results = InvoiceService._fan_out(
+                {
+                    'balance': lambda: {'base_balance_postpaid': 100},
+                    'usages': lambda: 20,
+                },
+                phases,
+            )
+        self.assertEqual(results['balance'], {'base_balance_postpaid': 100})
+        self.assertEqual(results['usages'], 20)
+        self.assertEqual(set(phases), {'balance', 'usages', 'total'})
+
+    def test_calls_run_concurrently(self):
+        started_at = time.monotonic()
+        with cgg_settings('VERIFY_AND_REPAIR', DEADLINE=5):
+            InvoiceService._fan_out({
+                'sessions': lambda: time.sleep(0.3),
+                'usages': lambda: time.sleep(0.3),
+                'balance': lambda: time.sleep(0.3),
+            })
+        self.assertLess(time.monotonic() - started_at, 0.8)
+
+    def test_deadline(self):
+        with cgg_settings('VERIFY_AND_REPAIR', DEADLINE=0.1):
+            with self.assertRaises(api_exceptions.TimeOut408):
+                InvoiceService._fan_out({
+                    'balance': lambda: time.sleep(1),
+                    'usages': lambda: 20,
+                })
+
+    def test_errors_are_raised(self):
+        def fail():
+            raise api_exceptions.NotFound404('not found')
+
+        with cgg_settings('VERIFY_AND_REPAIR', DEADLINE=5):
+            with self.assertRaises(api_exceptions.NotFound404):
+                InvoiceService._fan_out({'balance': fail})
@@ -277,6 +277,30 @@ urls = [
         api.ExportProfitsAPIView.as_view(),
         name='export_profits'
     ),
+    ############################################
+    #          Export job related URLs         #
+    ############################################
+    # Status and progress of an export job
+    re_path(
+        r'^(?:v1/)?export-jobs/(?P<export_job>[^/]+)(?:/)?$',
+        api.ExportJobAPIView.as_view(),
+        name='export_job'
+    ),
+    # Download file of a completed export job
+    re_path(
+        r'^(?:v1/)?export-jobs/(?P<export_job>[^/]+)/download(?:/)?$',
+        api.ExportJobDownloadAPIView.as_view(),
+        name='export_job_download'
+    ),
+    ############################################
+    #     Trunk notification related URLs      #
+    ############################################
+    # Lag and throughput of the outbox of trunk notifications
+    re_path(
+        r'^(?:v1/)?trunk-notifications/stats(?:/)?$',
+        api.TrunkNotificationStatsAPIView.as_view(),
+        name='trunk_notification_stats'
+    ),
     # Get or update a profit
     re_path(
         r'^(?:v1/)?profits/(?P<profit>[^/]+)(?:/)?$',
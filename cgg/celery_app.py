@@ -2,11 +2,73 @@ import logging
 import os
 
 from celery import Celery
+from kombu import Queue
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cgg.settings.base')
 
+# Queues of workload classes, each queue has its own workers (see
+# docker-compose.yml) so a flood of one class does not delay the others
+QUEUE_REALTIME = 'realtime'
+QUEUE_INVOICING = 'invoicing'
+QUEUE_BULK = 'bulk'
+
 app = Celery('cgg')
 
 app.config_from_object('django.conf:settings', namespace='CELERY')
+app.conf.task_queues = (
+    Queue(QUEUE_REALTIME),
+    Queue(QUEUE_INVOICING),
+    Queue(QUEUE_BULK),
+)
+# Tasks that are not routed (e.g. new ones) go to the bulk queue
+app.conf.task_default_queue = QUEUE_BULK
+# Priorities are from 0 (highest) to 9 in each queue
+app.conf.task_routes = {
+    # Notifications of CGRateS, 100 percent usage stops customers from
+    # overrunning their balance
+    'cgg.apps.finance.versions.v1.services.cgrates_notify.'
+    'handle_max_usage_postpaid_invoice': {
+        'queue': QUEUE_REALTIME,
+        'priority': 0,
+    },
+    'cgg.apps.finance.versions.v1.services.cgrates_notify.'
+    'handle_cgrates_notification': {
+        'queue': QUEUE_REALTIME,
+        'priority': 3,
+    },
+    'cgg.apps.finance.versions.v1.services.cgrates_notify.'
+    'handle_cgrates_expired_notification': {
+        'queue': QUEUE_REALTIME,
+        'priority': 3,
+    },
+    'cgg.apps.finance.versions.v1.services.trunk_outbox.'
+    'dispatch_trunk_notifications': {
+        'queue': QUEUE_REALTIME,
+        'priority': 6,
+    },
+    # Interim invoices go before chunks of periodic invoices
+    'cgg.apps.finance.versions.v1.services.invoice.'
+    'continue_issuing_interim_invoice': {
+        'queue': QUEUE_INVOICING,
+        'priority': 0,
+    },
+    'cgg.apps.finance.versions.v1.services.invoice.'
+    'restart_issuing_interim_invoice': {
+        'queue': QUEUE_INVOICING,
+        'priority': 0,
+    },
+    'cgg.apps.finance.versions.v1.services.invoice_run.'
+    'issue_periodic_invoice_chunk': {
+        'queue': QUEUE_INVOICING,
+        'priority': 6,
+    },
+    # Exports and periodic commands
+    'cgg.apps.finance.versions.v1.services.export_job.run_export_job': {
+        'queue': QUEUE_BULK,
+    },
+    'cgg.apps.finance.versions.v1.services.scheduler.run_scheduled_command': {
+        'queue': QUEUE_BULK,
+    },
+}
 app.autodiscover_tasks()
 logger = logging.getLogger('common')
@@ -3,6 +3,12 @@
 # and django's core caching system to store data.
 # Note: always use get_key method before other methods to get correct keys
 # based on KEY_CONVENTIONS.
+# Keys in CACHE_L1 settings are also kept in a small in-process cache (L1)
+# in front of Redis (L2). Changes are published on a Redis channel, so L1
+# caches of other processes drop their copy.
+# get_or_compute loads a missing value in one worker at a time (Redis lock),
+# refreshes hot values a bit before they expire and serves stale values
+# while another worker refreshes them.
 # (C) 2019 Mehrdad Esmaeilpour, Tehran, Iran
 # Respina Networks and beyonds - cache.py
 # Created at 2019-12-29,  12:6:16
@@ -11,11 +17,118 @@
 # --------------------------------------------------------------------------
 
 import json
+import logging
+import math
+import os
+import pickle
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
 from hashlib import sha256
 
+from django.conf import settings
 from django.core.cache import cache
 
 from cgg.core import api_exceptions
+from cgg.core.runtime import threads_available
+
+logger = logging.getLogger('common')
+
+
+class LocalCache:
+    """
+    Bounded LRU cache with a TTL per entry. Values are pickled, so callers
+    never share (and mutate) the same object
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        :param key:
+        :return: (found, value)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+
+        return True, pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class CachedValue:
+    """
+    Value stored by Cache.get_or_compute with the time it should be
+    refreshed and how long it took to compute. A not found result is stored
+    as the exception class and detail
+    """
+    __slots__ = ('value', 'refresh_at', 'delta', 'error')
+
+    def __init__(self, value, refresh_at, delta, error=None):
+        self.value = value
+        self.refresh_at = refresh_at
+        self.delta = delta
+        self.error = error
+
+    def __getstate__(self):
+        return self.value, self.refresh_at, self.delta, self.error
+
+    def __setstate__(self, state):
+        self.value, self.refresh_at, self.delta, self.error = state
+
+    def is_fresh(self, now):
+        return self.refresh_at is None or now < self.refresh_at
+
+    def should_refresh_early(self, now, beta):
+        """
+        Probabilistic early refresh (XFetch), values that are slow to
+        compute are refreshed earlier
+        """
+        if self.refresh_at is None or not self.delta:
+            return False
+
+        return now - self.delta * beta * math.log(
+            1 - random.random(),
+        ) >= self.refresh_at
+
+    def unwrap(self):
+        if self.error is not None:
+            error_class, detail = self.error
+            raise error_class(detail)
+
+        return self.value
 
 
 class Cache:
@@ -26,7 +139,15 @@ class Cache:
         "maximum_rate": "maximum_rate",
         "minimum_rate": "minimum_rate",
         "runtime_config": "runtime_config",
+        "prefix_index_version": "prefix_index_version",
     }
+    # Sender id of invalidation messages, to skip messages of this process
+    _instance_id = None
+    _pid = None
+    _local = None
+    _listener = None
+    _lock = threading.Lock()
+    _stats = {}
 
     @classmethod
     def set(cls, key, values: dict, store_value, expiry_time=None):
@@ -39,18 +160,357 @@ class Cache:
         :return:
         """
         cache_key = cls._get_key(key, **values)
-        cache.set(cache_key, store_value, expiry_time)
+        cls._store(key, cache_key, store_value, expiry_time)
 
     @classmethod
     def get(cls, key, values: dict):
         cache_key = cls._get_key(key, **values)
-        return cache.get(cache_key)
+        value = cls._load(key, cache_key)
+        if isinstance(value, CachedValue):
+            return None if value.error is not None else value.value
+
+        return value
+
+    @classmethod
+    def get_many(cls, key, values_list):
+        """
+        Get several values of a key in one round trip
+        :param key: from KEY_CONVENTIONS
+        :param values_list: list of key values (dict)
+        :return: list of values in the same order, None if not cached
+        """
+        cache_keys = [cls._get_key(key, **values) for values in values_list]
+        found = {}
+        use_local = cls._use_local(key)
+        if use_local:
+            local_cache = cls._local_cache()
+            for cache_key in cache_keys:
+                is_found, value = local_cache.get(cache_key)
+                if is_found:
+                    cls._count(key, 'l1_hits')
+                    found[cache_key] = value
+        missing_keys = [
+            cache_key for cache_key in dict.fromkeys(cache_keys)
+            if cache_key not in found
+        ]
+        if missing_keys:
+            stored = cache.get_many(missing_keys)
+            for cache_key in missing_keys:
+                value = stored.get(cache_key)
+                if value is None:
+                    cls._count(key, 'misses')
+                    continue
+                cls._count(key, 'l2_hits')
+                found[cache_key] = value
+                if use_local:
+                    local_cache.set(cache_key, value)
+        values = []
+        for cache_key in cache_keys:
+            value = found.get(cache_key)
+            if isinstance(value, CachedValue):
+                value = None if value.error is not None else value.value
+            values.append(value)
+
+        return values
+
+    @classmethod
+    def set_many(cls, key, items, expiry_time=None):
+        """
+        Set several values of a key in one round trip
+        :param key: from KEY_CONVENTIONS
+        :param items: list of (values, store_value)
+        :param expiry_time: in seconds
+        :return:
+        """
+        stored = {
+            cls._get_key(key, **values): store_value
+            for values, store_value in items
+        }
+        if not stored:
+            return
+        cache.set_many(stored, expiry_time)
+        if cls._use_local(key):
+            local_cache = cls._local_cache()
+            for cache_key, store_value in stored.items():
+                local_cache.set(cache_key, store_value, expiry_time)
+                cls._publish(cache_key)
+
+    @classmethod
+    def get_or_compute(
+            cls,
+            key,
+            values: dict,
+            compute,
+            expiry_time=None,
+            not_found=(),
+    ):
+        """
+        Return the cached value or compute and cache it. Only the worker
+        that holds the lock of a key computes it, the others wait for it or
+        get the stale value if there is one
+        :param key: from KEY_CONVENTIONS
+        :param values: key value (dict)
+        :param compute: callable without arguments
+        :param expiry_time: in seconds, None never expires
+        :param not_found: exception classes of compute that are cached for
+        NEGATIVE_TTL seconds and raised again on hit
+        :return: value
+        """
+        compute_config = settings.CGG['CACHE_COMPUTE']
+        cache_key = cls._get_key(key, **values)
+        cached = cls._load(key, cache_key)
+        if cached is not None and not isinstance(cached, CachedValue):
+            # Stored with Cache.set
+            return cached
+        now = time.time()
+        if cached is not None and cached.is_fresh(now) and \
+                not cached.should_refresh_early(now, compute_config['BETA']):
+            return cached.unwrap()
+
+        lock = cls._compute_lock(cache_key)
+        if cached is not None:
+            # Stale or about to expire, refresh it only if no other worker
+            # is refreshing it
+            if lock is not None and not lock.acquire(blocking=False):
+                return cached.unwrap()
+        elif lock is not None:
+            if lock.acquire(
+                    blocking=True,
+                    blocking_timeout=compute_config['LOCK_WAIT'],
+            ):
+                cached = cls._load(key, cache_key)
+                if isinstance(cached, CachedValue) and \
+                        cached.is_fresh(time.time()):
+                    cls._release(lock)
+                    return cached.unwrap()
+                if cached is not None and \
+                        not isinstance(cached, CachedValue):
+                    cls._release(lock)
+                    return cached
+            else:
+                # The worker that holds the lock is too slow, compute
+                # without it
+                lock = None
+
+        try:
+            return cls._compute(
+                key,
+                cache_key,
+                compute,
+                expiry_time,
+                not_found,
+                cached,
+            )
+        finally:
+            if lock is not None:
+                cls._release(lock)
+
+    @classmethod
+    def _compute(cls, key, cache_key, compute, expiry_time, not_found,
+                 stale):
+        compute_config = settings.CGG['CACHE_COMPUTE']
+        started_at = time.time()
+        try:
+            value = compute()
+        except not_found as e:
+            negative_ttl = compute_config['NEGATIVE_TTL']
+            cls._store(
+                key,
+                cache_key,
+                CachedValue(
+                    None,
+                    time.time() + negative_ttl,
+                    0,
+                    (type(e), str(getattr(e, 'detail', e))),
+                ),
+                negative_ttl,
+            )
+            raise
+        except Exception as e:
+            if stale is None or stale.error is not None:
+                raise
+            logger.error("cache refresh of %s failed: %s", key, e)
+            return stale.value
+        now = time.time()
+        if expiry_time is None:
+            refresh_at = None
+            hard_expiry_time = None
+        else:
+            refresh_at = now + expiry_time
+            hard_expiry_time = expiry_time + compute_config['STALE_TTL']
+        cls._store(
+            key,
+            cache_key,
+            CachedValue(value, refresh_at, now - started_at),
+            hard_expiry_time,
+        )
+
+        return value
+
+    @classmethod
+    def _compute_lock(cls, cache_key):
+        """
+        :return: Redis lock of a key or None if cache backend has no locks
+        """
+        if not hasattr(cache, 'lock'):
+            return None
+
+        return cache.lock(
+            f"compute_lock:{cache_key}",
+            timeout=settings.CGG['CACHE_COMPUTE']['LOCK_TIMEOUT'],
+        )
+
+    @classmethod
+    def _release(cls, lock):
+        try:
+            lock.release()
+        except Exception:
+            # Expired after LOCK_TIMEOUT and may be held by another worker
+            pass
+
+    @classmethod
+    def _store(cls, key, cache_key, value, expiry_time):
+        cache.set(cache_key, value, expiry_time)
+        if cls._use_local(key):
+            cls._local_cache().set(cache_key, value, expiry_time)
+            cls._publish(cache_key)
+
+    @classmethod
+    def _load(cls, key, cache_key):
+        use_local = cls._use_local(key)
+        if use_local:
+            found, value = cls._local_cache().get(cache_key)
+            if found:
+                cls._count(key, 'l1_hits')
+                return value
+        value = cache.get(cache_key)
+        if value is None:
+            cls._count(key, 'misses')
+            return None
+        cls._count(key, 'l2_hits')
+        if use_local:
+            cls._local_cache().set(cache_key, value)
+
+        return value
 
     @classmethod
     def delete(cls, key, values: dict):
         cache_key = cls._get_key(key, **values)
-        print('cache_key -> '+cache_key)
         cache.delete(cache_key)
+        if cls._use_local(key):
+            cls._local_cache().delete(cache_key)
+            cls._publish(cache_key)
+
+    @classmethod
+    def stats(cls):
+        """
+        Hit and miss counters per key of KEY_CONVENTIONS in this process
+        :return: dict
+        """
+        local_cache = cls._local if cls._pid == os.getpid() else None
+
+        return {
+            "pid": os.getpid(),
+            "l1_entries": len(local_cache) if local_cache else 0,
+            "l1_listening": cls._listener is not None and
+                            cls._listener.is_alive(),
+            "keys": {
+                key: dict(counters) for key, counters in cls._stats.items()
+            },
+        }
+
+    @classmethod
+    def _count(cls, key, counter):
+        counters = cls._stats.get(key)
+        if counters is None:
+            counters = cls._stats.setdefault(key, {
+                "l1_hits": 0,
+                "l2_hits": 0,
+                "misses": 0,
+            })
+        counters[counter] += 1
+
+    @classmethod
+    def _use_local(cls, key):
+        l1_config = settings.CGG['CACHE_L1']
+        # Without the listener thread invalidations of other processes are
+        # never received, so L1 would serve stale values until TTL
+        return l1_config['ENABLED'] and key in l1_config['KEYS'] and \
+            threads_available()
+
+    @classmethod
+    def _local_cache(cls):
+        """
+        Return L1 cache of the current process. After a fork the copy of
+        parent is dropped and a new invalidation listener is started
+        :return: LocalCache
+        """
+        pid = os.getpid()
+        if cls._local is None or cls._pid != pid:
+            with cls._lock:
+                if cls._local is None or cls._pid != pid:
+                    l1_config = settings.CGG['CACHE_L1']
+                    cls._local = LocalCache(
+                        l1_config['MAX_ENTRIES'],
+                        l1_config['TTL'],
+                    )
+                    cls._instance_id = uuid.uuid4().hex
+                    cls._stats = {}
+                    cls._pid = pid
+                    cls._listener = threading.Thread(
+                        target=cls._listen,
+                        args=(cls._local,),
+                        name='cache-invalidation',
+                        daemon=True,
+                    )
+                    cls._listener.start()
+
+        return cls._local
+
+    @classmethod
+    def _channel(cls):
+        return f"{settings.CACHES['default'].get('KEY_PREFIX') or ''}:" \
+               f"cache_invalidation"
+
+    @classmethod
+    def _publish(cls, cache_key):
+        try:
+            from django_redis import get_redis_connection
+
+            get_redis_connection('default').publish(
+                cls._channel(),
+                f"{cls._instance_id}:{cache_key}",
+            )
+        except Exception as e:
+            logger.error("cache invalidation is not published: %s", e)
+
+    @classmethod
+    def _listen(cls, local_cache):
+        """
+        Drop L1 entries changed by other processes. L1 is cleared whenever
+        the subscription is lost, because messages may have been missed
+        :param local_cache: LocalCache of this process
+        """
+        from django_redis import get_redis_connection
+
+        while cls._local is local_cache:
+            try:
+                pubsub = get_redis_connection('default').pubsub(
+                    ignore_subscribe_messages=True,
+                )
+                pubsub.subscribe(cls._channel())
+                local_cache.clear()
+                for message in pubsub.listen():
+                    data = message.get('data')
+                    if isinstance(data, bytes):
+                        data = data.decode('utf-8')
+                    sender, _, cache_key = str(data).partition(':')
+                    if sender != cls._instance_id:
+                        local_cache.delete(cache_key)
+            except Exception as e:
+                logger.error("cache invalidation listener failed: %s", e)
+                local_cache.clear()
+                time.sleep(1)
 
     @classmethod
     def _get_key(cls, caching_key, **kwargs):
@@ -64,7 +524,24 @@ class Cache:
             raise api_exceptions.Conflict409(
                 "Caching error, use standard keys"
             )
+        try:
+            # Types are part of the memo key, json.dumps tells 1 from True
+            return cls._hashed_key(caching_key, tuple(
+                (name, type(value), value) for name, value in kwargs.items()
+            ))
+        except TypeError:
+            # Values that are not hashable can not be memoized
+            return cls._hash(caching_key, kwargs)
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _hashed_key(caching_key, items):
+        return Cache._hash(caching_key, {
+            name: value for name, value_type, value in items
+        })
 
+    @staticmethod
+    def _hash(caching_key, kwargs):
         kwargs = json.dumps(kwargs)
         cache_key = sha256(
             str(f"{caching_key}:{kwargs}").encode('utf-8')
@@ -1,7 +1,4 @@
-import json
-from json import JSONDecodeError
-
-from cgg.apps.api_request.models import APIRequest
+from cgg.apps.api_request.buffer import APIRequestBuffer
 
 
 def get_client_ip(request):
@@ -31,29 +28,20 @@ def log_api_request(app_name, label, direction='in'):
         def args_wrapper(class_view_obj, request, *args, **kwargs):
             view_result = view_method(class_view_obj, request, *args, **kwargs)
 
-            api_request_obj = APIRequest()
-
-            api_request_obj.uri = request.get_full_path()
-            api_request_obj.http_method = request.method.lower()
-            api_request_obj.direction = direction
-            api_request_obj.label = label
-            api_request_obj.app_name = app_name
-            api_request_obj.ip = get_client_ip(request)
-
-            try:
-                api_request_obj.request = json.loads(
-                    (request.body or b'{}').decode('utf-8'),
-                )
-            except JSONDecodeError:
-                api_request_obj.request = {}
-
-            api_request_obj.response = \
-                view_result.data if hasattr(view_result, 'data') else str(
-                    type(view_result)
-                )
-            api_request_obj.status_code = view_result.status_code
-
-            api_request_obj.save()
+            APIRequestBuffer.add(
+                uri=request.get_full_path(),
+                http_method=request.method.lower(),
+                direction=direction,
+                label=label,
+                app_name=app_name,
+                ip=get_client_ip(request),
+                request_body=request.body,
+                response=view_result.data if hasattr(
+                    view_result,
+                    'data',
+                ) else str(type(view_result)),
+                status_code=view_result.status_code,
+            )
 
             return view_result
 
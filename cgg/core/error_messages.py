@@ -8,7 +8,13 @@ class ErrorMessages:
     BASE_BALANCE_INVOICE_409_CURRENT = _(
         "Can not be greater than the current balance"
     )
+    VERIFY_AND_REPAIR_408 = _(
+        "Verifying the balance did not finish before the deadline"
+    )
     EXPORT_NO_DATA = _("No data returned to export")
+    EXPORT_JOB_404 = _("Export job does not exists")
+    EXPORT_JOB_409 = _("Export job is not completed yet")
+    EXPORT_OUTPUT_400 = _("Invalid export output")
     PROFIT_409_SAME = _("Current status code is th same with selected one")
     PROFIT_409 = _("Can not update profit from this status code")
     PROFIT_400_STATUS_CDOE = _("Invalid status code for profit")
@@ -66,6 +72,11 @@ class ErrorMessages:
     BRANCH_CODE_400 = _("Invalid branch code")
     BRANCH_NAME_400 = _("Invalid branch name")
     ORDER_BY_400 = _("Invalid choices in order by query")
+    COUNT_MODE_400 = _("Invalid count, choices are exact/approximate/none")
+    CURSOR_400 = _("Invalid cursor")
+    CURSOR_ORDER_400 = _(
+        "Cursor pagination is not supported with this order by query"
+    )
     DESTINATION_404 = _("Destination does not exists")
     DESTINATION_PREFIX_400 = _("Invalid destination prefix")
     DESTINATION_NAME_400 = _("Invalid destination name")
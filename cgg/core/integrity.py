@@ -38,6 +38,14 @@ def _is_fk(model, key):
 
 
 class Integrity:
+    # Attributes of objects that are not part of the checksum
+    EXCLUDED_FIELDS = (
+        '_state',
+        'checksum',
+        'created_at',
+        'updated_at',
+    )
+
     @classmethod
     def check(cls, model_object: models.Model):
         try:
@@ -59,12 +67,7 @@ class Integrity:
         }
 
         for key in object_vars.keys():
-            if key not in (
-                    '_state',
-                    'checksum',
-                    'created_at',
-                    'updated_at',
-            ):
+            if key not in cls.EXCLUDED_FIELDS:
                 if not _is_fk(model_object, key):
                     checksum_dict[key] = _convert_to_string(object_vars[key])
 
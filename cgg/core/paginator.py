@@ -8,24 +8,56 @@
 # Email: m.esmailpour@respina.net
 # --------------------------------------------------------------------------
 
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Q
 from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from cgg.core import api_exceptions
+from cgg.core.error_messages import ErrorMessages
+
+# exact runs COUNT(*), approximate reads the planner estimate and counts
+# exactly below APPROXIMATE_COUNT_THRESHOLD, none skips counting
+COUNT_MODES = ('exact', 'approximate', 'none')
 
 
 class Paginator(LimitOffsetPagination):
+    count_query_param = 'count'
+
     def __init__(self, **kwargs):
         self.count = None
         self.limit = None
         self.offset = None
         self.request = None
+        # Set when the count is not exact, next page is found by fetching
+        # one more row than limit
+        self.has_next = None
 
     def paginate_queryset(self, queryset, request, view=None):
-        self.count = queryset.count()
+        count_mode = self.get_count_mode(request)
+        if count_mode == COUNT_MODES[0]:
+            self.count = queryset.count()
+        else:
+            self.count = self.approximate_count(queryset) if \
+                count_mode == COUNT_MODES[1] else None
         self.limit = self.get_limit(request)
         if self.limit is None:
             return None
 
         self.offset = self.get_offset(request)
         self.request = request
+        if count_mode != COUNT_MODES[0]:
+            rows = list(queryset[self.offset:self.offset + self.limit + 1])
+            self.has_next = len(rows) > self.limit
+            return rows[:self.limit]
+
         if self.count > self.limit and self.template is not None:
             self.display_page_controls = True
 
@@ -33,10 +65,84 @@ class Paginator(LimitOffsetPagination):
             return []
         return list(queryset[self.offset:self.offset + self.limit])
 
+    def get_next_link(self):
+        if self.has_next is None:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+
+        return replace_query_param(
+            url,
+            self.offset_query_param,
+            self.offset + self.limit,
+        )
+
+    def get_count_mode(self, request):
+        count_mode = request.query_params.get(
+            self.count_query_param,
+            COUNT_MODES[0],
+        )
+        if count_mode not in COUNT_MODES:
+            raise api_exceptions.ValidationError400({
+                self.count_query_param: ErrorMessages.COUNT_MODE_400,
+            })
+
+        return count_mode
+
+    @classmethod
+    def approximate_count(cls, queryset):
+        """
+        Row estimate of the planner, pg_class statistics for a whole table
+        (summed over its partitions) and EXPLAIN for a filtered query. Small
+        results are counted exactly
+        :param queryset:
+        :return: int
+        """
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return queryset.count()
+
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                # Partitioned tables have no rows of their own, their rows
+                # are counted in the statistics of partitions
+                cursor.execute(
+                    "WITH RECURSIVE tables AS ("
+                    "SELECT to_regclass(%s) AS oid "
+                    "UNION ALL "
+                    "SELECT pg_inherits.inhrelid FROM pg_inherits "
+                    "JOIN tables ON pg_inherits.inhparent = tables.oid"
+                    ") "
+                    "SELECT COALESCE(SUM(pg_class.reltuples) FILTER "
+                    "(WHERE pg_class.relkind <> 'p'), -1)::bigint "
+                    "FROM tables JOIN pg_class ON pg_class.oid = tables.oid",
+                    [queryset.model._meta.db_table],
+                )
+                estimate = cursor.fetchone()[0]
+            else:
+                sql, params = queryset.query.sql_with_params()
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                estimate = plan[0]['Plan']['Plan Rows']
+        threshold = settings.CGG['PAGINATION']['APPROXIMATE_COUNT_THRESHOLD']
+        # reltuples is -1 for a table that is never analyzed
+        if estimate < threshold:
+            return queryset.count()
+
+        return int(estimate)
+
     def paginate(self, request, queryset):
-        paginator = Paginator()
         if 'bypass_pagination' in request.query_params:
             return queryset, None
+        if CursorPaginator.cursor_query_param in request.query_params:
+            paginator = CursorPaginator()
+        else:
+            paginator = Paginator()
 
         queryset = paginator.paginate_queryset(
             request=request,
@@ -44,3 +150,175 @@ class Paginator(LimitOffsetPagination):
         )
 
         return queryset, paginator
+
+
+class CursorPaginator(Paginator):
+    """
+    Keyset pagination on the ordering of the queryset (created_at of most
+    models) with primary key as the tie breaker. Pages are fetched with a
+    WHERE on the last seen row instead of OFFSET. Use ?cursor= for the first
+    page and follow next and previous links. Count is skipped by default
+    """
+    cursor_query_param = 'cursor'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.ordering = None
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def get_count_mode(self, request):
+        if self.count_query_param not in request.query_params:
+            return COUNT_MODES[2]
+
+        return super().get_count_mode(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        count_mode = self.get_count_mode(request)
+        if count_mode == COUNT_MODES[0]:
+            self.count = queryset.count()
+        elif count_mode == COUNT_MODES[1]:
+            self.count = self.approximate_count(queryset)
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.request = request
+        self.ordering = self.get_ordering(queryset)
+        values, is_previous = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param),
+        )
+        ordering = self.ordering
+        if is_previous:
+            ordering = [(field, not descending) for field, descending in
+                        ordering]
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, values))
+        queryset = queryset.order_by(*[
+            f"-{field}" if descending else field
+            for field, descending in ordering
+        ])
+        rows = list(queryset[:self.limit + 1])
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if is_previous:
+            rows.reverse()
+        if rows:
+            has_next = not is_previous and has_more or \
+                is_previous and values is not None
+            has_previous = is_previous and has_more or \
+                not is_previous and values is not None
+            if has_next:
+                self.next_cursor = self.encode_cursor(rows[-1], False)
+            if has_previous:
+                self.previous_cursor = self.encode_cursor(rows[0], True)
+
+        return rows
+
+    def get_ordering(self, queryset):
+        """
+        Ordering of the queryset as (field name, descending) with the
+        primary key appended. Only not null fields of the model are allowed
+        :param queryset:
+        :return: list of tuples
+        """
+        meta = queryset.model._meta
+        order_by = list(queryset.query.order_by) or list(meta.ordering) or \
+            ['pk']
+        ordering = []
+        for order in order_by:
+            if not isinstance(order, str):
+                raise api_exceptions.ValidationError400({
+                    self.cursor_query_param: ErrorMessages.CURSOR_ORDER_400,
+                })
+            descending = order.startswith('-')
+            name = order.lstrip('-')
+            if name == 'pk':
+                name = meta.pk.name
+            try:
+                field = meta.get_field(name)
+            except FieldDoesNotExist:
+                field = None
+            if field is None or not field.concrete or field.null or \
+                    field.is_relation:
+                raise api_exceptions.ValidationError400({
+                    self.cursor_query_param: ErrorMessages.CURSOR_ORDER_400,
+                })
+            ordering.append((field.attname, descending))
+            if field.primary_key:
+                return ordering
+        ordering.append((meta.pk.attname, ordering[-1][1]))
+
+        return ordering
+
+    @classmethod
+    def keyset_filter(cls, ordering, values):
+        """
+        Rows after values in ordering, (a, b) > (x, y) is written as
+        a > x OR (a = x AND b > y) to support mixed directions
+        :param ordering: list of (field name, descending)
+        :param values: values of the fields in the last seen row
+        :return: Q
+        """
+        condition = Q()
+        for index, (field, descending) in enumerate(ordering):
+            lookup = 'lt' if descending else 'gt'
+            step = Q(**{f"{field}__{lookup}": values[index]})
+            for previous_index in range(index):
+                step &= Q(**{
+                    ordering[previous_index][0]: values[previous_index],
+                })
+            condition |= step
+
+        return condition
+
+    def encode_cursor(self, instance, is_previous):
+        values = []
+        for field, descending in self.ordering:
+            value = getattr(instance, field)
+            if isinstance(value, (datetime, date)):
+                value = value.isoformat()
+            elif not isinstance(value, (int, float, bool, str)):
+                value = str(value)
+            values.append(value)
+        cursor = json.dumps({"v": values, "p": is_previous})
+
+        return base64.urlsafe_b64encode(cursor.encode('utf-8')).decode()
+
+    def decode_cursor(self, cursor):
+        """
+        :param cursor: opaque cursor of a next or previous link
+        :return: (values or None for the first page, is previous)
+        """
+        if not cursor:
+            return None, False
+        try:
+            decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            values = decoded["v"]
+            is_previous = bool(decoded["p"])
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise api_exceptions.ValidationError400({
+                self.cursor_query_param: ErrorMessages.CURSOR_400,
+            })
+        if not isinstance(values, list) or \
+                len(values) != len(self.ordering):
+            raise api_exceptions.ValidationError400({
+                self.cursor_query_param: ErrorMessages.CURSOR_400,
+            })
+
+        return values, is_previous
+
+    def get_next_link(self):
+        return self.cursor_link(self.next_cursor)
+
+    def get_previous_link(self):
+        return self.cursor_link(self.previous_cursor)
+
+    def cursor_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.offset_query_param)
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+
+        return replace_query_param(url, self.cursor_query_param, cursor)
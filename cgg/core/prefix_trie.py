@@ -0,0 +1,67 @@
+# --------------------------------------------------------------------------
+# Prefix trie for phone numbers. Each prefix keeps a set of tags, lookups
+# walk the number once so they cost O(len(number)) regardless of how many
+# prefixes are stored.
+# (C) 2021 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - prefix_trie.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+
+
+class PrefixTrie:
+    __slots__ = ('_root', '_size')
+
+    def __init__(self):
+        self._root = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, prefix, tag):
+        """
+        Add a tag to a prefix, a prefix can have several tags
+        :param prefix: str
+        :param tag: any hashable value
+        :return:
+        """
+        if not prefix:
+            return
+        node = self._root
+        for char in str(prefix):
+            node = node.setdefault(char, {})
+        tags = node.get(None)
+        if tags is None:
+            tags = node[None] = set()
+            self._size += 1
+        tags.add(tag)
+
+    def matches(self, number):
+        """
+        All stored prefixes of a number, shortest first
+        :param number: str
+        :return: list of (prefix, frozenset of tags)
+        """
+        found = []
+        node = self._root
+        number = str(number)
+        for index, char in enumerate(number):
+            node = node.get(char)
+            if node is None:
+                break
+            tags = node.get(None)
+            if tags:
+                found.append((number[:index + 1], frozenset(tags)))
+
+        return found
+
+    def longest_match(self, number):
+        """
+        Longest stored prefix of a number
+        :param number: str
+        :return: (prefix, frozenset of tags) or None
+        """
+        found = self.matches(number)
+
+        return found[-1] if found else None
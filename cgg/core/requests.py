@@ -1,5 +1,7 @@
 # --------------------------------------------------------------------------
-# Override python's requests to handle outgoing request logging
+# Override python's requests to handle outgoing request logging. All
+# outgoing requests share one keep-alive session per process, so repeated
+# calls to CGRateS, MIS and trunk backend reuse pooled TCP connections.
 # (C) 2020 MehrdadEP, Tehran, Iran
 # Respina Networks and beyonds - requests.py
 # Created at 2020-8-29,  16:2:23
@@ -7,61 +9,154 @@
 # Email: m.esmailpour@respina.net
 # --------------------------------------------------------------------------
 
+import os
+import threading
+
 import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from cgg.core.tools import Tools
 
 
 class Requests:
+    _session = None
+    _session_pid = None
+    _lock = threading.Lock()
+    _stats = {
+        "sessions_created": 0,
+        "requests": 0,
+        "errors": 0,
+    }
+
     @classmethod
-    def get(cls, label, app_name, *args, **kwargs):
-        response = requests.get(*args, **kwargs)
-        kwargs['method'] = 'get'
-        kwargs['label'] = label
-        kwargs['app_name'] = app_name
-        Tools.log_outgoing_requests(
-            kwargs=kwargs,
-            response=response,
-            app_name=app_name,
-            label=label,
-        )
+    def session(cls):
+        """
+        Return the shared session of the current process. A new session is
+        created after a fork (uWSGI workers, Celery prefork children) so
+        pooled sockets are never shared between processes
+        :return: requests.Session
+        """
+        pid = os.getpid()
+        if cls._session is None or cls._session_pid != pid:
+            with cls._lock:
+                if cls._session is None or cls._session_pid != pid:
+                    cls._session = cls._create_session()
+                    cls._session_pid = pid
+                    cls._stats = {
+                        "sessions_created":
+                            cls._stats["sessions_created"] + 1,
+                        "requests": 0,
+                        "errors": 0,
+                    }
 
-        return response
+        return cls._session
 
     @classmethod
-    def put(cls, label, app_name, *args, **kwargs):
-        response = requests.put(*args, **kwargs)
-        kwargs['method'] = 'put'
-        kwargs['label'] = label
-        kwargs['app_name'] = app_name
-        Tools.log_outgoing_requests(
-            kwargs=kwargs,
-            response=response,
-            app_name=app_name,
-            label=label,
+    def _create_session(cls):
+        """
+        Create a session with pool size and retry policy from settings.
+        Only connection errors are retried, read errors are not because
+        JSON-RPC set methods are not idempotent
+        :return: requests.Session
+        """
+        pool_config = settings.CGG['HTTP_POOL']
+        retry = Retry(
+            total=pool_config['MAX_RETRIES'],
+            connect=pool_config['MAX_RETRIES'],
+            read=0,
+            status=0,
+            redirect=0,
+            backoff_factor=pool_config['BACKOFF_FACTOR'],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_config['POOL_CONNECTIONS'],
+            pool_maxsize=pool_config['POOL_MAXSIZE'],
+            pool_block=pool_config['POOL_BLOCK'],
+            max_retries=retry,
         )
+        session = requests.Session()
+        session.headers.update({
+            'Connection': 'keep-alive',
+        })
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
 
-        return response
+        return session
 
     @classmethod
-    def patch(cls, label, app_name, *args, **kwargs):
-        response = requests.patch(*args, **kwargs)
-        kwargs['method'] = 'patch'
-        kwargs['label'] = label
-        kwargs['app_name'] = app_name
-        Tools.log_outgoing_requests(
-            kwargs=kwargs,
-            response=response,
-            app_name=app_name,
-            label=label,
-        )
+    def reset(cls):
+        """
+        Close the shared session, the next request creates a new one
+        :return:
+        """
+        with cls._lock:
+            if cls._session is not None and cls._session_pid == os.getpid():
+                cls._session.close()
+            cls._session = None
+            cls._session_pid = None
 
-        return response
+    @classmethod
+    def pool_stats(cls):
+        """
+        Statistics of the shared session in the current process
+        :return: dict
+        """
+        hosts = []
+        if cls._session is not None and cls._session_pid == os.getpid():
+            adapter = cls._session.get_adapter('http://')
+            for pool_key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools.get(pool_key)
+                if pool is None:
+                    continue
+                hosts.append({
+                    "scheme": pool.scheme,
+                    "host": pool.host,
+                    "port": pool.port,
+                    "connections_opened": pool.num_connections,
+                    "requests": pool.num_requests,
+                    "idle_connections": cls._idle_connections(pool),
+                    "available_slots": pool.pool.qsize() if pool.pool else 0,
+                })
+        pool_config = settings.CGG['HTTP_POOL']
+
+        return {
+            "pid": os.getpid(),
+            "pool_connections": pool_config['POOL_CONNECTIONS'],
+            "pool_maxsize": pool_config['POOL_MAXSIZE'],
+            "max_retries": pool_config['MAX_RETRIES'],
+            "sessions_created": cls._stats["sessions_created"],
+            "requests": cls._stats["requests"],
+            "errors": cls._stats["errors"],
+            "hosts": hosts,
+        }
 
     @classmethod
-    def post(cls, label, app_name, *args, **kwargs):
-        response = requests.post(*args, **kwargs)
-        kwargs['method'] = 'post'
+    def _idle_connections(cls, pool):
+        """
+        Open connections waiting in a urllib3 pool, the queue is filled with
+        None for slots that have no connection yet
+        :param pool: HTTPConnectionPool
+        :return: int
+        """
+        if not pool.pool:
+            return 0
+        with pool.pool.mutex:
+            return sum(1 for conn in pool.pool.queue if conn is not None)
+
+    @classmethod
+    def _send(cls, http_method, label, app_name, *args, **kwargs):
+        session = cls.session()
+        try:
+            response = session.request(http_method, *args, **kwargs)
+        except requests.RequestException:
+            cls._stats["errors"] += 1
+            raise
+        finally:
+            cls._stats["requests"] += 1
+        kwargs['method'] = http_method
         kwargs['label'] = label
         kwargs['app_name'] = app_name
         Tools.log_outgoing_requests(
@@ -74,31 +169,25 @@ class Requests:
         return response
 
     @classmethod
-    def options(cls, label, app_name, *args, **kwargs):
-        response = requests.options(*args, **kwargs)
-        kwargs['method'] = 'options'
-        kwargs['label'] = label
-        kwargs['app_name'] = app_name
-        Tools.log_outgoing_requests(
-            kwargs=kwargs,
-            response=response,
-            app_name=app_name,
-            label=label,
-        )
+    def get(cls, label, app_name, *args, **kwargs):
+        return cls._send('get', label, app_name, *args, **kwargs)
 
-        return response
+    @classmethod
+    def put(cls, label, app_name, *args, **kwargs):
+        return cls._send('put', label, app_name, *args, **kwargs)
 
     @classmethod
-    def delete(cls, label, app_name, *args, **kwargs):
-        response = requests.delete(*args, **kwargs)
-        kwargs['method'] = 'delete'
-        kwargs['label'] = label
-        kwargs['app_name'] = app_name
-        Tools.log_outgoing_requests(
-            kwargs=kwargs,
-            response=response,
-            app_name=app_name,
-            label=label,
-        )
+    def patch(cls, label, app_name, *args, **kwargs):
+        return cls._send('patch', label, app_name, *args, **kwargs)
 
-        return response
+    @classmethod
+    def post(cls, label, app_name, *args, **kwargs):
+        return cls._send('post', label, app_name, *args, **kwargs)
+
+    @classmethod
+    def options(cls, label, app_name, *args, **kwargs):
+        return cls._send('options', label, app_name, *args, **kwargs)
+
+    @classmethod
+    def delete(cls, label, app_name, *args, **kwargs):
+        return cls._send('delete', label, app_name, *args, **kwargs)
@@ -9,9 +9,11 @@
 
 import codecs
 import csv
+import zlib
 from collections import OrderedDict
 from datetime import datetime
 
+from django.conf import settings
 from django.http import StreamingHttpResponse
 from rest_framework.response import Response as DRFResponse
 
@@ -97,25 +99,63 @@ class Echo(object):
 def csv_response(
         data,
         name,
+        compress=False,
 ):
     """
+    Stream rows as a csv file. Rows are consumed lazily and written in
+    chunks of about BUFFER_SIZE bytes, so the header goes out before the
+    rest of the rows are fetched
     :param name:
     :type name:
-    :type data: list of serialized dicts
+    :type data: iterable of serialized dicts
+    :param compress: gzip the file
+    :type compress: bool
     :return:
     :rtype:
     """
+    buffer_size = settings.CGG['EXPORT']['BUFFER_SIZE']
 
     def stream(rows):
-        yield Echo().write(codecs.BOM_UTF8)
+        rows = iter(rows)
+        first_row = next(rows, None)
         writer = csv.writer(Echo())
-        yield writer.writerow(rows[0].keys())
+        yield codecs.BOM_UTF8.decode('utf-8') + writer.writerow(
+            first_row.keys() if first_row is not None else [],
+        )
+        if first_row is None:
+            return
+        chunk = [writer.writerow(first_row.values())]
+        chunk_size = len(chunk[0])
         for row in rows:
-            yield writer.writerow(row.values())
-
-    response_csv = StreamingHttpResponse(
-        stream(data), content_type='text/csv',
-    )
-    response_csv['Content-Disposition'] = f"attachment; filename={name}.csv"
+            line = writer.writerow(row.values())
+            chunk.append(line)
+            chunk_size += len(line)
+            if chunk_size >= buffer_size:
+                yield ''.join(chunk)
+                chunk = []
+                chunk_size = 0
+        if chunk:
+            yield ''.join(chunk)
+
+    def gzip_stream(chunks):
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            compressed = compressor.compress(chunk.encode('utf-8'))
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
+    if compress:
+        response_csv = StreamingHttpResponse(
+            gzip_stream(stream(data)), content_type='application/gzip',
+        )
+        response_csv['Content-Disposition'] = \
+            f"attachment; filename={name}.csv.gz"
+    else:
+        response_csv = StreamingHttpResponse(
+            stream(data), content_type='text/csv',
+        )
+        response_csv['Content-Disposition'] = \
+            f"attachment; filename={name}.csv"
 
     return response_csv
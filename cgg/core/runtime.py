@@ -0,0 +1,39 @@
+# --------------------------------------------------------------------------
+# Facts about the server process the app runs in.
+# (C) 2023 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - runtime.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+
+from functools import lru_cache
+
+
+def _option(value):
+    # uWSGI options are bytes, repeated options are lists
+    if isinstance(value, (list, tuple)):
+        value = value[-1] if value else None
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    if value is True:
+        return 'true'
+
+    return str(value or '').strip().lower()
+
+
+@lru_cache(maxsize=None)
+def threads_available():
+    """
+    Threads started by the app do not run under uWSGI unless enable-threads
+    (or threads) is set, other servers and celery workers always run them
+    :return: bool
+    """
+    try:
+        import uwsgi
+    except ImportError:
+        return True
+    enable_threads = _option(uwsgi.opt.get('enable-threads'))
+    threads = _option(uwsgi.opt.get('threads'))
+
+    return enable_threads not in ('', '0', 'false', 'no', 'off') or \
+        (threads.isdigit() and int(threads) > 1)
@@ -0,0 +1,25 @@
+# --------------------------------------------------------------------------
+# Helpers shared by tests.
+# (C) 2023 MehrdadEP, Tehran, Iran
+# Respina Networks and beyonds - testing.py
+# Author: Mehrdad Esmaeilpour
+# Email: m.esmailpour@respina.net
+# --------------------------------------------------------------------------
+
+from django.conf import settings
+from django.test import override_settings
+
+
+def cgg_settings(section, **values):
+    """
+    Override some values of a section of CGG settings, the other values of
+    the section are kept
+    :param section: key of CGG settings, e.g. TRUNK_NOTIFY
+    :param values: key -> value in the section
+    :return: override_settings, usable as a decorator or context manager
+    """
+    return override_settings(
+        CGG=dict(settings.CGG, **{
+            section: dict(settings.CGG[section], **values),
+        }),
+    )
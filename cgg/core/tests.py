@@ -68,3 +68,203 @@ class CoreMethodsTestCase(TestCase):
     def test_check_uuid_validation_from_object_invalid(self):
         with self.assertRaises(api_exceptions.ValidationError400):
             Tools.uuid_validation(self.invalid_uuid_object)
+
+
+class RequestsSessionTestCase(TestCase):
+    def setUp(self):
+        from cgg.core.requests import Requests
+        self.requests_class = Requests
+        Requests.reset()
+
+    def test_session_is_shared_in_process(self):
+        self.assertIs(
+            self.requests_class.session(),
+            self.requests_class.session(),
+        )
+
+    def test_session_is_recreated_after_fork(self):
+        session = self.requests_class.session()
+        self.requests_class._session_pid = -1
+        self.assertIsNot(self.requests_class.session(), session)
+
+    def test_idle_connections_skip_empty_slots(self):
+        from urllib3 import HTTPConnectionPool
+
+        pool = HTTPConnectionPool('localhost', maxsize=4)
+        self.assertEqual(self.requests_class._idle_connections(pool), 0)
+        pool._put_conn(pool._get_conn())
+        self.assertEqual(self.requests_class._idle_connections(pool), 1)
+        self.assertEqual(pool.pool.qsize(), 4)
+
+
+class PrefixTrieTestCase(TestCase):
+    def setUp(self):
+        from cgg.core.prefix_trie import PrefixTrie
+        self.prefixes_trie = PrefixTrie()
+        self.prefixes_trie.insert('98', 'national')
+        self.prefixes_trie.insert('9821', 'local')
+        self.prefixes_trie.insert('9821', 'branch')
+        self.prefixes_trie.insert('98912', 'mobile')
+
+    def test_matches_all_prefixes(self):
+        self.assertEqual(
+            self.prefixes_trie.matches('982188776655'),
+            [
+                ('98', frozenset({'national'})),
+                ('9821', frozenset({'local', 'branch'})),
+            ],
+        )
+        self.assertEqual(self.prefixes_trie.matches('1234'), [])
+
+    def test_longest_match(self):
+        self.assertEqual(
+            self.prefixes_trie.longest_match('989121234567'),
+            ('98912', frozenset({'mobile'})),
+        )
+        self.assertIsNone(self.prefixes_trie.longest_match('44'))
+        self.assertEqual(len(self.prefixes_trie), 3)
+
+
+class LocalCacheTestCase(TestCase):
+    def setUp(self):
+        from cgg.core.cache import LocalCache
+        self.local_cache = LocalCache(max_entries=2, ttl=60)
+
+    def test_values_are_copied(self):
+        value = {'balances': [1, 2]}
+        self.local_cache.set('key', value)
+        value['balances'].append(3)
+        found, cached_value = self.local_cache.get('key')
+        self.assertTrue(found)
+        self.assertEqual(cached_value, {'balances': [1, 2]})
+
+    def test_least_recently_used_is_evicted(self):
+        self.local_cache.set('key1', 1)
+        self.local_cache.set('key2', 2)
+        self.local_cache.get('key1')
+        self.local_cache.set('key3', 3)
+        self.assertEqual(self.local_cache.get('key2'), (False, None))
+        self.assertEqual(self.local_cache.get('key1'), (True, 1))
+        self.assertEqual(len(self.local_cache), 2)
+
+    def test_expired_entry_is_not_returned(self):
+        self.local_cache.set('key', 1, ttl=-1)
+        self.assertEqual(self.local_cache.get('key'), (False, None))
+
+
+class CacheComputeTestCase(TestCase):
+    def setUp(self):
+        from cgg.core.cache import Cache, CachedValue
+        self.cache_class = Cache
+        self.cached_value_class = CachedValue
+        self.values = {'key': str(uuid.uuid4())}
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return 'value'
+
+    def test_value_is_computed_once(self):
+        for _ in range(3):
+            self.assertEqual(
+                self.cache_class.get_or_compute(
+                    key=self.cache_class.KEY_CONVENTIONS['runtime_config'],
+                    values=self.values,
+                    compute=self.compute,
+                    expiry_time=60,
+                ),
+                'value',
+            )
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(
+            self.cache_class.get(
+                key=self.cache_class.KEY_CONVENTIONS['runtime_config'],
+                values=self.values,
+            ),
+            'value',
+        )
+
+    def test_not_found_is_cached(self):
+        def compute():
+            self.calls += 1
+            raise api_exceptions.NotFound404('not found')
+
+        for _ in range(2):
+            with self.assertRaises(api_exceptions.NotFound404):
+                self.cache_class.get_or_compute(
+                    key=self.cache_class.KEY_CONVENTIONS['runtime_config'],
+                    values=self.values,
+                    compute=compute,
+                    not_found=(api_exceptions.NotFound404,),
+                )
+        self.assertEqual(self.calls, 1)
+
+    def test_early_refresh(self):
+        cached_value = self.cached_value_class('value', 100, 0)
+        self.assertTrue(cached_value.is_fresh(99))
+        self.assertFalse(cached_value.is_fresh(100))
+        self.assertFalse(cached_value.should_refresh_early(99, 1))
+        cached_value.delta = 1000
+        self.assertTrue(cached_value.should_refresh_early(99, 1000))
+
+
+class CsvResponseTestCase(TestCase):
+    def setUp(self):
+        from cgg.core.response import csv_response
+
+        self.csv_response = csv_response
+        self.rows = [{'id': index, 'name': f'row {index}'} for index in
+                     range(100)]
+
+    def test_rows_are_streamed_lazily(self):
+        response = self.csv_response(iter(self.rows), 'rows')
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'id,name')
+        self.assertEqual(len(lines), 101)
+        self.assertEqual(lines[-1], '99,row 99')
+
+    def test_gzip(self):
+        import gzip
+
+        response = self.csv_response(iter(self.rows), 'rows', compress=True)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        content = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(len(content.decode('utf-8-sig').splitlines()), 101)
+
+
+class CursorPaginatorTestCase(TestCase):
+    def setUp(self):
+        from datetime import datetime
+        from types import SimpleNamespace
+
+        from cgg.core.paginator import CursorPaginator
+
+        self.paginator = CursorPaginator()
+        self.paginator.ordering = [('created_at', True), ('id', True)]
+        self.row = SimpleNamespace(
+            created_at=datetime(2022, 12, 1, 10, 20, 30, 123456),
+            id=uuid.uuid4(),
+        )
+
+    def test_cursor_round_trip(self):
+        cursor = self.paginator.encode_cursor(self.row, True)
+        values, is_previous = self.paginator.decode_cursor(cursor)
+        self.assertTrue(is_previous)
+        self.assertEqual(values, [
+            '2022-12-01T10:20:30.123456',
+            str(self.row.id),
+        ])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(api_exceptions.ValidationError400):
+            self.paginator.decode_cursor('not-a-cursor')
+
+    def test_keyset_filter(self):
+        condition = self.paginator.keyset_filter(
+            self.paginator.ordering,
+            ['2022-12-01T10:20:30', 'id'],
+        )
+        self.assertEqual(condition.connector, 'OR')
+        self.assertIn(('created_at__lt', '2022-12-01T10:20:30'),
+                      condition.children)
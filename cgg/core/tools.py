@@ -18,7 +18,7 @@ import pytz
 from django.utils.translation import gettext as _
 from jdatetime import datetime as jdatetime
 
-from cgg.apps.api_request.models import APIRequest
+from cgg.apps.api_request.buffer import APIRequestBuffer
 from cgg.core import api_exceptions
 
 
@@ -127,32 +127,20 @@ class Tools:
             app_name,
             label,
     ):
-        api_request_obj = APIRequest()
-        api_request_obj.uri = kwargs['url']
-        api_request_obj.http_method = kwargs['method']
-        api_request_obj.direction = 'out'
-        api_request_obj.label = label
-        api_request_obj.app_name = app_name
-
-        try:
-            if 'body' in kwargs:
-                api_request_obj.request = json.loads(
-                    (kwargs['body'] or b'{}').decode('utf-8'),
-                )
-            elif 'json' in kwargs:
-                api_request_obj.request = kwargs['json']
-        except JSONDecodeError:
-            api_request_obj.request = {}
-
-        try:
-            api_request_obj.response = json.loads(
-                response.content.decode('utf-8'),
-            )
-        except JSONDecodeError:
-            api_request_obj.response = {}
-
-        api_request_obj.status_code = response.status_code
-        api_request_obj.save()
+        record = {
+            "uri": kwargs['url'],
+            "http_method": kwargs['method'],
+            "direction": 'out',
+            "label": label,
+            "app_name": app_name,
+            "response_body": response.content,
+            "status_code": response.status_code,
+        }
+        if 'body' in kwargs:
+            record['request_body'] = kwargs['body']
+        elif 'json' in kwargs:
+            record['request'] = kwargs['json']
+        APIRequestBuffer.add(**record)
 
     @classmethod
     def to_snake_case(cls, word):
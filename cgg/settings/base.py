@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 import os
 
+from celery.schedules import crontab
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -49,6 +51,7 @@ INSTALLED_APPS = [
     'cgg.apps.api_request.apps.APIRequestConfig',
     'cgg.apps.finance.apps.FinanceConfig',
     'cgg.apps.basic.apps.BasicConfig',
+    'cgg.apps.cdr.apps.CDRConfig',
 
     # Health check apps
     'health_check',
@@ -114,6 +117,18 @@ DATABASES = {
             'NAME': os.getenv('CGRATES_GATEWAY_DATABASES_TEST_LOG_NAME'),
         },
     },
+    # Replica of rated CDRs of CGRateS
+    'cdr': {
+        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'NAME': os.getenv('CGRATES_GATEWAY_DATABASES_CDR_NAME'),
+        'USER': os.getenv('CGRATES_GATEWAY_DATABASES_CDR_USER'),
+        'PASSWORD': os.getenv('CGRATES_GATEWAY_DATABASES_CDR_PASSWORD'),
+        'HOST': os.getenv('CGRATES_GATEWAY_DATABASES_CDR_HOST'),
+        'PORT': os.getenv('CGRATES_GATEWAY_DATABASES_CDR_PORT', 5432),
+        'TEST': {
+            'NAME': os.getenv('CGRATES_GATEWAY_DATABASES_TEST_CDR_NAME'),
+        },
+    },
 }
 DATABASE_ROUTERS = ['cgg.settings.database_router.DatabaseRouter']
 
@@ -341,6 +356,354 @@ CGG = {
         'CGRATES_GATEWAY_API_REQUESTS_KEEP_DAYS')) < 1 else int(
         os.getenv('CGRATES_GATEWAY_API_REQUESTS_KEEP_DAYS')
     ),
+    # Maximum number of calls in one JSON-RPC batch request to CGRateS
+    'CGRATES_BATCH_SIZE': int(1) if int(os.getenv(
+        'CGRATES_GATEWAY_CGRATES_BATCH_SIZE', 50)) < 1 else int(
+        os.getenv('CGRATES_GATEWAY_CGRATES_BATCH_SIZE', 50)
+    ),
+    # Number of CDRs fetched per request when streaming CDRs from CGRateS
+    'CDRS_PAGE_SIZE': int(1) if int(os.getenv(
+        'CGRATES_GATEWAY_CDRS_PAGE_SIZE', 1000)) < 1 else int(
+        os.getenv('CGRATES_GATEWAY_CDRS_PAGE_SIZE', 1000)
+    ),
+    # Rated CDRs are replicated to the cdr database by cdr_sync command.
+    # The first sync starts INITIAL_DAYS ago, each sync reads at most
+    # MAX_WINDOW seconds and reads LOOKBACK seconds before the high water
+    # mark again for late and re-rated CDRs. When ENABLED, invoices, profits
+    # and CDR lists read replicated periods locally
+    'CDR_REPLICA': {
+        'ENABLED': os.getenv(
+            'CGRATES_GATEWAY_CDR_REPLICA_ENABLED',
+            'False',
+        ) == 'True',
+        'INITIAL_DAYS': int(
+            os.getenv('CGRATES_GATEWAY_CDR_REPLICA_INITIAL_DAYS', 90),
+        ),
+        'MAX_WINDOW': int(
+            os.getenv('CGRATES_GATEWAY_CDR_REPLICA_MAX_WINDOW', 86400),
+        ),
+        'LOOKBACK': int(
+            os.getenv('CGRATES_GATEWAY_CDR_REPLICA_LOOKBACK', 3600),
+        ),
+    },
+    # Periodic invoices are issued in chunks of subscriptions, CONCURRENCY
+    # is the maximum number of chunks processed at the same time
+    'INVOICE_RUN': {
+        'CHUNK_SIZE': int(
+            os.getenv('CGRATES_GATEWAY_INVOICE_RUN_CHUNK_SIZE', 100),
+        ),
+        'CONCURRENCY': int(
+            os.getenv('CGRATES_GATEWAY_INVOICE_RUN_CONCURRENCY', 4),
+        ),
+        # Seconds to wait for a chunk before leaving it for the next run, a
+        # chunk whose worker has not renewed its lease for this long is
+        # taken over by the next run
+        'CHUNK_TIMEOUT': int(
+            os.getenv('CGRATES_GATEWAY_INVOICE_RUN_CHUNK_TIMEOUT', 3600),
+        ),
+    },
+    # finance_integrity_check splits primary keys of each model into
+    # PARTITIONS ranges checked by CONCURRENCY processes, CHUNK_SIZE rows
+    # are checked between checkpoints and a run stops after MAX_SECONDS
+    # (0 is no limit), the next run continues
+    'INTEGRITY_SCAN': {
+        'PARTITIONS': int(
+            os.getenv('CGRATES_GATEWAY_INTEGRITY_SCAN_PARTITIONS', 8),
+        ),
+        'CONCURRENCY': int(
+            os.getenv('CGRATES_GATEWAY_INTEGRITY_SCAN_CONCURRENCY', 4),
+        ),
+        'CHUNK_SIZE': int(
+            os.getenv('CGRATES_GATEWAY_INTEGRITY_SCAN_CHUNK_SIZE', 2000),
+        ),
+        'MAX_SECONDS': int(
+            os.getenv('CGRATES_GATEWAY_INTEGRITY_SCAN_MAX_SECONDS', 3600),
+        ),
+    },
+    # Reads of verify_and_repair (on 80 and 100 percent notifications of
+    # CGRateS) run concurrently and must all finish in DEADLINE seconds
+    'VERIFY_AND_REPAIR': {
+        'DEADLINE': float(
+            os.getenv('CGRATES_GATEWAY_VERIFY_AND_REPAIR_DEADLINE', 30),
+        ),
+    },
+    # Notifications of CGRateS are coalesced per notify type and
+    # subscription: while a task of a key is queued or running (at most
+    # LOCK_TIMEOUT seconds), later notifications fold into one follow-up
+    # task that runs WINDOW seconds after it
+    'NOTIFY_INTAKE': {
+        'ENABLED': os.getenv(
+            'CGRATES_GATEWAY_NOTIFY_INTAKE_ENABLED',
+            'True',
+        ) == 'True',
+        'WINDOW': int(
+            os.getenv('CGRATES_GATEWAY_NOTIFY_INTAKE_WINDOW', 10),
+        ),
+        'LOCK_TIMEOUT': int(
+            os.getenv('CGRATES_GATEWAY_NOTIFY_INTAKE_LOCK_TIMEOUT', 600),
+        ),
+    },
+    # Notifications to trunk backend are added to an outbox and sent by a
+    # dispatcher
+    'TRUNK_NOTIFY': {
+        # Number of items in each request of batched notify types
+        'BATCH_SIZE': int(
+            os.getenv('CGRATES_GATEWAY_TRUNK_NOTIFY_BATCH_SIZE', 25),
+        ),
+        # Maximum number of requests at the same time
+        'CONCURRENCY': int(
+            os.getenv('CGRATES_GATEWAY_TRUNK_NOTIFY_CONCURRENCY', 4),
+        ),
+        # Number of rows fetched from database at a time
+        'CHUNK_SIZE': int(
+            os.getenv('CGRATES_GATEWAY_TRUNK_NOTIFY_CHUNK_SIZE', 2000),
+        ),
+        # Seconds of each request
+        'TIMEOUT': float(
+            os.getenv('CGRATES_GATEWAY_TRUNK_NOTIFY_TIMEOUT', 5),
+        ),
+        # Number of outbox rows the dispatcher sends at a time, they are
+        # leased for LEASE seconds
+        'FETCH_SIZE': int(
+            os.getenv('CGRATES_GATEWAY_TRUNK_NOTIFY_FETCH_SIZE', 500),
+        ),
+        'LEASE': int(
+            os.getenv('CGRATES_GATEWAY_TRUNK_NOTIFY_LEASE', 300),
+        ),
+        # Failed rows are retried after BACKOFF * 2 ^ (attempts - 1) seconds
+        # (at most BACKOFF_MAX) and given up after MAX_ATTEMPTS
+        'MAX_ATTEMPTS': int(
+            os.getenv('CGRATES_GATEWAY_TRUNK_NOTIFY_MAX_ATTEMPTS', 10),
+        ),
+        'BACKOFF': int(
+            os.getenv('CGRATES_GATEWAY_TRUNK_NOTIFY_BACKOFF', 30),
+        ),
+        'BACKOFF_MAX': int(
+            os.getenv('CGRATES_GATEWAY_TRUNK_NOTIFY_BACKOFF_MAX', 3600),
+        ),
+    },
+    # Delayed tasks are kept in a sorted set of Redis instead of Celery ETA
+    # messages. finance_delayed_tasks polls it every POLL_INTERVAL seconds
+    # and queues BATCH_SIZE due tasks at a time, tasks that can not be
+    # queued are tried again after RETRY seconds. When disabled, delayed
+    # tasks are sent with ETA
+    'DELAYED_TASKS': {
+        'ENABLED': os.getenv(
+            'CGRATES_GATEWAY_DELAYED_TASKS_ENABLED',
+            'True',
+        ) == 'True',
+        'POLL_INTERVAL': float(
+            os.getenv('CGRATES_GATEWAY_DELAYED_TASKS_POLL_INTERVAL', 1),
+        ),
+        'BATCH_SIZE': int(
+            os.getenv('CGRATES_GATEWAY_DELAYED_TASKS_BATCH_SIZE', 100),
+        ),
+        'RETRY': int(
+            os.getenv('CGRATES_GATEWAY_DELAYED_TASKS_RETRY', 5),
+        ),
+    },
+    # Runs of a command hold a lock for at most LOCK_TIMEOUT seconds (or the
+    # timeout of the command in LOCK_TIMEOUTS), so a crashed run does not
+    # block the command for longer. Daily commands of CELERY_BEAT_SCHEDULE
+    # run at DAILY_HOUR:DAILY_MINUTE of CELERY_TIMEZONE
+    'SCHEDULER': {
+        'LOCK_TIMEOUT': int(
+            os.getenv('CGRATES_GATEWAY_SCHEDULER_LOCK_TIMEOUT', 21600),
+        ),
+        'LOCK_TIMEOUTS': {
+            'check_sessions': 900,
+            'sync_cdrs': 900,
+            'dispatch_trunk_notifications': 900,
+            'due_date': 3600,
+            'check_deallocation': 3600,
+            'failed_jobs': 3600,
+        },
+        'DAILY_HOUR': int(
+            os.getenv('CGRATES_GATEWAY_SCHEDULER_DAILY_HOUR', 0),
+        ),
+        'DAILY_MINUTE': int(
+            os.getenv('CGRATES_GATEWAY_SCHEDULER_DAILY_MINUTE', 30),
+        ),
+    },
+    # finance_failed_jobs leases FETCH_SIZE due jobs at a time for LEASE
+    # seconds and runs them with at most CONCURRENCY jobs of each service at
+    # the same time. Failed jobs are retried after BACKOFF * 2 ^ (attempts
+    # - 1) seconds (at most BACKOFF_MAX) until MAX_ATTEMPTS
+    'FAILED_JOBS': {
+        'FETCH_SIZE': int(
+            os.getenv('CGRATES_GATEWAY_FAILED_JOBS_FETCH_SIZE', 200),
+        ),
+        'LEASE': int(
+            os.getenv('CGRATES_GATEWAY_FAILED_JOBS_LEASE', 900),
+        ),
+        'CONCURRENCY': int(
+            os.getenv('CGRATES_GATEWAY_FAILED_JOBS_CONCURRENCY', 4),
+        ),
+        'MAX_ATTEMPTS': int(
+            os.getenv('CGRATES_GATEWAY_FAILED_JOBS_MAX_ATTEMPTS', 12),
+        ),
+        'BACKOFF': int(
+            os.getenv('CGRATES_GATEWAY_FAILED_JOBS_BACKOFF', 300),
+        ),
+        'BACKOFF_MAX': int(
+            os.getenv('CGRATES_GATEWAY_FAILED_JOBS_BACKOFF_MAX', 86400),
+        ),
+    },
+    # CSV exports fetch CHUNK_SIZE rows from database at a time and send
+    # about BUFFER_SIZE bytes to the client at a time
+    'EXPORT': {
+        'CHUNK_SIZE': int(
+            os.getenv('CGRATES_GATEWAY_EXPORT_CHUNK_SIZE', 2000),
+        ),
+        'BUFFER_SIZE': int(
+            os.getenv('CGRATES_GATEWAY_EXPORT_BUFFER_SIZE', 65536),
+        ),
+    },
+    # ?count=approximate uses the row estimate of PostgreSQL for lists
+    # larger than this and counts smaller ones exactly
+    'PAGINATION': {
+        'APPROXIMATE_COUNT_THRESHOLD': int(os.getenv(
+            'CGRATES_GATEWAY_PAGINATION_APPROXIMATE_COUNT_THRESHOLD',
+            100000,
+        )),
+    },
+    # Asynchronous exports are written by Celery workers to STORAGE under
+    # LOCATION, which must be shared with the app servers. A completed job
+    # is reused for REUSE_TTL seconds by requests with the same filters and
+    # deleted with its file after KEEP_HOURS
+    'EXPORT_JOB': {
+        'STORAGE': os.getenv(
+            'CGRATES_GATEWAY_EXPORT_JOB_STORAGE',
+            'django.core.files.storage.FileSystemStorage',
+        ),
+        'LOCATION': os.path.join(
+            BASE_DIR, os.getenv(
+                'CGRATES_GATEWAY_EXPORT_JOB_LOCATION',
+                'exports',
+            ),
+        ),
+        'REUSE_TTL': int(
+            os.getenv('CGRATES_GATEWAY_EXPORT_JOB_REUSE_TTL', 600),
+        ),
+        'KEEP_HOURS': int(
+            os.getenv('CGRATES_GATEWAY_EXPORT_JOB_KEEP_HOURS', 24),
+        ),
+    },
+    # In-process cache (L1) in front of Redis for KEYS of Cache
+    # KEY_CONVENTIONS, entries live at most TTL seconds
+    'CACHE_L1': {
+        'ENABLED': os.getenv(
+            'CGRATES_GATEWAY_CACHE_L1_ENABLED',
+            'True',
+        ) == 'True',
+        'MAX_ENTRIES': int(
+            os.getenv('CGRATES_GATEWAY_CACHE_L1_MAX_ENTRIES', 1000),
+        ),
+        'TTL': int(
+            os.getenv('CGRATES_GATEWAY_CACHE_L1_TTL', 5),
+        ),
+        'KEYS': tuple(
+            key.strip() for key in os.getenv(
+                'CGRATES_GATEWAY_CACHE_L1_KEYS',
+                'account_details,base_balance_postpaid,base_balance_prepaid',
+            ).split(',') if key.strip()
+        ),
+    },
+    # Cache.get_or_compute: a lock lets one worker compute a missing value,
+    # others wait up to LOCK_WAIT seconds. Expired values are served for
+    # STALE_TTL more seconds while being refreshed, not found results are
+    # cached for NEGATIVE_TTL seconds. Higher BETA refreshes values earlier
+    'CACHE_COMPUTE': {
+        'LOCK_TIMEOUT': int(
+            os.getenv('CGRATES_GATEWAY_CACHE_COMPUTE_LOCK_TIMEOUT', 30),
+        ),
+        'LOCK_WAIT': float(
+            os.getenv('CGRATES_GATEWAY_CACHE_COMPUTE_LOCK_WAIT', 10),
+        ),
+        'STALE_TTL': int(
+            os.getenv('CGRATES_GATEWAY_CACHE_COMPUTE_STALE_TTL', 300),
+        ),
+        'NEGATIVE_TTL': int(
+            os.getenv('CGRATES_GATEWAY_CACHE_COMPUTE_NEGATIVE_TTL', 30),
+        ),
+        'BETA': float(
+            os.getenv('CGRATES_GATEWAY_CACHE_COMPUTE_BETA', 1),
+        ),
+    },
+    # api_request table is range partitioned on created_at by day or week,
+    # PREMAKE partitions are created ahead by api_request_clean command
+    'API_REQUEST_PARTITION': {
+        'INTERVAL': os.getenv(
+            'CGRATES_GATEWAY_API_REQUEST_PARTITION_INTERVAL',
+            'day',
+        ),
+        'PREMAKE': int(
+            os.getenv('CGRATES_GATEWAY_API_REQUEST_PARTITION_PREMAKE', 7),
+        ),
+    },
+    # API request logs are buffered in memory and written in batches by a
+    # background thread of each process
+    'API_REQUEST_LOG': {
+        # Write logs in a background thread instead of the request thread
+        'ASYNC': os.getenv(
+            'CGRATES_GATEWAY_API_REQUEST_LOG_ASYNC',
+            'True',
+        ) == 'True',
+        # Maximum number of queued logs, new logs are dropped above this
+        'MAX_BUFFER': int(
+            os.getenv('CGRATES_GATEWAY_API_REQUEST_LOG_MAX_BUFFER', 10000),
+        ),
+        # Number of logs in each insert
+        'BATCH_SIZE': int(
+            os.getenv('CGRATES_GATEWAY_API_REQUEST_LOG_BATCH_SIZE', 500),
+        ),
+        # Seconds between flushes
+        'FLUSH_INTERVAL': float(
+            os.getenv('CGRATES_GATEWAY_API_REQUEST_LOG_FLUSH_INTERVAL', 2),
+        ),
+        # drop: drop logs only when the buffer is full, sample: keep one
+        # log out of SAMPLE_RATE when the buffer is filled more than
+        # SAMPLE_WATERMARK (a ratio of MAX_BUFFER)
+        'OVERLOAD_POLICY': os.getenv(
+            'CGRATES_GATEWAY_API_REQUEST_LOG_OVERLOAD_POLICY',
+            'drop',
+        ),
+        'SAMPLE_RATE': max(int(
+            os.getenv('CGRATES_GATEWAY_API_REQUEST_LOG_SAMPLE_RATE', 10),
+        ), 1),
+        'SAMPLE_WATERMARK': float(
+            os.getenv('CGRATES_GATEWAY_API_REQUEST_LOG_SAMPLE_WATERMARK', 0.5),
+        ),
+        # Bodies larger than this (in bytes) are not logged, 0 is no limit.
+        # Queued logs hold their bodies, so the buffer of a process holds
+        # up to MAX_BUFFER times this
+        'MAX_BODY_SIZE': int(
+            os.getenv('CGRATES_GATEWAY_API_REQUEST_LOG_MAX_BODY_SIZE', 65536),
+        ),
+    },
+    # Shared keep-alive HTTP session for CGRateS, MIS and trunk backend
+    'HTTP_POOL': {
+        # Number of hosts to keep a connection pool for
+        'POOL_CONNECTIONS': int(
+            os.getenv('CGRATES_GATEWAY_HTTP_POOL_CONNECTIONS', 10),
+        ),
+        # Maximum number of kept-alive connections per host
+        'POOL_MAXSIZE': int(
+            os.getenv('CGRATES_GATEWAY_HTTP_POOL_MAXSIZE', 20),
+        ),
+        # Wait for a free connection instead of opening a throwaway one
+        'POOL_BLOCK': os.getenv(
+            'CGRATES_GATEWAY_HTTP_POOL_BLOCK',
+            'False',
+        ) == 'True',
+        # Retries on connection errors only (never on read errors)
+        'MAX_RETRIES': int(
+            os.getenv('CGRATES_GATEWAY_HTTP_POOL_MAX_RETRIES', 2),
+        ),
+        'BACKOFF_FACTOR': float(
+            os.getenv('CGRATES_GATEWAY_HTTP_POOL_BACKOFF_FACTOR', 0.2),
+        ),
+    },
 }
 
 # Celery configs
@@ -350,9 +713,98 @@ CELERY_BROKER_URL = f"{os.getenv('CGRATES_GATEWAY_REDIS_HOST')}:" \
 CELERY_RESULT_BACKEND = f"{os.getenv('CGRATES_GATEWAY_REDIS_HOST')}:" \
                         f"{os.getenv('CGRATES_GATEWAY_REDIS_PORT')}/" \
                         f"{os.getenv('CGRATES_GATEWAY_CELERY_DATABASE')}"
-CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 18000}
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'visibility_timeout': 18000,
+    # Task priorities of cgg.celery_app: each queue is split into lists of
+    # these steps and higher priority lists are consumed first
+    'priority_steps': [0, 3, 6, 9],
+    'queue_order_strategy': 'priority',
+}
 CELERY_RESULT_BACKEND_TRANSPORT_OPTIONS = {'visibility_timeout': 3600}
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+# Workers reserve one task per process at a time, so a long task does not
+# hold other tasks of its queue (concurrency of each queue is set on its
+# workers in docker-compose.yml)
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(
+    os.getenv('CGRATES_GATEWAY_CELERY_PREFETCH_MULTIPLIER', 1),
+)
+# Tasks per second (or minute with /m) of a worker to protect CGRateS, an
+# empty value is no limit
+_celery_rate_limits = {
+    'cgg.apps.finance.versions.v1.services.cgrates_notify.'
+    'handle_cgrates_notification': os.getenv(
+        'CGRATES_GATEWAY_CELERY_RATE_LIMIT_NOTIFICATION',
+        '20/s',
+    ),
+    'cgg.apps.finance.versions.v1.services.cgrates_notify.'
+    'handle_cgrates_expired_notification': os.getenv(
+        'CGRATES_GATEWAY_CELERY_RATE_LIMIT_NOTIFICATION',
+        '20/s',
+    ),
+    'cgg.apps.finance.versions.v1.services.invoice.'
+    'continue_issuing_interim_invoice': os.getenv(
+        'CGRATES_GATEWAY_CELERY_RATE_LIMIT_INTERIM_INVOICE',
+        '10/s',
+    ),
+    'cgg.apps.finance.versions.v1.services.invoice_run.'
+    'issue_periodic_invoice_chunk': os.getenv(
+        'CGRATES_GATEWAY_CELERY_RATE_LIMIT_PERIODIC_INVOICE_CHUNK',
+        '30/m',
+    ),
+}
+CELERY_TASK_ANNOTATIONS = {
+    task_name: {'rate_limit': rate_limit}
+    for task_name, rate_limit in _celery_rate_limits.items() if rate_limit
+}
+# Modules with tasks that are not imported by Django on startup
+CELERY_IMPORTS = (
+    'cgg.apps.finance.versions.v1.services.invoice_run',
+    'cgg.apps.finance.versions.v1.services.export_job',
+    'cgg.apps.finance.versions.v1.services.trunk_outbox',
+    'cgg.apps.finance.versions.v1.services.scheduler',
+)
+
+
+def _scheduled_commands(schedule, expires, *command_names):
+    return {
+        command_name: {
+            'task': 'cgg.apps.finance.versions.v1.services.scheduler.'
+                    'run_scheduled_command',
+            'schedule': schedule,
+            'args': (command_name,),
+            # A run that is not started before the next one is dropped
+            'options': {'expires': expires},
+        } for command_name in command_names
+    }
+
+
+# Periodic commands run as tasks of celery beat (celery -A cgg beat)
+CELERY_BEAT_SCHEDULE = {
+    **_scheduled_commands(
+        crontab(minute='*/5'),
+        240,
+        'finance_check_loose_sessions',
+        'cdr_sync',
+        'finance_trunk_dispatch',
+    ),
+    **_scheduled_commands(
+        crontab(minute=0),
+        3000,
+        'finance_due_date',
+        'finance_deallocation',
+        'finance_failed_jobs',
+    ),
+    **_scheduled_commands(
+        crontab(
+            hour=CGG['SCHEDULER']['DAILY_HOUR'],
+            minute=CGG['SCHEDULER']['DAILY_MINUTE'],
+        ),
+        72000,
+        'finance_periodic_invoice',
+        'finance_integrity_check',
+        'api_request_clean',
+    ),
+}
@@ -1,4 +1,5 @@
 #!/bin/bash
+# Not needed when celery beat runs, see CELERY_BEAT_SCHEDULE
 pipenv run python manage.py finance_periodic_invoice
 pipenv run python manage.py finance_integrity_check
 pipenv run python manage.py api_request_clean
@@ -1,2 +1,5 @@
 #!/bin/bash
+# Not needed when celery beat runs, see CELERY_BEAT_SCHEDULE
 pipenv run python manage.py finance_check_loose_sessions
+pipenv run python manage.py cdr_sync
+pipenv run python manage.py finance_trunk_dispatch
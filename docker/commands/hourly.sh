@@ -1,4 +1,5 @@
 #!/bin/bash
+# Not needed when celery beat runs, see CELERY_BEAT_SCHEDULE
 pipenv run python manage.py finance_due_date
 pipenv run python manage.py finance_deallocation
 pipenv run python manage.py finance_failed_jobs
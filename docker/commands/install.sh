@@ -3,6 +3,7 @@ pipenv run python manage.py compilemessages  && \
 pipenv run python manage.py makemigrations && \
 pipenv run python manage.py migrate --database=default && \
 pipenv run python manage.py migrate --database=log && \
+pipenv run python manage.py migrate --database=cdr && \
 pipenv run python manage.py loaddata tax && \
 pipenv run python manage.py loaddata packages  && \
 pipenv run python manage.py collectstatic --noinput  && \
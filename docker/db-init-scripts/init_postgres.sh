@@ -4,4 +4,7 @@ psql -a -e --username root -c "CREATE DATABASE $CGRATES_GATEWAY_DATABASES_DEFAUL
 psql -a -e --username root -c "ALTER USER $CGRATES_GATEWAY_DATABASES_DEFAULT_USER CREATEDB;"
 psql -a -e --username root -c "CREATE ROLE $CGRATES_GATEWAY_DATABASES_LOG_USER WITH LOGIN ENCRYPTED PASSWORD '$CGRATES_GATEWAY_DATABASES_LOG_PASSWORD';"
 psql -a -e --username root -c "CREATE DATABASE $CGRATES_GATEWAY_DATABASES_LOG_NAME OWNER =  $CGRATES_GATEWAY_DATABASES_LOG_USER;"
-psql -a -e --username root -c "ALTER USER $CGRATES_GATEWAY_DATABASES_LOG_USER CREATEDB;"
\ No newline at end of file
+psql -a -e --username root -c "ALTER USER $CGRATES_GATEWAY_DATABASES_LOG_USER CREATEDB;"
+psql -a -e --username root -c "CREATE ROLE $CGRATES_GATEWAY_DATABASES_CDR_USER WITH LOGIN ENCRYPTED PASSWORD '$CGRATES_GATEWAY_DATABASES_CDR_PASSWORD';"
+psql -a -e --username root -c "CREATE DATABASE $CGRATES_GATEWAY_DATABASES_CDR_NAME OWNER =  $CGRATES_GATEWAY_DATABASES_CDR_USER;"
+psql -a -e --username root -c "ALTER USER $CGRATES_GATEWAY_DATABASES_CDR_USER CREATEDB;"
\ No newline at end of file